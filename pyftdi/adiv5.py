@@ -0,0 +1,506 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""ARM ADIv5 debug interface support for PyFtdi"""
+
+from logging import getLogger
+from struct import pack as spack, unpack as sunpack
+from time import perf_counter as now
+from typing import List, Optional, Sequence, Tuple, Union
+from .jtag import JtagDevice, JtagEngine, JtagError, JtagQueue, JtagScan
+
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-arguments
+#pylint: disable-msg=too-many-locals
+#pylint: disable-msg=protected-access
+
+
+class Adiv5Error(JtagError):
+    """ARM debug interface error."""
+
+
+class Adiv5FaultError(Adiv5Error):
+    """ARM debug interface access fault, reported by the sticky error flag
+       of the debug port."""
+
+
+Adiv5Request = Tuple[int, int, bool, int]
+"""A DPACC or APACC request: instruction, register address, whether to read
+   the register, value to write."""
+
+
+class JtagDp:
+    """ARM ADIv5 JTAG Debug Port.
+
+       DPACC and APACC requests are queued as 35-bit DR scans, which are
+       executed with as few USB requests as possible. As with any JTAG-DP,
+       the result of a read request is captured with the next scan, so that
+       the reads are naturally pipelined.
+
+       A WAIT response means that the request has been ignored, as the
+       previous access is still in progress. :py:meth:`power_up` enables
+       the overrun detection of the debug port, so that all the requests
+       that follow a WAIT response are also ignored. Requests are then
+       replayed from the first one that has been ignored, once the sticky
+       overrun flag has been cleared, and the count of idle cycles inserted
+       after each AP access is doubled, so that the next requests are less
+       likely to be ignored.
+
+       :param engine: a configured JTAG engine
+       :param device: the debug port, for JTAG chains with several devices
+       :param idle_cycles: the count of TCK cycles spent in Run-Test/Idle
+                           after each AP access, to let the access complete
+                           before the next request is shifted
+       :param retries: the maximum count of consecutive replays without
+                       any progress
+    """
+
+    ABORT = 0b1000
+    DPACC = 0b1010
+    APACC = 0b1011
+    IDCODE = 0b1110
+
+    ACK_WAIT = 0b001
+    ACK_OK = 0b010
+
+    CTRL_STAT = 0x4
+    SELECT = 0x8
+    RDBUFF = 0xC
+
+    CSYSPWRUPACK = 1 << 31
+    CSYSPWRUPREQ = 1 << 30
+    CDBGPWRUPACK = 1 << 29
+    CDBGPWRUPREQ = 1 << 28
+    STICKYERR = 1 << 5
+    STICKYCMP = 1 << 4
+    STICKYORUN = 1 << 1
+    ORUNDETECT = 1 << 0
+
+    DAPABORT = 1 << 0
+
+    DEFAULT_RETRIES = 16
+    MAX_IDLE_CYCLES = 1024
+
+    def __init__(self, engine: JtagEngine,
+                 device: Optional[JtagDevice] = None, idle_cycles: int = 0,
+                 retries: int = DEFAULT_RETRIES):
+        self.log = getLogger('pyftdi.adiv5')
+        self._engine = engine
+        self._device = device
+        self._offset = device.dr_offset if device else 0
+        self._idle_cycles = idle_cycles
+        self._retries = retries
+        self._select: Optional[int] = None
+        self._ctrl_stat = 0
+        self._waits = 0
+
+    @property
+    def idle_cycles(self) -> int:
+        """Report the count of TCK cycles spent in Run-Test/Idle after each
+           AP access, which grows with WAIT responses.
+
+           :return: the count of idle cycles
+        """
+        return self._idle_cycles
+
+    @property
+    def wait_count(self) -> int:
+        """Report how many WAIT responses have been received.
+
+           :return: the count of WAIT responses
+        """
+        return self._waits
+
+    def read_idcode(self) -> int:
+        """Read the identifier of the debug port.
+
+           :return: the IDCODE value
+        """
+        queue = JtagQueue(self._engine)
+        self._queue_ir(queue, self.IDCODE)
+        scan = self._queue_dr(queue, 0, 32)
+        queue.flush()
+        return (int(scan) >> self._offset) & 0xffffffff
+
+    def read_dp(self, address: int) -> int:
+        """Read a debug port register.
+
+           :param address: the register address
+           :return: the register value
+        """
+        return self._execute([(self.DPACC, address, True, 0)])[0]
+
+    def write_dp(self, address: int, value: int) -> None:
+        """Write a debug port register.
+
+           :param address: the register address
+           :param value: the register value
+        """
+        if address == self.SELECT:
+            self._select = value
+        self._execute([(self.DPACC, address, False, value)])
+
+    def read_ap(self, apsel: int, address: int) -> int:
+        """Read an access port register.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :return: the register value
+        """
+        requests = self._select_bank(apsel, address)
+        requests.append((self.APACC, address, True, 0))
+        return self._execute(requests)[-1]
+
+    def write_ap(self, apsel: int, address: int, value: int) -> None:
+        """Write an access port register.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :param value: the register value
+        """
+        requests = self._select_bank(apsel, address)
+        requests.append((self.APACC, address, False, value))
+        self._execute(requests)
+
+    def power_up(self, timeout: float = 1.0) -> None:
+        """Power up the debug and system domains, and enable the overrun
+           detection.
+
+           :param timeout: the maximum time to wait for the power domains to
+                           be acknowledged, in seconds
+        """
+        self._ctrl_stat = (self.CSYSPWRUPREQ | self.CDBGPWRUPREQ |
+                           self.ORUNDETECT)
+        self.write_dp(self.CTRL_STAT, self._ctrl_stat)
+        acks = self.CSYSPWRUPACK | self.CDBGPWRUPACK
+        expire = now()+timeout
+        while self.read_dp(self.CTRL_STAT) & acks != acks:
+            if now() > expire:
+                raise Adiv5Error('Debug port power up timeout')
+
+    def clear_errors(self) -> None:
+        """Clear the sticky error flags of the debug port."""
+        self.write_dp(self.CTRL_STAT, self._ctrl_stat | self.STICKYERR |
+                      self.STICKYCMP | self.STICKYORUN)
+
+    def abort(self) -> None:
+        """Abort the current AP transaction."""
+        queue = JtagQueue(self._engine)
+        self._queue_ir(queue, self.ABORT)
+        self._queue_dr(queue, self.DAPABORT << 3, 35, capture=False)
+        queue.flush()
+        self._select = None
+
+    def _select_bank(self, apsel: int, address: int) -> List[Adiv5Request]:
+        """Build the request to select an access port register bank, if it
+           is not already selected."""
+        select = (apsel << 24) | (address & 0xf0)
+        if select == self._select:
+            return []
+        self._select = select
+        return [(self.DPACC, self.SELECT, False, select)]
+
+    def _execute(self, requests: List[Adiv5Request]) -> List[Optional[int]]:
+        """Execute DPACC and APACC requests, replaying the ignored ones.
+
+           :return: the read value of each request, None for writes
+        """
+        count = len(requests)
+        if requests[-1][2]:
+            # the result of the last read is captured with an extra scan
+            requests = requests + [(self.DPACC, self.RDBUFF, True, 0)]
+        results = []
+        retries = 0
+        replay = False
+        while True:
+            captured = self._run(requests, replay)
+            done = len(captured)
+            if done < len(requests) and done and requests[done-1][2]:
+                # the result of this read has not been captured
+                done -= 1
+            results.extend(captured[pos+1]
+                           if requests[pos][2] and pos+1 < len(captured)
+                           else None for pos in range(done))
+            if len(captured) == len(requests):
+                return results[:count]
+            requests = requests[done:]
+            retries = self._retry(retries, done > 0)
+            replay = True
+
+    def _retry(self, retries: int, progress: bool) -> int:
+        """Account for a WAIT response, increasing the idle cycles.
+
+           :param retries: the count of replays without progress
+           :param progress: whether some requests have been completed
+           :return: the updated count of replays without progress
+        """
+        self._idle_cycles = min(max(1, self._idle_cycles*2),
+                                self.MAX_IDLE_CYCLES)
+        retries = 0 if progress else retries+1
+        if retries > self._retries:
+            raise Adiv5Error('Too many WAIT responses')
+        return retries
+
+    def _run(self, requests: Sequence[Adiv5Request],
+             delay: bool = False) -> List[int]:
+        """Execute DPACC and APACC requests with a single queue flush.
+
+           :param requests: the requests to execute
+           :param delay: whether to wait and clear the sticky overrun flag
+                         before executing the requests
+           :return: the data captured with each request, up to the first
+                    ignored request
+        """
+        queue = JtagQueue(self._engine)
+        if delay:
+            queue.run_test(self._idle_cycles)
+            requests = [(self.DPACC, self.CTRL_STAT, False,
+                         self._ctrl_stat | self.STICKYORUN)] + list(requests)
+        instruction = None
+        scans = []
+        for instr, address, read, value in requests:
+            if instr != instruction:
+                self._queue_ir(queue, instr)
+                instruction = instr
+            request = (value << 3) | ((address >> 1) & 0b110) | int(read)
+            scans.append(self._queue_dr(queue, request, 35))
+            if instr == self.APACC and self._idle_cycles:
+                queue.run_test(self._idle_cycles)
+        queue.flush()
+        captured = []
+        for scan in scans:
+            value = int(scan) >> self._offset
+            ack = value & 0b111
+            if ack == self.ACK_WAIT:
+                self._waits += 1
+                # the bank selection may have been ignored
+                self._select = None
+                break
+            if ack != self.ACK_OK:
+                self._select = None
+                raise Adiv5Error('Unexpected ACK 0x%x' % ack)
+            captured.append((value >> 3) & 0xffffffff)
+        return captured[1:] if delay else captured
+
+    def _queue_ir(self, queue: JtagQueue, instruction: int) -> None:
+        if self._device:
+            self._device.queue_ir(queue, instruction)
+        else:
+            queue.scan_ir(instruction, 4)
+
+    def _queue_dr(self, queue: JtagQueue, data: int, length: int,
+                  capture: bool = True) -> Optional[JtagScan]:
+        if self._device:
+            return self._device.queue_dr(queue, data, length, capture)
+        return queue.scan_dr(data, length, capture=capture,
+                             end_state='update_dr')
+
+
+class MemAp:
+    """ARM ADIv5 Memory Access Port.
+
+       Memory blocks are transferred with 32-bit accesses, using the TAR
+       auto-increment feature. The address is only written again when a
+       1KB boundary is crossed, as auto-increment is not guaranteed beyond.
+       Each batch of accesses ends with a check of the sticky error flag,
+       and is executed with a single USB request.
+
+       :param dp: the debug port
+       :param apsel: the access port index
+       :param batch_size: the count of bytes to transfer with each USB
+                          request
+    """
+
+    CSW = 0x00
+    TAR = 0x04
+    DRW = 0x0C
+    CFG = 0xF4
+    BASE = 0xF8
+    IDR = 0xFC
+
+    CSW_SIZE_MASK = 0x07
+    CSW_SIZE_WORD = 0x02
+    CSW_ADDRINC_MASK = 0x30
+    CSW_ADDRINC_SINGLE = 0x10
+
+    TAR_WRAP = 0x400
+    DEFAULT_BATCH_SIZE = 4096
+
+    def __init__(self, dp: JtagDp, apsel: int = 0,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self._dp = dp
+        self._apsel = apsel
+        self._batch_size = batch_size
+        self._csw: Optional[int] = None
+        self._read_bytes = 0
+        self._read_time = 0.0
+        self._write_bytes = 0
+        self._write_time = 0.0
+
+    @property
+    def read_throughput(self) -> float:
+        """Report the throughput achieved by the memory reads.
+
+           :return: the throughput in bytes per second
+        """
+        if not self._read_time:
+            return 0.0
+        return self._read_bytes/self._read_time
+
+    @property
+    def write_throughput(self) -> float:
+        """Report the throughput achieved by the memory writes.
+
+           :return: the throughput in bytes per second
+        """
+        if not self._write_time:
+            return 0.0
+        return self._write_bytes/self._write_time
+
+    def reset_statistics(self) -> None:
+        """Reset the throughput statistics."""
+        self._read_bytes = 0
+        self._read_time = 0.0
+        self._write_bytes = 0
+        self._write_time = 0.0
+
+    def read_idr(self) -> int:
+        """Read the identification register of the access port.
+
+           :return: the IDR value
+        """
+        return self._dp.read_ap(self._apsel, self.IDR)
+
+    def read32(self, address: int) -> int:
+        """Read a 32-bit word.
+
+           :param address: the word address
+           :return: the word value
+        """
+        return self._transfer(address, 1)[0]
+
+    def write32(self, address: int, value: int) -> None:
+        """Write a 32-bit word.
+
+           :param address: the word address
+           :param value: the word value
+        """
+        self._transfer(address, 1, [value])
+
+    def read_memory(self, address: int, length: int) -> bytes:
+        """Read a memory block.
+
+           :param address: the address of the block, aligned on a word
+           :param length: the count of bytes to read, a multiple of 4
+           :return: the memory content
+        """
+        self._check_alignment(address, length)
+        start = now()
+        values = self._transfer(address, length//4)
+        self._read_time += now()-start
+        self._read_bytes += length
+        return spack('<%dI' % len(values), *values)
+
+    def write_memory(self, address: int,
+                     data: Union[bytes, bytearray]) -> None:
+        """Write a memory block.
+
+           :param address: the address of the block, aligned on a word
+           :param data: the data to write, a multiple of 4 bytes
+        """
+        self._check_alignment(address, len(data))
+        start = now()
+        self._transfer(address, len(data)//4,
+                       sunpack('<%dI' % (len(data)//4), data))
+        self._write_time += now()-start
+        self._write_bytes += len(data)
+
+    @classmethod
+    def _check_alignment(cls, address: int, length: int) -> None:
+        if address & 0b11 or length & 0b11:
+            raise Adiv5Error('Unaligned memory access')
+
+    def _setup(self) -> None:
+        """Select 32-bit accesses with auto-increment."""
+        if self._csw is not None:
+            return
+        csw = self._dp.read_ap(self._apsel, self.CSW)
+        csw &= ~(self.CSW_SIZE_MASK | self.CSW_ADDRINC_MASK)
+        csw |= self.CSW_SIZE_WORD | self.CSW_ADDRINC_SINGLE
+        self._dp.write_ap(self._apsel, self.CSW, csw)
+        self._csw = csw
+
+    def _transfer(self, address: int, count: int,
+                  data: Optional[Sequence[int]] = None) -> List[int]:
+        """Transfer words, in batches of queued accesses.
+
+           :param address: the address of the first word
+           :param count: the count of words to transfer
+           :param data: the words to write, None to read words
+           :return: the read words
+        """
+        dp = self._dp
+        self._setup()
+        read = data is None
+        batch = max(1, self._batch_size//4)
+        values = []
+        done = 0
+        retries = 0
+        replay = False
+        while done < count:
+            requests = dp._select_bank(self._apsel, self.DRW)
+            words = []
+            for pos in range(done, min(count, done+batch)):
+                waddr = address+4*pos
+                if pos == done or not waddr % self.TAR_WRAP:
+                    requests.append((dp.APACC, self.TAR, False, waddr))
+                words.append(len(requests))
+                requests.append((dp.APACC, self.DRW, read,
+                                 0 if read else data[pos]))
+            status = len(requests)
+            requests.append((dp.DPACC, dp.CTRL_STAT, True, 0))
+            requests.append((dp.DPACC, dp.RDBUFF, True, 0))
+            captured = dp._run(requests, replay)
+            # read results are captured with the next accepted request,
+            # replayed transfers restart from the first incomplete word
+            if read:
+                completed = [captured[word+1] for word in words
+                             if word+1 < len(captured)]
+                values.extend(completed)
+            else:
+                completed = [word for word in words if word < len(captured)]
+            done += len(completed)
+            if len(captured) < len(requests):
+                retries = dp._retry(retries, bool(completed))
+                replay = True
+                continue
+            retries = 0
+            replay = False
+            if captured[status+1] & dp.STICKYERR:
+                dp.clear_errors()
+                raise Adiv5FaultError('Memory access fault in 0x%08x..'
+                                      '0x%08x' % (address, address+4*count))
+        return values
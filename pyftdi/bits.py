@@ -26,14 +26,56 @@
 
 """Bit field and sequence management."""
 
-from typing import Iterable, List, Optional, Tuple, Union
-from .misc import is_iterable, xor
+from typing import Iterable, Optional, Tuple, Union
+from .misc import is_iterable
 
 #pylint: disable-msg=invalid-name
 #pylint: disable-msg=unneeded-not
 #pylint: disable-msg=too-many-branches
 #pylint: disable-msg=too-many-arguments
 
+
+_REVERSED_BYTES = bytes(int('{:08b}'.format(x)[::-1], 2) for x in range(256))
+"""Lookup table to reverse the bit order of a byte."""
+
+_ASCII_TO_BITS = bytes.maketrans(b'01', b'\x00\x01')
+_BITS_TO_ASCII = bytes.maketrans(b'\x00\x01\xff', b'010')
+_ZBITS_TO_ASCII = bytes.maketrans(b'\x00\x01\xff', b'001')
+
+
+def _reverse_bits(value: int, length: int) -> int:
+    """Reverse the bit order of an integral value.
+
+       :param value: the value to reverse, should fit in length bits
+       :param length: the count of bits to reverse
+       :return: the reversed value
+    """
+    if length <= 0:
+        return 0
+    size = (length+7)//8
+    data = value.to_bytes(size, 'little').translate(_REVERSED_BYTES)
+    return int.from_bytes(data, 'big') >> (8*size-length)
+
+
+def _int_to_bits(value: int, length: int) -> bytes:
+    """Expand an integral value into a byte sequence, one byte per bit,
+       least significant bit first.
+    """
+    if not length:
+        return b''
+    digits = format(value, '0%db' % length).encode()
+    return digits[::-1].translate(_ASCII_TO_BITS)
+
+
+def _bits_to_int(bits: Union[bytes, bytearray], table: bytes) -> int:
+    """Pack a byte sequence, one byte per bit, least significant bit first,
+       into an integral value.
+    """
+    if not bits:
+        return 0
+    return int(bits[::-1].translate(table), 2)
+
+
 class BitSequenceError(Exception):
     """Bit sequence error"""
 
@@ -49,6 +91,11 @@ class BitSequence:
        Can be initialized with another bit sequence, a integral value,
        a sequence of bytes or an iterable of common boolean values.
 
+       Bits are stored packed into an integral value, the first bit of the
+       sequence being the least significant bit of the integral value, so
+       that conversions from and to integral values or byte sequences are
+       cheap, whatever the length of the sequence.
+
        :param value:  initial value
        :param msb:    most significant bit first or not
        :param length: count of signficant bits in the bit sequence
@@ -56,36 +103,31 @@ class BitSequence:
        :param msby:   most significant byte first or not
     """
 
+    __slots__ = ['_int', '_z', '_len']
+
+    _VALID_BITS = b'\x00\x01'
+    _SMAP = {'0': 0, '1': 1, False: 0, True: 1, 0: 0, 1: 1}
+
     def __init__(self, value: Union['BitSequence', str, int] = None,
                  msb: bool = False, length: int = 0,
                  bytes_: Optional[bytes] = None, msby: bool = True):
         """Instantiate a new bit sequence.
         """
-        self._seq = bytearray()
-        seq = self._seq
+        # packed bit values, high-Z bit mask and bit count
+        self._int = 0
+        self._z = 0
+        self._len = 0
         if value and bytes_:
             raise BitSequenceError("Cannot inialize with both a value and "
                                    "bytes")
         if bytes_:
-            provider = list(bytes_).__iter__() if msby else reversed(bytes_)
-            for byte in provider:
-                if isinstance(byte, str):
-                    byte = ord(byte)
-                elif byte > 0xff:
-                    raise BitSequenceError("Invalid byte value")
-                b = []
-                for _ in range(8):
-                    b.append(bool(byte & 0x1))
-                    byte >>= 1
-                if msb:
-                    b.reverse()
-                seq.extend(b)
-        else:
-            value = self._tomutable(value)
-        if isinstance(value, int):
+            self._init_from_bytes(bytes_, msb, msby)
+        elif isinstance(value, int):
             self._init_from_integer(value, msb, length)
         elif isinstance(value, BitSequence):
             self._init_from_sibling(value, msb)
+        elif isinstance(value, str):
+            self._init_from_string(value, msb)
         elif is_iterable(value):
             self._init_from_iterable(value, msb)
         elif value is None:
@@ -94,140 +136,230 @@ class BitSequence:
             raise BitSequenceError("Cannot initialize from a %s" % type(value))
         self._update_length(length, msb)
 
+    @classmethod
+    def _build(cls, value: int, zmask: int, length: int) -> 'BitSequence':
+        """Create a new sequence from its packed representation"""
+        seq = cls.__new__(cls)
+        seq._int = value
+        seq._z = zmask
+        seq._len = length
+        return seq
+
+    @property
+    def _mask(self) -> int:
+        return (1 << self._len) - 1
+
     def sequence(self) -> bytearray:
         """Return the internal representation as a new mutable sequence"""
-        return bytearray(self._seq)
+        bits = _int_to_bits(self._int, self._len)
+        if self._z:
+            # high-Z value bits are always cleared, no carry may occur
+            bits = (int.from_bytes(bits, 'little') +
+                    int.from_bytes(_int_to_bits(self._z, self._len),
+                                   'little') * 0xff).to_bytes(self._len,
+                                                              'little')
+        return bytearray(bits)
 
     def reverse(self) -> 'BitSequence':
         """In-place reverse"""
-        self._seq.reverse()
+        self._int = _reverse_bits(self._int, self._len)
+        if self._z:
+            self._z = _reverse_bits(self._z, self._len)
         return self
 
     def invert(self) -> 'BitSequence':
         """In-place invert sequence values"""
-        self._seq = bytearray([x ^ 1 for x in self._seq])
+        self._int = ~(self._int | self._z) & self._mask
         return self
 
     def append(self, seq) -> 'BitSequence':
         """Concatenate a new BitSequence"""
         if not isinstance(seq, BitSequence):
             seq = BitSequence(seq)
-        self._seq.extend(seq.sequence())
+        self._int |= seq._int << self._len
+        self._z |= seq._z << self._len
+        self._len += seq._len
         return self
 
     def lsr(self, count: int) -> None:
         """Left shift rotate"""
         count %= len(self)
-        self._seq[:] = self._seq[count:] + self._seq[:count]
+        self._int = self._rotate(self._int, count)
+        self._z = self._rotate(self._z, count)
 
     def rsr(self, count: int) -> None:
         """Right shift rotate"""
         count %= len(self)
-        self._seq[:] = self._seq[-count:] + self._seq[:-count]
+        count = (self._len - count) % self._len
+        self._int = self._rotate(self._int, count)
+        self._z = self._rotate(self._z, count)
 
     def tobit(self) -> bool:
         """Degenerate the sequence into a single bit, if possible"""
         if len(self) != 1:
             raise BitSequenceError("BitSequence should be a scalar")
-        return bool(self._seq[0])
+        return bool(self._int | self._z)
 
     def tobyte(self, msb: bool = False) -> int:
         """Convert the sequence into a single byte value, if possible"""
         if len(self) > 8:
             raise BitSequenceError("Cannot fit into a single byte")
-        byte = 0
-        pos = -1 if not msb else 0
-        # copy the sequence
-        seq = self._seq[:]
-        while seq:
-            byte <<= 1
-            byte |= seq.pop(pos)
+        byte = self._int | self._z
+        if msb:
+            byte = _reverse_bits(byte, self._len)
         return byte
 
     def tobytes(self, msb: bool = False, msby: bool = False) -> bytearray:
         """Convert the sequence into a sequence of byte values"""
-        blength = (len(self)+7) & (~0x7)
-        sequence = list(self._seq)
-        if not msb:
-            sequence.reverse()
-        bytes_ = bytearray()
-        for pos in range(0, blength, 8):
-            seq = sequence[pos:pos+8]
-            byte = 0
-            while seq:
-                byte <<= 1
-                byte |= seq.pop(0)
-            bytes_.append(byte)
+        value = self._int | self._z
+        count, rem = divmod(self._len, 8)
+        if msb:
+            # bytes are emitted from the first bit of the sequence
+            bytes_ = bytearray((value & ((1 << (8*count))-1)).to_bytes(
+                count, 'little').translate(_REVERSED_BYTES))
+            if rem:
+                bytes_.append(_reverse_bits(value >> (8*count), rem))
+        else:
+            # bytes are emitted from the last bit of the sequence
+            bytes_ = bytearray((value >> rem).to_bytes(count, 'big'))
+            if rem:
+                bytes_.append(value & ((1 << rem)-1))
         if msby:
             bytes_.reverse()
         return bytes_
 
-    @staticmethod
-    def _tomutable(value: Union[str, Tuple]) -> List:
-        """Convert a immutable sequence into a mutable one"""
-        if isinstance(value, tuple):
-            # convert immutable sequence into a list so it can be popped out
-            value = list(value)
-        elif isinstance(value, str):
-            # convert immutable sequence into a list so it can be popped out
-            if value.startswith('0b'):
-                value = list(value[2:])
-            else:
-                value = list(value)
-        return value
+    def _rotate(self, value: int, count: int) -> int:
+        """Rotate a packed value towards its least significant bit"""
+        if not value or not count:
+            return value
+        return ((value >> count) |
+                (value << (self._len-count))) & self._mask
+
+    def _init_from_bytes(self, bytes_: Iterable, msb: bool,
+                         msby: bool) -> None:
+        """Initialize from a sequence of bytes"""
+        if not isinstance(bytes_, (bytes, bytearray)):
+            values = []
+            for byte in bytes_:
+                if isinstance(byte, str):
+                    byte = ord(byte)
+                elif byte > 0xff:
+                    raise BitSequenceError("Invalid byte value")
+                values.append(byte)
+            try:
+                bytes_ = bytes(values)
+            except ValueError:
+                raise BitSequenceError("Invalid byte value")
+        if msb:
+            bytes_ = bytes_.translate(_REVERSED_BYTES)
+        self._int = int.from_bytes(bytes_, 'little' if msby else 'big')
+        self._len = 8*len(bytes_)
 
     def _init_from_integer(self, value: int, msb: bool, length: int) -> None:
         """Initialize from any integer value"""
-        bl = length or -1
-        seq = self._seq
-        while bl:
-            seq.append(bool(value & 1))
-            value >>= 1
-            if not value:
-                break
-            bl -= 1
+        if value < 0:
+            if not length:
+                raise BitSequenceError("Cannot initialize from a negative "
+                                       "value without a length")
+            count = length
+        else:
+            count = max(1, value.bit_length())
+            if length:
+                count = min(count, length)
+        value &= (1 << count)-1
         if msb:
-            seq.reverse()
+            value = _reverse_bits(value, count)
+        self._int = value
+        self._len = count
+
+    def _init_from_string(self, text: str, msb: bool) -> None:
+        """Initialize from a string of binary digits"""
+        if text.startswith('0b'):
+            text = text[2:]
+        if not msb:
+            text = text[::-1]
+        self._init_from_digits(text)
+
+    def _init_from_digits(self, text: str) -> None:
+        """Initialize from a string of binary digits, most significant bit
+           first"""
+        if text.strip('01'):
+            raise BitSequenceError("Invalid binary character in initializer")
+        self._int = int(text, 2) if text else 0
+        self._len = len(text)
 
     def _init_from_iterable(self, iterable: Iterable, msb: bool) -> None:
         """Initialize from an iterable"""
-        smap = {'0': 0, '1': 1, False: 0, True: 1, 0: 0, 1: 1}
-        seq = self._seq
-        try:
-            if msb:
-                seq.extend([smap[bit] for bit in reversed(iterable)])
-            else:
-                seq.extend([smap[bit] for bit in iterable])
-        except KeyError:
-            raise BitSequenceError("Invalid binary character in initializer")
+        if isinstance(iterable, (bytes, bytearray)):
+            bits = iterable
+            if bits.translate(None, self._VALID_BITS):
+                raise BitSequenceError("Invalid binary character in "
+                                       "initializer")
+        else:
+            smap = self._SMAP
+            try:
+                bits = bytes([smap[bit] for bit in iterable])
+            except (KeyError, TypeError):
+                raise BitSequenceError("Invalid binary character in "
+                                       "initializer")
+        if msb:
+            bits = bits[::-1]
+        self._load_bits(bits)
+
+    def _load_bits(self, bits: Union[bytes, bytearray]) -> None:
+        """Initialize from a sequence of bit values, one byte per bit"""
+        self._int = _bits_to_int(bits, _BITS_TO_ASCII)
+        self._z = _bits_to_int(bits, _ZBITS_TO_ASCII) if 0xff in bits else 0
+        self._len = len(bits)
 
     def _init_from_sibling(self, value: 'BitSequence', msb: bool) -> None:
         """Initialize from a fellow object"""
-        self._seq = value.sequence()
+        self._int = value._int
+        self._z = value._z
+        self._len = value._len
         if msb:
-            self._seq.reverse()
+            self.reverse()
 
     def _update_length(self, length, msb):
         """If a specific length is specified, extend the sequence as
            expected"""
         if length and (len(self) < length):
-            extra = bytearray([False] * (length-len(self)))
             if msb:
-                extra.extend(self._seq)
-                self._seq = extra
-            else:
-                self._seq.extend(extra)
+                extra = length-len(self)
+                self._int <<= extra
+                self._z <<= extra
+            self._len = length
+
+    def _get_slice(self, index: slice) -> Optional[Tuple[int, int]]:
+        """Convert a slice into a bit offset and count, or None if the slice
+           does not select contiguous bits"""
+        start, stop, step = index.indices(self._len)
+        if step != 1:
+            return None
+        return start, max(0, stop-start)
 
     def __iter__(self):
-        return self._seq.__iter__()
+        return self.sequence().__iter__()
 
     def __reversed__(self):
-        return self._seq.__reversed__()
+        return self.sequence().__reversed__()
 
     def __getitem__(self, index):
         if isinstance(index, slice):
-            return self.__class__(value=self._seq[index])
-        return self._seq[index]
+            bounds = self._get_slice(index)
+            if not bounds:
+                return self.__class__(value=self.sequence()[index])
+            offset, count = bounds
+            mask = (1 << count)-1
+            return self._build((self._int >> offset) & mask,
+                               (self._z >> offset) & mask, count)
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('bit index out of range')
+        if (self._z >> index) & 1:
+            return BitZSequence.Z
+        return (self._int >> index) & 1
 
     def __setitem__(self, index, value):
         if isinstance(value, BitSequence):
@@ -236,18 +368,43 @@ class BitSequence:
                 raise BitSequenceError("Cannot set item with instance of a "
                                        "subclass")
         if isinstance(index, slice):
-            value = self.__class__(value, length=len(self._seq[index]))
-            self._seq[index] = value.sequence()
+            bounds = self._get_slice(index)
+            if not bounds:
+                seq = self.sequence()
+                count = len(seq[index])
+                value = self.__class__(value, length=count)
+                seq[index] = value.sequence()
+                self._load_bits(seq)
+                return
+            offset, count = bounds
+            value = self.__class__(value, length=count)
+            low = (1 << offset)-1
+            shift = offset+value._len
+            tail = offset+count
+            self._int = ((self._int & low) | (value._int << offset) |
+                         ((self._int >> tail) << shift))
+            self._z = ((self._z & low) | (value._z << offset) |
+                       ((self._z >> tail) << shift))
+            self._len += value._len-count
         else:
             if not isinstance(value, BitSequence):
                 value = self.__class__(value)
             val = value.tobit()
-            if index > len(self._seq):
+            if index > len(self):
                 raise BitSequenceError("Cannot change the sequence size")
-            self._seq[index] = val
+            if index < 0:
+                index += self._len
+            if not 0 <= index < self._len:
+                raise IndexError('bit index out of range')
+            bit = 1 << index
+            self._z &= ~bit
+            if val:
+                self._int |= bit
+            else:
+                self._int &= ~bit
 
     def __len__(self):
-        return len(self._seq)
+        return self._len
 
     def __eq__(self, other):
         return self._cmp(other) == 0
@@ -272,14 +429,16 @@ class BitSequence:
         ld = len(self) - len(other)
         if ld:
             return ld
-        for n, (x, y) in enumerate(zip(self._seq, other.sequence()), start=1):
-            if xor(x, y):
-                return n
-        return 0
+        # high-Z bits compare as set bits
+        diff = (self._int | self._z) ^ (other._int | other._z)
+        # position of the first different bit, starting from 1
+        return (diff & -diff).bit_length()
 
     def __repr__(self):
         # cannot use bin() as it truncates the MSB zero bits
-        return ''.join([b and '1' or '0' for b in reversed(self._seq)])
+        if not self._len:
+            return ''
+        return format(self._int | self._z, '0%db' % self._len)
 
     def __str__(self):
         chunks = []
@@ -294,60 +453,49 @@ class BitSequence:
         return '%d: %s' % (len(self), ' '.join(reversed(chunks)))
 
     def __int__(self):
-        value = 0
-        for b in reversed(self._seq):
-            value <<= 1
-            value |= b and 1
-        return value
+        return self._int | self._z
 
     def __and__(self, other):
         if not isinstance(other, self.__class__):
             raise BitSequenceError('Need a BitSequence to combine')
         if len(self) != len(other):
             raise BitSequenceError('Sequences must be the same size')
-        return self.__class__(value=list(map(lambda x, y: x and y,
-                                             self._seq, other.sequence())))
+        return self._build((self._int | self._z) & (other._int | other._z),
+                           0, self._len)
 
     def __or__(self, other):
         if not isinstance(other, self.__class__):
             raise BitSequenceError('Need a BitSequence to combine')
         if len(self) != len(other):
             raise BitSequenceError('Sequences must be the same size')
-        return self.__class__(value=list(map(lambda x, y: x or y,
-                                             self._seq, other.sequence())))
+        return self._build(self._int | self._z | other._int | other._z,
+                           0, self._len)
 
     def __add__(self, other):
-        return self.__class__(value=self._seq + other.sequence())
+        return self._build(self._int | (other._int << self._len),
+                           self._z | (other._z << self._len),
+                           self._len + other._len)
 
     def __ilshift__(self, count):
         count %= len(self)
-        seq = bytearray([0]*count)
-        seq.extend(self._seq[:-count])
-        self._seq = seq
+        mask = self._mask
+        self._int = (self._int << count) & mask
+        self._z = (self._z << count) & mask
         return self
 
     def __irshift__(self, count):
         count %= len(self)
-        seq = self._seq[count:]
-        seq.extend([0]*count)
-        self._seq = seq
+        self._int >>= count
+        self._z >>= count
         return self
 
     def inc(self) -> None:
         """Increment the sequence"""
-        for p, b in enumerate(self._seq):
-            b ^= True
-            self._seq[p] = b
-            if b:
-                break
+        self._int = (self._int + 1) & self._mask & ~self._z
 
     def dec(self) -> None:
         """Decrement the sequence"""
-        for p, b in enumerate(self._seq):
-            b ^= True
-            self._seq[p] = b
-            if not b:
-                break
+        self._int = (self._int - 1) & self._mask & ~self._z
 
     def invariant(self) -> bool:
         """Tells whether all bits of the sequence are of the same value.
@@ -355,15 +503,16 @@ class BitSequence:
            Return the value, or ValueError if the bits are not of the same
            value
         """
-        try:
-            ref = self._seq[0]
-        except IndexError:
+        if not self._len:
             raise ValueError('Empty sequence')
-        if len(self._seq) == 1:
-            return ref
-        for b in self._seq[1:]:
-            if b != ref:
-                raise ValueError('Bits do no match')
+        ref = self[0]
+        mask = self._mask
+        if ref == BitZSequence.Z:
+            match = self._z == mask
+        else:
+            match = not self._z and self._int == (mask if ref else 0)
+        if not match:
+            raise ValueError('Bits do no match')
         return ref
 
 
@@ -377,18 +526,17 @@ class BitZSequence(BitSequence):
        :param length: count of signficant bits in the bit sequence
     """
 
-    __slots__ = ['_seq']
+    __slots__ = []
 
     Z = 0xff  # maximum byte value
 
+    _VALID_BITS = b'\x00\x01\xff'
+    _SMAP = {'0': 0, '1': 1, 'Z': Z, False: 0, True: 1, None: Z,
+             0: 0, 1: 1, Z: Z}
+
     def __init__(self, value=None, msb=False, length=0):
         BitSequence.__init__(self, value=value, msb=msb, length=length)
 
-    def invert(self):
-        self._seq = [x in (None, BitZSequence.Z) and BitZSequence.Z or x ^ 1
-                     for x in self._seq]
-        return self
-
     def tobyte(self, msb=False):
         raise BitSequenceError("Type %s cannot be converted to byte" %
                                type(self))
@@ -404,33 +552,35 @@ class BitZSequence(BitSequence):
         ld = len(self) - len(other)
         if ld:
             return ld
-        for (x, y) in zip(self._seq, other.sequence()):
-            if BitZSequence.Z in (x, y):
-                continue
-            if x is not y:
-                return False
-        return True
-
-    def _init_from_iterable(self, iterable, msb):
-        """Initialize from an iterable"""
-        smap = {'0': 0, '1': 1, 'Z': BitZSequence.Z,
-                False: 0, True: 1, None: BitZSequence.Z,
-                0: 0, 1: 1, BitZSequence.Z: BitZSequence.Z}
-        seq = self._seq
-        try:
-            if msb:
-                seq.extend([smap[bit] for bit in reversed(iterable)])
-            else:
-                seq.extend([smap[bit] for bit in iterable])
-        except KeyError:
+        care = ~(self._z | other._z)
+        return not (self._int ^ other._int) & care
+
+    def _init_from_digits(self, text):
+        """Initialize from a string of binary digits, most significant bit
+           first"""
+        if 'Z' not in text:
+            BitSequence._init_from_digits(self, text)
+            return
+        if text.strip('01Z'):
             raise BitSequenceError("Invalid binary character in initializer")
+        self._int = int(text.replace('Z', '0'), 2)
+        self._z = int(text.replace('1', '0').replace('Z', '1'), 2)
+        self._len = len(text)
 
     def __repr__(self):
-        smap = {False: '0', True: '1', BitZSequence.Z: 'Z'}
-        return ''.join([smap[b] for b in reversed(self._seq)])
+        srepr = BitSequence.__repr__(self)
+        if not self._z:
+            return srepr
+        # turn the high-Z digits, reported as '1', into 'Z' digits: as each
+        # digit is a byte, the whole representation is updated at once
+        zdigits = format(self._z, '0%db' % self._len).encode()
+        zmask = int.from_bytes(zdigits.translate(_ASCII_TO_BITS), 'big')
+        value = (int.from_bytes(srepr.encode(), 'big') +
+                 zmask * (ord('Z') - ord('1')))
+        return value.to_bytes(self._len, 'big').decode()
 
     def __int__(self):
-        if BitZSequence.Z in self._seq:
+        if self._z:
             raise BitSequenceError("High-Z BitSequence cannot be converted to "
                                    "an integral type")
         return BitSequence.__int__(self)
@@ -440,10 +590,8 @@ class BitZSequence(BitSequence):
         ld = len(self) - len(other)
         if ld:
             return ld
-        for n, (x, y) in enumerate(zip(self._seq, other.sequence()), start=1):
-            if x is not y:
-                return n
-        return 0
+        diff = (self._int ^ other._int) | (self._z ^ other._z)
+        return (diff & -diff).bit_length()
 
     def __and__(self, other):
         if not isinstance(self, BitSequence):
@@ -451,14 +599,8 @@ class BitZSequence(BitSequence):
                                    'combine')
         if len(self) != len(other):
             raise BitSequenceError('Sequences must be the same size')
-
-        def andz(x, y):
-            """Compute the boolean AND operation for a tri-state boolean"""
-            if BitZSequence.Z in (x, y):
-                return BitZSequence.Z
-            return x and y
-        return self.__class__(
-            value=list(map(andz, self._seq, other.sequence())))
+        zmask = self._z | other._z
+        return self._build(self._int & other._int & ~zmask, zmask, self._len)
 
     def __or__(self, other):
         if not isinstance(self, BitSequence):
@@ -466,14 +608,9 @@ class BitZSequence(BitSequence):
                                    'combine')
         if len(self) != len(other):
             raise BitSequenceError('Sequences must be the same size')
-
-        def orz(x, y):
-            """Compute the boolean OR operation for a tri-state boolean"""
-            if BitZSequence.Z in (x, y):
-                return BitZSequence.Z
-            return x or y
-        return self.__class__(value=list(map(orz, self._seq,
-                                             other.sequence())))
+        zmask = self._z | other._z
+        return self._build((self._int | other._int) & ~zmask, zmask,
+                           self._len)
 
     def __rand__(self, other):
         return self.__and__(other)
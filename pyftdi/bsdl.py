@@ -0,0 +1,382 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""BSDL parser and boundary-scan sampler for PyFtdi"""
+
+from collections import namedtuple
+from re import DOTALL, IGNORECASE, compile as recompile
+from time import perf_counter as now
+from typing import Dict, Iterable, List, Optional, Tuple
+from .bits import BitSequence
+from .jtag import JtagDevice, JtagEngine, JtagQueue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#pylint: disable-msg=invalid-name
+#pylint: disable-msg=too-many-instance-attributes
+
+
+class BsdlError(Exception):
+    """BSDL parsing error."""
+
+
+BsdlCell = namedtuple('BsdlCell', 'number cell port function safe control '
+                                  'disable_value disable_result')
+"""A boundary register cell.
+
+   * ``number`` is the position of the cell in the boundary register, cell 0
+     being the closest one to TDO,
+   * ``cell`` is the cell type, *e.g.* ``BC_1``,
+   * ``port`` is the name of the device port, or ``*``,
+   * ``function`` is the cell function, *e.g.* ``INPUT`` or ``OUTPUT3``,
+   * ``safe`` is the safe value of the cell, as a string,
+   * ``control`` is the position of the control cell, if any,
+   * ``disable_value`` is the value of the control cell that disables the
+     output, if any,
+   * ``disable_result`` is the state of the disabled output, if any.
+"""
+
+BsdlPin = namedtuple('BsdlPin', 'input output control')
+"""The boundary register cells of a device port.
+
+   * ``input`` is the position of the cell that captures the port level,
+   * ``output`` is the position of the cell that drives the port,
+   * ``control`` is the position of the cell that enables the output.
+
+   Missing cells are reported as None.
+"""
+
+
+class Bsdl:
+    """Boundary-scan description of a device, parsed from a BSDL file.
+
+       Only the attributes required for boundary-scan operations are
+       decoded: the instruction register, the device identifier and the
+       boundary register.
+
+       :param text: the BSDL description
+    """
+
+    ENTITY = recompile(r'\bentity\s+(\w+)\s+is\b', IGNORECASE)
+    ATTRIBUTE = recompile(r'\battribute\s+(\w+)\s+of\s+(\w+)\s*:\s*\w+\s+'
+                          r'is\s+(.*?);', IGNORECASE | DOTALL)
+    STRING = recompile(r'"([^"]*)"')
+    OPCODE = recompile(r'(\w+)\s*\(([^)]*)\)')
+    CELL = recompile(r'(\d+)\s*\(\s*(\w+)\s*,\s*([\w*]+(?:\s*\(\s*\d+\s*\))?)'
+                     r'\s*,\s*(\w+)\s*,\s*(\w+)\s*(?:,\s*(\d+)\s*,\s*(\d+)'
+                     r'\s*,\s*(\w+)\s*)?\)')
+
+    INPUT_FUNCTIONS = ('INPUT', 'CLOCK', 'BIDIR', 'OBSERVE_ONLY')
+    OUTPUT_FUNCTIONS = ('OUTPUT2', 'OUTPUT3', 'BIDIR')
+
+    def __init__(self, text: str):
+        # strip VHDL comments
+        text = '\n'.join(line.split('--', 1)[0] for line in text.splitlines())
+        entity = self.ENTITY.search(text)
+        if not entity:
+            raise BsdlError('No entity found')
+        self._entity = entity.group(1)
+        attributes = {}
+        for name, owner, value in self.ATTRIBUTE.findall(text):
+            if owner.lower() != self._entity.lower():
+                continue
+            strings = self.STRING.findall(value)
+            attributes[name.upper()] = (''.join(strings) if strings
+                                        else value.strip())
+        try:
+            self._ir_length = int(attributes['INSTRUCTION_LENGTH'])
+            self._boundary_length = int(attributes['BOUNDARY_LENGTH'])
+            opcodes = attributes['INSTRUCTION_OPCODE']
+            register = attributes['BOUNDARY_REGISTER']
+        except (KeyError, ValueError) as exc:
+            raise BsdlError('Missing or invalid attribute: %s' % exc)
+        self._instructions: Dict[str, int] = {}
+        for name, codes in self.OPCODE.findall(opcodes):
+            # when several opcodes are defined, use the first one
+            code = codes.split(',')[0].strip().upper().replace('X', '0')
+            if len(code) != self._ir_length:
+                raise BsdlError('Invalid opcode for %s' % name)
+            self._instructions[name.upper()] = int(code, 2)
+        self._idcode: Optional[Tuple[int, int]] = None
+        idcode = ''.join(attributes.get('IDCODE_REGISTER', '').split())
+        if idcode:
+            idcode = idcode.upper()
+            self._idcode = (int(idcode.replace('X', '0'), 2),
+                            int(''.join('0' if bit == 'X' else '1'
+                                        for bit in idcode), 2))
+        self._cells: List[Optional[BsdlCell]] = [None]*self._boundary_length
+        for (number, cell, port, function, safe, control, disval,
+             disres) in self.CELL.findall(register):
+            number = int(number)
+            if number >= self._boundary_length:
+                raise BsdlError('Invalid cell number %d' % number)
+            self._cells[number] = BsdlCell(
+                number, cell.upper(), ''.join(port.split()),
+                function.upper(), safe.upper(),
+                int(control) if control else None,
+                int(disval) if disval else None,
+                disres.upper() if disres else None)
+        self._pins: Dict[str, BsdlPin] = {}
+        for cell in self._cells:
+            if not cell or cell.port == '*':
+                continue
+            pin = self._pins.get(cell.port, BsdlPin(None, None, None))
+            if cell.function in self.INPUT_FUNCTIONS:
+                pin = pin._replace(input=cell.number)
+            if cell.function in self.OUTPUT_FUNCTIONS:
+                pin = pin._replace(output=cell.number, control=cell.control)
+            self._pins[cell.port] = pin
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Bsdl':
+        """Parse a BSDL file.
+
+           :param path: the path to the BSDL file
+           :return: the device description
+        """
+        with open(path, 'rt') as bfp:
+            return cls(bfp.read())
+
+    @property
+    def entity(self) -> str:
+        """Return the name of the device.
+
+           :return: the BSDL entity name
+        """
+        return self._entity
+
+    @property
+    def ir_length(self) -> int:
+        """Return the length of the instruction register.
+
+           :return: the count of instruction bits
+        """
+        return self._ir_length
+
+    @property
+    def boundary_length(self) -> int:
+        """Return the length of the boundary register.
+
+           :return: the count of boundary register cells
+        """
+        return self._boundary_length
+
+    @property
+    def idcode(self) -> Optional[Tuple[int, int]]:
+        """Return the device identifier.
+
+           :return: the identifier value and the mask of its defined bits,
+                    if any
+        """
+        return self._idcode
+
+    @property
+    def instructions(self) -> Dict[str, int]:
+        """Return the instructions of the device.
+
+           :return: a map of instruction names to opcodes
+        """
+        return dict(self._instructions)
+
+    @property
+    def cells(self) -> List[Optional[BsdlCell]]:
+        """Return the boundary register cells.
+
+           :return: the cells, in boundary register order
+        """
+        return list(self._cells)
+
+    @property
+    def pins(self) -> Dict[str, BsdlPin]:
+        """Return the cell map of the device ports.
+
+           :return: a map of port names to boundary register cells
+        """
+        return dict(self._pins)
+
+    def get_jtag_ir(self, name: str) -> BitSequence:
+        """Return the opcode of an instruction.
+
+           :param name: the instruction name, ``SAMPLE`` and ``PRELOAD``
+                        are used for one another if only one of them is
+                        defined
+           :return: the instruction bits
+        """
+        name = name.upper()
+        aliases = {'SAMPLE': 'PRELOAD', 'PRELOAD': 'SAMPLE'}
+        for alias in (name, aliases.get(name)):
+            if alias in self._instructions:
+                return BitSequence(self._instructions[alias],
+                                   length=self._ir_length)
+        raise BsdlError('Unknown instruction %s' % name)
+
+    def get_boundary_length(self) -> int:
+        """Return the length of the boundary register.
+
+           :return: the count of boundary register cells
+        """
+        return self._boundary_length
+
+    def match_idcode(self, idcode: int) -> bool:
+        """Tell whether a device identifier matches the description.
+
+           :param idcode: the device identifier
+           :return: True if the identifier matches
+        """
+        if not self._idcode:
+            return False
+        value, mask = self._idcode
+        return not (idcode ^ value) & mask
+
+
+class BsdlSampler:
+    """Boundary register sampler.
+
+       The SAMPLE instruction is loaded once, then the boundary register is
+       captured with back-to-back DR scans, queued so that many samples are
+       retrieved with each USB request. Captured samples are kept as
+       integral values, which are decoded into per-pin bitfields, or into
+       NumPy arrays if NumPy is available.
+
+       :param engine: a configured JTAG engine
+       :param bsdl: the description of the sampled device
+       :param device: the sampled device, for JTAG chains with several
+                      devices
+       :param batch_size: the count of captured bytes to queue before the
+                          queued scans are executed
+    """
+
+    DEFAULT_BATCH_SIZE = 1 << 16
+
+    def __init__(self, engine: JtagEngine, bsdl: Bsdl,
+                 device: Optional[JtagDevice] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self._engine = engine
+        self._bsdl = bsdl
+        self._device = device
+        self._length = bsdl.boundary_length
+        self._offset = device.dr_offset if device else 0
+        self._scan_length = self._length + (device.dr_padding if device
+                                            else 0)
+        self._batch = max(1, batch_size//((self._scan_length+7)//8))
+        self._count = 0
+        self._elapsed = 0.0
+
+    @property
+    def sample_rate(self) -> float:
+        """Return the achieved sample rate, including the USB overhead.
+
+           :return: the count of samples per second
+        """
+        return self._count/self._elapsed if self._elapsed else 0.0
+
+    def select(self) -> None:
+        """Load the SAMPLE instruction, if it is not already loaded."""
+        instruction = self._bsdl.get_jtag_ir('SAMPLE')
+        if self._device:
+            self._device.write_ir(instruction)
+        else:
+            self._engine.write_ir(instruction)
+
+    def sample(self, count: int = 1) -> List[int]:
+        """Capture the boundary register.
+
+           :param count: the count of samples to capture
+           :return: the captured boundary registers, cell 0 as the least
+                    significant bit
+        """
+        self.select()
+        queue = JtagQueue(self._engine)
+        offset = self._offset
+        mask = (1 << self._length)-1
+        samples = []
+        start = now()
+        for pos in range(0, count, self._batch):
+            scans = [queue.read_dr(self._scan_length, end_state='update_dr')
+                     for _ in range(min(self._batch, count-pos))]
+            queue.flush()
+            samples.extend((int(scan) >> offset) & mask for scan in scans)
+        self._elapsed += now()-start
+        self._count += count
+        return samples
+
+    def decode(self, samples: List[int],
+               pins: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Decode the level of device ports as bitfields.
+
+           :param samples: the captured boundary registers
+           :param pins: the names of the ports to decode, default to all
+                        the observable ports
+           :return: a map of port names to bitfields, where bit *n* is the
+                    level of the port in sample *n*
+        """
+        levels = {}
+        for pin, cell in self._get_cells(pins).items():
+            bits = bytes((sample >> cell) & 1 for sample in reversed(samples))
+            levels[pin] = int(bits.translate(b'01'.ljust(256, b'0')) or b'0',
+                              2)
+        return levels
+
+    def decode_array(self, samples: List[int],
+                     pins: Optional[Iterable[str]] = None) \
+            -> Dict[str, 'np.ndarray']:
+        """Decode the level of device ports as NumPy arrays.
+
+           :param samples: the captured boundary registers
+           :param pins: the names of the ports to decode, default to all
+                        the observable ports
+           :return: a map of port names to arrays of levels, one per sample
+        """
+        if np is None:
+            raise ImportError('NumPy is required to decode into arrays')
+        size = (self._length+7)//8
+        raw = np.frombuffer(b''.join(sample.to_bytes(size, 'little')
+                                     for sample in samples),
+                            dtype=np.uint8).reshape(len(samples), size)
+        bits = np.unpackbits(raw, axis=1, bitorder='little')
+        return {pin: bits[:, cell]
+                for pin, cell in self._get_cells(pins).items()}
+
+    def _get_cells(self, pins: Optional[Iterable[str]]) -> Dict[str, int]:
+        """Select the cell that captures the level of each port."""
+        pinmap = self._bsdl.pins
+        if pins is None:
+            pins = pinmap
+        cells = {}
+        for name in pins:
+            try:
+                pin = pinmap[name]
+            except KeyError:
+                raise BsdlError('Unknown pin %s' % name)
+            # output cells capture the level driven by the device
+            cell = pin.input if pin.input is not None else pin.output
+            if cell is None:
+                raise BsdlError('Pin %s cannot be observed' % name)
+            cells[name] = cell
+        return cells
@@ -27,11 +27,13 @@
 """FTDI core driver."""
 
 from binascii import hexlify
+from collections import namedtuple
 from errno import ENODEV
 from logging import getLogger
 from struct import unpack as sunpack
 from sys import platform
-from typing import Optional, List, Sequence, TextIO, Tuple, Union
+from time import perf_counter as now
+from typing import Dict, Optional, List, Sequence, TextIO, Tuple, Union
 from usb.core import (Configuration as UsbConfiguration, Device as UsbDevice,
                       USBError)
 from usb.util import (build_request_type, CTRL_IN, CTRL_OUT, CTRL_TYPE_VENDOR,
@@ -67,6 +69,25 @@ class FtdiEepromError(FtdiError):
     """FTDI EEPROM access errors"""
 
 
+FtdiStatistics = namedtuple('FtdiStatistics',
+                            'tx_bytes tx_packets rx_bytes rx_packets '
+                            'empty_packets line_status')
+"""Statistics of the USB traffic of an FTDI interface.
+
+   * ``tx_bytes`` and ``tx_packets`` are the counts of bytes and USB packets
+     written to the device,
+   * ``rx_bytes`` is the count of payload bytes read from the device, i.e.
+     without the modem status bytes,
+   * ``rx_packets`` is the count of USB packets read from the device,
+   * ``empty_packets`` is the count of USB packets which only contain the
+     modem status bytes, i.e. empty polls,
+   * ``line_status`` maps the name of each line status bit, as in
+     :py:meth:`Ftdi.decode_modem_status`, to the count of received packets
+     which have been flagged with it, e.g. ``overrun``, ``parity``,
+     ``framing`` or ``break``.
+"""
+
+
 class Ftdi:
     """FTDI device driver"""
 
@@ -291,6 +312,9 @@ class Ftdi:
     # EEPROM Properties
     EEPROM_SIZES = (128, 256) # in bytes (93C66 seen as 93C56)
 
+    # Modem status cache, default maximum age in seconds
+    MODEM_STATUS_MAX_AGE = 0.016
+
     def __init__(self):
         self.log = getLogger('pyftdi.ftdi')
         self.usb_dev = None
@@ -313,7 +337,11 @@ class Ftdi:
         self.latency_max = self.LATENCY_MAX
         self.latency_threshold = None  # disable dynamic latency
         self.lineprop = 0
+        self.modem_status_max_age = self.MODEM_STATUS_MAX_AGE
+        self._modem_status = 0
+        self._modem_status_time = 0.0
         self._tracer = None
+        self.reset_statistics()
 
     # --- Public API -------------------------------------------------------
 
@@ -527,6 +555,7 @@ class Ftdi:
             # Unfortunately, we need to access pyusb ResourceManager
             # and there is no public API for this.
             ctx = dev._ctx
+            self._modem_status_time = 0.0
             if ctx.handle:
                 # Do not attempt to execute the following calls if the
                 # device has been closed: the ResourceManager may attempt
@@ -703,7 +732,7 @@ class Ftdi:
         return frequency
 
     def open_bitbang_from_url(self, url: str, direction: int = 0x0,
-                              latency: int = 16) -> None:
+                              latency: int = 16, sync: bool = False) -> None:
         """Open a new interface to the specified FTDI device in bitbang mode.
 
            Bitbang enables direct read or write to FTDI GPIOs.
@@ -715,17 +744,19 @@ class Ftdi:
            :param initial: ignored
            :param latency: low-level latency to select the USB FTDI poll
                 delay. The shorter the delay, the higher the host CPU load.
+           :param sync: whether to use the synchronous bitbang mode, where
+                the pins are sampled each time a byte is written
         """
         devdesc, interface = self.get_identifiers(url)
         device = UsbTools.get_device(devdesc)
         self.open_bitbang_from_device(device, interface, direction=direction,
-                                      latency=latency)
+                                      latency=latency, sync=sync)
 
     def open_bitbang(self, vendor: int, product: int,
                      bus: Optional[int] = None, address: Optional[int] = None,
                      index: int = 0, serial: Optional[str] = None,
                      interface: int = 1, direction: int = 0x0,
-                     latency: int = 16) -> None:
+                     latency: int = 16, sync: bool = False) -> None:
         """Open a new interface to the specified FTDI device in bitbang mode.
 
            Bitbang enables direct read or write to FTDI GPIOs.
@@ -742,16 +773,19 @@ class Ftdi:
                 input
            :param latency: low-level latency to select the USB FTDI poll
                 delay. The shorter the delay, the higher the host CPU load.
+           :param sync: whether to use the synchronous bitbang mode, where
+                the pins are sampled each time a byte is written
         """
         devdesc = UsbDeviceDescriptor(vendor, product, bus, address, serial,
                                       index, None)
         device = UsbTools.get_device(devdesc)
         self.open_bitbang_from_device(device, interface, direction=direction,
-                                      latency=latency)
+                                      latency=latency, sync=sync)
 
     def open_bitbang_from_device(self, device: UsbDevice,
                                  interface: int = 1, direction: int = 0x0,
-                                 latency: int = 16) -> None:
+                                 latency: int = 16,
+                                 sync: bool = False) -> None:
         """Open a new interface to the specified FTDI device in bitbang mode.
 
            Bitbang enables direct read or write to FTDI GPIOs.
@@ -763,6 +797,8 @@ class Ftdi:
                 input
            :param latency: low-level latency to select the USB FTDI poll
                 delay. The shorter the delay, the higher the host CPU load.
+           :param sync: whether to use the synchronous bitbang mode, where
+                the pins are sampled each time a byte is written
         """
         self.open_from_device(device, interface)
         # Set latency timer
@@ -771,7 +807,8 @@ class Ftdi:
         self.write_data_set_chunksize(512)
         self.read_data_set_chunksize(512)
         # Enable BITBANG mode
-        self.set_bitmode(direction, Ftdi.BITMODE_BITBANG)
+        self.set_bitmode(direction, Ftdi.BITMODE_SYNCBB if sync else
+                         Ftdi.BITMODE_BITBANG)
         # Drain input buffer
         self.purge_buffers()
 
@@ -1136,8 +1173,33 @@ class Ftdi:
         if not value or len(value) != 2:
             raise FtdiError('Unable to get modem status')
         status, = sunpack('<H', value)
+        self._modem_status = status
+        self._modem_status_time = now()
         return status
 
+    def get_modem_status(self, max_age: Optional[float] = None) -> int:
+        """Report the modem status, avoiding a control request if possible.
+
+           The FTDI device prefixes each USB packet it sends on the bulk IN
+           endpoint with the two modem status bytes. The status bytes of the
+           latest packet are used if they are recent enough, otherwise the
+           status is polled with :py:meth:`poll_modem_status`.
+
+           Note that the line status bits, i.e. the upper byte, only report
+           the errors of the USB packet the status has been retrieved from.
+
+           :param max_age: the maximum age of the cached status in seconds,
+                           defaults to :py:attr:`modem_status_max_age`. Use
+                           0 to always poll the status.
+           :return: modem status, as a proprietary bitfield
+        """
+        if max_age is None:
+            max_age = self.modem_status_max_age
+        if max_age > 0 and self._modem_status_time and \
+                now()-self._modem_status_time <= max_age:
+            return self._modem_status
+        return self.poll_modem_status()
+
     def modem_status(self) -> Tuple[str]:
         """Provide the current modem status as a tuple of set signals
 
@@ -1694,12 +1756,38 @@ class Ftdi:
         """
         return bytes(self.read_data_bytes(size))
 
+    def read_data_packets(self) -> Tuple[bytes, int]:
+        """Read a single USB transfer from the FTDI interface, bypassing the
+           read buffer.
+
+           This is useful to stream data, as the line status of every USB
+           packet is reported, whereas :py:meth:`read_data_bytes` only checks
+           the status of the first packet of each transfer.
+
+           :return: the payload bytes, with the modem status bytes stripped
+                    out, and the line status bytes of all packets OR-ed
+                    together, i.e. the upper byte of the modem status
+        """
+        if not self.max_packet_size:
+            raise FtdiError("max_packet_size is bogus")
+        packet_size = self.max_packet_size
+        try:
+            data = self._read()
+        except USBError as ex:
+            raise FtdiError('UsbError: %s' % str(ex))
+        payload = bytearray()
+        status = 0
+        for pos in range(0, len(data)-1, packet_size):
+            status |= data[pos+1]
+            payload.extend(data[pos+2:pos+packet_size])
+        return bytes(payload), status
+
     def get_cts(self) -> bool:
         """Read terminal status line: Clear To Send
 
            :return: CTS line logical level
         """
-        status = self.poll_modem_status()
+        status = self.get_modem_status()
         return bool(status & self.MODEM_CTS)
 
     def get_dsr(self) -> bool:
@@ -1707,7 +1795,7 @@ class Ftdi:
 
            :return: DSR line logical level
         """
-        status = self.poll_modem_status()
+        status = self.get_modem_status()
         return bool(status & self.MODEM_DSR)
 
     def get_ri(self) -> bool:
@@ -1715,7 +1803,7 @@ class Ftdi:
 
            :return: RI line logical level
         """
-        status = self.poll_modem_status()
+        status = self.get_modem_status()
         return bool(status & self.MODEM_RI)
 
     def get_cd(self) -> bool:
@@ -1723,9 +1811,36 @@ class Ftdi:
 
            :return: CD line logical level
         """
-        status = self.poll_modem_status()
+        status = self.get_modem_status()
         return bool(status & self.MODEM_RLSD)
 
+    def statistics(self) -> FtdiStatistics:
+        """Report the statistics of the USB traffic since the last reset.
+
+           :return: a snapshot of the statistics
+        """
+        line_status: Dict[str, int] = {name: 0 for name
+                                       in self.MODEM_STATUS[1]}
+        for value, count in enumerate(self._line_status):
+            if not count:
+                continue
+            for bit, name in enumerate(self.MODEM_STATUS[1]):
+                if value & (1 << bit):
+                    line_status[name] += count
+        return FtdiStatistics(self._tx_bytes, self._tx_packets,
+                              self._rx_bytes, self._rx_packets,
+                              self._empty_packets, line_status)
+
+    def reset_statistics(self) -> None:
+        """Reset the statistics of the USB traffic."""
+        self._tx_bytes = 0
+        self._tx_packets = 0
+        self._rx_bytes = 0
+        self._rx_packets = 0
+        self._empty_packets = 0
+        # count of received packets for each line status byte value
+        self._line_status = [0] * 256
+
     def set_dynamic_latency(self, lmin: int, lmax: int,
                             threshold: int) -> None:
         """Set up or disable latency values.
@@ -1843,7 +1958,12 @@ class Ftdi:
             self.log.error('> (invalid output byte sequence)')
         if self._tracer:
             self._tracer.send(data)
-        return self.usb_dev.write(self.in_ep, data, self.usb_write_timeout)
+        length = self.usb_dev.write(self.in_ep, data, self.usb_write_timeout)
+        if length > 0:
+            packet_size = self.max_packet_size or length
+            self._tx_bytes += length
+            self._tx_packets += (length+packet_size-1)//packet_size
+        return length
 
     def _read(self) -> bytes:
         """Read from FTDI, using the API introduced with pyusb 1.0.0b2"""
@@ -1851,6 +1971,20 @@ class Ftdi:
                                  self.usb_read_timeout)
         if data:
             self.log.debug('< %s', hexlify(data).decode())
+            # the last packet holds the most recent modem status
+            packet_size = self.max_packet_size or len(data)
+            pos = (len(data)-1)//packet_size*packet_size
+            if len(data) >= pos+2:
+                self._modem_status = data[pos] | (data[pos+1] << 8)
+                self._modem_status_time = now()
+                if len(data) == pos+2:
+                    self._empty_packets += 1
+            packets = (len(data)+packet_size-1)//packet_size
+            self._rx_packets += packets
+            self._rx_bytes += max(0, len(data)-2*packets)
+            line_status = self._line_status
+            for value in data[1::packet_size]:
+                line_status[value] += 1
             if self._tracer and len(data) > 2:
                 self._tracer.receive(data[2:])
         return data
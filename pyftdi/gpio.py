@@ -26,8 +26,24 @@
 
 """GPIO/BitBang support for PyFdti"""
 
+from collections import namedtuple
+from logging import getLogger
+from math import gcd
+from queue import Empty, Full, Queue
 from struct import pack as spack
+from threading import Event, Lock, Thread
+from time import perf_counter as now
+from typing import (Callable, Dict, Iterator, List, Optional, Sequence,
+                    TextIO, Tuple, Union)
 from .ftdi import Ftdi
+from .mpsse import MpssePipeline
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#pylint: disable-msg=too-many-instance-attributes
 
 
 class GpioException(IOError):
@@ -35,6 +51,35 @@ class GpioException(IOError):
     """
 
 
+GpioEvent = namedtuple('GpioEvent', 'controller pins value timestamp')
+"""An edge event, reported by :py:class:`GpioWatcher`.
+
+   * ``controller`` is the GPIO controller of the pins
+   * ``pins`` is a bitfield of the pins that have changed
+   * ``value`` is the new level of these pins
+   * ``timestamp`` is the time of the detection, from ``perf_counter``
+"""
+
+
+def _to_samples(samples) -> memoryview:
+    """Convert GPIO samples into a byte view.
+
+       :param samples: a bytes-like object or a sequence of integers
+       :return: the samples
+    """
+    if isinstance(samples, (list, tuple)):
+        try:
+            samples = bytes(samples)
+        except ValueError:
+            raise GpioException('Samples should be 8-bit values')
+    view = memoryview(samples)
+    if view.itemsize != 1:
+        raise GpioException('Samples should be 8-bit values')
+    if not view.nbytes:
+        raise GpioException('No samples')
+    return view.cast('B')
+
+
 class GpioController:
     """GPIO controller for an FTDI port, in bit-bang legacy mode.
 
@@ -70,6 +115,8 @@ class GpioController:
            :param int direction: a bitfield specifying the FTDI GPIO direction,
                 where high level defines an output, and low level defines an
                 input
+           :param bool sync: whether to use the synchronous bitbang mode,
+                see :py:meth:`exchange`
         """
         for k in ('direction',):
             if k in kwargs:
@@ -140,7 +187,7 @@ class GpioController:
             raise GpioException("Invalid direction mask")
         self._direction &= ~pins
         self._direction |= (pins & direction)
-        self._ftdi.set_bitmode(self._direction, Ftdi.BITMODE_BITBANG)
+        self._ftdi.set_bitmode(self._direction, self._ftdi.bitmode)
 
     def read(self) -> int:
         """Read the GPIO input pin electrical level.
@@ -161,9 +208,1277 @@ class GpioController:
             raise GpioException('Not connected')
         if value > self.MASK:
             raise GpioException("Invalid value")
+        if self._ftdi.bitmode == Ftdi.BITMODE_SYNCBB:
+            # discard the sampled pins
+            self.exchange(spack('<B', value))
+            return
         self._ftdi.write_data(spack('<B', value))
 
+    def exchange(self, samples) -> bytes:
+        """Output samples and read back the pin levels, in synchronous
+           bitbang mode.
+
+           The FTDI device samples the pins right before it outputs each
+           byte, so one extra sample is written, which repeats the last
+           one: the response is aligned with the stimulus, i.e. each
+           response sample reports the pin levels once the matching stimulus
+           sample has been output.
+
+           Samples are written in blocks of half the RX FIFO size, and each
+           block is written before the response of the previous one is read
+           back, so that the FTDI device never waits for the host.
+
+           :param samples: the stimulus, as a bytes-like object or a
+                sequence of integers
+           :return: the response, one sample per stimulus sample
+        """
+        if not self.is_connected:
+            raise GpioException('Not connected')
+        if self._ftdi.bitmode != Ftdi.BITMODE_SYNCBB:
+            raise GpioException('Exchanges require the synchronous bitbang '
+                                'mode')
+        stimulus = bytearray(_to_samples(samples))
+        stimulus.append(stimulus[-1])
+        block_size = self._ftdi.fifo_sizes[1]//2
+        response = bytearray()
+        pending = []
+        for pos in range(0, len(stimulus), block_size):
+            block = stimulus[pos:pos+block_size]
+            self._ftdi.write_data(block)
+            pending.append(len(block))
+            if len(pending) > 1:
+                response.extend(self._read_samples(pending.pop(0)))
+        while pending:
+            response.extend(self._read_samples(pending.pop(0)))
+        return bytes(response[1:])
+
+    def play(self, samples, rate: float, loop: bool = False) -> 'GpioPlayer':
+        """Output a waveform, i.e. a sequence of GPIO samples clocked out at
+           the bitbang rate.
+
+           Without loop, the call returns once all the samples have been
+           written to the FTDI device. With loop, the samples are repeated
+           from a background thread, till :py:meth:`GpioPlayer.stop` is
+           called.
+
+           :param samples: a bytes-like object, such as bytes, an array or a
+                NumPy array of 8-bit values, or a sequence of integers
+           :param rate: the sample rate in Hz
+           :param loop: whether to repeat the samples
+           :return: the player, which reports the achieved sample rate and
+                the underruns
+        """
+        if not self.is_connected:
+            raise GpioException('Not connected')
+        if self._ftdi.bitmode != Ftdi.BITMODE_BITBANG:
+            raise GpioException('Waveforms require the bitbang mode')
+        player = GpioPlayer(self._ftdi, samples, rate, loop)
+        player.start()
+        return player
+
+    def capture(self, rate: float, duration: Optional[float] = None,
+                sample_count: Optional[int] = None,
+                sink=None) -> 'GpioCapture':
+        """Sample the GPIO pins at a fixed rate, as a logic analyzer.
+
+           All the pins are configured as inputs while the capture runs, and
+           the GPIO direction is restored once it completes.
+
+           :param rate: the sample rate in Hz
+           :param duration: the capture duration in seconds
+           :param sample_count: the count of samples to capture, rather than
+                a duration
+           :param sink: an object with a ``write`` method, such as a
+                :py:class:`GpioRingBuffer`, a memory-mapped file or a file
+                object, which receives the samples. If no sink is defined,
+                the samples are kept in :py:attr:`GpioCapture.samples`
+           :return: the capture, which reports the achieved sample rate and
+                the overruns
+        """
+        if not self.is_connected:
+            raise GpioException('Not connected')
+        if self._ftdi.bitmode != Ftdi.BITMODE_BITBANG:
+            raise GpioException('Captures require the bitbang mode')
+        if (duration is None) == (sample_count is None):
+            raise ValueError('Either a duration or a sample count is '
+                             'required')
+        if sample_count is None:
+            sample_count = int(round(duration*rate))
+        if sample_count <= 0:
+            raise ValueError('Invalid sample count')
+        try:
+            self._ftdi.set_bitmode(0, Ftdi.BITMODE_BITBANG)
+            capture = GpioCapture(self._ftdi, rate, sample_count, sink)
+            capture.run()
+        finally:
+            self._ftdi.set_bitmode(self._direction, Ftdi.BITMODE_BITBANG)
+        return capture
+
+    def _read_samples(self, size: int) -> bytes:
+        data = bytearray()
+        attempt = 4
+        while len(data) < size:
+            samples = self._ftdi.read_data_bytes(size-len(data), 4)
+            if not samples:
+                attempt -= 1
+                if not attempt:
+                    raise GpioException('Unable to read GPIO samples')
+            data.extend(samples)
+        return data
+
     # old API names
     open_from_url = configure
     read_port = read
     write_port = write
+
+
+class GpioPlayer:
+    """Stream GPIO samples to an FTDI port in asynchronous bitbang mode.
+
+       Players are created with :py:meth:`GpioController.play`.
+
+       Samples are written with chunked USB transfers, one FIFO block at a
+       time. The FTDI device does not report when its TX FIFO runs empty, so
+       underruns are detected on the host side, whenever the samples written
+       so far should have been played out before the next block is written.
+
+       In loop mode, a new waveform may be queued while the current one is
+       played: it replaces the current waveform at the end of its loop, so
+       that the output never stalls.
+
+       :param ftdi: the FTDI port, in bitbang mode
+       :param samples: the waveform samples
+       :param rate: the sample rate in Hz
+       :param loop: whether to repeat the samples
+    """
+
+    def __init__(self, ftdi: Ftdi, samples, rate: float, loop: bool):
+        self.log = getLogger('pyftdi.gpio')
+        self._ftdi = ftdi
+        self._samples = _to_samples(samples)
+        self._loop = loop
+        self._block_size = ftdi.fifo_sizes[0]
+        self._next: Optional[memoryview] = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._sample_count = 0
+        self._underruns = 0
+        self._time = 0.0
+        ftdi.set_baudrate(int(rate))
+        self._rate = ftdi.baudrate / Ftdi.BITBANG_CLOCK_MULTIPLIER
+
+    @property
+    def rate(self) -> float:
+        """Report the actual sample rate of the FTDI device.
+
+           :return: the sample rate in Hz
+        """
+        return self._rate
+
+    @property
+    def sample_count(self) -> int:
+        """Report how many samples have been written to the FTDI device.
+
+           :return: the count of samples
+        """
+        return self._sample_count
+
+    @property
+    def underruns(self) -> int:
+        """Report how many times the FTDI device has run out of samples.
+
+           :return: the count of underruns
+        """
+        return self._underruns
+
+    @property
+    def throughput(self) -> float:
+        """Report the achieved sample rate, which only matches the actual
+           rate of the device if no underrun occured.
+
+           :return: the count of samples per second
+        """
+        if not self._time:
+            return 0.0
+        return self._sample_count/self._time
+
+    @property
+    def is_playing(self) -> bool:
+        """Tell whether samples are still being written.
+
+           :return: True if the waveform has not been fully written
+        """
+        return bool(self._thread and self._thread.is_alive())
+
+    def start(self) -> None:
+        """Start writing the samples, from a background thread in loop
+           mode.
+        """
+        if not self._loop:
+            self._run()
+            return
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def queue(self, samples) -> None:
+        """Replace the waveform at the end of the current loop.
+
+           :param samples: the new waveform samples
+        """
+        if not self._loop:
+            raise GpioException('Waveform is not looping')
+        samples = _to_samples(samples)
+        with self._lock:
+            self._next = samples
+
+    def stop(self) -> None:
+        """Stop a looping waveform, at the end of the current block."""
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """Wait for the samples to be written.
+
+           :param timeout: the maximum time to wait, in seconds
+        """
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        start = now()
+        # the time at which the device started to play the current stream
+        origin = start
+        sent = 0
+        samples = self._samples
+        while not self._stop.is_set():
+            for pos in range(0, len(samples), self._block_size):
+                if self._stop.is_set():
+                    break
+                with self._lock:
+                    current = now()
+                    if sent and current > origin + sent/self._rate:
+                        self._underruns += 1
+                        origin = current - sent/self._rate
+                    block = bytes(samples[pos:pos+self._block_size])
+                    self._ftdi.write_data(block)
+                    sent += len(block)
+                    self._sample_count = sent
+                    self._time = now()-start
+            if not self._loop:
+                break
+            with self._lock:
+                if self._next is not None:
+                    samples, self._next = self._next, None
+        # account for the samples still buffered in the FTDI device
+        self._time = max(now(), origin + sent/self._rate) - start
+        if self._underruns:
+            self.log.warning('Waveform underruns: %d', self._underruns)
+
+
+
+class GpioPwm:
+    """Multi-channel PWM and pulse train generator, in bitbang mode.
+
+       Each channel drives a set of output pins with a square wave, whose
+       frequency, duty cycle and phase are rounded to the bitbang sample
+       rate. One period of the combined channels is computed into a sample
+       buffer, which is repeated by a looping :py:class:`GpioPlayer` from a
+       background thread, so that the output timing only depends on the
+       FTDI device clock.
+
+       Channel updates are staged, and only take effect on :py:meth:`apply`.
+       While the engine is running, the new pattern is queued to the player,
+       which swaps it in at the end of the current buffer, i.e. on a period
+       boundary of the previous pattern.
+
+       :param controller: the GPIO controller, in bitbang mode
+       :param rate: the bitbang sample rate in Hz
+    """
+
+    MAX_PERIOD = 1 << 16
+    """Maximum length of the combined period, in samples."""
+
+    def __init__(self, controller: GpioController, rate: float):
+        if not controller.is_connected:
+            raise GpioException('Not connected')
+        ftdi = controller.ftdi
+        if ftdi.bitmode != Ftdi.BITMODE_BITBANG:
+            raise GpioException('PWM requires the bitbang mode')
+        self._controller = controller
+        ftdi.set_baudrate(int(rate))
+        self._rate = ftdi.baudrate / Ftdi.BITBANG_CLOCK_MULTIPLIER
+        self._block_size = ftdi.fifo_sizes[0]
+        # output pins which are not driven by a channel keep their level
+        self._base = controller.read() & controller.direction
+        self._channels: Dict[int, Tuple[int, int, int]] = {}
+        self._staged: Dict[int, Tuple[int, int, int]] = {}
+        self._player: Optional[GpioPlayer] = None
+        self._period = 0
+
+    @property
+    def rate(self) -> float:
+        """Report the actual sample rate of the FTDI device.
+
+           :return: the sample rate in Hz
+        """
+        return self._rate
+
+    @property
+    def period(self) -> int:
+        """Report the length of the combined period of the applied channels.
+
+           :return: the count of samples
+        """
+        return self._period
+
+    @property
+    def channels(self) -> Dict[int, Tuple[float, float]]:
+        """Report the actual settings of the applied channels.
+
+           :return: a map of channel pins to their frequency in Hz and
+                their duty cycle
+        """
+        return {pins: (self._rate/period, high/period)
+                for pins, (period, high, _) in self._channels.items()}
+
+    @property
+    def is_running(self) -> bool:
+        """Tell whether the pattern is being output.
+
+           :return: True if running
+        """
+        return bool(self._player and self._player.is_playing)
+
+    @property
+    def underruns(self) -> int:
+        """Report how many times the FTDI device has run out of samples.
+
+           :return: the count of underruns
+        """
+        return self._player.underruns if self._player else 0
+
+    def set_channel(self, pins: int, frequency: float, duty: float = 0.5,
+                    phase: float = 0.0) -> None:
+        """Stage the settings of a channel.
+
+           :param pins: a bitfield of the output pins of the channel
+           :param frequency: the frequency in Hz
+           :param duty: the ratio of the period the pins are high, from 0
+                to 1
+           :param phase: the delay of the rising edge, as a ratio of the
+                period
+        """
+        if not pins or pins & ~self._controller.direction:
+            raise GpioException('Channel pins should be outputs')
+        for other in self._staged:
+            if other != pins and other & pins:
+                raise GpioException('Channels should not share pins')
+        if not 0.0 <= duty <= 1.0:
+            raise ValueError('Invalid duty cycle')
+        if not 0 < frequency <= self._rate/2:
+            raise ValueError('Invalid frequency')
+        period = int(round(self._rate/frequency))
+        high = int(round(duty*period))
+        shift = int(round((phase % 1.0)*period)) % period
+        self._staged[pins] = (period, high, shift)
+
+    def clear_channel(self, pins: int) -> None:
+        """Stage the removal of a channel, whose pins are driven low.
+
+           :param pins: the pins of the channel
+        """
+        if pins not in self._staged:
+            raise GpioException('Unknown channel')
+        del self._staged[pins]
+        self._base &= ~pins
+
+    def apply(self) -> None:
+        """Apply the staged channel settings.
+
+           If the engine is running, the new pattern replaces the current one
+           on a period boundary.
+        """
+        samples = self._build(self._staged)
+        self._channels = dict(self._staged)
+        if self._player:
+            self._player.queue(samples)
+
+    def start(self) -> None:
+        """Apply the staged channel settings, and start the output."""
+        if self.is_running:
+            raise GpioException('PWM is already running')
+        samples = self._build(self._staged)
+        self._channels = dict(self._staged)
+        self._player = self._controller.play(samples, self._rate, loop=True)
+
+    def stop(self) -> None:
+        """Stop the output, at the end of the current buffer block.
+
+           The pins keep the level of the last output sample.
+        """
+        if self._player:
+            self._player.stop()
+            self._player = None
+
+    def _build(self, channels: Dict[int, Tuple[int, int, int]]) -> bytes:
+        period = 1
+        for channel, _, _ in channels.values():
+            period = period*channel//gcd(period, channel)
+            if period > self.MAX_PERIOD:
+                raise GpioException('Channel periods do not fit in %d '
+                                    'samples' % self.MAX_PERIOD)
+        # the buffer spans at least a FIFO block, to write large transfers
+        length = period*max(1, -(-self._block_size//period))
+        value = int.from_bytes(bytes((self._base,))*length, 'little')
+        for pins, (channel, high, shift) in channels.items():
+            value &= ~int.from_bytes(bytes((pins,))*length, 'little')
+            wave = bytes((pins,))*high + bytes(channel-high)
+            wave = (wave[-shift:] + wave[:-shift]) if shift else wave
+            value |= int.from_bytes(wave*(length//channel), 'little')
+        self._period = period
+        return value.to_bytes(length, 'little')
+
+
+class GpioCapture:
+    """Capture the GPIO pins of an FTDI port in asynchronous bitbang mode.
+
+       Captures are created with :py:meth:`GpioController.capture`.
+
+       A reader thread drains the USB IN endpoint with large bulk transfers,
+       and hands the samples over to the calling thread, which feeds the
+       sink, so that a slow sink does not stall the USB reads. Overruns are
+       reported by the FTDI device in the line status of the USB packets,
+       whenever its RX FIFO has overflowed.
+
+       :param ftdi: the FTDI port, in bitbang mode
+       :param rate: the sample rate in Hz
+       :param sample_count: the count of samples to capture
+       :param sink: the sample sink, if any
+    """
+
+    QUEUE_DEPTH = 64
+    """Maximum count of USB transfers pending for the sink."""
+
+    TRANSFER_TIME = 0.02
+    """Time to fill a USB read transfer, in seconds."""
+
+    TIMEOUT = 1.0
+    """Extra time allowed to complete the capture, in seconds."""
+
+    def __init__(self, ftdi: Ftdi, rate: float, sample_count: int, sink):
+        self.log = getLogger('pyftdi.gpio')
+        self._ftdi = ftdi
+        self._count = sample_count
+        self._sink = sink
+        self._samples = bytearray() if sink is None else None
+        self._sample_count = 0
+        self._overruns = 0
+        self._time = 0.0
+        ftdi.set_baudrate(int(rate))
+        self._rate = ftdi.baudrate / Ftdi.BITBANG_CLOCK_MULTIPLIER
+
+    @property
+    def rate(self) -> float:
+        """Report the actual sample rate of the FTDI device.
+
+           :return: the sample rate in Hz
+        """
+        return self._rate
+
+    @property
+    def sample_count(self) -> int:
+        """Report how many samples have been captured.
+
+           :return: the count of samples
+        """
+        return self._sample_count
+
+    @property
+    def overruns(self) -> int:
+        """Report how many USB packets have been flagged with an overrun,
+           i.e. the samples are not contiguous.
+
+           :return: the count of flagged packets
+        """
+        return self._overruns
+
+    @property
+    def throughput(self) -> float:
+        """Report the achieved sample rate.
+
+           :return: the count of samples per second
+        """
+        if not self._time:
+            return 0.0
+        return self._sample_count/self._time
+
+    @property
+    def samples(self) -> Optional[bytes]:
+        """Return the captured samples, if no sink has been defined.
+
+           :return: the samples, or None
+        """
+        if self._samples is None:
+            return None
+        return bytes(self._samples)
+
+    def run(self) -> None:
+        """Capture the samples, and wait for the capture to complete."""
+        ftdi = self._ftdi
+        chunksize = ftdi.read_data_get_chunksize()
+        packet_size = ftdi.max_packet_size
+        # large enough transfers so that the host does not fall behind
+        transfer = int(self._rate*self.TRANSFER_TIME)
+        transfer = min(max(transfer, 4 << 10), 64 << 10)
+        ftdi.read_data_set_chunksize(
+            (transfer+packet_size-1)//packet_size*packet_size)
+        queue = Queue(self.QUEUE_DEPTH)
+        stop = Event()
+        reader = Thread(target=self._read, args=(queue, stop), daemon=True)
+        try:
+            ftdi.purge_rx_buffer()
+            start = now()
+            reader.start()
+            while True:
+                data = queue.get()
+                if data is None:
+                    break
+                if isinstance(data, Exception):
+                    raise data
+                if self._samples is not None:
+                    self._samples.extend(data)
+                else:
+                    self._sink.write(data)
+                self._sample_count += len(data)
+            self._time = now()-start
+        finally:
+            # the reader may be blocked on a full queue if the capture has
+            # been aborted
+            stop.set()
+            while reader.is_alive():
+                try:
+                    queue.get(timeout=self.TRANSFER_TIME)
+                except Empty:
+                    pass
+            reader.join()
+            ftdi.read_data_set_chunksize(chunksize)
+        if self._overruns:
+            self.log.warning('Capture overruns: %d', self._overruns)
+
+    def export_vcd(self, out: TextIO,
+                   names: Optional[Sequence[str]] = None) -> None:
+        """Export the captured samples as a Value Change Dump.
+
+           :param out: the output text stream
+           :param names: the names of the pins, from AD0
+        """
+        if self._samples is None:
+            raise GpioException('Samples are only kept without a sink')
+        self.write_vcd(out, self._samples, self._rate, names)
+
+    @classmethod
+    def write_vcd(cls, out: TextIO, samples, rate: float,
+                  names: Optional[Sequence[str]] = None) -> None:
+        """Write GPIO samples as a Value Change Dump.
+
+           :param out: the output text stream
+           :param samples: the 8-bit samples
+           :param rate: the sample rate in Hz
+           :param names: the names of the pins, from AD0
+        """
+        names = list(names or ['AD%d' % pin for pin in range(8)])[:8]
+        idents = [chr(ord('!')+pin) for pin in range(len(names))]
+        mask = (1 << len(names))-1
+        print('$version pyftdi $end', file=out)
+        print('$timescale 1 ns $end', file=out)
+        print('$scope module ftdi $end', file=out)
+        for ident, name in zip(idents, names):
+            print('$var wire 1 %s %s $end' % (ident, name), file=out)
+        print('$upscope $end', file=out)
+        print('$enddefinitions $end', file=out)
+        previous = None
+        for pos, sample in enumerate(memoryview(samples).cast('B')):
+            sample &= mask
+            if sample == previous:
+                continue
+            changes = mask if previous is None else sample ^ previous
+            print('#%d' % int(pos*1E9/rate), file=out)
+            for pin, ident in enumerate(idents):
+                if changes & (1 << pin):
+                    print('%d%s' % ((sample >> pin) & 1, ident), file=out)
+            previous = sample
+
+    def _read(self, queue: Queue, stop: Event) -> None:
+        deadline = now() + self._count/self._rate + self.TIMEOUT
+        remaining = self._count
+        try:
+            while remaining > 0:
+                if stop.is_set():
+                    return
+                data, status = self._ftdi.read_data_packets()
+                if status & (Ftdi.MODEM_OE >> 8):
+                    self._overruns += 1
+                if data:
+                    data = data[:remaining]
+                    remaining -= len(data)
+                    self._put(queue, stop, data)
+                elif now() > deadline:
+                    raise GpioException('Capture timed out')
+        except Exception as ex:  #pylint: disable-msg=broad-except
+            self._put(queue, stop, ex)
+            return
+        self._put(queue, stop, None)
+
+    def _put(self, queue: Queue, stop: Event, item) -> None:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=self.TRANSFER_TIME)
+                return
+            except Full:
+                pass
+
+
+class GpioRingBuffer:
+    """Capture sink which keeps the last samples, in a NumPy array if NumPy
+       is available.
+
+       :param size: the count of samples to keep
+    """
+
+    def __init__(self, size: int):
+        if size <= 0:
+            raise ValueError('Invalid size')
+        self._buffer = (np.zeros(size, dtype=np.uint8) if np else
+                        bytearray(size))
+        self._size = size
+        self._pos = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def samples(self):
+        """Return the samples, from the oldest one.
+
+           :return: a NumPy array if NumPy is available, bytes otherwise
+        """
+        if self._count < self._size:
+            data = self._buffer[:self._count]
+        elif np:
+            data = np.concatenate((self._buffer[self._pos:],
+                                   self._buffer[:self._pos]))
+        else:
+            data = self._buffer[self._pos:] + self._buffer[:self._pos]
+        return data.copy() if np else bytes(data)
+
+    def write(self, data) -> int:
+        """Append samples, dropping the oldest ones.
+
+           :param data: the 8-bit samples
+           :return: the count of written samples
+        """
+        src = np.frombuffer(data, dtype=np.uint8) if np else memoryview(data)
+        length = len(src)
+        if length >= self._size:
+            self._buffer[:] = src[length-self._size:]
+            self._pos = 0
+        else:
+            first = min(length, self._size-self._pos)
+            self._buffer[self._pos:self._pos+first] = src[:first]
+            self._buffer[:length-first] = src[first:]
+            self._pos = (self._pos+length) % self._size
+        self._count = min(self._count+length, self._size)
+        return length
+
+
+class GpioMpsseController(GpioController):
+    """GPIO controller for an FTDI port, in MPSSE mode.
+
+       All the pins of the port may be used as GPIOs, i.e. 16 pins with
+       FT232H and FT2232H, 8 pins with FT4232H. Each :py:meth:`read` is a
+       single USB round trip, rather than a control request.
+
+       Sequences of writes, reads and delays may be built with
+       :py:class:`GpioMpsseSequence`, and executed as a single MPSSE command
+       stream with :py:meth:`execute`. Delays are generated with MPSSE clock
+       cycles, so they do not depend on the USB latency. Note that AD0 outputs
+       the MPSSE clock during delays, if it is configured as an output.
+    """
+
+    DEFAULT_FREQUENCY = 6.0E6
+
+    def __init__(self):
+        super().__init__()
+        self._out = 0
+        self._width = 0
+        self._mask = 0
+        self._frequency = 0.0
+        self._pipe = MpssePipeline(self._ftdi, GpioException)
+
+    def configure(self, url, direction=0, initial=0,
+                  frequency=DEFAULT_FREQUENCY, **kwargs):
+        """Open a new interface to the specified FTDI device in MPSSE mode.
+
+           :param str url: a FTDI URL selector
+           :param int direction: a bitfield specifying the FTDI GPIO direction,
+                where high level defines an output, and low level defines an
+                input
+           :param int initial: a bitfield specifying the initial output value
+           :param float frequency: the MPSSE clock frequency, which defines
+                the resolution of the delays
+        """
+        try:
+            self._frequency = self._ftdi.open_mpsse_from_url(
+                url, direction=direction, initial=initial,
+                frequency=frequency, **kwargs)
+        except IOError as ex:
+            raise GpioException('Unable to open USB port: %s' % str(ex))
+        self._width = self._ftdi.port_width
+        self._mask = (1 << self._width) - 1
+        self._direction = direction & self._mask
+        self._out = initial & self._mask
+        self._pipe.configure()
+
+    @property
+    def pins(self) -> int:
+        """Report the configured GPIOs as a bitfield.
+
+           :return: all the pins of the port
+        """
+        return self._mask
+
+    @property
+    def all_pins(self) -> int:
+        """Report the addressable GPIOs as a bitfield.
+
+           :return: all the pins of the port
+        """
+        return self._mask
+
+    @property
+    def width(self) -> int:
+        """Report the FTDI count of addressable pins.
+
+           :return: 16 for wide ports, 8 otherwise
+        """
+        return self._width
+
+    @property
+    def frequency(self) -> float:
+        """Return the actual MPSSE clock frequency.
+
+           :return: the frequency in Hz
+        """
+        return self._frequency
+
+    def set_direction(self, pins: int, direction: int) -> None:
+        """Update the GPIO pin direction.
+
+           :param pins: which GPIO pins should be reconfigured
+           :param direction: a bitfield of GPIO pins. Each bit represent a
+                GPIO pin, where a high level sets the pin as output and a low
+                level sets the pin as input/high-Z.
+        """
+        if direction > self._mask:
+            raise GpioException("Invalid direction mask")
+        sequence = GpioMpsseSequence(self)
+        sequence.set_direction(pins, direction)
+        self.execute(sequence)
+
+    def read(self) -> int:
+        """Read the GPIO input pin electrical level.
+
+           :return: a bitfield of GPIO pins. Each bit represent a GPIO
+                pin, matching the logical input level of the pin.
+        """
+        sequence = GpioMpsseSequence(self)
+        sequence.read()
+        return self.execute(sequence)[0]
+
+    def write(self, value: int) -> None:
+        """Set the GPIO output pin electrical level.
+
+           :param int value: a bitfield of GPIO pins.
+        """
+        sequence = GpioMpsseSequence(self)
+        sequence.write(value)
+        self.execute(sequence)
+
+    def execute(self, sequence: 'GpioMpsseSequence') -> List[int]:
+        """Execute a sequence of GPIO writes, reads and delays.
+
+           The MPSSE commands are sent so that the read values always fit
+           into the FTDI FIFO, and the next commands are sent before the
+           current values are read back, so that the sequence does not
+           stall in between.
+
+           :param sequence: the sequence to execute
+           :return: the read values, in sequence order
+        """
+        if not self.is_connected:
+            raise GpioException('Not connected')
+        data = self._pipe.transfer(
+            sequence.build_segments(self._pipe.chunk_size, self._out,
+                                    self._direction))
+        self._out, self._direction = sequence.final_state(self._out,
+                                                          self._direction)
+        if self._width > 8:
+            return [data[pos] | (data[pos+1] << 8)
+                    for pos in range(0, len(data), 2)]
+        return list(data)
+
+    # old API names
+    open_from_url = configure
+    read_port = read
+    write_port = write
+
+
+class GpioMpsseSequence:
+    """A sequence of GPIO writes, reads and delays.
+
+       The sequence is built once, then executed with
+       :py:meth:`GpioMpsseController.execute` as many times as required.
+       Only the GPIO bytes whose output level or direction change are
+       updated. The pins the sequence does not set keep the output level
+       and direction the controller has when the sequence is executed.
+
+       :param controller: the MPSSE GPIO controller
+    """
+
+    MAX_CLOCK_BYTES = 1 << 16
+
+    def __init__(self, controller: GpioMpsseController):
+        self._width = controller.width
+        self._mask = controller.pins
+        self._frequency = controller.frequency
+        self._bit_delay = controller.ftdi.mpsse_bit_delay
+        # output and direction bits set by the sequence, and their masks
+        self._out = 0
+        self._out_mask = 0
+        self._direction = 0
+        self._dir_mask = 0
+        # MPSSE commands, or GPIO byte updates which are resolved against
+        # the controller state on execution
+        self._steps: List[Tuple[Union[bytes, Tuple[int, ...]], int]] = []
+        self._read_count = 0
+        self._duration = 0.0
+
+    @property
+    def read_count(self) -> int:
+        """Report how many values the sequence reads.
+
+           :return: the count of reads
+        """
+        return self._read_count
+
+    @property
+    def duration(self) -> float:
+        """Report the minimum time the sequence lasts, on the GPIO side.
+
+           :return: the duration in seconds
+        """
+        return self._duration
+
+    def final_state(self, out: int, direction: int) -> Tuple[int, int]:
+        """Report the GPIO output levels and direction once the sequence has
+           been executed.
+
+           :param out: the output levels before the execution
+           :param direction: the direction before the execution
+           :return: the output levels and the direction bitfields
+        """
+        return ((out & ~self._out_mask) | self._out,
+                (direction & ~self._dir_mask) | self._direction)
+
+    def write(self, value: int) -> None:
+        """Set the GPIO output pin electrical level.
+
+           :param value: a bitfield of GPIO pins
+        """
+        if value > self._mask:
+            raise GpioException("Invalid value")
+        self._update(value, self._mask, 0, 0)
+
+    def set_direction(self, pins: int, direction: int) -> None:
+        """Update the GPIO pin direction.
+
+           :param pins: which GPIO pins should be reconfigured
+           :param direction: a bitfield of GPIO pins, where a high level sets
+                the pin as output and a low level as input
+        """
+        if direction > self._mask:
+            raise GpioException("Invalid direction mask")
+        self._update(0, 0, direction & pins, pins & self._mask)
+
+    def read(self) -> int:
+        """Read the GPIO pin electrical level.
+
+           :return: the position of the read value in the list returned by
+                    :py:meth:`GpioMpsseController.execute`
+        """
+        if self._width > 8:
+            self._steps.append((bytes((Ftdi.GET_BITS_LOW,
+                                       Ftdi.GET_BITS_HIGH)), 2))
+            self._duration += 2*self._bit_delay
+        else:
+            self._steps.append((bytes((Ftdi.GET_BITS_LOW,)), 1))
+            self._duration += self._bit_delay
+        self._read_count += 1
+        return self._read_count-1
+
+    def delay(self, delay: float) -> None:
+        """Wait before executing the next step.
+
+           :param delay: the delay in seconds, rounded to the closest count
+                of MPSSE clock cycles
+        """
+        cycles = int(round(delay*self._frequency))
+        if cycles < 0:
+            raise ValueError('Invalid delay')
+        byte_count, bit_count = divmod(cycles, 8)
+        cmd = bytearray()
+        while byte_count:
+            count = min(byte_count, self.MAX_CLOCK_BYTES)
+            cmd.extend((Ftdi.CLK_BYTES_NO_DATA, (count-1) & 0xff,
+                        (count-1) >> 8))
+            byte_count -= count
+        if bit_count:
+            cmd.extend((Ftdi.CLK_BITS_NO_DATA, bit_count-1))
+        if cmd:
+            self._steps.append((bytes(cmd), 0))
+            self._duration += cycles/self._frequency
+
+    def build_segments(self, chunk_size: int, out: int = 0,
+                       direction: int = 0) \
+            -> Iterator[Tuple[bytearray, int]]:
+        """Group the MPSSE commands into segments whose read values fit into
+           a FIFO chunk.
+
+           :param chunk_size: the maximum count of bytes to read back per
+                              segment
+           :param out: the output levels of the controller, for the pins
+                       the sequence does not set
+           :param direction: the direction of the controller, for the pins
+                             the sequence does not set
+           :return: a generator of (segment, read byte count) tuples
+        """
+        segment = bytearray()
+        size = 0
+        for cmd, rsize in self._steps:
+            if isinstance(cmd, tuple):
+                code, shift, value, vmask, dir_, dmask = cmd
+                cmd = (code,
+                       (((out >> shift) & ~vmask) | value) & 0xff,
+                       (((direction >> shift) & ~dmask) | dir_) & 0xff)
+            if size and size+rsize > chunk_size:
+                segment.append(Ftdi.SEND_IMMEDIATE)
+                yield segment, size
+                segment = bytearray()
+                size = 0
+            segment.extend(cmd)
+            size += rsize
+        if segment:
+            if size:
+                segment.append(Ftdi.SEND_IMMEDIATE)
+            yield segment, size
+
+    def _update(self, out: int, out_mask: int, direction: int,
+                dir_mask: int) -> None:
+        new_out = (self._out & ~out_mask) | out
+        new_out_mask = self._out_mask | out_mask
+        new_dir = (self._direction & ~dir_mask) | direction
+        new_dir_mask = self._dir_mask | dir_mask
+        # bits which are set for the first time, or with another value
+        changes = ((new_out_mask ^ self._out_mask) |
+                   (new_dir_mask ^ self._dir_mask) |
+                   (new_out ^ self._out) | (new_dir ^ self._direction))
+        for shift, code in ((0, Ftdi.SET_BITS_LOW), (8, Ftdi.SET_BITS_HIGH)):
+            if shift >= self._width:
+                break
+            if not changes & (0xff << shift):
+                continue
+            # the bits the sequence has not set are only known on execution
+            self._steps.append(((code, shift,
+                                 (new_out >> shift) & 0xff,
+                                 (new_out_mask >> shift) & 0xff,
+                                 (new_dir >> shift) & 0xff,
+                                 (new_dir_mask >> shift) & 0xff), 0))
+            self._duration += self._bit_delay
+        self._out, self._out_mask = new_out, new_out_mask
+        self._direction, self._dir_mask = new_dir, new_dir_mask
+
+
+class GpioWatcher:
+    """Watch the input pins of one or more GPIO controllers, and report their
+       edges, from a single polling thread.
+
+       Each controller is read once per poll, whatever the count of pin
+       subscriptions it serves. The poll interval adapts to the activity:
+       it is reset to ``min_interval`` whenever a watched pin changes, then
+       doubled after each idle poll up to ``max_interval``, which bounds the
+       edge detection latency of an idle watcher.
+
+       Edges are either reported to the subscription callback, from the
+       polling thread, or queued, to be retrieved with
+       :py:meth:`get_event`.
+
+       The controllers should not be used from another thread while they are
+       watched, unless the caller serializes the accesses with
+       :py:attr:`lock`.
+
+       :param min_interval: the poll interval while pins are active, in
+            seconds
+       :param max_interval: the poll interval while pins are idle, in
+            seconds
+    """
+
+    RISING = 0x1
+    """Report low to high transitions."""
+
+    FALLING = 0x2
+    """Report high to low transitions."""
+
+    BOTH = RISING | FALLING
+    """Report all transitions."""
+
+    def __init__(self, min_interval: float = 1.0E-3,
+                 max_interval: float = 50.0E-3):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError('Invalid poll intervals')
+        self.log = getLogger('pyftdi.gpio')
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._interval = min_interval
+        self._subscriptions: Dict[GpioController,
+                                  List['_GpioSubscription']] = {}
+        self._events = Queue()
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._error: Optional[Exception] = None
+        self._poll_count = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def lock(self) -> Lock:
+        """Return the lock held while the controllers are polled.
+
+           :return: the lock
+        """
+        return self._lock
+
+    @property
+    def interval(self) -> float:
+        """Report the current poll interval.
+
+           :return: the interval in seconds
+        """
+        return self._interval
+
+    @property
+    def poll_count(self) -> int:
+        """Report how many times the controllers have been polled.
+
+           :return: the count of polls
+        """
+        return self._poll_count
+
+    @property
+    def is_running(self) -> bool:
+        """Tell whether the polling thread is running.
+
+           :return: True if pins are watched
+        """
+        return bool(self._thread and self._thread.is_alive())
+
+    def watch(self, controller: GpioController, pins: int,
+              callback: Optional[Callable[[GpioEvent], None]] = None,
+              edge: int = BOTH, debounce: float = 0.0) -> object:
+        """Subscribe to the edges of some input pins.
+
+           :param controller: the GPIO controller of the pins
+           :param pins: a bitfield of the pins to watch
+           :param callback: the function called with each :py:data:`GpioEvent`,
+                from the polling thread. Events are queued if no callback is
+                defined.
+           :param edge: which transitions to report, a combination of
+                :py:attr:`RISING` and :py:attr:`FALLING`
+           :param debounce: how long a pin should keep its new level before
+                the edge is reported, in seconds
+           :return: the subscription handle, to be used with
+                :py:meth:`unwatch`
+        """
+        if not controller.is_connected:
+            raise GpioException('Not connected')
+        if not pins or pins & ~controller.all_pins:
+            raise GpioException('Invalid pins')
+        if not edge or edge & ~self.BOTH:
+            raise ValueError('Invalid edge')
+        if debounce < 0:
+            raise ValueError('Invalid debounce time')
+        with self._lock:
+            level = controller.read() & pins
+            subscription = _GpioSubscription(controller, pins, callback, edge,
+                                             debounce, level)
+            self._subscriptions.setdefault(controller, []).append(
+                subscription)
+            self._interval = self._min_interval
+        self._wakeup.set()
+        return subscription
+
+    def unwatch(self, subscription: object) -> None:
+        """Cancel a subscription.
+
+           :param subscription: the handle returned by :py:meth:`watch`
+        """
+        with self._lock:
+            for controller, subscriptions in self._subscriptions.items():
+                if subscription in subscriptions:
+                    subscriptions.remove(subscription)
+                    if not subscriptions:
+                        del self._subscriptions[controller]
+                    return
+        raise ValueError('Unknown subscription')
+
+    def get_event(self, timeout: Optional[float] = None) \
+            -> Optional[GpioEvent]:
+        """Retrieve the next queued event.
+
+           :param timeout: the maximum time to wait, in seconds, or None to
+                wait forever
+           :return: the event, or None on timeout
+        """
+        try:
+            return self._events.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def start(self) -> None:
+        """Start the polling thread."""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._error = None
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the polling thread.
+
+           If the polling thread has been aborted on an error, the error is
+           raised again.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._error:
+            error, self._error = self._error, None
+            raise error
+
+    def poll(self) -> bool:
+        """Poll the controllers once, and report the edges.
+
+           This method is called from the polling thread, but may also be
+           called directly if no thread is started.
+
+           :return: True if any watched pin has changed
+        """
+        events = []
+        active = False
+        with self._lock:
+            self._poll_count += 1
+            for controller, subscriptions in self._subscriptions.items():
+                value = controller.read()
+                timestamp = now()
+                for subscription in subscriptions:
+                    changed, pending = subscription.update(value, timestamp)
+                    active |= pending
+                    if changed:
+                        events.append((subscription,
+                                       GpioEvent(controller, changed,
+                                                 value & changed,
+                                                 timestamp)))
+        for subscription, event in events:
+            if subscription.callback:
+                subscription.callback(event)
+            else:
+                self._events.put(event)
+        return active
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                if self.poll():
+                    self._interval = self._min_interval
+                else:
+                    self._interval = min(self._interval*2, self._max_interval)
+                self._wakeup.wait(self._interval)
+                self._wakeup.clear()
+        except Exception as ex:  #pylint: disable-msg=broad-except
+            self.log.error('GPIO watcher aborted: %s', ex)
+            self._error = ex
+
+
+class _GpioSubscription:
+    """Debouncing state of watched pins."""
+
+    def __init__(self, controller: GpioController, pins: int,
+                 callback: Optional[Callable[[GpioEvent], None]], edge: int,
+                 debounce: float, level: int):
+        self.controller = controller
+        self.pins = pins
+        self.callback = callback
+        self.edge = edge
+        self.debounce = debounce
+        # the reported level, and the last sampled level
+        self._state = level
+        self._level = level
+        # the time at which each pending pin has reached its current level
+        self._stamps: Dict[int, float] = {}
+
+    def update(self, value: int, timestamp: float) -> Tuple[int, bool]:
+        """Update the pin levels.
+
+           :param value: the current level of the controller pins
+           :param timestamp: the time of the sample
+           :return: the pins whose edge should be reported, and whether
+                any pin is still changing
+        """
+        level = value & self.pins
+        toggled = level ^ self._level
+        self._level = level
+        diff = level ^ self._state
+        if not diff and not self._stamps:
+            return 0, bool(toggled)
+        stamps = self._stamps
+        ready = 0
+        for pin in list(stamps):
+            if not diff & pin or toggled & pin:
+                # glitch: the pin is back to its reported level, or its
+                # debouncing restarts
+                del stamps[pin]
+        bits = diff
+        while bits:
+            pin = bits & -bits
+            bits &= ~pin
+            since = stamps.setdefault(pin, timestamp)
+            if timestamp-since >= self.debounce:
+                ready |= pin
+                del stamps[pin]
+        self._state ^= ready
+        changed = ready & (self._state if self.edge & GpioWatcher.RISING
+                           else 0)
+        changed |= ready & (~self._state if self.edge & GpioWatcher.FALLING
+                            else 0)
+        return changed, bool(toggled or stamps)
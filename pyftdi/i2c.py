@@ -26,11 +26,13 @@
 """I2C support for PyFdti"""
 
 from binascii import hexlify
-from collections import namedtuple
+from collections import deque, namedtuple
 from logging import getLogger
 from struct import calcsize as scalc, pack as spack, unpack as sunpack
-from threading import Lock
-from typing import Any, Iterable, Mapping, Optional, Tuple, Union
+from threading import Condition, Event, Lock, Thread
+from time import perf_counter as now
+from typing import (Any, Callable, Iterable, List, Mapping, Optional,
+                    Sequence, Tuple, Union)
 from usb.core import Device as UsbDevice
 from .ftdi import Ftdi, FtdiFeatureError
 
@@ -221,6 +223,52 @@ class I2cPort:
             self._address+self._shift if start else None,
             fmt, mask, value, count, relax=relax)
 
+    def poll_batch(self, count: int, write: bool = False, batch: int = 0,
+                   relax: bool = True) -> Optional[int]:
+        """Poll a remote slave till it acknowledges its address, queuing
+           several poll cycles in each USB request.
+
+           :param count: maximum poll cycle count
+           :param write: poll in write mode (vs. read)
+           :param batch: maximum count of poll cycles per USB request, or
+                         0 to pack as many cycles as the FTDI FIFOs can hold
+           :param relax: whether to relax the bus (emit STOP) or not
+           :return: the index of the first acknowledged poll cycle, or None
+                    if the slave never acknowledged
+        """
+        return self._controller.poll_batch(
+            self._address+self._shift, count, write, batch, relax=relax)
+
+    def poll_cond_batch(self, width: int, mask: int, value: int, count: int,
+                        batch: int = 0, relax: bool = True) \
+            -> Optional[Tuple[bytes, int]]:
+        """Poll a remote slave, watching for condition to satisfy, queuing
+           several poll cycles in each USB request.
+
+           See :py:meth:`I2cController.poll_cond_batch`.
+
+           :param width: count of bytes to poll for the condition check,
+                that is the size of the condition register
+           :param mask: binary mask to apply on the condition register
+                before testing for the value
+           :param value: value to test the masked condition register
+                against. Condition is satisfied when register & mask == value
+           :param count: maximum poll cycle count
+           :param batch: maximum count of poll cycles per USB request, or
+                         0 to pack as many cycles as the FTDI FIFOs can hold
+           :param relax: whether to relax the bus (emit STOP) or not
+           :return: a 2-tuple of the polled register value and the index of
+                    the poll cycle that fulfilled the condition, or None if
+                    the condition has not been fulfilled
+        """
+        try:
+            fmt = ''.join((self._endian, self.FORMATS[width]))
+        except KeyError:
+            raise I2cIOError('Unsupported integer width')
+        return self._controller.poll_cond_batch(
+            self._address+self._shift, fmt, mask, value, count, batch,
+            relax=relax)
+
     def flush(self) -> None:
         """Force the flush of the HW FIFOs.
         """
@@ -387,6 +435,10 @@ class I2cController:
     I2C_400K = I2CTimings(0.6E-6, 0.6E-6, 0.6E-6, 1.3E-6)
     I2C_1M = I2CTimings(0.26E-6, 0.26E-6, 0.26E-6, 0.5E-6)
 
+    I2C_PROFILES = ((100E3, I2C_100K), (400E3, I2C_400K), (1E6, I2C_1M))
+    """Standard, fast and fast-plus mode timings, with their nominal bus
+       frequency."""
+
     def __init__(self):
         self._ftdi = Ftdi()
         self._lock = Lock()
@@ -400,12 +452,12 @@ class I2cController:
         self._slaves = {}
         self._retry_count = self.RETRY_COUNT
         self._frequency = 0.0
-        self._immediate = (Ftdi.SEND_IMMEDIATE,)
-        self._read_bit = (Ftdi.READ_BITS_PVE_MSB, 0)
-        self._read_byte = (Ftdi.READ_BYTES_PVE_MSB, 0, 0)
-        self._write_byte = (Ftdi.WRITE_BYTES_NVE_MSB, 0, 0)
-        self._nack = (Ftdi.WRITE_BITS_NVE_MSB, 0, self.HIGH)
-        self._ack = (Ftdi.WRITE_BITS_NVE_MSB, 0, self.LOW)
+        self._immediate = bytes((Ftdi.SEND_IMMEDIATE,))
+        self._read_bit = bytes((Ftdi.READ_BITS_PVE_MSB, 0))
+        self._read_byte = bytes((Ftdi.READ_BYTES_PVE_MSB, 0, 0))
+        self._write_byte = bytes((Ftdi.WRITE_BYTES_NVE_MSB, 0, 0))
+        self._nack = bytes((Ftdi.WRITE_BITS_NVE_MSB, 0, self.HIGH))
+        self._ack = bytes((Ftdi.WRITE_BITS_NVE_MSB, 0, self.LOW))
         self._ck_delay = 1
         self._fake_tristate = False
         self._tx_size = 1
@@ -413,6 +465,22 @@ class I2cController:
         self._ck_hd_sta = 0
         self._ck_su_sto = 0
         self._ck_idle = 0
+        self._timings = self.I2C_100K
+        self._xfer_start = None
+        self._xfer_bytes = 0
+        self._xfer_time = 0.0
+        # pre-built MPSSE command sequences, see _build_sequences()
+        self._data_lo = b''
+        self._clk_lo_data_hi = b''
+        self._clk_lo_data_input = b''
+        self._clk_lo_data_lo = b''
+        self._idle = b''
+        self._start = b''
+        self._stop = b''
+        self._read_ack = b''
+        self._check_ack = b''
+        self._read_not_last = b''
+        self._read_last = b''
 
     def set_retry_count(self, count: int) -> None:
         """Change the default retry count when a communication error occurs,
@@ -423,6 +491,14 @@ class I2cController:
             raise ValueError('Invalid retry count')
         self._retry_count = count
 
+    @property
+    def retry_count(self) -> int:
+        """Report the default retry count when a communication error occurs.
+
+           :return: count of retries
+        """
+        return self._retry_count
+
     def configure(self, url: Union[str, UsbDevice],
                   **kwargs: Mapping[str, Any]) -> None:
         """Configure the FTDI interface as a I2c master.
@@ -453,13 +529,9 @@ class I2cController:
             del kwargs['frequency']
         else:
             frequency = self.DEFAULT_BUS_FREQUENCY
-        # Fix frequency for 3-phase clock
-        if frequency <= 100E3:
-            timings = self.I2C_100K
-        elif frequency <= 400E3:
-            timings = self.I2C_100K
-        else:
-            timings = self.I2C_100K
+        for nominal, timings in self.I2C_PROFILES:
+            if frequency <= nominal:
+                break
         if 'clockstretching' in kwargs:
             clkstrch = bool(kwargs['clockstretching'])
             del kwargs['clockstretching']
@@ -483,12 +555,6 @@ class I2cController:
         else:
             interface = 1
         with self._lock:
-            self._ck_hd_sta = self._compute_delay_cycles(timings.t_hd_sta)
-            self._ck_su_sto = self._compute_delay_cycles(timings.t_su_sto)
-            ck_su_sta = self._compute_delay_cycles(timings.t_su_sta)
-            ck_buf = self._compute_delay_cycles(timings.t_buf)
-            self._ck_idle = max(ck_su_sta, ck_buf)
-            self._ck_delay = ck_buf
             if clkstrch:
                 self._i2c_mask = self.I2C_MASK_CS
             else:
@@ -508,6 +574,9 @@ class I2cController:
             else:
                 frequency = self._ftdi.open_mpsse_from_url(url, **kwargs)
             self._frequency = (2.0*frequency)/3.0
+            self._set_timings(timings, nominal)
+            self._xfer_bytes = 0
+            self._xfer_time = 0.0
             self._tx_size, self._rx_size = self._ftdi.fifo_sizes
             self._ftdi.enable_adaptive_clock(clkstrch)
             self._ftdi.enable_3phase_clock(True)
@@ -523,6 +592,7 @@ class I2cController:
             self._wide_port = self._ftdi.has_wide_port
             if not self._wide_port:
                 self._set_gpio_direction(8, io_out & 0xFF, io_dir & 0xFF)
+            self._build_sequences()
 
     def terminate(self) -> None:
         """Close the FTDI interface.
@@ -601,6 +671,29 @@ class I2cController:
         """
         return self._frequency
 
+    @property
+    def timings(self) -> I2CTimings:
+        """Provides the I2C bus condition timings in use.
+
+           :return: the START/STOP hold and setup timings, in seconds
+        """
+        return self._timings
+
+    @property
+    def throughput(self) -> float:
+        """Provides the effective I2C payload throughput, as achieved by the
+           read and write requests since the controller has been configured.
+
+           Time is accounted from the start to the end of each I2C
+           transaction, so that bus conditions, slave addressing and USB
+           latency are taken into account.
+
+           :return: the payload throughput in bytes per second
+        """
+        if not self._xfer_time:
+            return 0.0
+        return self._xfer_bytes/self._xfer_time
+
     @property
     def direction(self) -> int:
         """Provide the FTDI pin direction
@@ -863,6 +956,99 @@ class I2cController:
                 if do_epilog:
                     self._do_epilog()
 
+    def poll_batch(self, address: int, count: int, write: bool = False,
+                   batch: int = 0, relax: bool = True) -> Optional[int]:
+        """Poll a remote slave till it acknowledges its address, queuing
+           several poll cycles in each USB request.
+
+           This is the typical way to wait for an EEPROM device to complete
+           its write cycle. Rather than waiting for the MPSSE engine to
+           report the ACK/NACK status of each poll cycle, up to ``batch``
+           poll cycles are emitted at once, each of them starting with a
+           (repeated) start condition, and the ACK/NACK statuses are
+           evaluated on the host once the whole response has been received.
+           In read mode, a single byte is read back and NACKed on each
+           acknowledged cycle so that the slave releases the bus.
+
+           Poll cycles that have been queued after the first acknowledged
+           one are still emitted on the bus, and their status is discarded.
+
+           If relax is set, this method releases the I2C bus however it leaves.
+
+           :param address: the address on the I2C bus
+           :param count: maximum poll cycle count
+           :param write: poll in write mode (vs. read)
+           :param batch: maximum count of poll cycles per USB request, or
+                         0 to pack as many cycles as the FTDI FIFOs can hold
+           :param relax: whether to relax the bus (emit STOP) or not
+           :return: the index of the first acknowledged poll cycle, or None
+                    if the slave never acknowledged
+        """
+        i2caddress = self._get_batch_address(address, not write)
+        cycle = bytearray(self._build_address_phase(i2caddress))
+        if not write:
+            cycle.extend(self._read_last)
+        result = self._poll_batch(cycle, 0 if write else 1, count, batch,
+                                  None, relax)
+        if result is None:
+            return None
+        return result[1]
+
+    def poll_cond_batch(self, address: int, fmt: str, mask: int, value: int,
+                        count: int, batch: int = 0, relax: bool = True) \
+            -> Optional[Tuple[bytes, int]]:
+        """Poll a remote slave, watching for condition to satisfy, queuing
+           several poll cycles in each USB request.
+
+           This method is the batched flavour of :py:meth:`poll_cond`: rather
+           than waiting for each poll cycle to complete before emitting the
+           next one, up to ``batch`` poll cycles are emitted at once, each of
+           them starting with a repeated start condition followed with the
+           read-out of the condition register. The condition is evaluated on
+           the host once the whole response has been received. A poll cycle
+           that is not acknowledged by the slave does not fulfill the
+           condition.
+
+           Poll cycles that have been queued after the first matching one are
+           still emitted on the bus, and their results are discarded.
+
+           If relax is set, this method releases the I2C bus however it leaves.
+
+           :param address: the address on the I2C bus
+           :param fmt: struct format for poll register
+           :param mask: binary mask to apply on the condition register
+                before testing for the value
+           :param value: value to test the masked condition register
+                against. Condition is satisfied when register & mask == value
+           :param count: maximum poll cycle count
+           :param batch: maximum count of poll cycles per USB request, or
+                         0 to pack as many cycles as the FTDI FIFOs can hold
+           :param relax: whether to relax the bus (emit STOP) or not
+           :return: a 2-tuple of the polled register value and the index of
+                    the poll cycle that fulfilled the condition, or None if
+                    the condition has not been fulfilled
+        """
+        i2caddress = self._get_batch_address(address, True)
+        size = scalc(fmt)
+        if not size:
+            raise I2cIOError('Invalid poll register format')
+        cycle = bytearray(self._build_address_phase(i2caddress))
+        cycle.extend(self._read_not_last * (size-1))
+        cycle.extend(self._read_last)
+
+        def match(data: bytes) -> bool:
+            cond, = sunpack(fmt, data)
+            if (cond & mask) == value:
+                return True
+            self.log.debug('Poll condition not fulfilled: %x/%x',
+                           cond & mask, value)
+            return False
+
+        result = self._poll_batch(cycle, size, count, batch, match, relax)
+        if result is None:
+            self.log.warning('Poll condition failed')
+        return result
+
     def flush(self) -> None:
         """Flush the HW FIFOs.
         """
@@ -901,6 +1087,7 @@ class I2cController:
             data |= value
             self._write_raw(data, use_high)
             self._gpio_low = data & 0xFF & ~self._i2c_mask
+            self._build_sequences()
 
     def set_gpio_direction(self, pins: int, direction: int) -> None:
         """Change the direction of the GPIO pins.
@@ -923,47 +1110,84 @@ class I2cController:
         self._gpio_dir &= ~pins
         self._gpio_dir |= (pins & direction)
         self._gpio_mask = gpio_mask & pins
+        self._build_sequences()
 
-    @property
-    def _data_lo(self) -> Tuple[int]:
-        return (Ftdi.SET_BITS_LOW,
-                self.SCL_BIT | self._gpio_low,
-                self.I2C_DIR | (self._gpio_dir & 0xFF))
-
-    @property
-    def _clk_lo_data_hi(self) -> Tuple[int]:
-        return (Ftdi.SET_BITS_LOW,
-                self.SDA_O_BIT | self._gpio_low,
-                self.I2C_DIR | (self._gpio_dir & 0xFF))
-
-    @property
-    def _clk_lo_data_input(self) -> Tuple[int]:
-        return (Ftdi.SET_BITS_LOW,
-                self.LOW | self._gpio_low,
-                self.SCL_BIT | (self._gpio_dir & 0xFF))
-
-    @property
-    def _clk_lo_data_lo(self) -> Tuple[int]:
-        return (Ftdi.SET_BITS_LOW,
-                self._gpio_low,
-                self.I2C_DIR | (self._gpio_dir & 0xFF))
+    def _build_sequences(self) -> None:
+        """Build the MPSSE command sequences used to emit I2C bus conditions.
 
-    @property
-    def _idle(self) -> Tuple[int]:
-        return (Ftdi.SET_BITS_LOW,
-                self.I2C_DIR | self._gpio_low,
-                self.I2C_DIR | (self._gpio_dir & 0xFF))
-
-    @property
-    def _start(self) -> Tuple[int]:
-        return self._data_lo * self._ck_hd_sta + \
-               self._clk_lo_data_lo * self._ck_hd_sta
-
-    @property
-    def _stop(self) -> Tuple[int]:
-        return self._clk_lo_data_hi * self._ck_hd_sta + \
-               self._data_lo * self._ck_su_sto + \
-               self._idle * self._ck_idle
+           These sequences only depend on the bus timings, the GPIO output
+           and direction, and the tristate emulation mode, so they are only
+           rebuilt whenever one of those settings is changed, rather than on
+           each I2C transaction.
+        """
+        gpio_dir = self._gpio_dir & 0xFF
+        gpio_low = self._gpio_low
+        self._data_lo = bytes((Ftdi.SET_BITS_LOW,
+                               self.SCL_BIT | gpio_low,
+                               self.I2C_DIR | gpio_dir))
+        self._clk_lo_data_hi = bytes((Ftdi.SET_BITS_LOW,
+                                      self.SDA_O_BIT | gpio_low,
+                                      self.I2C_DIR | gpio_dir))
+        self._clk_lo_data_input = bytes((Ftdi.SET_BITS_LOW,
+                                         self.LOW | gpio_low,
+                                         self.SCL_BIT | gpio_dir))
+        self._clk_lo_data_lo = bytes((Ftdi.SET_BITS_LOW,
+                                      gpio_low,
+                                      self.I2C_DIR | gpio_dir))
+        self._idle = bytes((Ftdi.SET_BITS_LOW,
+                            self.I2C_DIR | gpio_low,
+                            self.I2C_DIR | gpio_dir))
+        self._start = (self._data_lo * self._ck_hd_sta +
+                       self._clk_lo_data_lo * self._ck_hd_sta)
+        self._stop = (self._clk_lo_data_hi * self._ck_hd_sta +
+                      self._data_lo * self._ck_su_sto +
+                      self._idle * self._ck_idle)
+        if self._fake_tristate:
+            # SCL low, SDA high-Z (input), read SDA (ack from slave), then
+            # leave SCL low, restore SDA as output
+            self._read_ack = (self._clk_lo_data_input +
+                              self._read_bit +
+                              self._clk_lo_data_hi)
+            read_byte = (self._clk_lo_data_input +
+                         self._read_byte +
+                         self._clk_lo_data_hi)
+            self._read_not_last = (read_byte + self._ack +
+                                   self._clk_lo_data_lo * self._ck_delay)
+            self._read_last = (read_byte + self._nack +
+                               self._clk_lo_data_hi * self._ck_delay)
+        else:
+            # SCL low, SDA high-Z, read SDA (ack from slave)
+            self._read_ack = self._clk_lo_data_hi + self._read_bit
+            self._read_not_last = (self._read_byte + self._ack +
+                                   self._clk_lo_data_hi * self._ck_delay)
+            self._read_last = (self._read_byte + self._nack +
+                               self._clk_lo_data_hi * self._ck_delay)
+        self._check_ack = self._read_ack + self._immediate
+
+    def _set_timings(self, timings: I2CTimings, nominal: float) -> None:
+        """Compute the count of delay cycles required to emit the I2C bus
+           conditions.
+
+           Profile timings are minimum values for the nominal bus frequency of
+           each I2C mode. When the actual bus frequency is lower, the timings
+           are stretched in proportion, so that bus conditions remain in line
+           with the SCL clock period.
+
+           :param timings: the I2C mode timings
+           :param nominal: the nominal bus frequency of the I2C mode
+        """
+        ratio = max(1.0, nominal/self._frequency) if self._frequency else 1.0
+        timings = I2CTimings(*[value*ratio for value in timings])
+        self._timings = timings
+        self._ck_hd_sta = self._compute_delay_cycles(timings.t_hd_sta)
+        self._ck_su_sto = self._compute_delay_cycles(timings.t_su_sto)
+        ck_su_sta = self._compute_delay_cycles(timings.t_su_sta)
+        ck_buf = self._compute_delay_cycles(timings.t_buf)
+        self._ck_idle = max(ck_su_sta, ck_buf)
+        self._ck_delay = ck_buf
+        self.log.debug('I2C timings: hd_sta %d, su_sto %d, idle %d, '
+                       'delay %d cycles', self._ck_hd_sta, self._ck_su_sto,
+                       self._ck_idle, self._ck_delay)
 
     def _compute_delay_cycles(self, value: Union[int, float]) -> int:
         # approx ceiling without relying on math module
@@ -1003,6 +1227,8 @@ class I2cController:
         self._ftdi.write_data(cmd)
 
     def _do_prolog(self, i2caddress: int) -> None:
+        if self._xfer_start is None:
+            self._xfer_start = now()
         if i2caddress is None:
             return
         self.log.debug('   prolog 0x%x', i2caddress >> 1)
@@ -1016,28 +1242,228 @@ class I2cController:
             self.log.warning('NACK @ 0x%02x', (i2caddress>>1))
             raise
 
+    def _get_batch_address(self, address: int, read: bool) -> int:
+        if not self.configured:
+            raise I2cIOError("FTDI controller not initialized")
+        if address is None:
+            raise I2cIOError('Batched poll requires a slave address')
+        self.validate_address(address)
+        i2caddress = (address << 1) & self.HIGH
+        if read:
+            i2caddress |= self.BIT0
+        return i2caddress
+
+    def _build_address_phase(self, i2caddress: int) -> bytes:
+        return b''.join((self._idle, self._start, self._write_byte,
+                         bytes((i2caddress,)), self._read_ack))
+
+    def _poll_batch(self, cycle: bytes, size: int, count: int, batch: int,
+                    match: Optional[Callable[[bytes], bool]],
+                    relax: bool) -> Optional[Tuple[bytes, int]]:
+        """Emit batches of poll cycles, and report the first acknowledged
+           cycle whose data, if any, fulfills the match condition.
+
+           :param cycle: the MPSSE command sequence of a single poll cycle
+           :param size: the count of data bytes read back on each cycle
+           :param count: maximum poll cycle count
+           :param batch: maximum count of poll cycles per USB request
+           :param match: optional condition to evaluate on read back data
+           :param relax: whether to relax the bus (emit STOP) or not
+           :return: a 2-tuple of the read back data and the cycle index
+        """
+        if count < 1 or batch < 0:
+            raise ValueError('Invalid poll count')
+        resp_size = 1 + size
+        # keep room for the 'send immediate' command and the status bytes
+        max_batch = min((self._tx_size-1) // len(cycle),
+                        (self._rx_size-2) // resp_size)
+        if batch:
+            max_batch = min(batch, max_batch)
+        if max_batch < 1:
+            raise I2cIOError('Poll cycle does not fit into FTDI FIFOs')
+        do_epilog = True
+        with self._lock:
+            try:
+                index = 0
+                while index < count:
+                    cycles = min(max_batch, count-index)
+                    cmd = bytearray(cycle * cycles)
+                    cmd.extend(self._immediate)
+                    self._ftdi.write_data(cmd)
+                    buf = self._ftdi.read_data_bytes(cycles*resp_size, 4)
+                    if len(buf) != cycles*resp_size:
+                        raise I2cIOError('No answer from FTDI')
+                    for pos in range(0, len(buf), resp_size):
+                        data = bytes(buf[pos+1:pos+resp_size])
+                        if buf[pos] & self.BIT0:
+                            self.log.debug('Poll cycle %d: NACK', index)
+                        elif not match or match(data):
+                            self.log.debug('Poll cycle %d: matched', index)
+                            do_epilog = relax
+                            return data, index
+                        index += 1
+                        if index >= count:
+                            break
+                return None
+            finally:
+                if do_epilog:
+                    self._do_epilog()
+
+    def transaction_sizes(self, outlen: int,
+                          readlen: int) -> Tuple[int, int]:
+        """Compute the sizes of the MPSSE command and response streams of a
+           write and/or read transaction, see :py:meth:`run_transactions`.
+
+           :param outlen: count of bytes to write
+           :param readlen: count of bytes to read
+           :return: a 2-tuple of the command and response sizes, in bytes
+        """
+        address_size = (len(self._idle) + len(self._start) +
+                        len(self._write_byte) + 1 + len(self._read_ack))
+        cmd_size = len(self._stop)
+        resp_size = 0
+        if outlen:
+            cmd_size += address_size
+            cmd_size += outlen*(len(self._write_byte) + 1 +
+                                len(self._read_ack))
+            resp_size += 1 + outlen
+        if readlen:
+            cmd_size += address_size
+            cmd_size += (len(self._read_not_last)*(readlen-1) +
+                         len(self._read_last))
+            resp_size += 1 + readlen
+        return cmd_size, resp_size
+
+    def can_batch(self, cmd_size: int, resp_size: int) -> bool:
+        """Tell whether MPSSE command and response streams fit into the
+           FTDI FIFOs, so that they may be sent as a single USB request.
+
+           :param cmd_size: size of the command stream, in bytes
+           :param resp_size: size of the response stream, in bytes
+           :return: True if the streams fit into the FIFOs
+        """
+        # keep room for the 'send immediate' command and the status bytes
+        return cmd_size <= self._tx_size-1 and resp_size <= self._rx_size-2
+
+    def run_transaction(self, address: int, out: bytes,
+                        readlen: int) -> Optional[bytes]:
+        """Execute a write and/or read transaction, without retrying on NACK,
+           and release the bus.
+
+           :param address: the address on the I2C bus
+           :param out: the byte buffer to send, if any
+           :param readlen: count of bytes to read out, if any
+           :return: read bytes, if any
+           :raise I2cNackError: if the slave did not acknowledge
+        """
+        i2caddress = (address << 1) & self.HIGH
+        with self._lock:
+            try:
+                if out:
+                    self._do_prolog(i2caddress)
+                    self._do_write(out)
+                if readlen:
+                    self._do_prolog(i2caddress | self.BIT0)
+                    return self._do_read(readlen)
+                return None
+            finally:
+                self._do_epilog()
+
+    def run_transactions(self, transactions: Sequence[Tuple[int, bytes,
+                                                           int]]) \
+            -> List[Union[bytes, None, I2cNackError]]:
+        """Execute several write and/or read transactions in a single USB
+           request, and release the bus after each transaction.
+
+           ACK/NACK statuses of write transactions are only checked once all
+           the transactions have been executed, so that a NACKed write is
+           not aborted. The address phase of a read transaction is checked
+           before its data bytes are clocked in, which splits the USB
+           request, so that a NACKed read is aborted.
+
+           :param transactions: a sequence of (address, out, readlen) tuples
+           :return: for each transaction, the read bytes if any, or the
+                    NACK error if the transaction has not been acknowledged
+        """
+        cmd = bytearray()
+        resp_size = 0
+        buf = bytearray()
+        do_epilog = True
+        with self._lock:
+            try:
+                for address, out, readlen in transactions:
+                    i2caddress = (address << 1) & self.HIGH
+                    if out:
+                        cmd.extend(self._build_address_phase(i2caddress))
+                        for byte in out:
+                            cmd.extend(self._write_byte)
+                            cmd.append(byte)
+                            cmd.extend(self._read_ack)
+                        resp_size += 1 + len(out)
+                    if readlen:
+                        cmd.extend(self._build_address_phase(
+                            i2caddress | self.BIT0))
+                        buf.extend(self._exchange_batch(cmd, resp_size+1))
+                        cmd = bytearray()
+                        resp_size = 0
+                        if not buf[-1] & self.BIT0:
+                            cmd.extend(self._read_not_last * (readlen-1))
+                            cmd.extend(self._read_last)
+                            resp_size += readlen
+                    cmd.extend(self._stop)
+                buf.extend(self._exchange_batch(cmd, resp_size))
+                # each transaction has released the bus
+                do_epilog = False
+            finally:
+                if do_epilog:
+                    self._do_epilog()
+        results = []
+        pos = 0
+        for address, out, readlen in transactions:
+            acks = []
+            if out:
+                acks.extend(buf[pos:pos+1+len(out)])
+                pos += 1 + len(out)
+            data = None
+            if readlen:
+                acks.append(buf[pos])
+                pos += 1
+                if not buf[pos-1] & self.BIT0:
+                    data = bytes(buf[pos:pos+readlen])
+                    pos += readlen
+            if any(ack & self.BIT0 for ack in acks):
+                self.log.warning('NACK @ 0x%02x', address)
+                results.append(I2cNackError('NACK from slave'))
+                continue
+            self._xfer_bytes += len(out) + readlen
+            results.append(data)
+        return results
+
+    def _exchange_batch(self, cmd: bytearray, resp_size: int) -> bytes:
+        # lock should be held
+        start = now()
+        if resp_size:
+            cmd.extend(self._immediate)
+        self._ftdi.write_data(cmd)
+        buf = self._ftdi.read_data_bytes(resp_size, 4) if resp_size else b''
+        if len(buf) != resp_size:
+            raise I2cIOError('No answer from FTDI')
+        self._xfer_time += now()-start
+        return buf
+
     def _do_epilog(self) -> None:
         self.log.debug('   epilog')
         cmd = bytearray(self._stop)
         self._ftdi.write_data(cmd)
         # be sure to purge the MPSSE reply
         self._ftdi.read_data_bytes(1, 1)
+        if self._xfer_start is not None:
+            self._xfer_time += now()-self._xfer_start
+            self._xfer_start = None
 
     def _send_check_ack(self, cmd: bytearray):
         # note: cmd is modified
-        if self._fake_tristate:
-            # SCL low, SDA high-Z (input)
-            cmd.extend(self._clk_lo_data_input)
-            # read SDA (ack from slave)
-            cmd.extend(self._read_bit)
-            # leave SCL low, restore SDA as output
-            cmd.extend(self._clk_lo_data_hi)
-        else:
-            # SCL low, SDA high-Z
-            cmd.extend(self._clk_lo_data_hi)
-            # read SDA (ack from slave)
-            cmd.extend(self._read_bit)
-        cmd.extend(self._immediate)
+        cmd.extend(self._check_ack)
         self._ftdi.write_data(cmd)
         ack = self._ftdi.read_data_bytes(1, 4)
         if not ack:
@@ -1054,19 +1480,8 @@ class I2cController:
             self._ftdi.write_data(cmd)
             self._ftdi.read_data_bytes(0, 4)
             return bytearray()
-        if self._fake_tristate:
-            read_byte = (self._clk_lo_data_input +
-                         self._read_byte +
-                         self._clk_lo_data_hi)
-            read_not_last = (read_byte + self._ack +
-                             self._clk_lo_data_lo * self._ck_delay)
-            read_last = (read_byte + self._nack +
-                         self._clk_lo_data_hi * self._ck_delay)
-        else:
-            read_not_last = (self._read_byte + self._ack +
-                             self._clk_lo_data_hi * self._ck_delay)
-            read_last = (self._read_byte + self._nack +
-                         self._clk_lo_data_hi * self._ck_delay)
+        read_not_last = self._read_not_last
+        read_last = self._read_last
         # maximum RX size to fit in FTDI FIFO, minus 2 status bytes
         chunk_size = self._rx_size-2
         cmd_size = len(read_last)
@@ -1095,6 +1510,7 @@ class I2cController:
                            len(buf), hexlify(buf).decode())
             chunks.append(buf)
             rem -= size
+        self._xfer_bytes += readlen
         return bytearray(b''.join(chunks))
 
     def _do_write(self, out: Union[bytes, bytearray, Iterable[int]]):
@@ -1108,3 +1524,490 @@ class I2cController:
             cmd = bytearray(self._write_byte)
             cmd.append(byte)
             self._send_check_ack(cmd)
+        self._xfer_bytes += len(out)
+
+
+I2cSchedulerStats = namedtuple('I2cSchedulerStats',
+                               'depth max_depth count retries batched '
+                               'avg_wait max_wait p99_wait')
+"""Statistics of the transactions queued for an I2C slave.
+
+   * ``depth`` is the count of pending transactions,
+   * ``max_depth`` is the maximum count of pending transactions,
+   * ``count`` is the count of completed transactions,
+   * ``retries`` is the count of transactions re-queued on NACK,
+   * ``batched`` is the count of transaction executions that shared a USB
+     request with other transactions,
+   * ``avg_wait``, ``max_wait`` and ``p99_wait`` are the average, maximum and
+     99th percentile times in seconds the callers have been waiting for their
+     transactions to complete, from submission to completion.
+"""
+
+
+class I2cTransaction:
+    """A queued I2C transaction.
+
+       Transactions are created and executed by :py:class:`I2cScheduler`.
+
+       :param address: the address on the I2C bus
+       :param out: the bytes to write, if any
+       :param readlen: the count of bytes to read, if any
+       :param call: a controller request to execute, in place of the
+                    write and read phases
+       :param retries: how many times the transaction may be executed
+    """
+
+    def __init__(self, address: int, out: bytes = b'', readlen: int = 0,
+                 call: Optional[Callable[[], Any]] = None, retries: int = 1):
+        self.address = address
+        self.out = out
+        self.readlen = readlen
+        self.call = call
+        self.retries = retries
+        self.submitted = now()
+        self.result = None
+        self.error = None
+        self._done = Event()
+
+    @property
+    def done(self) -> bool:
+        """Tell whether the transaction has been completed."""
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Wait for the transaction to complete.
+
+           :param timeout: the maximum time to wait for, in seconds
+           :return: the transaction result, if any
+           :raise I2cTimeoutError: if the transaction is not completed in time
+        """
+        if not self._done.wait(timeout):
+            raise I2cTimeoutError('I2C transaction not completed')
+        if self.error:
+            raise self.error
+        return self.result
+
+    def complete(self, result: Any = None,
+                 error: Optional[Exception] = None) -> None:
+        """Complete the transaction and wake up the waiting caller."""
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class I2cScheduler:
+    """Fair scheduler for I2C transactions, to share an I2C controller
+       between several threads.
+
+       Transactions are queued per slave, and executed by a worker thread, one
+       transaction per slave at a time. Slaves are either served in turn
+       (round-robin policy) or by decreasing priority, slaves of equal
+       priority being served in turn (priority policy).
+
+       A transaction that is not acknowledged by its slave is put back in
+       front of the transactions pending for this slave, so that the
+       transactions of a slave are always executed in order, but it is not
+       retried immediately: the other slaves are served first, so that a
+       busy slave cannot starve them.
+
+       When coalescing is enabled, several pending transactions are packed
+       into a single USB request, as long as they fit into the FTDI FIFOs, and
+       their ACK/NACK statuses are checked once the whole request has been
+       completed. Note that in this mode, a write transaction which is not
+       acknowledged by its slave is not aborted till its end, although the
+       remaining bytes are ignored by the slave. The address phase of a read
+       transaction is always checked before its bytes are read out.
+
+       Scheduled transactions always release the I2C bus when they complete.
+
+       Example:
+
+       >>> ctrl = I2cController()
+       >>> ctrl.configure('ftdi://ftdi:232h/1')
+       >>> scheduler = I2cScheduler(ctrl, I2cScheduler.PRIORITY)
+       >>> scheduler.set_priority(0x21, 1)
+       >>> # may be used from any thread
+       >>> i2c = scheduler.get_port(0x21)
+       >>> out = i2c.exchange([0x12, 0x34], 2)
+       >>> scheduler.terminate()
+
+       :param controller: the I2C controller to share
+       :param policy: the scheduling policy
+       :param coalesce: whether to pack several transactions into a single
+                        USB request
+       :param retry_count: how many times a NACKed transaction is executed
+                           before reporting an error, default to the
+                           controller setting
+    """
+
+    ROUND_ROBIN = 'round-robin'
+    """Serve the slaves in turn."""
+
+    PRIORITY = 'priority'
+    """Serve the slaves by decreasing priority."""
+
+    WAIT_SAMPLES = 1000
+    """Count of wait times kept per slave to compute the percentiles."""
+
+    def __init__(self, controller: I2cController,
+                 policy: str = ROUND_ROBIN, coalesce: bool = True,
+                 retry_count: Optional[int] = None):
+        if policy not in (self.ROUND_ROBIN, self.PRIORITY):
+            raise ValueError(f'Unsupported policy: {policy}')
+        self.log = getLogger('pyftdi.i2c.scheduler')
+        self._controller = controller
+        self._policy = policy
+        self._coalesce = coalesce
+        self._retry_count = (controller.retry_count if retry_count is None
+                             else retry_count)
+        if self._retry_count < 1:
+            raise ValueError('Invalid retry count')
+        self._cond = Condition()
+        self._queues = {}
+        self._priorities = {}
+        self._order = []
+        self._next = 0
+        self._stats = {}
+        self._worker = None
+        self._running = False
+
+    def terminate(self) -> None:
+        """Complete the pending transactions and stop the worker thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+            worker, self._worker = self._worker, None
+        if worker:
+            worker.join()
+
+    def set_priority(self, address: int, priority: int) -> None:
+        """Change the priority of a slave, for the priority policy.
+
+           :param address: the address on the I2C bus
+           :param priority: the priority, higher values are served first
+        """
+        I2cController.validate_address(address)
+        with self._cond:
+            self._get_queue(address)
+            self._priorities[address] = priority
+
+    def get_port(self, address: int) -> I2cPort:
+        """Obtain an I2cPort to drive an I2C slave, whose requests are
+           queued into the scheduler.
+
+           :param address: the address on the I2C bus
+           :return: an I2cPort instance
+        """
+        I2cController.validate_address(address)
+        return I2cPort(self, address)
+
+    @property
+    def configured(self) -> bool:
+        """Test whether the shared controller is configured."""
+        return self._controller.configured
+
+    @property
+    def frequency(self) -> float:
+        """Provides the current I2C clock frequency in Hz."""
+        return self._controller.frequency
+
+    @property
+    def statistics(self) -> Mapping[int, I2cSchedulerStats]:
+        """Report the statistics of the transactions queued for each slave.
+
+           :return: a map of slave statistics, indexed by slave address
+        """
+        with self._cond:
+            return {address: self._get_stats(address)
+                    for address in self._queues}
+
+    def reset_statistics(self) -> None:
+        """Reset the statistics of all slaves."""
+        with self._cond:
+            for address in self._stats:
+                self._stats[address] = self._new_stats(address)
+
+    def read(self, address: int, readlen: int = 1,
+             relax: bool = True) -> bytes:
+        """Queue a read request and wait for its completion.
+
+           :param address: the address on the I2C bus
+           :param readlen: count of bytes to read out.
+           :param relax: should always be True
+           :return: read bytes
+        """
+        return self.submit(address, readlen=readlen, relax=relax).wait()
+
+    def write(self, address: int, out: Union[bytes, bytearray, Iterable[int]],
+              relax: bool = True) -> None:
+        """Queue a write request and wait for its completion.
+
+           :param address: the address on the I2C bus
+           :param out: the byte buffer to send
+           :param relax: should always be True
+        """
+        self.submit(address, out=out, relax=relax).wait()
+
+    def exchange(self, address: int,
+                 out: Union[bytes, bytearray, Iterable[int]],
+                 readlen: int = 0, relax: bool = True) -> bytes:
+        """Queue a write request followed with a read request, and wait for
+           their completion.
+
+           :param address: the address on the I2C bus
+           :param out: the byte buffer to send
+           :param readlen: count of bytes to read out.
+           :param relax: should always be True
+           :return: read bytes
+        """
+        if readlen < 1:
+            raise I2cIOError('Nothing to read')
+        return self.submit(address, out, readlen, relax=relax).wait()
+
+    def poll(self, address: int, write: bool = False,
+             relax: bool = True) -> bool:
+        """Queue a poll request, see :py:meth:`I2cController.poll`."""
+        self._check_relax(relax)
+        return self._submit_call(
+            address, lambda: self._controller.poll(address, write)).wait()
+
+    def poll_cond(self, address: int, fmt: str, mask: int, value: int,
+                  count: int, relax: bool = True) -> Optional[bytes]:
+        """Queue a poll request, see :py:meth:`I2cController.poll_cond`."""
+        self._check_relax(relax)
+        return self._submit_call(
+            address, lambda: self._controller.poll_cond(address, fmt, mask,
+                                                        value, count)).wait()
+
+    def poll_batch(self, address: int, count: int, write: bool = False,
+                   batch: int = 0, relax: bool = True) -> Optional[int]:
+        """Queue a batched poll request, see
+           :py:meth:`I2cController.poll_batch`."""
+        self._check_relax(relax)
+        return self._submit_call(
+            address, lambda: self._controller.poll_batch(address, count,
+                                                         write, batch)).wait()
+
+    def poll_cond_batch(self, address: int, fmt: str, mask: int, value: int,
+                        count: int, batch: int = 0, relax: bool = True) \
+            -> Optional[Tuple[bytes, int]]:
+        """Queue a batched poll request, see
+           :py:meth:`I2cController.poll_cond_batch`."""
+        self._check_relax(relax)
+        return self._submit_call(
+            address, lambda: self._controller.poll_cond_batch(
+                address, fmt, mask, value, count, batch)).wait()
+
+    def flush(self) -> None:
+        """Flush the HW FIFOs."""
+        self._controller.flush()
+
+    def submit(self, address: int,
+               out: Union[bytes, bytearray, Iterable[int]] = b'',
+               readlen: int = 0, relax: bool = True) -> I2cTransaction:
+        """Queue a transaction, without waiting for its completion.
+
+           :param address: the address on the I2C bus
+           :param out: the byte buffer to send, if any
+           :param readlen: count of bytes to read out, if any
+           :param relax: should always be True
+           :return: the queued transaction
+        """
+        self._check_relax(relax)
+        self._check_address(address)
+        out = bytes(out)
+        if not out and not readlen:
+            raise I2cIOError('Empty transaction')
+        if readlen > (I2cController.PAYLOAD_MAX_LENGTH/3-1):
+            raise I2cIOError("Input payload is too large")
+        if not self._controller.configured:
+            raise I2cIOError("FTDI controller not initialized")
+        return self._enqueue(I2cTransaction(address, out, readlen,
+                                            retries=self._retry_count))
+
+    def _submit_call(self, address: int,
+                     call: Callable[[], Any]) -> I2cTransaction:
+        self._check_address(address)
+        return self._enqueue(I2cTransaction(address, call=call))
+
+    @staticmethod
+    def _check_relax(relax: bool) -> None:
+        if not relax:
+            raise I2cIOError('Scheduled transactions always release the bus')
+
+    @staticmethod
+    def _check_address(address: int) -> None:
+        if address is None:
+            raise I2cIOError('Scheduled transactions require a slave address')
+        I2cController.validate_address(address)
+
+    def _enqueue(self, transaction: I2cTransaction) -> I2cTransaction:
+        with self._cond:
+            queue = self._get_queue(transaction.address)
+            queue.append(transaction)
+            stats = self._stats[transaction.address]
+            stats['max_depth'] = max(stats['max_depth'], len(queue))
+            if not self._worker:
+                self._running = True
+                self._worker = Thread(target=self._serve, daemon=True,
+                                      name='I2cScheduler')
+                self._worker.start()
+            self._cond.notify()
+        return transaction
+
+    def _get_queue(self, address: int) -> deque:
+        # lock should be held
+        if address not in self._queues:
+            self._queues[address] = deque()
+            self._priorities.setdefault(address, 0)
+            self._order.append(address)
+            self._stats[address] = self._new_stats(address)
+        return self._queues[address]
+
+    def _new_stats(self, address: int) -> dict:
+        return {'max_depth': len(self._queues[address]), 'count': 0,
+                'retries': 0, 'batched': 0, 'wait': 0.0, 'max_wait': 0.0,
+                'waits': deque(maxlen=self.WAIT_SAMPLES)}
+
+    def _get_stats(self, address: int) -> I2cSchedulerStats:
+        stats = self._stats[address]
+        waits = sorted(stats['waits'])
+        p99 = waits[min(len(waits)-1, int(0.99*len(waits)))] if waits else 0.0
+        count = stats['count']
+        return I2cSchedulerStats(len(self._queues[address]),
+                                 stats['max_depth'], count,
+                                 stats['retries'], stats['batched'],
+                                 stats['wait']/count if count else 0.0,
+                                 stats['max_wait'], p99)
+
+    def _serve(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._pending():
+                    self._cond.wait()
+                if not self._pending():
+                    break
+                batch = self._select()
+            if len(batch) > 1 or \
+                    (self._coalesce and not batch[0].call and
+                     self._controller.can_batch(*self._get_sizes(batch[0]))):
+                self._execute_batch(batch)
+            else:
+                self._execute(batch[0])
+
+    def _pending(self) -> bool:
+        return any(self._queues.values())
+
+    def _pick(self) -> Optional[int]:
+        """Select the slave to serve next, w/o dequeuing its transaction.
+        """
+        best = None
+        count = len(self._order)
+        for pos in range(count):
+            address = self._order[(self._next+pos) % count]
+            if not self._queues[address]:
+                continue
+            if self._policy == self.ROUND_ROBIN:
+                return address
+            if best is None or \
+                    self._priorities[address] > self._priorities[best]:
+                best = address
+        return best
+
+    def _select(self) -> List[I2cTransaction]:
+        """Dequeue the next transactions to execute."""
+        # lock should be held
+        batch = []
+        cmd_size = 0
+        resp_size = 0
+        while True:
+            address = self._pick()
+            if address is None:
+                break
+            transaction = self._queues[address][0]
+            if batch:
+                if transaction.call or not self._coalesce:
+                    break
+                tcmd, tresp = self._get_sizes(transaction)
+                if not self._controller.can_batch(cmd_size+tcmd,
+                                                   resp_size+tresp):
+                    break
+                cmd_size += tcmd
+                resp_size += tresp
+            elif not transaction.call:
+                cmd_size, resp_size = self._get_sizes(transaction)
+            self._queues[address].popleft()
+            self._next = (self._order.index(address)+1) % len(self._order)
+            batch.append(transaction)
+            if transaction.call or not self._coalesce or \
+                    not self._controller.can_batch(cmd_size, resp_size):
+                # cannot be packed with other transactions
+                break
+        return batch
+
+    def _get_sizes(self, transaction: I2cTransaction) -> Tuple[int, int]:
+        """Compute the sizes of the MPSSE command and response of a
+           transaction."""
+        return self._controller.transaction_sizes(len(transaction.out),
+                                                  transaction.readlen)
+
+    def _execute(self, transaction: I2cTransaction) -> None:
+        try:
+            if transaction.call:
+                result = transaction.call()
+            else:
+                result = self._controller.run_transaction(
+                    transaction.address, transaction.out,
+                    transaction.readlen)
+        except I2cNackError as exc:
+            self._nack(transaction, exc)
+            return
+        except Exception as exc:  # pylint: disable-msg=broad-except
+            self._complete(transaction, error=exc)
+            return
+        self._complete(transaction, result)
+
+    def _execute_batch(self, batch: List[I2cTransaction]) -> None:
+        try:
+            results = self._controller.run_transactions(
+                [(trans.address, trans.out, trans.readlen)
+                 for trans in batch])
+        except Exception as exc:  # pylint: disable-msg=broad-except
+            for transaction in batch:
+                self._complete(transaction, error=exc)
+            return
+        if len(batch) > 1:
+            with self._cond:
+                for transaction in batch:
+                    self._stats[transaction.address]['batched'] += 1
+        for transaction, result in zip(batch, results):
+            if isinstance(result, I2cNackError):
+                self._nack(transaction, result)
+            else:
+                self._complete(transaction, result)
+
+    def _nack(self, transaction: I2cTransaction,
+              error: I2cNackError) -> None:
+        transaction.retries -= 1
+        if transaction.retries <= 0:
+            self._complete(transaction, error=error)
+            return
+        self.log.debug('Re-queue transaction @ 0x%02x', transaction.address)
+        with self._cond:
+            self._stats[transaction.address]['retries'] += 1
+            # keep the transaction order of the slave, but serve the other
+            # slaves first
+            self._queues[transaction.address].appendleft(transaction)
+            self._next = ((self._order.index(transaction.address)+1) %
+                          len(self._order))
+
+    def _complete(self, transaction: I2cTransaction, result: Any = None,
+                  error: Optional[Exception] = None) -> None:
+        wait = now()-transaction.submitted
+        with self._cond:
+            stats = self._stats[transaction.address]
+            stats['count'] += 1
+            stats['wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+            stats['waits'].append(wait)
+        transaction.complete(result, error)
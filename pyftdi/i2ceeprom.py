@@ -0,0 +1,300 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""I2C EEPROM support for PyFdti"""
+
+from collections import namedtuple
+from logging import getLogger
+from time import perf_counter as now
+from typing import Iterator, Optional, Tuple, Union
+from .i2c import I2cController, I2cIOError, I2cTimeoutError
+
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-arguments
+
+
+class I2cEepromError(I2cIOError):
+    """I2C EEPROM error"""
+
+
+I2cEepromGeometry = namedtuple('I2cEepromGeometry',
+                               'size page_size addr_width addr_bits')
+"""Geometry of an I2C EEPROM device.
+
+   * ``size`` is the capacity of the device in bytes,
+   * ``page_size`` is the size of a write page in bytes,
+   * ``addr_width`` is the count of address bytes sent after the device
+     address,
+   * ``addr_bits`` is the count of most significant address bits which are
+     encoded in the device address.
+"""
+
+
+class I2cEeprom:
+    """24Cxx-class I2C EEPROM driver.
+
+       Writes are split into page-aligned requests. Once a page has been
+       sent, the device is polled for the completion of its write cycle with
+       batched address polling, see :py:meth:`I2cController.poll_batch`.
+
+       Example:
+
+       >>> ctrl = I2cController()
+       >>> ctrl.configure('ftdi://ftdi:232h/1', frequency=400E3)
+       >>> eeprom = I2cEeprom(ctrl, '24C256')
+       >>> eeprom.write(0x100, b'Hello world')
+       >>> data = eeprom.read(0x100, 11)
+
+       :param controller: the I2C controller the device is attached to
+       :param model: the device model, see :py:attr:`MODELS`, or its
+                     geometry
+       :param address: the base I2C address of the device
+    """
+
+    MODELS = {
+        '24C01': I2cEepromGeometry(128, 8, 1, 0),
+        '24C02': I2cEepromGeometry(256, 8, 1, 0),
+        '24C04': I2cEepromGeometry(512, 16, 1, 1),
+        '24C08': I2cEepromGeometry(1 << 10, 16, 1, 2),
+        '24C16': I2cEepromGeometry(2 << 10, 16, 1, 3),
+        '24C32': I2cEepromGeometry(4 << 10, 32, 2, 0),
+        '24C64': I2cEepromGeometry(8 << 10, 32, 2, 0),
+        '24C128': I2cEepromGeometry(16 << 10, 64, 2, 0),
+        '24C256': I2cEepromGeometry(32 << 10, 64, 2, 0),
+        '24C512': I2cEepromGeometry(64 << 10, 128, 2, 0),
+        '24CM01': I2cEepromGeometry(128 << 10, 256, 2, 1),
+        '24CM02': I2cEepromGeometry(256 << 10, 256, 2, 2),
+    }
+    """Supported device models."""
+
+    DEFAULT_ADDRESS = 0x50
+    """Default base I2C address of 24Cxx devices."""
+
+    WRITE_TIMEOUT = 20E-3
+    """Maximum time to wait for a write cycle to complete, in seconds."""
+
+    POLL_COUNT = 32
+    """Count of poll cycles emitted before checking for timeout."""
+
+    def __init__(self, controller: I2cController,
+                 model: Union[str, I2cEepromGeometry] = '24C02',
+                 address: int = DEFAULT_ADDRESS):
+        if isinstance(model, str):
+            try:
+                geometry = self.MODELS[model.upper()]
+            except KeyError:
+                raise ValueError(f'Unsupported EEPROM model: {model}')
+        else:
+            geometry = I2cEepromGeometry(*model)
+        if geometry.size > (1 << (8*geometry.addr_width+geometry.addr_bits)):
+            raise ValueError('Invalid EEPROM geometry')
+        if address & ((1 << geometry.addr_bits)-1):
+            raise ValueError('Invalid EEPROM address')
+        controller.validate_address(address)
+        self.log = getLogger('pyftdi.i2c.eeprom')
+        self._controller = controller
+        self._geometry = geometry
+        self._address = address
+        self._write_timeout = self.WRITE_TIMEOUT
+        self._read_bytes = 0
+        self._read_time = 0.0
+        self._write_bytes = 0
+        self._write_time = 0.0
+
+    @property
+    def geometry(self) -> I2cEepromGeometry:
+        """Report the geometry of the device."""
+        return self._geometry
+
+    @property
+    def size(self) -> int:
+        """Report the capacity of the device in bytes."""
+        return self._geometry.size
+
+    @property
+    def page_size(self) -> int:
+        """Report the size of a write page in bytes."""
+        return self._geometry.page_size
+
+    @property
+    def read_throughput(self) -> float:
+        """Report the throughput achieved by the read requests.
+
+           :return: the throughput in bytes per second
+        """
+        if not self._read_time:
+            return 0.0
+        return self._read_bytes/self._read_time
+
+    @property
+    def write_throughput(self) -> float:
+        """Report the throughput achieved by the write requests, including
+           the time spent waiting for the write cycles to complete.
+
+           :return: the throughput in bytes per second
+        """
+        if not self._write_time:
+            return 0.0
+        return self._write_bytes/self._write_time
+
+    def reset_statistics(self) -> None:
+        """Reset the throughput statistics."""
+        self._read_bytes = 0
+        self._read_time = 0.0
+        self._write_bytes = 0
+        self._write_time = 0.0
+
+    def set_write_timeout(self, timeout: float) -> None:
+        """Change the maximum time to wait for a write cycle to complete.
+
+           :param timeout: the timeout in seconds
+        """
+        if timeout <= 0:
+            raise ValueError('Invalid timeout')
+        self._write_timeout = timeout
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        """Read a sequence of bytes from the device.
+
+           :param offset: the offset of the first byte to read
+           :param length: the count of bytes to read, default to the end of
+                          the device
+           :return: the read bytes
+        """
+        if length is None:
+            length = self.size-offset
+        self._check_range(offset, length)
+        start = now()
+        # read requests are limited by the I2C controller, and cannot cross
+        # the boundary of an address block selected with the device address
+        max_chunk = int(self._controller.PAYLOAD_MAX_LENGTH/3-1)
+        block_size = 1 << (8*self._geometry.addr_width)
+        chunks = []
+        pos = offset
+        end = offset+length
+        while pos < end:
+            size = min(end-pos, max_chunk, block_size-(pos % block_size))
+            address, regaddr = self._encode_address(pos)
+            chunks.append(self._controller.exchange(address, regaddr, size))
+            pos += size
+        data = b''.join(chunks)
+        elapsed = now()-start
+        self._read_bytes += length
+        self._read_time += elapsed
+        self.log.info('Read %d bytes @ 0x%x: %.1f KB/s', length, offset,
+                      length/(1E3*elapsed) if elapsed else 0.0)
+        return data
+
+    def write(self, offset: int, data: Union[bytes, bytearray]) -> None:
+        """Write a sequence of bytes to the device.
+
+           Data are split into page-aligned write requests, and each write
+           cycle is completed before the next page is written.
+
+           :param offset: the offset of the first byte to write
+           :param data: the bytes to write
+        """
+        self._check_range(offset, len(data))
+        start = now()
+        pages = 0
+        for pos, chunk in self._split_pages(offset, data):
+            self._write_page(pos, chunk)
+            pages += 1
+        self._account_write(start, offset, len(data), pages)
+
+    def update(self, offset: int, data: Union[bytes, bytearray]) -> int:
+        """Write a sequence of bytes to the device, only programming the
+           pages whose content differs.
+
+           Within each page, only the span of modified bytes is written.
+
+           :param offset: the offset of the first byte to write
+           :param data: the bytes to write
+           :return: the count of written pages
+        """
+        self._check_range(offset, len(data))
+        current = self.read(offset, len(data))
+        start = now()
+        pages = 0
+        skipped = 0
+        written = 0
+        for pos, chunk in self._split_pages(offset, data):
+            base = pos-offset
+            diffs = [idx for idx, byte in enumerate(chunk)
+                     if current[base+idx] != byte]
+            if not diffs:
+                skipped += 1
+                continue
+            first, last = diffs[0], diffs[-1]
+            self._write_page(pos+first, chunk[first:last+1])
+            pages += 1
+            written += last+1-first
+        self.log.debug('Skipped %d unchanged pages', skipped)
+        if pages:
+            self._account_write(start, offset, written, pages)
+        return pages
+
+    def _check_range(self, offset: int, length: int) -> None:
+        if offset < 0 or length < 0 or offset+length > self.size:
+            raise I2cEepromError(f'Out of range access: 0x{offset:x}, '
+                                 f'{length} bytes')
+
+    def _encode_address(self, offset: int) -> Tuple[int, bytes]:
+        width = self._geometry.addr_width
+        address = self._address | (offset >> (8*width))
+        return address, (offset & ((1 << (8*width))-1)).to_bytes(width, 'big')
+
+    def _split_pages(self, offset: int, data: Union[bytes, bytearray]) \
+            -> Iterator[Tuple[int, bytes]]:
+        page_size = self._geometry.page_size
+        pos = 0
+        while pos < len(data):
+            size = min(len(data)-pos, page_size-((offset+pos) % page_size))
+            yield offset+pos, data[pos:pos+size]
+            pos += size
+
+    def _write_page(self, offset: int, chunk: Union[bytes, bytearray]) -> None:
+        address, regaddr = self._encode_address(offset)
+        self._controller.write(address, regaddr+bytes(chunk))
+        self._wait_write_cycle(address)
+
+    def _wait_write_cycle(self, address: int) -> None:
+        timeout = now()+self._write_timeout
+        while True:
+            cycle = self._controller.poll_batch(address, self.POLL_COUNT,
+                                                write=True)
+            if cycle is not None:
+                return
+            if now() > timeout:
+                raise I2cTimeoutError('EEPROM write cycle not completed')
+
+    def _account_write(self, start: float, offset: int, length: int,
+                       pages: int) -> None:
+        elapsed = now()-start
+        self._write_bytes += length
+        self._write_time += elapsed
+        self.log.info('Wrote %d bytes @ 0x%x, %d pages: %.1f KB/s', length,
+                      offset, pages, length/(1E3*elapsed) if elapsed else 0.0)
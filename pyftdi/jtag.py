@@ -27,11 +27,13 @@
 """JTAG support for PyFdti"""
 
 from time import sleep
-from typing import Any, List, Tuple, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from .ftdi import Ftdi
 from .bits import BitSequence
+from .mpsse import MpssePipeline
 
 #pylint: disable-msg=invalid-name
+#pylint: disable-msg=protected-access
 
 
 class JtagError(Exception):
@@ -66,6 +68,10 @@ class JtagState:
 class JtagStateMachine:
     """Test Access Port controller state machine."""
 
+    _paths: Dict[Tuple[str, str], Tuple[int, int]] = {}
+    """Shortest TMS sequences between any two states, shared by all the
+       state machines."""
+
     def __init__(self):
         self.states = {}
         for s, modes in [('test_logic_reset', ('reset', ' idle')),
@@ -107,6 +113,8 @@ class JtagStateMachine:
         self['exit_2_ir'].setx(self['shift_ir'], self['update_ir'])
         self['update_ir'].setx(self['run_test_idle'], self['select_dr_scan'])
         self._current = self['test_logic_reset']
+        if not JtagStateMachine._paths:
+            JtagStateMachine._paths = self._build_paths()
 
     def __getitem__(self, name: str) -> JtagState:
         return self.states[name]
@@ -133,31 +141,39 @@ class JtagStateMachine:
             source = self.state()
         if isinstance(source, str):
             source = self[source]
-        if isinstance(target, str):
-            target = self[target]
-
-        def next_path(state, target, path):
-            # this test match the target, path is valid
-            if state == target:
-                return path+[state]
-            # candidate paths
-            paths = []
-            for n, x in enumerate(state.exits):
-                # next state is self (loop around), kill the path
-                if x == state:
-                    continue
-                # next state already in upstream (loop back), kill the path
-                if x in path:
-                    continue
-                # try the current path
-                npath = next_path(x, target, path + [state])
-                # downstream is a valid path, store it
-                if npath:
-                    paths.append(npath)
-            # keep the shortest path
-            return min([(len(l), l) for l in paths],
-                       key=lambda x: x[0])[1] if paths else []
-        return next_path(source, target, [])
+        tms, length = self.get_tms(target, source)
+        path = [source]
+        for _ in range(length):
+            path.append(path[-1].getx(tms & 1))
+            tms >>= 1
+        return path
+
+    def get_tms(self, target: Union[JtagState, str],
+                source: Union[JtagState, str, None] = None) \
+            -> Tuple[int, int]:
+        """Return the shortest TMS sequence to move from source state to
+           target state. If source state is not specified, used the current
+           state.
+
+           :param target: the state to move to
+           :param source: the state to move from
+           :return: the TMS bits, first bit as the least significant one,
+                    and the count of TMS bits
+        """
+        if source is None:
+            source = self._current
+        return self._paths[(str(source), str(target))]
+
+    def move(self, target: Union[JtagState, str]) -> Tuple[int, int]:
+        """Move to another state.
+
+           :param target: the state to move to
+           :return: the TMS bits, first bit as the least significant one,
+                    and the count of TMS bits
+        """
+        tms = self._paths[(self._current.name, str(target))]
+        self._current = self.states[str(target)]
+        return tms
 
     def get_events(self, path):
         """Build up an event sequence from a state sequence, so that the
@@ -176,6 +192,24 @@ class JtagStateMachine:
         for event in events:
             self._current = self._current.getx(event)
 
+    def _build_paths(self) -> Dict[Tuple[str, str], Tuple[int, int]]:
+        """Compute the shortest TMS sequences between any two states with a
+           breadth-first search from each state."""
+        paths = {}
+        for source in self.states.values():
+            found = {source: (0, 0)}
+            pending = [source]
+            while pending:
+                state = pending.pop(0)
+                tms, length = found[state]
+                for event, xstate in enumerate(state.exits):
+                    if xstate not in found:
+                        found[xstate] = (tms | (event << length), length+1)
+                        pending.append(xstate)
+            for state, path in found.items():
+                paths[(source.name, state.name)] = path
+        return paths
+
 
 class JtagController:
     """JTAG master of an FTDI device"""
@@ -187,6 +221,7 @@ class JtagController:
     TRST_BIT = 0x10  # FTDI output, not available on 2232 JTAG debugger
     JTAG_MASK = 0x1f
     FTDI_PIPE_LEN = 512
+    MPSSE_PAYLOAD_MAX_LENGTH = 0x10000  # 16-bit length field
 
     # Private API
     def __init__(self, trst: bool = False, frequency: float = 3.0E6):
@@ -203,12 +238,16 @@ class JtagController:
                           (self._trst and JtagController.TRST_BIT or 0))
         self._last = None  # Last deferred TDO bit
         self._write_buff = bytearray()
+        self._tx_size = JtagController.FTDI_PIPE_LEN
+        self._pipe = MpssePipeline(self._ftdi, JtagError)
 
     # Public API
     def configure(self, url: str) -> None:
         """Configure the FTDI interface as a JTAG controller"""
-        self._ftdi.open_mpsse_from_url(
+        self._frequency = self._ftdi.open_mpsse_from_url(
             url, direction=self.direction, frequency=self._frequency)
+        self._tx_size, _ = self._ftdi.fifo_sizes
+        self._pipe.configure()
         # FTDI requires to initialize all GPIOs before MPSSE kicks in
         cmd = bytearray((Ftdi.SET_BITS_LOW, 0x0, self.direction))
         self._ftdi.write_data(cmd)
@@ -256,32 +295,14 @@ class JtagController:
         """Change the TAP controller state"""
         if not isinstance(tms, BitSequence):
             raise JtagError('Expect a BitSequence')
-        length = len(tms)
-        if not 0 < length < 8:
-            raise JtagError('Invalid TMS length')
-        out = BitSequence(tms, length=8)
-        # apply the last TDO bit
-        if self._last is not None:
-            out[7] = self._last
-        # print("TMS", tms, (self._last is not None) and 'w/ Last' or '')
-        # reset last bit
-        self._last = None
-        cmd = bytearray((Ftdi.WRITE_BITS_TMS_NVE, length-1, out.tobyte()))
-        self._stack_cmd(cmd)
-        self.sync()
+        self._write_tms(int(tms), len(tms))
 
     def read(self, length: int) -> BitSequence:
         """Read out a sequence of bits from TDO."""
-        byte_count = length//8
-        bit_count = length-8*byte_count
-        bs = BitSequence()
-        if byte_count:
-            bytes_ = self._read_bytes(byte_count)
-            bs.append(bytes_)
-        if bit_count:
-            bits = self._read_bits(bit_count)
-            bs.append(bits)
-        return bs
+        if not length:
+            return BitSequence()
+        data = self.read_bytes(length)
+        return BitSequence(int.from_bytes(data, 'little'), length=length)
 
     def write(self, out: Union[BitSequence, str], use_last: bool = True):
         """Write a sequence of bits to TDI"""
@@ -307,55 +328,54 @@ class JtagController:
         """Shift a BitSequence into the current register and retrieve the
            register output"""
         if not isinstance(out, BitSequence):
-            return JtagError('Expect a BitSequence')
-        length = len(out)
+            raise JtagError('Expect a BitSequence')
         if use_last:
             (out, self._last) = (out[:-1], int(out[-1]))
-        byte_count = len(out)//8
-        pos = 8*byte_count
-        bit_count = len(out)-pos
-        if not byte_count and not bit_count:
+        length = len(out)
+        if not length:
             raise JtagError("Nothing to shift")
-        if byte_count:
-            blen = byte_count-1
-            # print("RW OUT %s" % out[:pos])
-            cmd = bytearray((Ftdi.RW_BYTES_PVE_NVE_LSB,
-                             blen, (blen >> 8) & 0xff))
-            cmd.extend(out[:pos].tobytes(msby=True))
-            self._stack_cmd(cmd)
-            # print("push %d bytes" % byte_count)
-        if bit_count:
-            # print("RW OUT %s" % out[pos:])
-            cmd = bytearray((Ftdi.RW_BITS_PVE_NVE_LSB, bit_count-1))
-            cmd.append(out[pos:].tobyte())
-            self._stack_cmd(cmd)
-            # print("push %d bits" % bit_count)
-        self.sync()
-        bs = BitSequence()
-        byte_count = length//8
-        pos = 8*byte_count
-        bit_count = length-pos
-        if byte_count:
-            data = self._ftdi.read_data_bytes(byte_count, 4)
-            if not data:
-                raise JtagError('Unable to read data from FTDI')
-            byteseq = BitSequence(bytes_=data, length=8*byte_count)
-            # print("RW IN %s" % byteseq)
-            bs.append(byteseq)
-            # print("pop %d bytes" % byte_count)
-        if bit_count:
-            data = self._ftdi.read_data_bytes(1, 4)
-            if not data:
-                raise JtagError('Unable to read data from FTDI')
-            byte = data[0]
-            # need to shift bits as they are shifted in from the MSB in FTDI
-            byte >>= 8-bit_count
-            bitseq = BitSequence(byte, length=bit_count)
-            bs.append(bitseq)
-            # print("pop %d bits" % bit_count)
-        if len(bs) != length:
-            raise ValueError("Internal error")
-        return bs
+        data = self.shift_bytes(int(out).to_bytes((length+7)//8, 'little'),
+                                length)
+        return BitSequence(int.from_bytes(data, 'little'), length=length)
+
+    def shift_bytes(self, out: Union[bytes, bytearray],
+                    bitlen: Optional[int] = None) -> bytes:
+        """Shift a sequence of bytes into the current register and retrieve
+           the register output.
+
+           This is the fast path of :py:meth:`shift_register`: bits are
+           directly shifted from and to bytes, without any intermediate
+           :py:class:`BitSequence`. Bits are shifted out starting from the
+           least significant bit of the first byte.
+
+           :param out: the bits to shift out on TDI
+           :param bitlen: the count of bits to shift, default to all the
+                          bits of ``out``
+           :return: the bits received on TDO, with the same layout as
+                    ``out``, *i.e.* the last byte is right-aligned if the
+                    bit count is not a multiple of 8. Use
+                    ``int.from_bytes(data, 'little')`` to convert them into
+                    an integral value.
+        """
+        if bitlen is None:
+            bitlen = 8*len(out)
+        if not bitlen:
+            raise JtagError("Nothing to shift")
+        if bitlen > 8*len(out):
+            raise JtagError("Not enough bits to shift")
+        return self._shift_bytes(out, bitlen)
+
+    def read_bytes(self, bitlen: int) -> bytes:
+        """Read out a sequence of bits from TDO, without any intermediate
+           :py:class:`BitSequence`.
+
+           :param bitlen: the count of bits to read
+           :return: the bits received on TDO, the last byte is right-aligned
+                    if the bit count is not a multiple of 8.
+        """
+        if not bitlen:
+            raise JtagError("Nothing to read")
+        return self._shift_bytes(None, bitlen)
 
     @property
     def ftdi(self) -> Ftdi:
@@ -365,29 +385,115 @@ class JtagController:
         """
         return self._ftdi
 
+    @property
+    def pipe(self) -> MpssePipeline:
+        """Return the MPSSE pipeline used to exchange TDI/TDO data.
+
+           Pending commands should be flushed with :py:meth:`sync` before
+           using the pipeline.
+
+           :return: the MpssePipeline instance
+        """
+        return self._pipe
+
+    @property
+    def frequency(self) -> float:
+        """Return the JTAG clock frequency.
+
+           :return: the actual TCK frequency in Hz, once configured
+        """
+        return self._frequency
+
+    def set_frequency(self, frequency: float) -> float:
+        """Change the JTAG clock frequency.
+
+           :param frequency: the new TCK frequency in Hz
+           :return: the actual TCK frequency, which may differ from the
+                    requested one
+        """
+        self.sync()
+        self._frequency = self._ftdi.set_frequency(frequency)
+        return self._frequency
+
     def _stack_cmd(self, cmd: Union[bytes, bytearray]):
         if not isinstance(cmd, (bytes, bytearray)):
             raise TypeError('Expect bytes or bytearray')
         if not self._ftdi:
             raise JtagError("FTDI controller terminated")
         # Currrent buffer + new command + send_immediate
-        if (len(self._write_buff)+len(cmd)+1) >= JtagController.FTDI_PIPE_LEN:
+        if (len(self._write_buff)+len(cmd)+1) >= self._tx_size:
             self.sync()
         self._write_buff.extend(cmd)
 
-    def _read_bits(self, length: int):
-        """Read out bits from TDO"""
-        if length > 8:
-            raise JtagError("Cannot fit into FTDI fifo")
-        cmd = bytearray((Ftdi.READ_BITS_NVE_LSB, length-1))
+    def _shift_bytes(self, out: Optional[Union[bytes, bytearray]],
+                     bitlen: int) -> bytes:
+        """Shift bits from and to TDI/TDO, or only read TDO if out is
+           None."""
+        byte_count, bit_count = divmod(bitlen, 8)
+        self.sync()
+        data = self._pipe.exchange(
+            self._build_shift_commands(out, byte_count, bit_count))
+        if bit_count:
+            # bits are shifted in from the MSB in FTDI
+            data[-1] >>= 8-bit_count
+        return bytes(data)
+
+    def _build_shift_commands(self, out: Optional[Union[bytes, bytearray]],
+                              byte_count: int, bit_count: int,
+                              read: bool = True) \
+            -> Iterator[Tuple[bytearray, int]]:
+        """Generate the MPSSE commands of a shift.
+
+           Byte shifts are split into commands whose TDO data fit into a
+           FIFO chunk.
+
+           :param out: the bits to shift out on TDI, or None to only read
+                       TDO
+           :param byte_count: the count of whole bytes to shift
+           :param bit_count: the count of remaining bits to shift
+           :param read: whether to read back TDO
+           :return: a generator of (command, TDO byte count) tuples
+        """
+        if out is None:
+            byte_cmd, bit_cmd = Ftdi.READ_BYTES_NVE_LSB, Ftdi.READ_BITS_NVE_LSB
+        elif read:
+            byte_cmd, bit_cmd = (Ftdi.RW_BYTES_PVE_NVE_LSB,
+                                 Ftdi.RW_BITS_PVE_NVE_LSB)
+        else:
+            byte_cmd, bit_cmd = (Ftdi.WRITE_BYTES_NVE_LSB,
+                                 Ftdi.WRITE_BITS_NVE_LSB)
+        # write-only commands are only limited by the MPSSE length field
+        chunk_size = (self._pipe.chunk_size if read else
+                      JtagController.MPSSE_PAYLOAD_MAX_LENGTH)
+        for pos in range(0, byte_count, chunk_size):
+            size = min(byte_count-pos, chunk_size)
+            alen = size-1
+            cmd = bytearray((byte_cmd, alen & 0xff, (alen >> 8) & 0xff))
+            if out is not None:
+                cmd.extend(out[pos:pos+size])
+            yield cmd, size if read else 0
+        if bit_count:
+            cmd = bytearray((bit_cmd, bit_count-1))
+            if out is not None:
+                cmd.append(out[byte_count])
+            yield cmd, int(read)
+
+    def _write_tms(self, tms: int, length: int) -> None:
+        """Output TMS bits, first bit as the least significant one"""
+        if not length:
+            raise JtagError('Invalid TMS length')
+        cmd = bytearray()
+        for pos in range(0, length, 7):
+            count = min(length-pos, 7)
+            bits = (tms >> pos) & 0x7f
+            # apply the last TDO bit
+            if self._last is not None:
+                bits |= int(self._last) << 7
+                # reset last bit
+                self._last = None
+            cmd.extend((Ftdi.WRITE_BITS_TMS_NVE, count-1, bits))
         self._stack_cmd(cmd)
         self.sync()
-        data = self._ftdi.read_data_bytes(1, 4)
-        # need to shift bits as they are shifted in from the MSB in FTDI
-        byte = data[0] >> 8-length
-        bs = BitSequence(byte, length=length)
-        # print("READ BITS %s" % bs)
-        return bs
 
     def _write_bits(self, out: BitSequence) -> None:
         """Output bits on TDI"""
@@ -397,46 +503,34 @@ class JtagController:
         cmd = bytearray((Ftdi.WRITE_BITS_NVE_LSB, length-1, byte))
         self._stack_cmd(cmd)
 
-    def _read_bytes(self, length: int) -> BitSequence:
-        """Read out bytes from TDO"""
-        if length > JtagController.FTDI_PIPE_LEN:
-            raise JtagError("Cannot fit into FTDI fifo")
-        alen = length-1
-        cmd = bytearray((Ftdi.READ_BYTES_NVE_LSB, alen & 0xff,
-                         (alen >> 8) & 0xff))
-        self._stack_cmd(cmd)
-        self.sync()
-        data = self._ftdi.read_data_bytes(length, 4)
-        bs = BitSequence(bytes_=data, length=8*length)
-        # print("READ BYTES %s" % bs)
-        return bs
-
     def _write_bytes(self, out: BitSequence):
         """Output bytes on TDI"""
-        bytes_ = out.tobytes(msby=True)  # don't ask...
-        olen = len(bytes_)-1
         # print("WRITE BYTES %s" % out)
-        cmd = bytearray((Ftdi.WRITE_BYTES_NVE_LSB, olen & 0xff,
-                          (olen >> 8) & 0xff))
-        cmd.extend(bytes_)
-        self._stack_cmd(cmd)
+        self._write_bytes_raw(out.tobytes(msby=True))  # don't ask...
 
     def _write_bytes_raw(self, out: BitSequence):
         """Output bytes on TDI"""
-        olen = len(out)-1
-        cmd = bytearray((Ftdi.WRITE_BYTES_NVE_LSB, olen & 0xff,
-                         (olen >> 8) & 0xff))
-        cmd.extend(out)
-        self._stack_cmd(cmd)
+        for pos in range(0, len(out),
+                         JtagController.MPSSE_PAYLOAD_MAX_LENGTH):
+            chunk = out[pos:pos+JtagController.MPSSE_PAYLOAD_MAX_LENGTH]
+            olen = len(chunk)-1
+            cmd = bytearray((Ftdi.WRITE_BYTES_NVE_LSB, olen & 0xff,
+                             (olen >> 8) & 0xff))
+            cmd.extend(chunk)
+            self._stack_cmd(cmd)
 
 
 class JtagEngine:
     """High-level JTAG engine controller"""
 
-    def __init__(self, trst: bool = False, frequency: float = 3E06):
+    def __init__(self, trst: bool = False, frequency: float = 3E06,
+                 ir_cache: bool = False):
         self._ctrl = JtagController(trst, frequency)
         self._sm = JtagStateMachine()
         self._seq = bytearray()
+        self._queue = JtagQueue(self)
+        self._ir_cache = ir_cache
+        self._ir: Optional[BitSequence] = None  # last shifted instruction
 
     @property
     def state_machine(self):
@@ -446,6 +540,19 @@ class JtagEngine:
     def controller(self):
         return self._ctrl
 
+    @property
+    def ir_cache(self) -> bool:
+        """Tell whether redundant instruction shifts are skipped.
+
+           :return: True if the last shifted instruction is cached
+        """
+        return self._ir_cache
+
+    @ir_cache.setter
+    def ir_cache(self, enable: bool) -> None:
+        self._ir_cache = enable
+        self._ir = None
+
     def configure(self, url: str) -> None:
         """Configure the FTDI interface as a JTAG controller"""
         self._ctrl.configure(url)
@@ -462,17 +569,21 @@ class JtagEngine:
         """Reset the attached TAP controller"""
         self._ctrl.reset()
         self._sm.reset()
+        self._ir = None
 
     def write_tms(self, out) -> None:
         """Change the TAP controller state"""
         self._ctrl.write_tms(out)
+        self._ir = None
 
     def read(self, length):
         """Read out a sequence of bits from TDO"""
+        self._discard_ir()
         return self._ctrl.read(length)
 
     def write(self, out, use_last=False) -> None:
         """Write a sequence of bits to TDI"""
+        self._discard_ir()
         self._ctrl.write(out, use_last)
 
     def get_available_statenames(self):
@@ -481,41 +592,73 @@ class JtagEngine:
 
     def change_state(self, statename) -> None:
         """Advance the TAP controller to the defined state"""
-        # find the state machine path to move to the new instruction
-        path = self._sm.find_path(statename)
-        # convert the path into an event sequence
-        events = self._sm.get_events(path)
+        # look up the TMS sequence to move to the new state, and update the
+        # current state machine's state
+        self._track_reset(statename)
+        tms, length = self._sm.move(statename)
         # update the remote device tap controller
-        self._ctrl.write_tms(events)
-        # update the current state machine's state
-        self._sm.handle_events(events)
+        if length:
+            self._ctrl._write_tms(tms, length)
 
     def go_idle(self) -> None:
         """Change the current TAP controller to the IDLE state"""
         self.change_state('run_test_idle')
 
-    def write_ir(self, instruction) -> None:
-        """Change the current instruction of the TAP controller"""
-        self.change_state('shift_ir')
-        self._ctrl.write(instruction)
-        self.change_state('update_ir')
+    def write_ir(self, instruction, force: bool = False) -> None:
+        """Change the current instruction of the TAP controller.
+
+           If the instruction cache is enabled, the instruction is not
+           shifted again if the TAP controller already holds it, in which
+           case the TAP controller stays in its current state rather than
+           moving to Update-IR.
+
+           :param instruction: the instruction bits
+           :param force: whether to shift the instruction even if it is
+                         already loaded, for instructions whose update has
+                         side effects
+        """
+        if not isinstance(instruction, BitSequence):
+            instruction = BitSequence(instruction)
+        if self._ir_cache and not force and self._ir is not None and \
+                instruction == self._ir:
+            return
+        self._queue.scan_ir(instruction, end_state='update_ir')
+        self._queue.flush()
+        self._ir = BitSequence(instruction)
 
     def capture_ir(self) -> None:
         """Capture the current instruction from the TAP controller"""
         self.change_state('capture_ir')
 
-    def write_dr(self, data) -> None:
-        """Change the data register of the TAP controller"""
-        self.change_state('shift_dr')
-        self._ctrl.write(data)
-        self.change_state('update_dr')
-
-    def read_dr(self, length: int) -> BitSequence:
-        """Read the data register from the TAP controller"""
-        self.change_state('shift_dr')
-        data = self._ctrl.read(length)
-        self.change_state('update_dr')
-        return data
+    def write_dr(self, data, end_state: str = 'update_dr') -> None:
+        """Change the data register of the TAP controller.
+
+           Keeping the default end state avoids the detour through
+           Run-Test/Idle between back-to-back DR scans.
+
+           :param data: the data bits
+           :param end_state: the state to move to once the data bits have
+                             been shifted, with the same TMS command as the
+                             last data bit
+        """
+        if not isinstance(data, BitSequence):
+            data = BitSequence(data)
+        self._queue.scan_dr(data, capture=False, end_state=end_state)
+        self._queue.flush()
+
+    def read_dr(self, length: int,
+                end_state: str = 'update_dr') -> BitSequence:
+        """Read the data register from the TAP controller.
+
+           :param length: the count of bits to read
+           :param end_state: the state to move to once the data bits have
+                             been read, with the same TMS command as the
+                             last data bit
+           :return: the data bits
+        """
+        scan = self._queue.read_dr(length, end_state=end_state)
+        self._queue.flush()
+        return scan.value
 
     def capture_dr(self) -> None:
         """Capture the current data register from the TAP controller"""
@@ -524,6 +667,7 @@ class JtagEngine:
     def shift_register(self, length) -> BitSequence:
         if not self._sm.state_of('shift'):
             raise JtagError("Invalid state: %s" % self._sm.state())
+        self._discard_ir()
         if self._sm.state_of('capture'):
             bs = BitSequence(False)
             self._ctrl.write_tms(bs)
@@ -533,6 +677,343 @@ class JtagEngine:
     def sync(self) -> None:
         self._ctrl.sync()
 
+    def _discard_ir(self) -> None:
+        """Forget about the current instruction if it may be altered."""
+        if self._sm.state_of('ir'):
+            self._ir = None
+
+    def _track_reset(self, statename: str) -> None:
+        """Forget about the current instruction if the TAP controller goes
+           through Test-Logic-Reset on its way to a state, as the reset
+           selects the IDCODE or BYPASS instruction."""
+        if self._ir is not None and self._resets_on_path(statename):
+            self._ir = None
+
+    def _resets_on_path(self, statename: str) -> bool:
+        """Tell whether the TAP controller goes through Test-Logic-Reset on
+           its way to a state."""
+        path = self._sm.find_path(statename)
+        return any(str(state) == 'test_logic_reset' for state in path[1:])
+
+
+class JtagScan:
+    """A JTAG scan, queued in a :py:class:`JtagQueue`.
+
+       The bits captured from TDO are only available once the queue has
+       been flushed.
+
+       :param length: the count of bits of the scan
+       :param expect: the optional expected TDO value
+       :param mask: the bits of the expected value to check, default to all
+    """
+
+    def __init__(self, length: int, expect: Optional[int] = None,
+                 mask: Optional[int] = None):
+        self.length = length
+        self.expect = expect
+        self.mask = mask if mask is not None else (1 << length)-1
+        self._value: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        """Tell whether the scan has been executed.
+
+           :return: True once the TDO bits have been captured
+        """
+        return self._value is not None
+
+    @property
+    def value(self) -> BitSequence:
+        """Return the captured TDO bits.
+
+           :return: the captured bits
+        """
+        return BitSequence(int(self), length=self.length)
+
+    @property
+    def data(self) -> bytes:
+        """Return the captured TDO bits as bytes, least significant bit
+           first.
+
+           :return: the captured bits
+        """
+        return int(self).to_bytes((self.length+7)//8, 'little')
+
+    @property
+    def matched(self) -> bool:
+        """Tell whether the captured TDO bits match the expected value.
+
+           :return: True if there is no expected value or if it is matched
+        """
+        if self.expect is None:
+            return True
+        return not (int(self) ^ self.expect) & self.mask
+
+    def __int__(self):
+        if self._value is None:
+            raise JtagError('Scan has not been executed')
+        return self._value
+
+    def _update(self, value: int) -> None:
+        self._value = (self._value or 0) | value
+
+
+class JtagQueue:
+    """Queue of JTAG operations, executed as a single MPSSE command stream.
+
+       IR and DR scans, TAP state moves and Run-Test/Idle clock cycles are
+       recorded along with the state changes of the TAP controller, and are
+       only sent to the FTDI device when the queue is flushed, with a single
+       bulk write and a single bulk read as long as the captured data fit
+       into the FTDI FIFOs.
+
+       :param engine: the JTAG engine, whose state machine tracks the state
+                      of the TAP controller
+    """
+
+    def __init__(self, engine: 'JtagEngine'):
+        self._engine = engine
+        self._ctrl = engine.controller
+        self._sm = engine.state_machine
+        self._commands: List[Tuple[bytearray, int]] = []
+        self._rsize = 0
+        # TDO bit fields: scan, offset, byte count, shift, width, position
+        self._fields: List[Tuple[JtagScan, int, int, int, int, int]] = []
+        self._scans: List[JtagScan] = []
+        # instruction left in the TAP controller once the queue is flushed
+        self._ir: Optional[BitSequence] = None
+        self._ir_changed = False
+
+    def __len__(self):
+        return len(self._commands)
+
+    def reset(self) -> None:
+        """Move the TAP controller to the Test-Logic-Reset state, whatever
+           its current state."""
+        self._write_tms(0b11111, 5)
+        self._sm.reset()
+        self._engine._ir = None
+        self._ir = None
+        self._ir_changed = True
+
+    def change_state(self, statename: str) -> None:
+        """Move the TAP controller to another state.
+
+           :param statename: the name of the state to move to
+        """
+        self._move(statename)
+
+    def run_test(self, cycles: int,
+                 statename: str = 'run_test_idle') -> None:
+        """Clock the TAP controller in a stable state.
+
+           :param cycles: the count of TCK clock cycles
+           :param statename: the state to move to, then clock in
+        """
+        self._move(statename)
+        bytecount, bitcount = divmod(cycles, 8)
+        while bytecount:
+            size = min(bytecount, 0x10000)
+            alen = size-1
+            self._push(bytearray((Ftdi.CLK_BYTES_NO_DATA,
+                                  alen & 0xff, (alen >> 8) & 0xff)))
+            bytecount -= size
+        if bitcount:
+            self._push(bytearray((Ftdi.CLK_BITS_NO_DATA, bitcount-1)))
+
+    def scan_ir(self, out: Union[BitSequence, bytes, bytearray, int],
+                length: Optional[int] = None, capture: bool = False,
+                end_state: str = 'run_test_idle',
+                expect: Optional[int] = None, mask: Optional[int] = None) \
+            -> Optional[JtagScan]:
+        """Queue an instruction register scan.
+
+           :param out: the bits to shift in the instruction register, as a
+                       bit sequence, an integral value or bytes, least
+                       significant bit first
+           :param length: the count of bits to shift, required for integral
+                          values, default to the whole sequence otherwise
+           :param capture: whether to capture the bits received on TDO
+           :param end_state: the state to move to once the scan is complete,
+                             or the shift state to keep on shifting with
+                             the next scan
+           :param expect: the expected TDO value, implies capture
+           :param mask: the bits of the expected value to check
+           :return: the scan, if TDO is captured
+        """
+        return self._scan('shift_ir', out, length, capture, end_state,
+                          expect, mask)
+
+    def scan_dr(self, out: Union[BitSequence, bytes, bytearray, int],
+                length: Optional[int] = None, capture: bool = True,
+                end_state: str = 'run_test_idle',
+                expect: Optional[int] = None, mask: Optional[int] = None) \
+            -> Optional[JtagScan]:
+        """Queue a data register scan.
+
+           :param out: the bits to shift in the data register, as a bit
+                       sequence, an integral value or bytes, least
+                       significant bit first
+           :param length: the count of bits to shift, required for integral
+                          values, default to the whole sequence otherwise
+           :param capture: whether to capture the bits received on TDO
+           :param end_state: the state to move to once the scan is complete,
+                             or the shift state to keep on shifting with
+                             the next scan
+           :param expect: the expected TDO value, implies capture
+           :param mask: the bits of the expected value to check
+           :return: the scan, if TDO is captured
+        """
+        return self._scan('shift_dr', out, length, capture, end_state,
+                          expect, mask)
+
+    def read_dr(self, length: int, end_state: str = 'run_test_idle') \
+            -> JtagScan:
+        """Queue a data register capture, shifting in zero bits.
+
+           :param length: the count of bits to capture
+           :param end_state: the state to move to once the scan is complete
+           :return: the scan
+        """
+        return self._scan('shift_dr', 0, length, True, end_state, None, None)
+
+    def flush(self) -> List[JtagScan]:
+        """Execute all the queued operations.
+
+           :return: the executed scans that captured TDO, in queue order
+        """
+        commands, self._commands = self._commands, []
+        fields, self._fields = self._fields, []
+        scans, self._scans = self._scans, []
+        rsize, self._rsize = self._rsize, 0
+        ir, self._ir = self._ir, None
+        ir_changed, self._ir_changed = self._ir_changed, False
+        if not commands:
+            return scans
+        ctrl = self._ctrl
+        ctrl.sync()
+        data = ctrl.pipe.exchange(commands)
+        if len(data) != rsize:
+            raise JtagError('Unexpected TDO data length')
+        for scan, offset, size, shift, width, pos in fields:
+            value = int.from_bytes(data[offset:offset+size], 'little')
+            scan._update(((value >> shift) & ((1 << width)-1)) << pos)
+        if ir_changed:
+            # the shifted instruction is now held by the TAP controller
+            self._engine._ir = ir
+        return scans
+
+    def _push(self, cmd: bytearray, rsize: int = 0) -> int:
+        offset = self._rsize
+        self._commands.append((cmd, rsize))
+        self._rsize += rsize
+        return offset
+
+    def _write_tms(self, tms: int, length: int, tdi: Optional[int] = None,
+                   read: bool = False) -> Optional[int]:
+        """Queue TMS commands, capturing TDO on the first clock cycle if
+           required.
+
+           Consecutive TMS sequences are folded into a single MPSSE command
+           whenever possible.
+
+           :param tms: the TMS bits, first bit as the least significant one
+           :param length: the count of TMS bits
+           :param tdi: the TDI level, None if it does not matter
+           :param read: whether to capture TDO
+           :return: the offset of the TDO byte, if any
+        """
+        offset = None
+        if not read and self._commands:
+            cmd, rsize = self._commands[-1]
+            if (cmd[0] == Ftdi.WRITE_BITS_TMS_NVE and not rsize and
+                    (tdi is None or tdi == cmd[2] >> 7)):
+                count = min(6-cmd[1], length)
+                if count > 0:
+                    cmd[2] |= (tms & ((1 << count)-1)) << (cmd[1]+1)
+                    cmd[1] += count
+                    tms >>= count
+                    length -= count
+        for pos in range(0, length, 7):
+            count = min(length-pos, 7)
+            bits = ((tms >> pos) & 0x7f) | ((tdi or 0) << 7)
+            if read and not pos:
+                offset = self._push(bytearray((Ftdi.RW_BITS_TMS_PVE_NVE,
+                                               count-1, bits)), 1)
+            else:
+                self._push(bytearray((Ftdi.WRITE_BITS_TMS_NVE,
+                                      count-1, bits)))
+        return offset
+
+    def _move(self, statename: str, tdi: Optional[int] = None,
+              read: bool = False) -> Tuple[Optional[int], int]:
+        """Queue the TMS commands to move the TAP controller to a state.
+
+           :return: the offset of the TDO byte, if any, and the count of TMS
+                    clock cycles
+        """
+        self._engine._track_reset(statename)
+        if self._ir is not None and self._engine._resets_on_path(statename):
+            self._ir = None
+        tms, length = self._sm.move(statename)
+        if not length:
+            return None, 0
+        return self._write_tms(tms, length, tdi, read), length
+
+    def _scan(self, shift_state: str,
+              out: Union[BitSequence, bytes, bytearray, int],
+              length: Optional[int], capture: bool, end_state: str,
+              expect: Optional[int], mask: Optional[int]) \
+            -> Optional[JtagScan]:
+        if isinstance(out, BitSequence):
+            if length is None:
+                length = len(out)
+            out = int(out)
+        if isinstance(out, int):
+            if length is None:
+                raise JtagError('Length is required for integral values')
+            out = out.to_bytes((length+7)//8, 'little')
+        elif length is None:
+            length = 8*len(out)
+        if not 0 < length <= 8*len(out):
+            raise JtagError('Invalid scan length')
+        stay = end_state == shift_state
+        if shift_state == 'shift_ir':
+            self._engine._ir = None
+            self._ir_changed = True
+            self._ir = None if stay else BitSequence(
+                int.from_bytes(out, 'little') & ((1 << length)-1),
+                length=length)
+        scan = None
+        if capture or expect is not None:
+            scan = JtagScan(length, expect, mask)
+            self._scans.append(scan)
+        self._move(shift_state)
+        # all bits but the last one are shifted while staying in the shift
+        # state, the last bit is shifted while leaving the shift state
+        byte_count, bit_count = divmod(length if stay else length-1, 8)
+        pos = 0
+        for cmd, rsize in self._ctrl._build_shift_commands(
+                out, byte_count, bit_count, bool(scan)):
+            offset = self._push(cmd, rsize)
+            if not scan:
+                continue
+            if pos < 8*byte_count:
+                self._fields.append((scan, offset, rsize, 0, 8*rsize, pos))
+                pos += 8*rsize
+            else:
+                # bits are shifted in from the MSB in FTDI
+                self._fields.append((scan, offset, 1, 8-bit_count, bit_count,
+                                     pos))
+        if stay:
+            return scan
+        last = (out[(length-1)//8] >> ((length-1) % 8)) & 1
+        offset, count = self._move(end_state, last, bool(scan))
+        if scan:
+            self._fields.append((scan, offset, 1, 8-min(count, 7), 1,
+                                 length-1))
+        return scan
+
 
 class JtagTool:
     """A helper class with facility functions"""
@@ -611,3 +1092,320 @@ class JtagTool:
         if stuck is not None:
             raise JtagError('TDO seems to be stuck')
         raise JtagError('Unable to detect register length')
+
+
+class JtagDevice:
+    """A TAP controller of a JTAG chain, as discovered by
+       :py:class:`JtagChain`.
+
+       All the other TAP controllers of the chain are placed in BYPASS mode
+       whenever an instruction is written, so that IR and DR scans are
+       padded with precomputed BYPASS bit templates.
+
+       :param chain: the JTAG chain the device belongs to
+       :param index: the position of the device in the chain, the first
+                     device being the closest one to the host TDI output
+       :param ir_length: the length of the instruction register
+       :param idcode: the device identifier, if any
+    """
+
+    def __init__(self, chain: 'JtagChain', index: int, ir_length: int,
+                 idcode: Optional[int]):
+        self.index = index
+        self.ir_length = ir_length
+        self.idcode = idcode
+        self._chain = chain
+        self._engine = chain.engine
+        # bits shifted first end up in the device closest to TDO
+        count = len(chain)
+        self._ir_pos = sum(dev_len for dev_len in chain.ir_lengths[index+1:])
+        self._ir_total = sum(chain.ir_lengths)
+        self._ir_template = (((1 << self._ir_total)-1) &
+                             ~(((1 << ir_length)-1) << self._ir_pos))
+        self._dr_pos = count-1-index
+        self._dr_pad = count-1
+
+    def __repr__(self):
+        idcode = '0x%08x' % self.idcode if self.idcode is not None else '-'
+        return 'JtagDevice(%d, ir %d, idcode %s)' % (self.index,
+                                                     self.ir_length, idcode)
+
+    @property
+    def dr_offset(self) -> int:
+        """Return the position of the device data register in the DR
+           scans of the chain.
+
+           :return: the count of BYPASS bits shifted before the device bits
+        """
+        return self._dr_pos
+
+    @property
+    def dr_padding(self) -> int:
+        """Return the count of BYPASS bits added to the DR scans.
+
+           :return: the count of devices in BYPASS mode
+        """
+        return self._dr_pad
+
+    def write_ir(self, instruction: Union[BitSequence, int],
+                 force: bool = False) -> None:
+        """Change the current instruction of the device, and select the
+           BYPASS instruction of all other devices.
+
+           :param instruction: the instruction bits
+           :param force: whether to shift the instruction even if it is
+                         already loaded
+        """
+        value = BitSequence(self._ir_template |
+                            (int(instruction) << self._ir_pos),
+                            length=self._ir_total)
+        self._engine.write_ir(value, force)
+        self._chain._select(self, value)
+
+    def write_dr(self, data: Union[BitSequence, int],
+                 length: Optional[int] = None,
+                 end_state: str = 'update_dr') -> None:
+        """Change the data register of the device.
+
+           :param data: the data bits
+           :param length: the count of bits to write, required for integral
+                          values, default to the whole sequence otherwise
+           :param end_state: the state to move to once the data bits have
+                             been shifted
+        """
+        self._check_selected()
+        if length is None:
+            if not isinstance(data, BitSequence):
+                raise JtagError('Length is required for integral values')
+            length = len(data)
+        value = int(data) << self._dr_pos
+        self._engine.write_dr(BitSequence(value, length=length+self._dr_pad),
+                              end_state)
+
+    def read_dr(self, length: int,
+                end_state: str = 'update_dr') -> BitSequence:
+        """Read the data register of the device.
+
+           :param length: the count of bits to read
+           :param end_state: the state to move to once the data bits have
+                             been read
+           :return: the data bits
+        """
+        self._check_selected()
+        value = int(self._engine.read_dr(length+self._dr_pad, end_state))
+        return BitSequence((value >> self._dr_pos) & ((1 << length)-1),
+                           length=length)
+
+    def queue_ir(self, queue: JtagQueue, instruction: int) -> None:
+        """Queue an instruction change of the device, selecting the BYPASS
+           instruction of all other devices.
+
+           :param queue: the queue to record the scan into
+           :param instruction: the instruction bits
+        """
+        value = BitSequence(self._ir_template |
+                            (int(instruction) << self._ir_pos),
+                            length=self._ir_total)
+        queue.scan_ir(value)
+        self._chain._select(self, value)
+
+    def queue_dr(self, queue: JtagQueue, data: int, length: int,
+                 capture: bool = True, end_state: str = 'update_dr') \
+            -> Optional[JtagScan]:
+        """Queue a data register scan of the device.
+
+           The device bits of the captured value start at
+           :py:attr:`dr_offset`.
+
+           :param queue: the queue to record the scan into
+           :param data: the data bits
+           :param length: the count of data bits
+           :param capture: whether to capture the bits received on TDO
+           :param end_state: the state to move to once the scan is complete
+           :return: the scan of the whole chain, if TDO is captured
+        """
+        return queue.scan_dr(int(data) << self._dr_pos, length+self._dr_pad,
+                             capture=capture, end_state=end_state)
+
+    def _check_selected(self) -> None:
+        # the selection only holds once the instruction has been shifted,
+        # i.e. the queue holding the IR scan has been flushed, and as long
+        # as no other instruction has been shifted since then
+        ir = self._engine._ir
+        if self._chain._selected is not self or ir is None or \
+                ir != self._chain._selected_ir:
+            raise JtagError('No instruction has been written to device %d' %
+                            self.index)
+
+
+class JtagChain:
+    """JTAG chain discovery.
+
+       The count of devices, their identifiers and the length of their
+       instruction registers are detected with a single USB request.
+
+       :param engine: a configured JTAG engine
+       :param max_devices: the maximum count of devices in the chain
+       :param max_ir_length: the maximum length of the whole instruction
+                             register of the chain
+    """
+
+    IDCODE_LENGTH = 32
+    IR_CAPTURE = 0b01  # mandatory value of the two first captured IR bits
+
+    def __init__(self, engine: JtagEngine, max_devices: int = 32,
+                 max_ir_length: int = 1024):
+        self._engine = engine
+        self._max_devices = max_devices
+        self._max_ir_length = max_ir_length
+        self._idcodes: List[Optional[int]] = []
+        self._ir_lengths: List[int] = []
+        self._ir_capture = 0
+        self._devices: List[JtagDevice] = []
+        self._selected: Optional[JtagDevice] = None
+        self._selected_ir: Optional[BitSequence] = None
+
+    def __len__(self):
+        return len(self._idcodes)
+
+    def __getitem__(self, index: int) -> JtagDevice:
+        return self._devices[index]
+
+    @property
+    def engine(self) -> JtagEngine:
+        """Return the JTAG engine.
+
+           :return: the JTAG engine
+        """
+        return self._engine
+
+    @property
+    def devices(self) -> List[JtagDevice]:
+        """Return the detected devices.
+
+           :return: the devices, the first one being the closest one to
+                    the host TDI output
+        """
+        return list(self._devices)
+
+    @property
+    def idcodes(self) -> List[Optional[int]]:
+        """Return the device identifiers.
+
+           :return: the identifiers, None for devices without an IDCODE
+                    register
+        """
+        return list(self._idcodes)
+
+    @property
+    def ir_lengths(self) -> List[int]:
+        """Return the length of the instruction register of the devices.
+
+           :return: the instruction register lengths
+        """
+        return list(self._ir_lengths)
+
+    def detect(self, ir_lengths: Optional[Iterable[int]] = None) \
+            -> List[JtagDevice]:
+        """Detect the devices of the chain.
+
+           The TAP controllers are reset, so that they select their IDCODE
+           register if any, or their BYPASS register otherwise. The count of
+           devices is then detected by flushing the BYPASS registers of the
+           chain, once all instruction registers have been filled with ones.
+
+           The length of each instruction register is inferred from the
+           mandatory ``01`` capture pattern, which may be ambiguous as the
+           other captured bits are device-specific. In this case, the
+           instruction register lengths should be specified.
+
+           :param ir_lengths: the optional length of the instruction
+                              register of each device
+           :return: the detected devices
+        """
+        engine = self._engine
+        max_dev = self._max_devices
+        max_ir = self._max_ir_length
+        queue = JtagQueue(engine)
+        queue.reset()
+        id_len = self.IDCODE_LENGTH*max_dev
+        idscan = queue.scan_dr((1 << id_len)-1, id_len)
+        # zeros then ones: once the captured bits have been flushed out, the
+        # first one bit shows up after as many zeros as the register length
+        irscan = queue.scan_ir(((1 << max_ir)-1) << max_ir, 2*max_ir,
+                               capture=True)
+        # all the devices now are in BYPASS mode
+        bpscan = queue.scan_dr(((1 << max_dev)-1) << max_dev, 2*max_dev)
+        queue.flush()
+        # the identifiers of the devices closest to TDO come first
+        idcodes = []
+        value = int(idscan)
+        while len(idcodes) < max_dev:
+            if not value & 1:
+                idcodes.append(None)
+                value >>= 1
+                continue
+            idcode = value & 0xffffffff
+            if idcode == 0xffffffff:
+                break
+            idcodes.append(idcode)
+            value >>= self.IDCODE_LENGTH
+        count = self._find_marker(int(bpscan), max_dev)
+        ir_total = self._find_marker(int(irscan), max_ir)
+        if not count:
+            raise JtagError('No JTAG device detected')
+        if count != len(idcodes):
+            raise JtagError('Inconsistent device count: %d/%d' %
+                            (count, len(idcodes)))
+        self._idcodes = list(reversed(idcodes))
+        self._ir_capture = int(irscan) & ((1 << ir_total)-1)
+        if ir_lengths is not None:
+            ir_lengths = list(ir_lengths)
+            if (len(ir_lengths) != count or sum(ir_lengths) != ir_total or
+                    not self._check_ir(self._ir_capture, ir_lengths)):
+                raise JtagError('IR lengths do not match the chain')
+        else:
+            ir_lengths = self._split_ir(self._ir_capture, ir_total, count)
+        self._ir_lengths = ir_lengths
+        self._selected = None
+        self._selected_ir = None
+        self._devices = [JtagDevice(self, pos, ir_len, idcode)
+                         for pos, (ir_len, idcode) in
+                         enumerate(zip(self._ir_lengths, self._idcodes))]
+        return self.devices
+
+    def _select(self, device: JtagDevice, instruction: BitSequence) -> None:
+        """Record the device whose instruction is shifted into the chain."""
+        self._selected = device
+        self._selected_ir = instruction
+
+    @classmethod
+    def _find_marker(cls, value: int, max_length: int) -> int:
+        """Find the first one bit after the captured bits, and return the
+           count of captured bits."""
+        value >>= max_length
+        if not value:
+            raise JtagError('JTAG chain is broken or too long')
+        return (value & -value).bit_length()-1
+
+    @classmethod
+    def _check_ir(cls, capture: int, ir_lengths: List[int]) -> bool:
+        """Check that each instruction register starts with the mandatory
+           capture pattern."""
+        pos = 0
+        for ir_length in reversed(ir_lengths):
+            if (capture >> pos) & 0b11 != cls.IR_CAPTURE:
+                return False
+            pos += ir_length
+        return True
+
+    @classmethod
+    def _split_ir(cls, capture: int, ir_total: int, count: int) -> List[int]:
+        """Split the captured IR bits into one register per device."""
+        starts = [pos for pos in range(ir_total-1)
+                  if (capture >> pos) & 0b11 == cls.IR_CAPTURE]
+        if len(starts) != count or (starts and starts[0]):
+            raise JtagError('Unable to infer IR lengths, please specify them')
+        ends = starts[1:] + [ir_total]
+        # the registers closest to TDO come first
+        return [end-start for start, end in reversed(list(zip(starts, ends)))]
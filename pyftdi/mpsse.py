@@ -0,0 +1,124 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""MPSSE command pipelining for PyFtdi protocol engines"""
+
+from typing import Iterable, Iterator, Tuple, Type
+from .ftdi import Ftdi
+
+
+class MpssePipeline:
+    """Send MPSSE command streams and read back their data, keeping the
+       MPSSE engine busy.
+
+       Commands are grouped into segments whose read back data fit into a
+       FIFO chunk. The next segment is always sent out before the data of
+       the current one is read back, so that the bus clock does not stall
+       between segments. A segment never exceeds half of the FTDI FIFOs, so
+       that the RX FIFO cannot stall the MPSSE engine while two segments are
+       in flight.
+
+       :param ftdi: the FTDI device
+       :param error: the exception type to raise on communication errors
+    """
+
+    FTDI_PIPE_LEN = 512
+    """Default chunk size, before the FIFO sizes are known."""
+
+    def __init__(self, ftdi: Ftdi, error: Type[Exception] = IOError):
+        self._ftdi = ftdi
+        self._error = error
+        self._chunk_size = self.FTDI_PIPE_LEN
+
+    def configure(self) -> None:
+        """Size the segments from the FIFOs of the opened FTDI device."""
+        tx_size, rx_size = self._ftdi.fifo_sizes
+        self._chunk_size = min(tx_size, rx_size)//2
+
+    @property
+    def chunk_size(self) -> int:
+        """Report the maximum count of bytes read back per segment.
+
+           :return: the chunk size in bytes
+        """
+        return self._chunk_size
+
+    def build_segments(self, commands: Iterable[Tuple[bytes, int]]) \
+            -> Iterator[Tuple[bytearray, int]]:
+        """Group MPSSE commands into segments whose read back data fit into
+           a FIFO chunk.
+
+           :param commands: an iterable of (command, byte count) tuples
+           :return: a generator of (segment, byte count) tuples
+        """
+        segment = bytearray()
+        size = 0
+        for cmd, rsize in commands:
+            if size and size+rsize > self._chunk_size:
+                segment.append(Ftdi.SEND_IMMEDIATE)
+                yield segment, size
+                segment = bytearray()
+                size = 0
+            segment.extend(cmd)
+            size += rsize
+        if segment:
+            if size:
+                segment.append(Ftdi.SEND_IMMEDIATE)
+            yield segment, size
+
+    def transfer(self, segments: Iterable[Tuple[bytes, int]]) -> bytearray:
+        """Send command segments and read back their data.
+
+           :param segments: an iterable of (segment, byte count) tuples
+           :return: the read back data
+        """
+        if not self._ftdi.is_connected:
+            raise self._error('FTDI controller terminated')
+        data = bytearray()
+        pending = []
+        for segment, size in segments:
+            self._ftdi.write_data(segment)
+            if size:
+                pending.append(size)
+            if len(pending) > 1:
+                data.extend(self._read(pending.pop(0)))
+        while pending:
+            data.extend(self._read(pending.pop(0)))
+        return data
+
+    def exchange(self, commands: Iterable[Tuple[bytes, int]]) -> bytearray:
+        """Send MPSSE commands and read back their data.
+
+           :param commands: an iterable of (command, byte count) tuples
+           :return: the read back data
+        """
+        return self.transfer(self.build_segments(commands))
+
+    def _read(self, size: int) -> bytes:
+        data = self._ftdi.read_data_bytes(size, 4)
+        if len(data) != size:
+            raise self._error('Unable to read data from FTDI')
+        return data
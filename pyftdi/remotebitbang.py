@@ -0,0 +1,364 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Remote bitbang JTAG server for PyFtdi"""
+
+from logging import getLogger
+from select import select
+from socket import socket
+from socketserver import BaseRequestHandler, TCPServer, UnixStreamServer
+from time import perf_counter as now
+from typing import List, Optional, Tuple, Union
+from .ftdi import Ftdi
+from .jtag import JtagController, JtagError
+
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=protected-access
+
+
+class RemoteBitbangDecoder:
+    """Decoder of the OpenOCD remote bitbang protocol.
+
+       The protocol is made of single character commands, which change the
+       TCK, TMS and TDI levels, or request the TDO level. Rather than
+       translating each command into a pin change, the decoder records the
+       TCK cycles, and only executes them when the TDO levels are required,
+       or when too many cycles have been buffered. Runs of cycles with TMS
+       low are shifted with MPSSE byte commands, TMS sequences with MPSSE
+       TMS commands, and TDO is only captured on cycles whose level has been
+       requested.
+
+       :param controller: the JTAG controller
+       :param max_cycles: the count of TCK cycles to buffer before executing
+                          them
+    """
+
+    DEFAULT_MAX_CYCLES = 1 << 16
+
+    def __init__(self, controller: JtagController,
+                 max_cycles: int = DEFAULT_MAX_CYCLES):
+        self.log = getLogger('pyftdi.jtag.rbb')
+        self._ctrl = controller
+        self._max_cycles = max_cycles
+        self._tck = 0
+        self._tms = 0
+        self._tdi = 0
+        # TCK cycles, as (TMS, TDI) levels
+        self._cycles: List[Tuple[int, int]] = []
+        # cycle index of each TDO request, -1 for the last executed cycle
+        self._reads: List[int] = []
+        self._answers = bytearray()
+        # the TMS pin level is unknown till a TMS command has been sent
+        self._pin_tms = 1
+        self._last_tdo: Optional[int] = None
+        self._quit = False
+        self._cycle_count = 0
+        self._time = 0.0
+
+    @property
+    def pending(self) -> bool:
+        """Tell whether some TDO requests have not been answered yet.
+
+           :return: True if :py:meth:`flush` should be called
+        """
+        return bool(self._reads or self._answers)
+
+    @property
+    def quit(self) -> bool:
+        """Tell whether the client has requested to quit.
+
+           :return: True once the quit command has been received
+        """
+        return self._quit
+
+    @property
+    def throughput(self) -> float:
+        """Report the rate of the executed TCK cycles.
+
+           :return: the count of TCK cycles per second
+        """
+        if not self._time:
+            return 0.0
+        return self._cycle_count/self._time
+
+    def reset_statistics(self) -> None:
+        """Reset the throughput statistics."""
+        self._cycle_count = 0
+        self._time = 0.0
+
+    def feed(self, data: Union[bytes, bytearray]) -> None:
+        """Decode remote bitbang commands.
+
+           :param data: the received commands
+        """
+        for code in data:
+            if 0x30 <= code <= 0x37:
+                # '0'..'7': TCK, TMS, TDI levels
+                value = code - 0x30
+                tck = value >> 2
+                self._tms = (value >> 1) & 1
+                self._tdi = value & 1
+                rising = tck and not self._tck
+                self._tck = tck
+                if rising:
+                    self._cycles.append((self._tms, self._tdi))
+                    if len(self._cycles) >= self._max_cycles:
+                        self._execute()
+            elif code == 0x52:
+                # 'R': TDO is updated on TCK falling edges, so that the
+                # requested level is sampled on the next TCK rising edge,
+                # or has been sampled on the last one if TCK is high
+                self._reads.append(len(self._cycles)-self._tck)
+            elif 0x72 <= code <= 0x75:
+                # 'r'..'u': TRST and SRST levels
+                self._reset(bool((code - 0x72) & 0b10))
+            elif code == 0x51:
+                # 'Q'
+                self._quit = True
+            elif code in (0x42, 0x62):
+                # 'B', 'b': blink
+                pass
+            elif code not in (0x0a, 0x0d):
+                self.log.warning('Unsupported command 0x%02x', code)
+
+    def flush(self) -> bytes:
+        """Execute the buffered TCK cycles.
+
+           :return: the TDO levels which have been requested so far, as '0'
+                    or '1' characters
+        """
+        if self._cycles or self._reads:
+            self._execute()
+        answers, self._answers = self._answers, bytearray()
+        return bytes(answers)
+
+    def _reset(self, trst: bool) -> None:
+        self._execute()
+        if not self._ctrl._trst:
+            return
+        value = 0 if trst else JtagController.TRST_BIT
+        if self._pin_tms:
+            value |= JtagController.TMS_BIT
+        self._ctrl._ftdi.write_data(bytes((Ftdi.SET_BITS_LOW, value,
+                                           self._ctrl.direction)))
+
+    def _execute(self) -> None:
+        cycles, self._cycles = self._cycles, []
+        reads, self._reads = self._reads, []
+        count = len(cycles)
+        captures = {index for index in reads if 0 <= index < count}
+        if self._tck and count:
+            # TCK is actually low once a MPSSE clock cycle has completed, so
+            # the last sampled TDO level is kept for the following requests
+            captures.add(count-1)
+        commands, fields = self._build_commands(cycles, captures)
+        # the TDO level to be sampled on the next TCK rising edge
+        pin_read = any(index == count for index in reads)
+        if pin_read:
+            commands.append((bytearray((Ftdi.GET_BITS_LOW,)), 1))
+        if not commands:
+            tdo = {}
+        else:
+            start = now()
+            ctrl = self._ctrl
+            ctrl.sync()
+            data = ctrl.pipe.exchange(commands)
+            self._time += now()-start
+            self._cycle_count += count
+            tdo = {}
+            for index, offset, shift in fields:
+                tdo[index] = (data[offset] >> shift) & 1
+            if pin_read:
+                tdo[count] = int(bool(data[-1] & JtagController.TDO_BIT))
+        last_tdo = self._last_tdo
+        if self._tck and count:
+            self._last_tdo = tdo[count-1]
+        for index in reads:
+            level = tdo.get(index, last_tdo) if index >= 0 else last_tdo
+            if level is None:
+                raise JtagError('No TDO level available')
+            self._answers.append(0x30 + level)
+
+    def _build_commands(self, cycles: List[Tuple[int, int]],
+                        captures: set) \
+            -> Tuple[List[Tuple[bytearray, int]], List[Tuple[int, int, int]]]:
+        """Translate TCK cycles into MPSSE commands.
+
+           :return: the MPSSE commands, as (command, TDO byte count) tuples,
+                    and the TDO bit fields, as (cycle, TDO offset, bit
+                    position) tuples
+        """
+        commands: List[Tuple[bytearray, int]] = []
+        fields: List[Tuple[int, int, int]] = []
+        rsize = 0
+        count = len(cycles)
+        pos = 0
+        while pos < count:
+            end = pos
+            while end < count and not cycles[end][0]:
+                end += 1
+            length = end-pos
+            if length and (length >= 8 or
+                           len({tdi for _, tdi in cycles[pos:end]}) > 1):
+                if self._pin_tms:
+                    # TMS should be low before data can be shifted
+                    end = pos+1
+                else:
+                    read = any(index in captures for index in range(pos, end))
+                    out = sum(cycles[index][1] << (index-pos)
+                              for index in range(pos, end))
+                    byte_count, bit_count = divmod(length, 8)
+                    bit = pos
+                    for cmd, size in self._ctrl._build_shift_commands(
+                            out.to_bytes((length+7)//8, 'little'),
+                            byte_count, bit_count, read):
+                        commands.append((cmd, size))
+                        if not read:
+                            continue
+                        if bit-pos < 8*byte_count:
+                            for index in range(bit, bit+8*size):
+                                if index in captures:
+                                    off, shift = divmod(index-bit, 8)
+                                    fields.append((index, rsize+off, shift))
+                            bit += 8*size
+                        else:
+                            # bits are shifted in from the MSB in FTDI
+                            for index in range(bit, bit+bit_count):
+                                if index in captures:
+                                    fields.append(
+                                        (index, rsize,
+                                         8-bit_count+index-bit))
+                        rsize += size
+                    pos += length
+                    continue
+            # TMS command, with a constant TDI level
+            tdi = cycles[pos][1]
+            end = pos+1
+            while end < count and end-pos < 7 and cycles[end][1] == tdi:
+                end += 1
+            length = end-pos
+            tms = sum(cycles[index][0] << (index-pos)
+                      for index in range(pos, end))
+            read = any(index in captures for index in range(pos, end))
+            if read:
+                commands.append((bytearray((Ftdi.RW_BITS_TMS_PVE_NVE,
+                                            length-1, tms | (tdi << 7))), 1))
+                for index in range(pos, end):
+                    if index in captures:
+                        fields.append((index, rsize, 8-length+index-pos))
+                rsize += 1
+            else:
+                commands.append((bytearray((Ftdi.WRITE_BITS_TMS_NVE,
+                                            length-1, tms | (tdi << 7))), 0))
+            self._pin_tms = cycles[end-1][0]
+            pos = end
+        return commands, fields
+
+
+class _TCPServer(TCPServer):
+    """TCP server which may be restarted on the same port right away."""
+
+    allow_reuse_address = True
+
+
+class _UnixStreamServer(UnixStreamServer):
+    """Unix socket server which may be restarted on the same path right
+       away."""
+
+    allow_reuse_address = True
+
+
+class RemoteBitbangServer:
+    """Remote bitbang JTAG server, which serves a single client at once.
+
+       :param controller: the configured JTAG controller
+       :param address: a (host, port) tuple for a TCP socket, or a path for
+                       a Unix domain socket
+       :param max_cycles: the count of TCK cycles to buffer before executing
+                          them
+    """
+
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, controller: JtagController,
+                 address: Union[Tuple[str, int], str],
+                 max_cycles: int = RemoteBitbangDecoder.DEFAULT_MAX_CYCLES):
+        self.log = getLogger('pyftdi.jtag.rbb')
+        self._decoder = RemoteBitbangDecoder(controller, max_cycles)
+        decoder = self._decoder
+        buffer_size = self.BUFFER_SIZE
+        log = self.log
+
+        class Handler(BaseRequestHandler):
+            """Serve a remote bitbang client."""
+
+            def handle(self):
+                log.info('Client connected')
+                sock: socket = self.request
+                while not decoder.quit:
+                    data = sock.recv(buffer_size)
+                    if not data:
+                        break
+                    decoder.feed(data)
+                    if decoder.pending:
+                        # wait for the client to stop sending commands
+                        readable = select([sock], [], [], 0)[0]
+                        if not readable or decoder.quit:
+                            sock.sendall(decoder.flush())
+                decoder.flush()
+                log.info('Client disconnected')
+
+        server_class = (_UnixStreamServer if isinstance(address, str) else
+                        _TCPServer)
+        self._server = server_class(address, Handler)
+
+    @property
+    def decoder(self) -> RemoteBitbangDecoder:
+        """Return the remote bitbang protocol decoder.
+
+           :return: the decoder
+        """
+        return self._decoder
+
+    @property
+    def server_address(self) -> Union[Tuple[str, int], str]:
+        """Return the actual address of the server.
+
+           :return: the TCP address or the Unix socket path
+        """
+        return self._server.server_address
+
+    def serve_forever(self) -> None:
+        """Serve clients till :py:meth:`shutdown` is called."""
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        """Stop serving clients, from another thread."""
+        self._server.shutdown()
+
+    def close(self) -> None:
+        """Release the server socket."""
+        self._server.server_close()
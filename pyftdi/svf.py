@@ -0,0 +1,605 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""SVF and XSVF player for PyFtdi"""
+
+from collections import namedtuple
+from logging import getLogger
+from math import ceil
+from re import compile as recompile
+from time import perf_counter as now
+from typing import (BinaryIO, Iterator, List, Optional, Sequence, TextIO,
+                    Tuple, Union)
+from .jtag import JtagEngine, JtagError, JtagQueue, JtagScan
+
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-arguments
+#pylint: disable-msg=too-many-locals
+#pylint: disable-msg=unused-argument
+
+
+class SvfError(JtagError):
+    """SVF or XSVF playback error."""
+
+
+SvfStatistics = namedtuple('SvfStatistics',
+                           'commands scans bits elapsed throughput')
+"""Statistics of the SVF or XSVF commands that have been played.
+
+   * ``commands`` is the count of executed commands,
+   * ``scans`` is the count of IR and DR scans,
+   * ``bits`` is the count of bits shifted in the scans,
+   * ``elapsed`` is the playback time in seconds,
+   * ``throughput`` is the scan throughput in bytes per second.
+"""
+
+
+class SvfPlayer:
+    """SVF and XSVF player.
+
+       SVF and XSVF files are parsed as a stream, so that large FPGA
+       bitstreams do not need to be loaded in memory. Scans and Run-Test/Idle
+       clock cycles are queued into large MPSSE command streams, and the TDO
+       values are checked against their expected values once a whole batch
+       has been executed, so that the JTAG clock keeps running whatever the
+       USB latency.
+
+       :param engine: a configured JTAG engine
+       :param batch_size: the count of shifted bytes to queue before the
+                          queued commands are executed
+    """
+
+    DEFAULT_BATCH_SIZE = 1 << 16
+
+    SVF_STATES = {
+        'RESET': 'test_logic_reset',
+        'IDLE': 'run_test_idle',
+        'DRSELECT': 'select_dr_scan',
+        'DRCAPTURE': 'capture_dr',
+        'DRSHIFT': 'shift_dr',
+        'DREXIT1': 'exit_1_dr',
+        'DRPAUSE': 'pause_dr',
+        'DREXIT2': 'exit_2_dr',
+        'DRUPDATE': 'update_dr',
+        'IRSELECT': 'select_ir_scan',
+        'IRCAPTURE': 'capture_ir',
+        'IRSHIFT': 'shift_ir',
+        'IREXIT1': 'exit_1_ir',
+        'IRPAUSE': 'pause_ir',
+        'IREXIT2': 'exit_2_ir',
+        'IRUPDATE': 'update_ir'}
+    """SVF state names."""
+
+    XSVF_STATES = ('test_logic_reset', 'run_test_idle', 'select_dr_scan',
+                   'capture_dr', 'shift_dr', 'exit_1_dr', 'pause_dr',
+                   'exit_2_dr', 'update_dr', 'select_ir_scan', 'capture_ir',
+                   'shift_ir', 'exit_1_ir', 'pause_ir', 'exit_2_ir',
+                   'update_ir')
+    """XSVF state encoding."""
+
+    STABLE_STATES = ('test_logic_reset', 'run_test_idle', 'pause_dr',
+                     'pause_ir')
+    """States the TAP controller may stay in."""
+
+    (XCOMPLETE, XTDOMASK, XSIR, XSDR, XRUNTEST, _, _, XREPEAT, XSDRSIZE,
+     XSDRTDO, XSETSDRMASKS, XSDRINC, XSDRB, XSDRC, XSDRE, XSDRTDOB, XSDRTDOC,
+     XSDRTDOE, XSTATE, XENDIR, XENDDR, XSIR2, XCOMMENT, XWAIT) = range(24)
+    """XSVF instructions."""
+
+    SVF_TOKEN = recompile(r'\(([^)]*)\)|([^\s()]+)')
+
+    def __init__(self, engine: JtagEngine,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.log = getLogger('pyftdi.svf')
+        self._ctrl = engine.controller
+        self._queue = JtagQueue(engine)
+        self._batch_size = batch_size
+        self._checks: List[Tuple[JtagScan, str]] = []
+        self._pending = 0
+        self._frequency = 0.0
+        self._max_frequency = 0.0
+        self._endir = 'run_test_idle'
+        self._enddr = 'run_test_idle'
+        # SVF state
+        self._run_state = 'run_test_idle'
+        self._run_end_state = 'run_test_idle'
+        self._svf_params = {}
+        # XSVF state
+        self._xsdrsize = 0
+        self._xtdomask = 0
+        self._xtdoexpected = 0
+        self._xruntest = 0
+        self._xrepeat = 0
+        # statistics
+        self._commands = 0
+        self._scans = 0
+        self._bits = 0
+        self._elapsed = 0.0
+
+    @property
+    def statistics(self) -> SvfStatistics:
+        """Report the statistics of the commands played so far.
+
+           :return: the playback statistics
+        """
+        rate = self._bits/(8*self._elapsed) if self._elapsed else 0.0
+        return SvfStatistics(self._commands, self._scans, self._bits,
+                             self._elapsed, rate)
+
+    def reset_statistics(self) -> None:
+        """Reset the playback statistics."""
+        self._commands = 0
+        self._scans = 0
+        self._bits = 0
+        self._elapsed = 0.0
+
+    def play_svf(self, svf: Union[str, TextIO]) -> SvfStatistics:
+        """Play a SVF file.
+
+           :param svf: the path to the SVF file, or a text stream
+           :return: the playback statistics
+        """
+        if isinstance(svf, str):
+            with open(svf, 'rt') as svfp:
+                return self.play_svf(svfp)
+        self._start()
+        self._run_state = 'run_test_idle'
+        self._run_end_state = 'run_test_idle'
+        self._svf_params = {kind: [0, 0, None, 0] for kind in
+                            ('SIR', 'SDR', 'HIR', 'HDR', 'TIR', 'TDR')}
+        start = now()
+        try:
+            for lineno, tokens in self.parse_svf(svf):
+                command = tokens[0].upper()
+                handler = getattr(self, '_svf_%s' % command.lower(), None)
+                if not handler:
+                    raise SvfError('Unsupported SVF command %s at line %d' %
+                                   (command, lineno))
+                try:
+                    handler(tokens[1:], 'line %d' % lineno)
+                except (IndexError, ValueError, KeyError) as exc:
+                    raise SvfError('Invalid SVF command %s at line %d: %s' %
+                                   (command, lineno, exc))
+                self._commands += 1
+            self._flush()
+        finally:
+            self._stop(start)
+        return self.statistics
+
+    def play_xsvf(self, xsvf: Union[str, BinaryIO]) -> SvfStatistics:
+        """Play a XSVF file.
+
+           :param xsvf: the path to the XSVF file, or a binary stream
+           :return: the playback statistics
+        """
+        if isinstance(xsvf, str):
+            with open(xsvf, 'rb') as xsvfp:
+                return self.play_xsvf(xsvfp)
+        self._start()
+        self._xsdrsize = 0
+        self._xtdomask = 0
+        self._xtdoexpected = 0
+        self._xruntest = 0
+        self._xrepeat = 0
+        handlers = {
+            self.XTDOMASK: self._xsvf_xtdomask,
+            self.XSIR: self._xsvf_xsir,
+            self.XSDR: self._xsvf_xsdr,
+            self.XRUNTEST: self._xsvf_xruntest,
+            self.XREPEAT: self._xsvf_xrepeat,
+            self.XSDRSIZE: self._xsvf_xsdrsize,
+            self.XSDRTDO: self._xsvf_xsdrtdo,
+            self.XSDRB: self._xsvf_xsdrb,
+            self.XSDRC: self._xsvf_xsdrb,
+            self.XSDRE: self._xsvf_xsdre,
+            self.XSDRTDOB: self._xsvf_xsdrtdob,
+            self.XSDRTDOC: self._xsvf_xsdrtdob,
+            self.XSDRTDOE: self._xsvf_xsdrtdoe,
+            self.XSTATE: self._xsvf_xstate,
+            self.XENDIR: self._xsvf_xendir,
+            self.XENDDR: self._xsvf_xenddr,
+            self.XSIR2: self._xsvf_xsir2,
+            self.XCOMMENT: self._xsvf_xcomment,
+            self.XWAIT: self._xsvf_xwait}
+        start = now()
+        try:
+            while True:
+                offset = xsvf.tell() if xsvf.seekable() else self._commands
+                code = xsvf.read(1)
+                if not code or code[0] == self.XCOMPLETE:
+                    break
+                handler = handlers.get(code[0])
+                if not handler:
+                    raise SvfError('Unsupported XSVF instruction 0x%02x @ %d' %
+                                   (code[0], offset))
+                handler(xsvf, '@ %d' % offset)
+                self._commands += 1
+            self._flush()
+        finally:
+            self._stop(start)
+        return self.statistics
+
+    @classmethod
+    def parse_svf(cls, svf: TextIO) -> Iterator[Tuple[int, List[str]]]:
+        """Parse a SVF stream, one command at a time.
+
+           Data fields are reported as a single token, enclosed within
+           parenthesis, without any whitespace.
+
+           :param svf: the SVF text stream
+           :return: a generator of (line number, tokens) tuples
+        """
+        statement = []
+        for lineno, line in enumerate(svf, start=1):
+            for marker in ('!', '//'):
+                pos = line.find(marker)
+                if pos >= 0:
+                    line = line[:pos]
+            while True:
+                pos = line.find(';')
+                if pos < 0:
+                    statement.append(line)
+                    break
+                statement.append(line[:pos])
+                line = line[pos+1:]
+                tokens = []
+                for data, word in cls.SVF_TOKEN.findall(''.join(statement)):
+                    tokens.append('(%s)' % ''.join(data.split()) if not word
+                                  else word)
+                statement = []
+                if tokens:
+                    yield lineno, tokens
+        if ''.join(statement).strip():
+            raise SvfError('Unterminated SVF command')
+
+    def _start(self) -> None:
+        self._checks = []
+        self._pending = 0
+        self._endir = 'run_test_idle'
+        self._enddr = 'run_test_idle'
+        self._frequency = self._ctrl.frequency
+        self._max_frequency = self._frequency
+
+    def _stop(self, start: float) -> None:
+        if self._max_frequency != self._frequency:
+            self._frequency = self._ctrl.set_frequency(self._max_frequency)
+        self._elapsed += now()-start
+        stats = self.statistics
+        self.log.info('%d commands, %d scans, %.3f MB/s', stats.commands,
+                      stats.scans, stats.throughput/1E6)
+
+    def _flush(self) -> None:
+        """Execute the queued commands, and check the captured TDO values
+           against the expected ones."""
+        self._queue.flush()
+        checks, self._checks = self._checks, []
+        self._pending = 0
+        for scan, where in checks:
+            if not scan.matched:
+                raise SvfError('TDO mismatch %s: expected 0x%x, got 0x%x, '
+                               'mask 0x%x' % (where, scan.expect, int(scan),
+                                              scan.mask))
+
+    def _scan(self, ir: bool, tdi: int, length: int, end_state: str,
+              expect: Optional[int], mask: Optional[int], where: str) \
+            -> Optional[JtagScan]:
+        """Queue a scan whose TDO value is checked with the next batch."""
+        if not length:
+            return None
+        if expect is not None and not mask:
+            expect = None
+        scan_cmd = self._queue.scan_ir if ir else self._queue.scan_dr
+        scan = scan_cmd(tdi, length, capture=False, end_state=end_state,
+                        expect=expect, mask=mask)
+        if scan:
+            self._checks.append((scan, where))
+        self._scans += 1
+        self._bits += length
+        self._pending += length
+        if self._pending >= 8*self._batch_size:
+            self._flush()
+        return scan
+
+    def _run_test(self, statename: str, duration: float,
+                  cycles: int = 0) -> None:
+        """Clock the TAP controller in a stable state, at least for the
+           specified duration, using clock-only MPSSE commands."""
+        if duration:
+            cycles = max(cycles, ceil(duration*self._frequency))
+        self._queue.run_test(cycles, statename)
+
+    def _change_state(self, statename: str) -> None:
+        if statename == 'test_logic_reset':
+            # do not rely on the current state, which may not be known
+            self._queue.reset()
+        else:
+            self._queue.change_state(statename)
+
+    def _get_svf_state(self, name: str, stable: bool = True) -> str:
+        statename = self.SVF_STATES[name.upper()]
+        if stable and statename not in self.STABLE_STATES:
+            raise ValueError('%s is not a stable state' % name)
+        return statename
+
+    def _svf_endir(self, args: Sequence[str], where: str) -> None:
+        self._endir = self._get_svf_state(args[0])
+
+    def _svf_enddr(self, args: Sequence[str], where: str) -> None:
+        self._enddr = self._get_svf_state(args[0])
+
+    def _svf_state(self, args: Sequence[str], where: str) -> None:
+        if not args:
+            raise ValueError('Missing state')
+        for pos, name in enumerate(args, start=1):
+            self._change_state(self._get_svf_state(name, pos == len(args)))
+
+    def _svf_frequency(self, args: Sequence[str], where: str) -> None:
+        frequency = min(float(args[0]), self._max_frequency) if args else \
+            self._max_frequency
+        # already queued commands should run at the previous frequency
+        self._flush()
+        self._frequency = self._ctrl.set_frequency(frequency)
+
+    def _svf_trst(self, args: Sequence[str], where: str) -> None:
+        self.log.debug('TRST %s ignored %s', args[0], where)
+
+    def _svf_runtest(self, args: Sequence[str], where: str) -> None:
+        args = [arg.upper() for arg in args]
+        if args and args[0] in self.SVF_STATES:
+            self._run_state = self._get_svf_state(args.pop(0))
+            # the end state defaults to the run state when the latter is
+            # specified, and to the previous end state otherwise
+            self._run_end_state = self._run_state
+        cycles = 0
+        duration = 0.0
+        while args:
+            arg = args.pop(0)
+            if arg == 'MAXIMUM':
+                # maximum time is not enforced
+                args.pop(0)
+                args.pop(0)
+            elif arg == 'ENDSTATE':
+                self._run_end_state = self._get_svf_state(args.pop(0))
+            elif args and args[0] in ('TCK', 'SCK'):
+                args.pop(0)
+                cycles = int(float(arg))
+            elif args and args[0] == 'SEC':
+                args.pop(0)
+                duration = float(arg)
+            else:
+                raise ValueError('Unexpected argument %s' % arg)
+        self._run_test(self._run_state, duration, cycles)
+        self._queue.change_state(self._run_end_state)
+
+    def _svf_hir(self, args: Sequence[str], where: str) -> None:
+        self._get_svf_params('HIR', args)
+
+    def _svf_tir(self, args: Sequence[str], where: str) -> None:
+        self._get_svf_params('TIR', args)
+
+    def _svf_hdr(self, args: Sequence[str], where: str) -> None:
+        self._get_svf_params('HDR', args)
+
+    def _svf_tdr(self, args: Sequence[str], where: str) -> None:
+        self._get_svf_params('TDR', args)
+
+    def _svf_sir(self, args: Sequence[str], where: str) -> None:
+        self._svf_scan(True, args, where)
+
+    def _svf_sdr(self, args: Sequence[str], where: str) -> None:
+        self._svf_scan(False, args, where)
+
+    def _svf_scan(self, ir: bool, args: Sequence[str], where: str) -> None:
+        kind = 'IR' if ir else 'DR'
+        length, tdi, tdo, mask = self._get_svf_params('S%s' % kind, args)
+        hlen, htdi, htdo, hmask = self._svf_params['H%s' % kind]
+        tlen, ttdi, ttdo, tmask = self._svf_params['T%s' % kind]
+        tdi = htdi | (tdi << hlen) | (ttdi << (hlen+length))
+        expect = None
+        if (tdo, htdo, ttdo) != (None, None, None):
+            expect = ((htdo or 0) | ((tdo or 0) << hlen) |
+                      ((ttdo or 0) << (hlen+length)))
+            mask = ((hmask if htdo is not None else 0) |
+                    ((mask if tdo is not None else 0) << hlen) |
+                    ((tmask if ttdo is not None else 0) << (hlen+length)))
+        self._scan(ir, tdi, hlen+length+tlen,
+                   self._endir if ir else self._enddr, expect, mask, where)
+
+    def _get_svf_params(self, kind: str, args: Sequence[str]) \
+            -> Tuple[int, int, Optional[int], int]:
+        """Parse the arguments of a scan command, and update the sticky
+           values of the command.
+
+           :return: the length, TDI, TDO and MASK values of the scan
+        """
+        params = self._svf_params[kind]
+        length = int(args[0])
+        values = {}
+        for pos in range(1, len(args), 2):
+            key = args[pos].upper()
+            data = args[pos+1]
+            if not data.startswith('('):
+                raise ValueError('Invalid %s value' % key)
+            values[key] = int(data[1:-1] or '0', 16)
+        if length != params[0]:
+            # TDI and MASK may only be reused with the same length
+            params[:] = [length, None, None, (1 << length)-1]
+        if 'TDI' in values:
+            params[1] = values['TDI']
+        if 'MASK' in values:
+            params[3] = values['MASK']
+        # header and trailer TDO values are sticky, scan ones are not
+        if kind[0] != 'S':
+            params[2] = values.get('TDO', params[2])
+        if params[1] is None:
+            if length:
+                raise ValueError('Missing TDI value')
+            params[1] = 0
+        return params[0], params[1], values.get('TDO', params[2]), params[3]
+
+    def _read_xsvf(self, xsvf: BinaryIO, size: int) -> bytes:
+        data = xsvf.read(size)
+        if len(data) != size:
+            raise SvfError('Truncated XSVF stream')
+        return data
+
+    def _read_xsvf_int(self, xsvf: BinaryIO, size: int) -> int:
+        return int.from_bytes(self._read_xsvf(xsvf, size), 'big')
+
+    def _read_xsvf_vector(self, xsvf: BinaryIO, length: int) -> int:
+        return self._read_xsvf_int(xsvf, (length+7)//8)
+
+    def _xsvf_runtest(self, statename: str) -> None:
+        if self._xruntest:
+            self._run_test(statename, self._xruntest*1E-6)
+
+    def _xsvf_shift_dr(self, tdi: int, where: str) -> None:
+        """Shift a DR, check it against the expected TDO value, and retry
+           on mismatch if XREPEAT and XRUNTEST are set.
+
+           As with the Xilinx reference player, each retry shifts an extra
+           bit through Pause-DR, then waits in Run-Test/Idle for the
+           XRUNTEST time, increased by 25% on each attempt."""
+        length = self._xsdrsize
+        expect = self._xtdoexpected
+        mask = self._xtdomask
+        if not self._xrepeat or not mask:
+            self._scan(False, tdi, length, self._enddr, expect, mask, where)
+            self._xsvf_runtest(self._enddr)
+            return
+        # retries require the TDO value to be checked right away
+        self._flush()
+        queue = self._queue
+        runtest = self._xruntest
+        attempt = 0
+        while True:
+            scan = queue.scan_dr(tdi, length, capture=False,
+                                 end_state='exit_1_dr', expect=expect,
+                                 mask=mask)
+            self._scans += 1
+            self._bits += length
+            queue.flush()
+            attempt += 1
+            if scan.matched:
+                break
+            if not runtest or attempt > self._xrepeat:
+                raise SvfError('TDO mismatch %s after %d attempts: expected '
+                               '0x%x, got 0x%x, mask 0x%x' %
+                               (where, attempt, expect, int(scan), mask))
+            # Exit1-DR, Pause-DR, Exit2-DR, Shift-DR, then leave Shift-DR
+            # with an extra bit, and wait longer in Run-Test/Idle
+            queue.change_state('pause_dr')
+            queue.change_state('shift_dr')
+            runtest += runtest >> 2
+            self._run_test('run_test_idle', runtest*1E-6)
+        queue.change_state('update_dr')
+        queue.change_state(self._enddr)
+        if runtest:
+            self._run_test(self._enddr, runtest*1E-6)
+
+    def _xsvf_xtdomask(self, xsvf: BinaryIO, where: str) -> None:
+        self._xtdomask = self._read_xsvf_vector(xsvf, self._xsdrsize)
+
+    def _xsvf_xsir(self, xsvf: BinaryIO, where: str, lsize: int = 1) -> None:
+        length = self._read_xsvf_int(xsvf, lsize)
+        tdi = self._read_xsvf_vector(xsvf, length)
+        self._scan(True, tdi, length, self._endir, None, None, where)
+        self._xsvf_runtest(self._endir)
+
+    def _xsvf_xsir2(self, xsvf: BinaryIO, where: str) -> None:
+        self._xsvf_xsir(xsvf, where, 2)
+
+    def _xsvf_xsdr(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._xsvf_shift_dr(tdi, where)
+
+    def _xsvf_xsdrtdo(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._xtdoexpected = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._xsvf_shift_dr(tdi, where)
+
+    def _xsvf_xsdrb(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._scan(False, tdi, self._xsdrsize, 'shift_dr', None, None, where)
+
+    def _xsvf_xsdre(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._scan(False, tdi, self._xsdrsize, self._enddr, None, None, where)
+
+    def _xsvf_xsdrtdob(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        tdo = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._scan(False, tdi, self._xsdrsize, 'shift_dr', tdo,
+                   self._xtdomask, where)
+
+    def _xsvf_xsdrtdoe(self, xsvf: BinaryIO, where: str) -> None:
+        tdi = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        tdo = self._read_xsvf_vector(xsvf, self._xsdrsize)
+        self._scan(False, tdi, self._xsdrsize, self._enddr, tdo,
+                   self._xtdomask, where)
+
+    def _xsvf_xruntest(self, xsvf: BinaryIO, where: str) -> None:
+        self._xruntest = self._read_xsvf_int(xsvf, 4)
+
+    def _xsvf_xrepeat(self, xsvf: BinaryIO, where: str) -> None:
+        self._xrepeat = self._read_xsvf_int(xsvf, 1)
+
+    def _xsvf_xsdrsize(self, xsvf: BinaryIO, where: str) -> None:
+        self._xsdrsize = self._read_xsvf_int(xsvf, 4)
+
+    def _get_xsvf_state(self, xsvf: BinaryIO) -> str:
+        state = self._read_xsvf_int(xsvf, 1)
+        if state >= len(self.XSVF_STATES):
+            raise SvfError('Invalid XSVF state %d' % state)
+        return self.XSVF_STATES[state]
+
+    def _xsvf_xstate(self, xsvf: BinaryIO, where: str) -> None:
+        self._change_state(self._get_xsvf_state(xsvf))
+
+    def _xsvf_xendir(self, xsvf: BinaryIO, where: str) -> None:
+        self._endir = ('run_test_idle', 'pause_ir')[
+            self._read_xsvf_int(xsvf, 1) & 1]
+
+    def _xsvf_xenddr(self, xsvf: BinaryIO, where: str) -> None:
+        self._enddr = ('run_test_idle', 'pause_dr')[
+            self._read_xsvf_int(xsvf, 1) & 1]
+
+    def _xsvf_xcomment(self, xsvf: BinaryIO, where: str) -> None:
+        comment = bytearray()
+        while True:
+            char = self._read_xsvf(xsvf, 1)
+            if not char[0]:
+                break
+            comment.extend(char)
+        self.log.debug('XSVF %s: %s', where, comment.decode(errors='replace'))
+
+    def _xsvf_xwait(self, xsvf: BinaryIO, where: str) -> None:
+        wait_state = self._get_xsvf_state(xsvf)
+        end_state = self._get_xsvf_state(xsvf)
+        duration = self._read_xsvf_int(xsvf, 4)*1E-6
+        self._change_state(wait_state)
+        self._run_test(wait_state, duration)
+        self._change_state(end_state)
@@ -0,0 +1,580 @@
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Neotion nor the names of its contributors may
+#       be used to endorse or promote products derived from this software
+#       without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL NEOTION BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA,
+# OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""SWD support for PyFtdi"""
+
+from logging import getLogger
+from time import perf_counter as now
+from typing import List, Optional, Tuple
+from .ftdi import Ftdi
+from .mpsse import MpssePipeline
+
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-public-methods
+#pylint: disable-msg=protected-access
+
+
+class SwdError(Exception):
+    """Generic SWD error."""
+
+
+class SwdFaultError(SwdError):
+    """SWD FAULT response, reported when a sticky error flag of the debug
+       port is set."""
+
+
+class SwdTransfer:
+    """A SWD register access, queued in a :py:class:`SwdQueue`.
+
+       The read value is only available once the queue has been flushed.
+
+       :param ap: whether to access an AP register, or a DP register
+       :param address: the register address, only bits 3:2 are used
+       :param read: whether to read the register
+       :param value: the value to write
+    """
+
+    def __init__(self, ap: bool, address: int, read: bool, value: int = 0):
+        self.ap = ap
+        self.address = address
+        self.read = read
+        self._value = None if read else value & 0xffffffff
+
+    @property
+    def done(self) -> bool:
+        """Tell whether the transfer has been executed.
+
+           :return: True once the read value is available
+        """
+        return self._value is not None
+
+    @property
+    def value(self) -> int:
+        """Return the read or written value.
+
+           :return: the register value
+        """
+        if self._value is None:
+            raise SwdError('Transfer has not been executed')
+        return self._value
+
+    @property
+    def request(self) -> int:
+        """Return the request header of the transfer.
+
+           :return: the 8-bit header, first bit as the least significant one
+        """
+        bits = int(self.ap) | (int(self.read) << 1) | \
+            ((self.address >> 2) & 0b11) << 2
+        return 0x81 | (bits << 1) | (SwdController.parity(bits) << 5)
+
+    def __repr__(self):
+        return '%s %s 0x%x' % ('AP' if self.ap else 'DP',
+                               'R' if self.read else 'W', self.address)
+
+
+class SwdController:
+    """SWD master of an FTDI device.
+
+       SWCLK is AD0. SWDIO is driven by AD1 and sampled on AD2: AD1 should
+       be connected to the SWDIO line through a resistor, and AD2 directly
+       connected to the SWDIO line.
+
+       Register accesses are queued as MPSSE command streams, so that many
+       of them can be executed with a single USB request. ACK and parity
+       bits are checked on the host once the whole stream has been read
+       back. :py:meth:`connect` enables the overrun detection of the debug
+       port: a WAIT response sets the sticky overrun flag, and all the
+       following accesses get a FAULT response, so that none of them is
+       executed. Accesses are then replayed from the first one that has been
+       ignored, once the flag has been cleared, and the count of idle
+       cycles inserted after each AP access is doubled.
+
+       :param frequency: the SWCLK frequency in Hz
+       :param idle_cycles: the count of SWCLK cycles to insert after each AP
+                           access, to let the access complete
+       :param retries: the maximum count of consecutive replays without
+                       any progress
+    """
+
+    SWCLK_BIT = 0x01    # FTDI output
+    SWDIO_O_BIT = 0x02  # FTDI output
+    SWDIO_I_BIT = 0x04  # FTDI input
+    SWD_MASK = 0x07
+
+    ACK_OK = 0b001
+    ACK_WAIT = 0b010
+    ACK_FAULT = 0b100
+
+    DPIDR = 0x0
+    ABORT = 0x0
+    CTRL_STAT = 0x4
+    SELECT = 0x8
+    RDBUFF = 0xC
+
+    CSYSPWRUPACK = 1 << 31
+    CSYSPWRUPREQ = 1 << 30
+    CDBGPWRUPACK = 1 << 29
+    CDBGPWRUPREQ = 1 << 28
+    WDATAERR = 1 << 7
+    STICKYERR = 1 << 5
+    STICKYCMP = 1 << 4
+    STICKYORUN = 1 << 1
+    ORUNDETECT = 1 << 0
+
+    ORUNERRCLR = 1 << 4
+    WDERRCLR = 1 << 3
+    STKERRCLR = 1 << 2
+    STKCMPCLR = 1 << 1
+    DAPABORT = 1 << 0
+
+    JTAG_TO_SWD = 0xe79e
+    LINE_RESET_BYTES = 7  # at least 50 SWCLK cycles with SWDIO high
+    TRAILING_IDLE_CYCLES = 8
+    DEFAULT_RETRIES = 16
+    MAX_IDLE_CYCLES = 1024
+
+    def __init__(self, frequency: float = 6.0E6, idle_cycles: int = 0,
+                 retries: int = DEFAULT_RETRIES):
+        self.log = getLogger('pyftdi.swd')
+        self._ftdi = Ftdi()
+        self._frequency = frequency
+        self._idle_cycles = idle_cycles
+        self._retries = retries
+        self._pipe = MpssePipeline(self._ftdi, SwdError)
+        self._select: Optional[int] = None
+        self._ctrl_stat = 0
+        self._waits = 0
+        self._transfers = 0
+        self._drive = bytes((Ftdi.SET_BITS_LOW, 0,
+                             self.SWCLK_BIT | self.SWDIO_O_BIT))
+        self._release = bytes((Ftdi.SET_BITS_LOW, 0, self.SWCLK_BIT))
+
+    def configure(self, url: str) -> None:
+        """Configure the FTDI interface as a SWD controller.
+
+           :param url: the FTDI URL of the interface
+        """
+        self._frequency = self._ftdi.open_mpsse_from_url(
+            url, direction=self.SWCLK_BIT | self.SWDIO_O_BIT,
+            frequency=self._frequency)
+        self._pipe.configure()
+        self._ftdi.write_data(self._drive)
+
+    def close(self) -> None:
+        """Close the FTDI interface."""
+        if self._ftdi.is_connected:
+            self._ftdi.close()
+
+    @property
+    def ftdi(self) -> Ftdi:
+        """Return the Ftdi instance.
+
+           :return: the Ftdi instance
+        """
+        return self._ftdi
+
+    @property
+    def frequency(self) -> float:
+        """Return the SWD clock frequency.
+
+           :return: the actual SWCLK frequency in Hz, once configured
+        """
+        return self._frequency
+
+    def set_frequency(self, frequency: float) -> float:
+        """Change the SWD clock frequency.
+
+           :param frequency: the new SWCLK frequency in Hz
+           :return: the actual SWCLK frequency, which may differ from the
+                    requested one
+        """
+        self._frequency = self._ftdi.set_frequency(frequency)
+        return self._frequency
+
+    @property
+    def idle_cycles(self) -> int:
+        """Report the count of SWCLK cycles inserted after each AP access,
+           which grows with WAIT responses.
+
+           :return: the count of idle cycles
+        """
+        return self._idle_cycles
+
+    @property
+    def wait_count(self) -> int:
+        """Report how many WAIT responses have been received.
+
+           :return: the count of WAIT responses
+        """
+        return self._waits
+
+    @property
+    def transfer_count(self) -> int:
+        """Report how many register accesses have been completed.
+
+           :return: the count of register accesses
+        """
+        return self._transfers
+
+    @classmethod
+    def parity(cls, value: int) -> int:
+        """Compute the even parity bit of a value.
+
+           :param value: the value
+           :return: the parity bit
+        """
+        return bin(value).count('1') & 1
+
+    def line_reset(self) -> None:
+        """Reset the SWD line: clock SWDIO high for more than 50 cycles,
+           then low for a couple of cycles."""
+        cmd = bytearray(self._line_reset())
+        cmd.extend(self._write_bits(0, 8))
+        self._ftdi.write_data(cmd)
+        self._select = None
+
+    def switch_to_swd(self) -> None:
+        """Switch a SWJ-DP from JTAG to SWD, with the selection sequence
+           framed by line resets."""
+        cmd = bytearray(self._line_reset())
+        cmd.extend(self._write_bits(self.JTAG_TO_SWD, 16))
+        cmd.extend(self._line_reset())
+        cmd.extend(self._write_bits(0, 8))
+        self._ftdi.write_data(cmd)
+        self._select = None
+
+    def connect(self) -> int:
+        """Switch the debug port to SWD, read its identifier, then clear its
+           sticky errors and enable its overrun detection.
+
+           :return: the DPIDR value
+        """
+        self.switch_to_swd()
+        # the DPIDR register should be read first after a line reset
+        idcode = self.read_dp(self.DPIDR)
+        self.write_dp(self.ABORT, self.ORUNERRCLR | self.WDERRCLR |
+                      self.STKERRCLR | self.STKCMPCLR)
+        self._ctrl_stat = self.ORUNDETECT
+        self.write_dp(self.CTRL_STAT, self._ctrl_stat)
+        return idcode
+
+    def power_up(self, timeout: float = 1.0) -> None:
+        """Power up the debug and system domains.
+
+           :param timeout: the maximum time to wait for the power domains to
+                           be acknowledged, in seconds
+        """
+        self._ctrl_stat |= self.CSYSPWRUPREQ | self.CDBGPWRUPREQ
+        self.write_dp(self.CTRL_STAT, self._ctrl_stat)
+        acks = self.CSYSPWRUPACK | self.CDBGPWRUPACK
+        expire = now()+timeout
+        while self.read_dp(self.CTRL_STAT) & acks != acks:
+            if now() > expire:
+                raise SwdError('Debug port power up timeout')
+
+    def clear_errors(self) -> None:
+        """Clear the sticky error flags of the debug port."""
+        self.write_dp(self.ABORT, self.ORUNERRCLR | self.WDERRCLR |
+                      self.STKERRCLR | self.STKCMPCLR)
+
+    def abort(self) -> None:
+        """Abort the current AP transaction."""
+        self.write_dp(self.ABORT, self.DAPABORT)
+
+    def read_dp(self, address: int) -> int:
+        """Read a debug port register.
+
+           :param address: the register address
+           :return: the register value
+        """
+        queue = SwdQueue(self)
+        transfer = queue.read_dp(address)
+        queue.flush()
+        return transfer.value
+
+    def write_dp(self, address: int, value: int) -> None:
+        """Write a debug port register.
+
+           :param address: the register address
+           :param value: the register value
+        """
+        queue = SwdQueue(self)
+        queue.write_dp(address, value)
+        queue.flush()
+
+    def read_ap(self, apsel: int, address: int) -> int:
+        """Read an access port register.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :return: the register value
+        """
+        queue = SwdQueue(self)
+        transfer = queue.read_ap(apsel, address)
+        queue.flush()
+        return transfer.value
+
+    def write_ap(self, apsel: int, address: int, value: int) -> None:
+        """Write an access port register.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :param value: the register value
+        """
+        queue = SwdQueue(self)
+        queue.write_ap(apsel, address, value)
+        queue.flush()
+
+    def _select_bank(self, apsel: int, address: int) -> Optional[int]:
+        """Tell which SELECT value should be written to access an access
+           port register, if it is not already selected."""
+        select = (apsel << 24) | (address & 0xf0)
+        if select == self._select:
+            return None
+        self._select = select
+        return select
+
+    def _execute(self, transfers: List[SwdTransfer]) -> None:
+        """Execute register accesses, replaying the ignored ones.
+
+           The result of an AP read is returned with the next AP read or
+           RDBUFF read, which should follow any AP read in the list.
+        """
+        posted: Optional[SwdTransfer] = None
+        retries = 0
+        replay = False
+        pos = 0
+        while pos < len(transfers):
+            pending = transfers[pos:]
+            results = self._run(pending, replay)
+            for transfer, (ack, data) in zip(pending, results):
+                if ack != self.ACK_OK:
+                    break
+                pos += 1
+                self._transfers += 1
+                if not transfer.read:
+                    continue
+                if data is None:
+                    self._select = None
+                    raise SwdError('Parity error on %r' % transfer)
+                if transfer.ap or transfer.address == self.RDBUFF:
+                    if posted:
+                        posted._value = data
+                    posted = transfer if transfer.ap else None
+                    if transfer.ap:
+                        continue
+                transfer._value = data
+            else:
+                return
+            if ack == self.ACK_WAIT:
+                self._waits += 1
+                # the bank selection may have been ignored
+                self._select = None
+                self._idle_cycles = min(max(1, self._idle_cycles*2),
+                                        self.MAX_IDLE_CYCLES)
+                retries = 0 if pending[0] is not transfers[pos] else \
+                    retries+1
+                if retries > self._retries:
+                    raise SwdError('Too many WAIT responses')
+                replay = True
+                continue
+            self._select = None
+            if ack == self.ACK_FAULT:
+                self.clear_errors()
+                raise SwdFaultError('FAULT response on %r' % transfers[pos])
+            raise SwdError('No response on %r (ACK 0x%x)' %
+                           (transfers[pos], ack))
+
+    def _run(self, transfers: List[SwdTransfer], replay: bool) \
+            -> List[Tuple[int, Optional[int]]]:
+        """Execute register accesses with as few USB requests as possible.
+
+           :param transfers: the accesses to execute
+           :param replay: whether to clear the sticky overrun flag first
+           :return: the ACK and the read value, None on parity errors, of
+                    each access
+        """
+        commands = []
+        if replay:
+            commands.append(self._build_transfer(SwdTransfer(
+                False, self.ABORT, False, self.ORUNERRCLR)))
+        for transfer in transfers:
+            commands.append(self._build_transfer(transfer))
+            if transfer.ap and self._idle_cycles:
+                commands.append((self._write_bits(0, self._idle_cycles), 0))
+        commands.append((self._write_bits(0, self.TRAILING_IDLE_CYCLES), 0))
+        data = self._pipe.exchange(commands)
+        results = []
+        pos = 0
+        if replay:
+            ack = (data[0] >> 5) & 0b111
+            if ack != self.ACK_OK:
+                return [(ack, None)]
+            pos = 1
+        for transfer in transfers:
+            ack = (data[pos] >> 5) & 0b111
+            pos += 1
+            value = None
+            if transfer.read:
+                value = int.from_bytes(data[pos:pos+4], 'little')
+                if data[pos+4] >> 7 != self.parity(value):
+                    value = None
+                pos += 5
+            results.append((ack, value))
+        return results
+
+    def _build_transfer(self, transfer: SwdTransfer) -> Tuple[bytes, int]:
+        """Build the MPSSE commands of a register access.
+
+           :return: the commands, and the count of bytes they read back
+        """
+        cmd = bytearray((Ftdi.WRITE_BITS_NVE_LSB, 7, transfer.request))
+        cmd.extend(self._release)
+        # turnaround and ACK
+        cmd.extend((Ftdi.READ_BITS_PVE_LSB, 3))
+        if transfer.read:
+            cmd.extend((Ftdi.READ_BYTES_PVE_LSB, 3, 0,
+                        Ftdi.READ_BITS_PVE_LSB, 0,
+                        Ftdi.CLK_BITS_NO_DATA, 0))
+            cmd.extend(self._drive)
+            return bytes(cmd), 6
+        value = transfer.value
+        cmd.extend((Ftdi.CLK_BITS_NO_DATA, 0))
+        cmd.extend(self._drive)
+        cmd.extend((Ftdi.WRITE_BYTES_NVE_LSB, 3, 0))
+        cmd.extend(value.to_bytes(4, 'little'))
+        cmd.extend((Ftdi.WRITE_BITS_NVE_LSB, 0, self.parity(value)))
+        return bytes(cmd), 1
+
+    def _line_reset(self) -> bytes:
+        alen = self.LINE_RESET_BYTES-1
+        return bytes((Ftdi.WRITE_BYTES_NVE_LSB, alen, 0)) + \
+            b'\xff' * self.LINE_RESET_BYTES
+
+    @classmethod
+    def _write_bits(cls, value: int, count: int) -> bytes:
+        """Build the MPSSE commands to output bits on SWDIO, first bit as
+           the least significant one."""
+        cmd = bytearray()
+        byte_count, bit_count = divmod(count, 8)
+        for pos in range(0, byte_count, 0x10000):
+            size = min(byte_count-pos, 0x10000)
+            alen = size-1
+            cmd.extend((Ftdi.WRITE_BYTES_NVE_LSB, alen & 0xff, alen >> 8))
+            cmd.extend(((value >> (8*pos)) & ((1 << (8*size))-1)).to_bytes(
+                size, 'little'))
+        if bit_count:
+            cmd.extend((Ftdi.WRITE_BITS_NVE_LSB, bit_count-1,
+                        (value >> (8*byte_count)) & 0xff))
+        return bytes(cmd)
+
+
+class SwdQueue:
+    """Queue of SWD register accesses, executed as a single MPSSE command
+       stream.
+
+       :param controller: the SWD controller
+    """
+
+    def __init__(self, controller: SwdController):
+        self._ctrl = controller
+        self._transfers: List[SwdTransfer] = []
+
+    def __len__(self):
+        return len(self._transfers)
+
+    def read_dp(self, address: int) -> SwdTransfer:
+        """Queue a debug port register read.
+
+           :param address: the register address
+           :return: the transfer, whose value is available once flushed
+        """
+        return self._push(SwdTransfer(False, address, True))
+
+    def write_dp(self, address: int, value: int) -> SwdTransfer:
+        """Queue a debug port register write.
+
+           :param address: the register address
+           :param value: the register value
+           :return: the transfer
+        """
+        if address == SwdController.SELECT:
+            self._ctrl._select = value
+        return self._push(SwdTransfer(False, address, False, value))
+
+    def read_ap(self, apsel: int, address: int) -> SwdTransfer:
+        """Queue an access port register read, selecting the register bank
+           first if needed.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :return: the transfer, whose value is available once flushed
+        """
+        self._select_bank(apsel, address)
+        return self._push(SwdTransfer(True, address, True))
+
+    def write_ap(self, apsel: int, address: int, value: int) -> SwdTransfer:
+        """Queue an access port register write, selecting the register bank
+           first if needed.
+
+           :param apsel: the access port index
+           :param address: the register address
+           :param value: the register value
+           :return: the transfer
+        """
+        self._select_bank(apsel, address)
+        return self._push(SwdTransfer(True, address, False, value))
+
+    def flush(self) -> List[SwdTransfer]:
+        """Execute all the queued accesses.
+
+           :return: the executed accesses, in queue order
+        """
+        transfers, self._transfers = self._transfers, []
+        if not transfers:
+            return transfers
+        requests = list(transfers)
+        for transfer in reversed(transfers):
+            if transfer.read and \
+                    (transfer.ap or transfer.address == SwdController.RDBUFF):
+                if transfer.ap:
+                    # the result of the last AP read is read from RDBUFF
+                    requests.append(SwdTransfer(False, SwdController.RDBUFF,
+                                                True))
+                break
+        self._ctrl._execute(requests)
+        return transfers
+
+    def _select_bank(self, apsel: int, address: int) -> None:
+        select = self._ctrl._select_bank(apsel, address)
+        if select is not None:
+            self._push(SwdTransfer(False, SwdController.SELECT, False,
+                                   select))
+
+    def _push(self, transfer: SwdTransfer) -> SwdTransfer:
+        self._transfers.append(transfer)
+        return transfer
@@ -14,10 +14,14 @@
 from array import array
 from binascii import hexlify
 from collections import deque
-from logging import getLogger
+from logging import DEBUG, getLogger
 from sys import version_info
+from time import perf_counter as now, sleep
+from typing import Optional
+from pyftdi.ftdi import Ftdi
 from pyftdi.tracer import FtdiMpsseTracer
 from .consts import FTDICONST, USBCONST
+from .mpssemock import MockMpsse, MockMpssePeripheral
 
 # need support for f-string syntax
 if version_info[:2] < (3, 6):
@@ -35,16 +39,41 @@ class MockMpsseTracer(FtdiMpsseTracer):
 
 class MockFtdi:
     """Fake FTDI device.
+
+       In bitbang mode, once a baudrate has been selected, written samples
+       are queued into a TX FIFO, which is drained at the bitbang rate. The
+       played samples are recorded into ``bitbang_output``, and
+       ``bitbang_underruns`` counts how many times the FIFO has run empty
+       before the host has written more samples.
+
+       In synchronous bitbang mode, the pins are sampled into the RX FIFO
+       each time a byte is written.
     """
 
+    BITBANG_FIFO_SIZE = 1024
+
     def __init__(self):
         self.log = getLogger('pyftdi.mock.ftdi')
         self._bitmode = FTDICONST.get_value('bitmode', 'reset')
+        self._peripherals = []
         self._mpsse = None
+        self._tracer = None
         self._direction = 0
         self._gpio = 0
         self._queues = deque(), deque()
         self._status = 0
+        self.modem_polls = 0
+        self.bulk_writes = 0
+        self.bulk_reads = 0
+        self.bitbang_rate: Optional[float] = None
+        self._bb_output = bytearray()
+        self.bitbang_underruns = 0
+        # highest count of bytes waiting in the RX FIFO, in sync bitbang mode
+        self.rx_peak = 0
+        self._bb_fifo = bytearray()
+        self._bb_time = 0.0
+        self._bb_in_time = 0.0
+        self._latency = 16
 
     def control(self, dev_handle: 'MockDeviceHandle', bmRequestType: int,
                 bRequest: int, wValue: int, wIndex: int, data: array,
@@ -72,19 +101,43 @@ class MockFtdi:
         self.log.debug('< (%d) %s', size, hexlify(data[:size]).decode())
         return size
 
+    def attach(self, peripheral: MockMpssePeripheral) -> None:
+        """Connect a virtual peripheral to the GPIO port."""
+        self._peripherals.append(peripheral)
+        if self._mpsse:
+            self._mpsse.refresh()
+
+    def detach(self, peripheral: MockMpssePeripheral) -> None:
+        """Disconnect a virtual peripheral from the GPIO port."""
+        self._peripherals.remove(peripheral)
+        if self._mpsse:
+            self._mpsse.refresh()
+
+    @property
+    def mpsse(self) -> MockMpsse:
+        return self._mpsse
+
     def write(self, dev_handle: 'MockDeviceHandle', ep: int, intf: int,
               data: array, timeout: int) -> int:
+        self.bulk_writes += 1
         if self._bitmode == FTDICONST.get_value('bitmode', 'mpsse'):
-            self._mpsse.send(data)
+            if self._tracer:
+                self._tracer.send(data)
+            self._queues[1].extend(self._mpsse.send(data))
             return len(data)
         if self._bitmode == FTDICONST.get_value('bitmode', 'reset'):
             self._queues[0].extend(data)
             return len(data)
         if self._bitmode == FTDICONST.get_value('bitmode', 'bitbang'):
-            self._gpio &= ~0xFF
-            self._gpio |= data[0] & self._direction
-            self.log.info('. %02x: %s', self._gpio, f'{self._gpio:08b}')
-            return 1
+            return self._bitbang_write(data)
+        if self._bitmode == FTDICONST.get_value('bitmode', 'syncbb'):
+            # pins are sampled right before each byte is output
+            queue = self._queues[1]
+            for value in data:
+                queue.append(self._gpio & 0xFF)
+                self._set_gpio_out(value)
+            self.rx_peak = max(self.rx_peak, len(queue))
+            return len(data)
         mode = FTDICONST.get_name('bitmode', self._bitmode)
         self.log.warning('Write buffer discarded, mode %s', mode)
         self.log.warning('. (%d) %s', len(data), hexlify(data).decode())
@@ -92,30 +145,144 @@ class MockFtdi:
 
     def read(self, dev_handle: 'MockDeviceHandle', ep: int, intf: int,
              buff: array, timeout: int) -> int:
-        if self._bitmode == FTDICONST.get_value('bitmode', 'reset'):
+        self.bulk_reads += 1
+        bitbang = (self._bitmode == FTDICONST.get_value('bitmode', 'bitbang')
+                   and self.bitbang_rate)
+        if self._bitmode in (FTDICONST.get_value('bitmode', 'reset'),
+                             FTDICONST.get_value('bitmode', 'mpsse'),
+                             FTDICONST.get_value('bitmode', 'syncbb')) or \
+                bitbang:
             count = len(buff)
             if count < 2:
                 return 0
-            cts = 0x08 if self._gpio & 0x08 else 0
-            dsr = 0x04 if self._gpio & 0x20 else 0
-            ri = 0x02 if self._gpio & 0x80 else 0
-            dcd = 0x01 if self._gpio & 0x40 else 0
-            buff[0] = cts | dsr | ri | dcd
-            buff[1] = self._status
-            pos = 2
-            while self._queues[1] and pos < count:
-                buff[pos] = self._queues[1].popleft()
-                pos += 1
+            # each USB packet starts with the two modem status bytes
+            packet_size = self._get_max_packet_size(dev_handle, ep, intf)
+            line_status = self._status
+            if bitbang:
+                payload = count - 2*((count+packet_size-1)//packet_size)
+                if self._bitbang_sample(payload):
+                    line_status |= 0x02
+            status = (self._modem_status(), line_status)
+            queue = self._queues[1]
+            pos = 0
+            while pos + 2 <= count:
+                buff[pos:pos+2] = array('B', status)
+                pos += 2
+                end = min(pos + packet_size - 2, count)
+                while queue and pos < end:
+                    buff[pos] = queue.popleft()
+                    pos += 1
+                if not queue:
+                    break
             return pos
         mode = FTDICONST.get_name('bitmode', self._bitmode)
         self.log.debug('Read buffer discarded, mode %s', mode)
         self.log.debug('. (%d)', len(buff))
         return 0
 
+    @staticmethod
+    def _get_max_packet_size(dev_handle: 'MockDeviceHandle', ep: int,
+                             intf: int) -> int:
+        try:
+            config = dev_handle.device.configurations[0]
+            for endpoint in config.interfaces[intf].endpoints:
+                if endpoint.bEndpointAddress == ep:
+                    return endpoint.wMaxPacketSize
+        except (AttributeError, IndexError):
+            pass
+        return 64
+
     @property
     def gpio(self) -> int:
         return self._gpio
 
+    @property
+    def line_status(self) -> int:
+        """Line status byte reported in each USB packet."""
+        return self._status
+
+    @line_status.setter
+    def line_status(self, status: int) -> None:
+        self._status = status & 0xFF
+
+    @property
+    def bitbang_output(self) -> bytearray:
+        """Samples that have been played out in bitbang mode."""
+        self._bitbang_play()
+        return self._bb_output
+
+    def _bitbang_write(self, data: array) -> int:
+        if not self.bitbang_rate:
+            self._set_gpio_out(data[-1])
+            return len(data)
+        self._bitbang_play()
+        if not self._bb_fifo and self._bb_output:
+            self.bitbang_underruns += 1
+        pos = 0
+        while pos < len(data):
+            room = self.BITBANG_FIFO_SIZE - len(self._bb_fifo)
+            if room <= 0:
+                # USB write is stalled till the FIFO is drained
+                sleep(1/self.bitbang_rate)
+                self._bitbang_play()
+                continue
+            if not self._bb_fifo:
+                self._bb_time = now()
+            self._bb_fifo.extend(data[pos:pos+room])
+            pos += room
+        return len(data)
+
+    def _bitbang_play(self) -> None:
+        if not self._bb_fifo:
+            return
+        current = now()
+        count = int((current - self._bb_time) * self.bitbang_rate)
+        if not count:
+            return
+        if count < len(self._bb_fifo):
+            self._bb_time += count / self.bitbang_rate
+        else:
+            count = len(self._bb_fifo)
+        self._bb_output.extend(self._bb_fifo[:count])
+        self._set_gpio_out(self._bb_fifo[count-1])
+        del self._bb_fifo[:count]
+
+    def _bitbang_sample(self, size: int) -> bool:
+        """Sample the pins at the bitbang rate, into the RX FIFO.
+
+           :param size: the count of samples the host is waiting for
+           :return: True if the RX FIFO has overflowed
+        """
+        self._bitbang_play()
+        queue = self._queues[1]
+        # samples accumulated while no USB read was pending
+        pending = int((now() - self._bb_in_time) * self.bitbang_rate)
+        room = self.BITBANG_FIFO_SIZE - len(queue)
+        overrun = pending > room
+        if overrun:
+            self._bb_in_time = now()
+            pending = room
+        else:
+            self._bb_in_time += pending / self.bitbang_rate
+        queue.extend(bytes((self._gpio & 0xFF,)) * pending)
+        if len(queue) < size:
+            # samples are streamed to the host while the read is pending,
+            # till the transfer is full or the latency timer expires
+            sleep(min((size - len(queue)) / self.bitbang_rate,
+                      self._latency / 1000))
+            self._bitbang_play()
+            pending = int((now() - self._bb_in_time) * self.bitbang_rate)
+            pending = min(pending, size - len(queue))
+            self._bb_in_time += pending / self.bitbang_rate
+            queue.extend(bytes((self._gpio & 0xFF,)) * pending)
+        return overrun
+
+    def _set_gpio_out(self, value: int) -> None:
+        # input pins are left as is
+        direction = self._direction & 0xFF
+        self._gpio = (self._gpio & ~direction) | (value & direction)
+        self.log.info('. %02x: %s', self._gpio, f'{self._gpio:08b}')
+
     def uart_write(self, buffer: bytes) -> None:
         self._queues[1].extend(buffer)
 
@@ -130,7 +297,8 @@ class MockFtdi:
 
     @gpio.setter
     def gpio(self, gpio: int) -> None:
-        self._gpio |= gpio & ~self._direction & 0xFFFF
+        self._gpio = (self._gpio & self._direction) | \
+            (gpio & ~self._direction & 0xFFFF)
 
     @property
     def direction(self) -> int:
@@ -144,6 +312,9 @@ class MockFtdi:
                        data: array) -> None:
         reset = FTDICONST.get_name('sio_reset', wValue)
         self.log.info('> ftdi reset %s', reset)
+        if reset == 'purge_rx' and self.bitbang_rate:
+            self._queues[1].clear()
+            self._bb_in_time = now()
 
     def _control_set_bitmode(self, wValue: int, wIndex: int,
                              data: array) -> None:
@@ -153,11 +324,21 @@ class MockFtdi:
         self.log.info('> ftdi bitmode %s: %s', mode, f'{direction:08b}')
         self._bitmode = bitmode
         self._direction = direction
-        self._mpsse = FtdiMpsseTracer() if mode == 'mpsse' else None
+        if mode != 'bitbang':
+            self.bitbang_rate = None
+        self._bb_fifo.clear()
+        if mode == 'mpsse':
+            self._mpsse = MockMpsse(self._peripherals)
+            self._tracer = (FtdiMpsseTracer()
+                            if self.log.isEnabledFor(DEBUG) else None)
+        else:
+            self._mpsse = None
+            self._tracer = None
 
     def _control_set_latency_timer(self, wValue: int, wIndex: int,
                                    data: array) -> None:
         self.log.info('> ftdi latency timer: %d', wValue)
+        self._latency = wValue
 
     def _control_set_event_char(self, wValue: int, wIndex: int,
                                 data: array) -> None:
@@ -173,6 +354,18 @@ class MockFtdi:
         self.log.info('> ftdi %sable error char: 0x%02x',
                       'en' if enable else 'dis', char)
 
+    def _control_poll_modem_status(self, wValue: int, wIndex: int,
+                                   data: array) -> bytes:
+        self.modem_polls += 1
+        return bytes((self._modem_status(), self._status))
+
+    def _modem_status(self) -> int:
+        cts = 0x10 if self._gpio & 0x08 else 0
+        dsr = 0x20 if self._gpio & 0x20 else 0
+        ri = 0x40 if self._gpio & 0x80 else 0
+        dcd = 0x80 if self._gpio & 0x40 else 0
+        return cts | dsr | ri | dcd
+
     def _control_read_pins(self, wValue: int, wIndex: int,
                            data: array) -> bytes:
         self.log.info('> ftdi read_pins')
@@ -182,7 +375,23 @@ class MockFtdi:
 
     def _control_set_baudrate(self, wValue: int, wIndex: int,
                               data: array) -> None:
-        pass
+        # only the encoding of MPSSE-capable devices is supported
+        div = wValue | ((wIndex >> 8) << 16)
+        clock = (Ftdi.BAUDRATE_REF_HIGH if div & 0x20000 else
+                 Ftdi.BAUDRATE_REF_BASE)
+        div &= 0x1ffff
+        if div == 0:
+            div8 = 8
+        elif div == 1:
+            div8 = 12
+        else:
+            div8 = (8 * (div & 0x3fff) +
+                    Ftdi.FRAC_DIV_CODE.index(div >> 14))
+        baudrate = 8 * clock / div8
+        self.log.info('> ftdi baudrate: %d', baudrate)
+        if self._bitmode == FTDICONST.get_value('bitmode', 'bitbang'):
+            self.bitbang_rate = baudrate / Ftdi.BITBANG_CLOCK_MULTIPLIER
+            self._bb_in_time = now()
 
     def _control_set_data(self, wValue: int, wIndex: int,
                           data: array) -> None:
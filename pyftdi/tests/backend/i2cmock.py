@@ -0,0 +1,279 @@
+"""PyUSB virtual I2C slave devices."""
+
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+
+#pylint: disable-msg=missing-docstring
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-branches
+#pylint: disable-msg=no-self-use
+#pylint: disable-msg=unused-argument
+
+from logging import getLogger
+from typing import Optional
+from .mpssemock import MockMpssePeripheral
+
+
+class MockI2cSlave(MockMpssePeripheral):
+    """Virtual I2C slave, clocked by the pin levels of a virtual MPSSE
+       engine.
+
+       SCL is AD0, SDA is both AD1 (host output) and AD2 (host input). The
+       slave only decodes the bus at the signal level; subclasses implement
+       the device behaviour overriding the :py:meth:`select`,
+       :py:meth:`write`, :py:meth:`read` and :py:meth:`stop` hooks.
+
+       :param address: the 7-bit I2C address of the slave
+    """
+
+    SCL_BIT = 0x01
+    SDA_O_BIT = 0x02
+    SDA_I_BIT = 0x04
+
+    (IDLE, ADDRESS, WRITE, READ) = range(4)
+
+    def __init__(self, address: int):
+        self.log = getLogger('pyftdi.mock.i2c')
+        self.address = address
+        self._state = self.IDLE
+        self._scl = True
+        self._sda = True
+        self._drive_low = False
+        self._clocked = False
+        self._bit = 0
+        self._shift = 0
+        self._ack = False
+        self._reading = False
+
+    def match(self, address: int) -> bool:
+        """Called to check whether the slave is addressed.
+
+           :param address: the 7-bit I2C address on the bus
+           :return: True if the slave should respond to this address
+        """
+        return address == self.address
+
+    def select(self, read: bool) -> bool:
+        """Called when the slave is addressed.
+
+           :param read: whether the master requests a read transfer
+           :return: True to acknowledge the request
+        """
+        return True
+
+    def write(self, byte: int) -> bool:
+        """Called when a byte has been received from the master.
+
+           :param byte: the received byte
+           :return: True to acknowledge the byte
+        """
+        return True
+
+    def read(self) -> int:
+        """Called when a byte should be sent to the master.
+
+           :return: the byte to send
+        """
+        return 0xFF
+
+    def stop(self) -> None:
+        """Called when a STOP condition is detected on the bus."""
+
+    def update(self, pins: int) -> int:
+        scl = bool(pins & self.SCL_BIT)
+        sda = bool(pins & self.SDA_O_BIT) and not self._drive_low
+        if scl and self._scl and sda != self._sda:
+            if not sda:
+                self._start()
+            else:
+                self._stop()
+        elif scl and not self._scl:
+            self._clocked = True
+            self._rising_edge(sda)
+        elif not scl and self._scl and self._clocked:
+            # ignore the SCL falling edge that follows a START condition
+            self._clocked = False
+            self._falling_edge()
+        self._scl = scl
+        self._sda = bool(pins & self.SDA_O_BIT) and not self._drive_low
+        if self._drive_low:
+            return self.RELEASED & ~(self.SDA_O_BIT | self.SDA_I_BIT)
+        return self.RELEASED
+
+    def _start(self) -> None:
+        self._state = self.ADDRESS
+        self._drive_low = False
+        self._clocked = False
+        self._bit = 0
+        self._shift = 0
+
+    def _stop(self) -> None:
+        self._drive_low = False
+        if self._state != self.IDLE:
+            self._state = self.IDLE
+        self.stop()
+
+    def _rising_edge(self, sda: bool) -> None:
+        if self._state in (self.ADDRESS, self.WRITE):
+            if self._bit < 8:
+                self._shift = ((self._shift << 1) | int(sda)) & 0xFF
+        elif self._state == self.READ:
+            if self._bit == 8:
+                # master acknowledge
+                self._ack = not sda
+
+    def _falling_edge(self) -> None:
+        if self._state in (self.ADDRESS, self.WRITE):
+            if self._bit < 8:
+                self._bit += 1
+                if self._bit == 8:
+                    self._ack = self._receive(self._shift)
+                    self._drive_low = self._ack
+                return
+            # end of the acknowledge slot
+            self._drive_low = False
+            self._bit = 0
+            if not self._ack:
+                self._state = self.IDLE
+                return
+            if self._state == self.ADDRESS:
+                if self._reading:
+                    self._state = self.READ
+                    self._load()
+                else:
+                    self._state = self.WRITE
+            return
+        if self._state == self.READ:
+            if self._bit < 7:
+                self._bit += 1
+                self._drive_low = not self._shift & (0x80 >> self._bit)
+            elif self._bit == 7:
+                # release the line for the master acknowledge
+                self._bit = 8
+                self._drive_low = False
+            else:
+                self._bit = 0
+                if self._ack:
+                    self._load()
+                else:
+                    self._state = self.IDLE
+
+    def _receive(self, byte: int) -> bool:
+        if self._state == self.ADDRESS:
+            if not self.match(byte >> 1):
+                return False
+            self._reading = bool(byte & 0x01)
+            return self.select(self._reading)
+        return self.write(byte)
+
+    def _load(self) -> None:
+        self._shift = self.read() & 0xFF
+        self._drive_low = not self._shift & 0x80
+
+
+class MockI2cMemory(MockI2cSlave):
+    """Virtual I2C memory with an auto-incremented address pointer.
+
+       After a write request is completed with a STOP condition, the memory
+       does not acknowledge its address for the next ``busy_count`` selection
+       attempts, as an EEPROM would do while it programs its cells.
+
+       :param address: the 7-bit I2C address of the slave
+       :param size: the memory size in bytes
+       :param addr_width: the width of the address pointer in bytes
+       :param busy_count: how many selections are not acknowledged once a
+                          write request has been completed
+    """
+
+    def __init__(self, address: int, size: int = 256, addr_width: int = 1,
+                 busy_count: int = 0):
+        super().__init__(address)
+        self.memory = bytearray(size)
+        self.addr_width = addr_width
+        self.busy_count = busy_count
+        self.selections = 0
+        self._busy = 0
+        self._pointer = 0
+        self._addr_bytes: Optional[int] = None
+        self._written = False
+
+    def select(self, read: bool) -> bool:
+        self.selections += 1
+        if self._busy:
+            self._busy -= 1
+            return False
+        self._addr_bytes = 0 if not read else None
+        return True
+
+    def write(self, byte: int) -> bool:
+        if self._addr_bytes is not None and self._addr_bytes < self.addr_width:
+            if not self._addr_bytes:
+                self._pointer = 0
+            self._pointer = ((self._pointer << 8) | byte) % len(self.memory)
+            self._addr_bytes += 1
+            return True
+        self.memory[self._pointer] = byte
+        self._pointer = (self._pointer + 1) % len(self.memory)
+        self._written = True
+        return True
+
+    def read(self) -> int:
+        byte = self.memory[self._pointer]
+        self._pointer = (self._pointer + 1) % len(self.memory)
+        return byte
+
+    def stop(self) -> None:
+        if self._written:
+            self._written = False
+            self._busy = self.busy_count
+
+
+class MockI2cEeprom(MockI2cMemory):
+    """Virtual 24Cxx-class I2C EEPROM.
+
+       The most significant bits of the cell address may be encoded in the
+       device address. Sequential writes roll over within the current page,
+       and the device does not acknowledge its address for the next
+       ``busy_count`` selection attempts once a page write has been completed.
+
+       :param address: the base 7-bit I2C address of the device
+       :param size: the memory size in bytes
+       :param page_size: the size of a write page in bytes
+       :param addr_width: the width of the address pointer in bytes
+       :param addr_bits: the count of address bits encoded in the device
+                         address
+       :param busy_count: how many selections are not acknowledged once a
+                          page write has been completed
+    """
+
+    def __init__(self, address: int, size: int, page_size: int,
+                 addr_width: int, addr_bits: int = 0, busy_count: int = 0):
+        super().__init__(address, size, addr_width, busy_count)
+        self.page_size = page_size
+        self.addr_bits = addr_bits
+        self.page_writes = 0
+        self._block = 0
+
+    def match(self, address: int) -> bool:
+        if (address >> self.addr_bits) != (self.address >> self.addr_bits):
+            return False
+        self._block = address & ((1 << self.addr_bits)-1)
+        return True
+
+    def write(self, byte: int) -> bool:
+        if self._addr_bytes is not None and self._addr_bytes < self.addr_width:
+            if not self._addr_bytes:
+                self._pointer = self._block
+            self._pointer = ((self._pointer << 8) | byte) % len(self.memory)
+            self._addr_bytes += 1
+            return True
+        self.memory[self._pointer] = byte
+        page = self._pointer - (self._pointer % self.page_size)
+        self._pointer = page + (self._pointer+1) % self.page_size
+        self._written = True
+        return True
+
+    def stop(self) -> None:
+        if self._written:
+            self.page_writes += 1
+        super().stop()
@@ -0,0 +1,321 @@
+"""PyUSB virtual JTAG TAP controllers."""
+
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+
+#pylint: disable-msg=missing-docstring
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-arguments
+
+from logging import getLogger
+from typing import Callable, Dict, List, Optional, Tuple
+from pyftdi.jtag import JtagStateMachine
+from .mpssemock import MockMpssePeripheral
+
+
+class MockJtagTap:
+    """Virtual JTAG TAP controller.
+
+       The TAP implements the mandatory BYPASS instruction, an optional
+       IDCODE instruction, and any count of user data registers. Unknown
+       instructions select the BYPASS register.
+
+       :param ir_length: the length of the instruction register
+       :param idcode: the device identifier, if any
+       :param idcode_instr: the IDCODE instruction
+       :param registers: a map of user instructions to the length of the
+                         data register they select
+    """
+
+    IR_CAPTURE = 0b01
+
+    def __init__(self, ir_length: int, idcode: Optional[int] = None,
+                 idcode_instr: int = 0b0001,
+                 registers: Optional[Dict[int, int]] = None):
+        self.log = getLogger('pyftdi.mock.jtag')
+        self.ir_length = ir_length
+        self.idcode = idcode
+        self.bypass_instr = (1 << ir_length) - 1
+        self.idcode_instr = idcode_instr if idcode is not None else None
+        self.lengths: Dict[int, int] = dict(registers or {})
+        self.values: Dict[int, int] = {instr: 0 for instr in self.lengths}
+        # user hooks to generate the captured value of a data register
+        self.captures: Dict[int, Callable[[], int]] = {}
+        self.ir_scans = 0
+        self.dr_scans = 0
+        self.clocks = 0
+        self.idle_clocks = 0
+        self._sm = JtagStateMachine()
+        self._ir = 0
+        self._shift = 0
+        self._length = 0
+        self.tdo = 1
+        self.reset()
+
+    def reset(self) -> None:
+        self._sm.reset()
+        self._ir = (self.idcode_instr if self.idcode_instr is not None
+                    else self.bypass_instr)
+
+    @property
+    def state(self) -> str:
+        return str(self._sm.state())
+
+    @property
+    def instruction(self) -> int:
+        return self._ir
+
+    def reset_stats(self) -> None:
+        self.ir_scans = 0
+        self.dr_scans = 0
+        self.clocks = 0
+        self.idle_clocks = 0
+
+    def rising_edge(self, tms: bool, tdi: bool) -> None:
+        self.clocks += 1
+        state = self.state
+        if state == 'run_test_idle':
+            self.idle_clocks += 1
+        if state == 'test_logic_reset':
+            self.reset()
+        elif state == 'capture_ir':
+            self._shift = self.IR_CAPTURE
+            self._length = self.ir_length
+        elif state == 'capture_dr':
+            self._length, self._shift = self._capture_dr()
+        elif state in ('shift_ir', 'shift_dr'):
+            self._shift = ((self._shift >> 1) |
+                           (int(tdi) << (self._length-1)))
+        self._sm.handle_events([tms])
+
+    def falling_edge(self) -> None:
+        state = self.state
+        if state == 'update_ir':
+            self.ir_scans += 1
+            self._ir = self._shift
+        elif state == 'update_dr':
+            self.dr_scans += 1
+            self._update_dr(self._shift)
+        if state in ('shift_ir', 'shift_dr'):
+            self.tdo = self._shift & 1
+        else:
+            # TDO is left in high-Z state and pulled up
+            self.tdo = 1
+
+    def _capture_dr(self):
+        if self._ir == self.idcode_instr:
+            return 32, self.idcode
+        if self._ir in self.captures:
+            return self.lengths[self._ir], self.captures[self._ir]()
+        if self._ir in self.lengths:
+            return self.lengths[self._ir], self.values[self._ir]
+        return 1, 0
+
+    def _update_dr(self, value: int) -> None:
+        if self._ir in self.lengths:
+            self.values[self._ir] = value
+
+
+class MockMemAp:
+    """Virtual ARM ADIv5 MEM-AP, which gives access to a memory block.
+
+       Only 32-bit accesses are supported, other access sizes and accesses
+       out of the memory block are reported as errors.
+
+       :param size: the memory size in bytes
+       :param base: the address of the memory block
+    """
+
+    IDR = 0x24770011
+
+    def __init__(self, size: int = 0x4000, base: int = 0x20000000):
+        self.memory = bytearray(size)
+        self.base = base
+        self.csw = 0x03000040
+        self.tar = 0
+
+    def access(self, register: int, read: bool, data: int) \
+            -> Tuple[Optional[int], bool]:
+        """Access an AP register.
+
+           :param register: the register address, including the bank
+           :param read: whether to read the register
+           :param data: the value to write
+           :return: the read value, if any, and whether the access succeeded
+        """
+        if register == 0x00:
+            if read:
+                return self.csw, True
+            self.csw = (self.csw & ~0x37) | (data & 0x37)
+        elif register == 0x04:
+            if read:
+                return self.tar, True
+            self.tar = data
+        elif register == 0x0c:
+            offset = self.tar - self.base
+            if self.csw & 0x30 == 0x10:
+                # auto-increment only wraps within a 1KB block
+                self.tar = (self.tar & ~0x3ff) | ((self.tar + 4) & 0x3ff)
+            if (self.csw & 0x7) != 0x2 or offset < 0 or \
+                    offset + 4 > len(self.memory):
+                return 0, False
+            if read:
+                return int.from_bytes(self.memory[offset:offset+4],
+                                      'little'), True
+            self.memory[offset:offset+4] = data.to_bytes(4, 'little')
+        elif register == 0xfc:
+            if read:
+                return self.IDR, True
+        elif read:
+            return 0, True
+        return None, True
+
+
+class MockJtagDap(MockJtagTap):
+    """Virtual ARM ADIv5 JTAG Debug Port, with a single MEM-AP that gives
+       access to a memory block.
+
+       Once an AP access has been updated, DPACC and APACC scans report the
+       WAIT response for the next ``latency`` TCK cycles and are ignored.
+       When overrun detection is enabled, a WAIT response sets the sticky
+       overrun flag, and all requests but CTRL/STAT accesses are ignored
+       till the flag is cleared.
+
+       :param size: the memory size in bytes
+       :param base: the address of the memory block
+       :param latency: the count of TCK cycles each AP access lasts
+    """
+
+    ABORT = 0b1000
+    DPACC = 0b1010
+    APACC = 0b1011
+    IDCODE = 0b1110
+
+    ACK_WAIT = 0b001
+    ACK_OK = 0b010
+
+    POWER_REQS = (1 << 30) | (1 << 28)
+    ORUNDETECT = 1 << 0
+    STICKYORUN = 1 << 1
+    STICKIES = (1 << 5) | (1 << 4) | (1 << 1)
+    STICKYERR = 1 << 5
+
+    AP_IDR = MockMemAp.IDR
+
+    def __init__(self, size: int = 0x4000, base: int = 0x20000000,
+                 latency: int = 0):
+        super().__init__(4, 0x4ba00477, idcode_instr=self.IDCODE,
+                         registers={self.ABORT: 35, self.DPACC: 35,
+                                    self.APACC: 35})
+        self.ap = MockMemAp(size, base)
+        self.memory = self.ap.memory
+        self.latency = latency
+        self.ctrl_stat = 0
+        self.select = 0
+        self.waits = 0
+        self.ap_accesses = 0
+        self._result = 0
+        self._ready = 0
+        self._ack = self.ACK_OK
+
+    def _capture_dr(self):
+        if self._ir not in (self.DPACC, self.APACC):
+            return super()._capture_dr()
+        if self.clocks < self._ready:
+            self.waits += 1
+            self._ack = self.ACK_WAIT
+            if self.ctrl_stat & self.ORUNDETECT:
+                self.ctrl_stat |= self.STICKYORUN
+        else:
+            self._ack = self.ACK_OK
+        return 35, (self._result << 3) | self._ack
+
+    def _update_dr(self, value: int) -> None:
+        if self._ir not in (self.DPACC, self.APACC):
+            super()._update_dr(value)
+            return
+        if self._ack != self.ACK_OK:
+            return
+        read = bool(value & 1)
+        address = (value << 1) & 0xc
+        data = (value >> 3) & 0xffffffff
+        if self.ctrl_stat & self.STICKYORUN and \
+                (self._ir, address) != (self.DPACC, 0x4):
+            return
+        if self._ir == self.DPACC:
+            self._dp_access(address, read, data)
+        else:
+            self.ap_accesses += 1
+            self._ap_access(address, read, data)
+            self._ready = self.clocks + self.latency
+
+    def _dp_access(self, address: int, read: bool, data: int) -> None:
+        if address == 0x4:
+            if read:
+                # power up requests are immediately acknowledged
+                reqs = self.ctrl_stat & self.POWER_REQS
+                self._result = self.ctrl_stat | (reqs << 1)
+            else:
+                self.ctrl_stat &= ~(data & self.STICKIES)
+                self.ctrl_stat = ((self.ctrl_stat & self.STICKIES) |
+                                  (data & (self.POWER_REQS |
+                                           self.ORUNDETECT)))
+        elif address == 0x8:
+            if read:
+                self._result = 0
+            else:
+                self.select = data
+        elif address == 0xc:
+            # RDBUFF: the last AP read result is left as is
+            pass
+        else:
+            self._result = 0
+
+    def _ap_access(self, address: int, read: bool, data: int) -> None:
+        if self.select >> 24 or not self.ctrl_stat & self.POWER_REQS:
+            self.ctrl_stat |= self.STICKYERR
+            self._result = 0
+            return
+        value, ok = self.ap.access((self.select & 0xf0) | address, read,
+                                   data)
+        if not ok:
+            self.ctrl_stat |= self.STICKYERR
+        if value is not None:
+            self._result = value
+
+
+class MockJtagChain(MockMpssePeripheral):
+    """Virtual JTAG chain, attached to the JTAG pins of a virtual MPSSE
+       engine.
+
+       TCK is AD0, TDI is AD1, TDO is AD2 and TMS is AD3. The first TAP of
+       the chain is the closest one to the host TDI output.
+
+       :param taps: the TAP controllers of the chain
+    """
+
+    TCK_BIT = 0x01
+    TDI_BIT = 0x02
+    TDO_BIT = 0x04
+    TMS_BIT = 0x08
+
+    def __init__(self, taps: List[MockJtagTap]):
+        self.taps = taps
+        self._tck = False
+
+    def update(self, pins: int) -> int:
+        tck = bool(pins & self.TCK_BIT)
+        if tck and not self._tck:
+            tms = bool(pins & self.TMS_BIT)
+            tdi = bool(pins & self.TDI_BIT)
+            # all TAPs sample their input at once
+            inputs = [tdi] + [tap.tdo for tap in self.taps[:-1]]
+            for tap, tap_tdi in zip(self.taps, inputs):
+                tap.rising_edge(tms, tap_tdi)
+        elif not tck and self._tck:
+            for tap in self.taps:
+                tap.falling_edge()
+        self._tck = tck
+        if self.taps and not self.taps[-1].tdo:
+            return self.RELEASED & ~self.TDO_BIT
+        return self.RELEASED
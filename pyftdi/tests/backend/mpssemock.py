@@ -0,0 +1,301 @@
+"""PyUSB virtual FTDI MPSSE engine."""
+
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+
+#pylint: disable-msg=missing-docstring
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-branches
+#pylint: disable-msg=no-self-use
+
+from logging import getLogger
+from struct import unpack as sunpack
+from sys import version_info
+from typing import List, Optional, Union
+from pyftdi.ftdi import Ftdi
+
+# need support for f-string syntax
+if version_info[:2] < (3, 6):
+    raise AssertionError('Python 3.6 is required for this module')
+
+
+class MockMpssePeripheral:
+    """Virtual device attached to the GPIO port of a virtual MPSSE engine.
+
+       The peripheral is notified each time the logical level of the pins
+       driven by the MPSSE engine changes. It reports the pins it pulls low,
+       all lines being considered as open-drain lines with a pull-up
+       resistor, i.e. a line is low as soon as either the FTDI device or any
+       peripheral forces it low.
+    """
+
+    RELEASED = 0xFFFF
+
+    def update(self, pins: int) -> int:
+        """Handle a pin level change.
+
+           :param pins: the logical level of the pins driven by the host,
+                        where undriven (input) pins are reported high
+           :return: the bitfield of released pins, where a cleared bit pulls
+                    the matching line low
+        """
+        return self.RELEASED
+
+
+class MockMpsse:
+    """Virtual MPSSE engine.
+
+       Execute MPSSE commands, clock the virtual peripherals attached to the
+       GPIO port and build up the MPSSE response stream.
+
+       The engine also accounts for the time the commands would have taken to
+       execute on an actual device, so that bus-level throughput can be
+       estimated without any HW.
+    """
+
+    CLK_BIT = 0x01
+    DO_BIT = 0x02
+    DI_BIT = 0x04
+    TMS_BIT = 0x08
+
+    BAD_COMMAND = 0xFA
+
+    # time required to execute a GPIO command, see Ftdi.mpsse_bit_delay
+    GPIO_DELAY = 0.5E-6
+    # time required to execute any other command
+    CMD_DELAY = 50E-9
+
+    def __init__(self, peripherals: List[MockMpssePeripheral]):
+        self.log = getLogger('pyftdi.mock.mpsse')
+        self._peripherals = peripherals
+        self._cmd = bytearray()
+        self._out = 0
+        self._dir = 0
+        self._lines = 0xFFFF
+        self._clkdiv5 = True
+        self._divisor = 0
+        self._three_phase = False
+        self._loopback = False
+        self.cycles = 0
+        self.bus_time = 0.0
+
+    @property
+    def frequency(self) -> float:
+        base = 12E6 if self._clkdiv5 else 60E6
+        return base / ((1 + self._divisor) * 2)
+
+    @property
+    def pins(self) -> int:
+        """Current logical level of the port lines."""
+        return self._lines
+
+    @property
+    def direction(self) -> int:
+        return self._dir
+
+    def reset_stats(self) -> None:
+        self.cycles = 0
+        self.bus_time = 0.0
+
+    def refresh(self) -> None:
+        """Refresh the line levels, e.g. after a peripheral has been
+           attached.
+        """
+        self._set_out(self._out)
+
+    def send(self, data: Union[bytes, bytearray]) -> bytes:
+        """Execute a stream of MPSSE commands.
+
+           :param data: the MPSSE command stream
+           :return: the MPSSE response stream
+        """
+        self._cmd.extend(data)
+        resp = bytearray()
+        cmd = self._cmd
+        pos = 0
+        size = len(cmd)
+        while pos < size:
+            code = cmd[pos]
+            length = self._get_command_length(code, cmd, pos)
+            if length is None or pos + length > size:
+                # not enough data in buffer to decode a whole command
+                break
+            self._execute(code, cmd[pos+1:pos+length], resp)
+            pos += length
+        del cmd[:pos]
+        return bytes(resp)
+
+    def _get_command_length(self, code: int, cmd: bytearray,
+                            pos: int) -> Optional[int]:
+        if code < 0x80:
+            if code & 0x40:
+                # TMS commands: length, data
+                return 3
+            if not code & 0x30:
+                return 1
+            if code & 0x02:
+                # bit mode: length, [data]
+                return 3 if code & 0x10 else 2
+            # byte mode: length (16 bits), [data]
+            if not code & 0x10:
+                return 3
+            if pos + 3 > len(cmd):
+                return None
+            length, = sunpack('<H', cmd[pos+1:pos+3])
+            return 4 + length
+        if code in (Ftdi.SET_BITS_LOW, Ftdi.SET_BITS_HIGH,
+                    Ftdi.SET_TCK_DIVISOR, Ftdi.DRIVE_ZERO,
+                    Ftdi.CLK_BYTES_NO_DATA, Ftdi.CLK_COUNT_WAIT_ON_HIGH,
+                    Ftdi.CLK_COUNT_WAIT_ON_LOW):
+            return 3
+        if code == Ftdi.CLK_BITS_NO_DATA:
+            return 2
+        return 1
+
+    def _execute(self, code: int, args: bytearray, resp: bytearray) -> None:
+        if code < 0x80:
+            if code & 0x70:
+                self._execute_shift(code, args, resp)
+                return
+            self._bad_command(code, resp)
+            return
+        self.bus_time += self.CMD_DELAY
+        if code == Ftdi.SET_BITS_LOW:
+            self.bus_time += self.GPIO_DELAY - self.CMD_DELAY
+            self._dir = (self._dir & 0xFF00) | args[1]
+            self._set_out((self._out & 0xFF00) | args[0])
+        elif code == Ftdi.SET_BITS_HIGH:
+            self.bus_time += self.GPIO_DELAY - self.CMD_DELAY
+            self._dir = (self._dir & 0x00FF) | (args[1] << 8)
+            self._set_out((self._out & 0x00FF) | (args[0] << 8))
+        elif code == Ftdi.GET_BITS_LOW:
+            self.bus_time += self.GPIO_DELAY - self.CMD_DELAY
+            resp.append(self._lines & 0xFF)
+        elif code == Ftdi.GET_BITS_HIGH:
+            self.bus_time += self.GPIO_DELAY - self.CMD_DELAY
+            resp.append((self._lines >> 8) & 0xFF)
+        elif code == Ftdi.SET_TCK_DIVISOR:
+            self._divisor, = sunpack('<H', args)
+            self.log.debug('Frequency: %.3f KHz', self.frequency/1E3)
+        elif code == Ftdi.ENABLE_CLK_DIV5:
+            self._clkdiv5 = True
+        elif code == Ftdi.DISABLE_CLK_DIV5:
+            self._clkdiv5 = False
+        elif code == Ftdi.ENABLE_CLK_3PHASE:
+            self._three_phase = True
+        elif code == Ftdi.DISABLE_CLK_3PHASE:
+            self._three_phase = False
+        elif code == Ftdi.LOOPBACK_START:
+            self._loopback = True
+        elif code == Ftdi.LOOPBACK_END:
+            self._loopback = False
+        elif code == Ftdi.CLK_BITS_NO_DATA:
+            self._clock_no_data(args[0] + 1)
+        elif code == Ftdi.CLK_BYTES_NO_DATA:
+            length, = sunpack('<H', args)
+            self._clock_no_data(8 * (length + 1))
+        elif code in (Ftdi.SEND_IMMEDIATE, Ftdi.ENABLE_CLK_ADAPTIVE,
+                      Ftdi.DISABLE_CLK_ADAPTIVE, Ftdi.DRIVE_ZERO,
+                      Ftdi.WAIT_ON_HIGH, Ftdi.WAIT_ON_LOW):
+            pass
+        else:
+            self._bad_command(code, resp)
+
+    def _bad_command(self, code: int, resp: bytearray) -> None:
+        self.log.warning('Bad MPSSE command 0x%02x', code)
+        resp.extend((self.BAD_COMMAND, code))
+
+    def _execute_shift(self, code: int, args: bytearray,
+                       resp: bytearray) -> None:
+        rneg = bool(code & 0x04)
+        lsb = bool(code & 0x08)
+        write = bool(code & 0x10)
+        read = bool(code & 0x20)
+        if code & 0x40:
+            # TMS shift: bit 7 of the data byte is the static TDI value
+            count = args[0] + 1
+            value = args[1]
+            self._set_out((self._out & ~self.DO_BIT) |
+                          (self.DO_BIT if value & 0x80 else 0))
+            byte = 0
+            for bit in range(count):
+                sample = self._clock((value >> bit) & 1, rneg, True)
+                byte = (byte >> 1) | (sample << 7)
+            if read:
+                resp.append(byte)
+            return
+        if code & 0x02:
+            count = args[0] + 1
+            value = args[1] if write else 0
+            byte = 0
+            for bit in range(count):
+                if lsb:
+                    dout = (value >> bit) & 1 if write else None
+                    sample = self._clock(dout, rneg)
+                    byte = (byte >> 1) | (sample << 7)
+                else:
+                    dout = (value >> (7-bit)) & 1 if write else None
+                    sample = self._clock(dout, rneg)
+                    byte = ((byte << 1) | sample) & 0xFF
+            if read:
+                resp.append(byte)
+            return
+        length, = sunpack('<H', args[:2])
+        length += 1
+        data = args[2:] if write else bytes(length)
+        for value in data:
+            byte = 0
+            if lsb:
+                for bit in range(8):
+                    dout = (value >> bit) & 1 if write else None
+                    byte |= self._clock(dout, rneg) << bit
+            else:
+                for bit in range(7, -1, -1):
+                    dout = (value >> bit) & 1 if write else None
+                    byte |= self._clock(dout, rneg) << bit
+            if read:
+                resp.append(byte)
+
+    def _clock_no_data(self, count: int) -> None:
+        for _ in range(count):
+            self._clock(None, False)
+
+    def _clock(self, dout: Optional[int], rneg: bool,
+               tms: bool = False) -> int:
+        """Emit a single clock pulse.
+
+           Output data is presented while the clock line is idle, input data
+           is sampled on the first or second clock edge, depending on the
+           clock idle level and the selected sampling edge.
+        """
+        self.cycles += 1
+        self.bus_time += (1.5 if self._three_phase else 1.0) / self.frequency
+        out = self._out
+        if dout is not None:
+            if tms:
+                out = (out & ~self.TMS_BIT) | (self.TMS_BIT if dout else 0)
+            else:
+                out = (out & ~self.DO_BIT) | (self.DO_BIT if dout else 0)
+            if out != self._out:
+                self._set_out(out)
+        idle_high = bool(out & self.CLK_BIT)
+        # the first edge is the rising one if the clock idles low
+        sample_first = rneg == idle_high
+        first = self._sample()
+        self._set_out(out ^ self.CLK_BIT)
+        second = self._sample()
+        self._set_out(out)
+        return first if sample_first else second
+
+    def _sample(self) -> int:
+        if self._loopback:
+            return 1 if self._out & self.DO_BIT else 0
+        return 1 if self._lines & self.DI_BIT else 0
+
+    def _set_out(self, out: int) -> None:
+        self._out = out & 0xFFFF
+        host = (self._out | ~self._dir) & 0xFFFF
+        lines = host
+        for peripheral in self._peripherals:
+            lines &= peripheral.update(host)
+        self._lines = lines
@@ -0,0 +1,265 @@
+"""PyUSB virtual ARM Serial Wire Debug Port."""
+
+# Copyright (c) 2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+
+#pylint: disable-msg=missing-docstring
+#pylint: disable-msg=too-many-instance-attributes
+#pylint: disable-msg=too-many-branches
+
+from logging import getLogger
+from typing import Optional
+from .jtagmock import MockMemAp
+from .mpssemock import MockMpssePeripheral
+
+
+class MockSwdDp(MockMpssePeripheral):
+    """Virtual ARM ADIv5 SW-DP, with a single MEM-AP that gives access to a
+       memory block.
+
+       SWCLK is AD0, SWDIO is both AD1 (host output) and AD2 (host input).
+       The debug port starts in JTAG mode, and only switches to SWD once it
+       has received the JTAG-to-SWD selection sequence. After a line reset,
+       all requests but a DPIDR read are left unanswered.
+
+       Once an AP access has been executed, the requests received within the
+       next ``latency`` SWCLK cycles get a WAIT response. When overrun
+       detection is enabled, a WAIT response sets the sticky overrun flag,
+       and a data phase is expected after WAIT and FAULT responses.
+
+       :param size: the memory size in bytes
+       :param base: the address of the memory block
+       :param latency: the count of SWCLK cycles each AP access lasts
+    """
+
+    SWCLK_BIT = 0x01
+    SWDIO_O_BIT = 0x02
+    SWDIO_I_BIT = 0x04
+
+    ACK_OK = 0b001
+    ACK_WAIT = 0b010
+    ACK_FAULT = 0b100
+
+    DPIDR = 0x2ba01477
+    JTAG_TO_SWD = 0xe79e
+    LINE_RESET_CYCLES = 50
+
+    POWER_REQS = (1 << 30) | (1 << 28)
+    WDATAERR = 1 << 7
+    STICKYERR = 1 << 5
+    STICKYCMP = 1 << 4
+    STICKYORUN = 1 << 1
+    ORUNDETECT = 1 << 0
+
+    (JTAG, LOCKOUT, IDLE, REQUEST, ACK, RDATA, WDATA, TURNAROUND) = range(8)
+
+    def __init__(self, size: int = 0x4000, base: int = 0x20000000,
+                 latency: int = 0):
+        self.log = getLogger('pyftdi.mock.swd')
+        self.ap = MockMemAp(size, base)
+        self.memory = self.ap.memory
+        self.latency = latency
+        self.ctrl_stat = 0
+        self.power_delay = 0
+        self.select = 0
+        self.clocks = 0
+        self.waits = 0
+        self.faults = 0
+        self.line_resets = 0
+        self.ap_accesses = 0
+        self._state = self.JTAG
+        self._swclk = False
+        self._drive: Optional[int] = None
+        self._ones = 0
+        self._sequence = 0
+        self._reset = False
+        self._bit = 0
+        self._request = 0
+        self._ack = 0
+        self._data = 0
+        self._skip = 0
+        self._buffer = 0
+        self._ready = 0
+
+    def update(self, pins: int) -> int:
+        swclk = bool(pins & self.SWCLK_BIT)
+        if swclk and not self._swclk:
+            self._rising_edge(bool(pins & self.SWDIO_O_BIT))
+        self._swclk = swclk
+        if self._drive == 0:
+            return self.RELEASED & ~(self.SWDIO_O_BIT | self.SWDIO_I_BIT)
+        return self.RELEASED
+
+    def _rising_edge(self, swdio: bool) -> None:
+        self.clocks += 1
+        if self._drive is None:
+            self._ones = self._ones + 1 if swdio else 0
+            if self._ones == self.LINE_RESET_CYCLES:
+                self._line_reset()
+                return
+        if self._state == self.JTAG:
+            self._sequence = (self._sequence >> 1) | (int(swdio) << 15)
+            if self._sequence == self.JTAG_TO_SWD:
+                self._state = self.LOCKOUT
+            return
+        if self._state == self.LOCKOUT:
+            return
+        if self._state == self.IDLE:
+            # the line should be low for a request to start after a reset
+            if swdio and self._ones < self.LINE_RESET_CYCLES:
+                self._state = self.REQUEST
+                self._request = 1
+                self._bit = 1
+            return
+        if self._state == self.REQUEST:
+            self._request |= int(swdio) << self._bit
+            self._bit += 1
+            if self._bit == 8:
+                self._decode_request()
+            return
+        if self._state == self.ACK:
+            self._drive = (self._ack >> self._bit) & 1
+            self._bit += 1
+            if self._bit == 3:
+                self._bit = 0
+                if self._ack == self.ACK_OK or \
+                        self.ctrl_stat & self.ORUNDETECT:
+                    self._state = (self.RDATA if self._request & 0x04 else
+                                   self.WDATA)
+                    # a write data phase starts after a turnaround cycle
+                    self._skip = 0 if self._request & 0x04 else 2
+                else:
+                    self._state = self.TURNAROUND
+                    self._skip = 2
+            return
+        if self._state == self.TURNAROUND:
+            self._drive = None
+            self._skip -= 1
+            if not self._skip:
+                self._state = self.IDLE
+            return
+        if self._state == self.RDATA:
+            if self._bit < 32:
+                self._drive = ((self._data >> self._bit) & 1
+                               if self._ack == self.ACK_OK else None)
+            elif self._bit == 32:
+                self._drive = (self._parity(self._data)
+                               if self._ack == self.ACK_OK else None)
+            else:
+                self._drive = None
+                self._state = self.TURNAROUND
+                self._skip = 1
+            self._bit += 1
+            return
+        if self._state == self.WDATA:
+            if self._skip:
+                self._drive = None
+                self._skip -= 1
+                return
+            if self._bit < 32:
+                self._data |= int(swdio) << self._bit
+                self._bit += 1
+                return
+            self._state = self.IDLE
+            if self._ack != self.ACK_OK:
+                return
+            if int(swdio) != self._parity(self._data):
+                self.ctrl_stat |= self.WDATAERR
+                return
+            self._execute(False, self._data)
+
+    def _line_reset(self) -> None:
+        self.line_resets += 1
+        self._drive = None
+        self._sequence = 0
+        if self._state != self.JTAG:
+            self._state = self.IDLE
+            self._reset = True
+
+    def _decode_request(self) -> None:
+        request = self._request
+        parity = self._parity((request >> 1) & 0xf)
+        if request & 0x40 or not request & 0x80 or \
+                parity != (request >> 5) & 1:
+            # protocol error: wait for a line reset
+            self._state = self.LOCKOUT
+            return
+        apndp = bool(request & 0x02)
+        read = bool(request & 0x04)
+        address = (request >> 1) & 0xc
+        exempt = not apndp and (address in (0x0, 0x4) if read else
+                                address == 0x0)
+        if self._reset and (apndp or not read or address):
+            self._state = self.LOCKOUT
+            return
+        self._reset = False
+        self._state = self.ACK
+        self._bit = 0
+        self._data = 0
+        if self.clocks < self._ready and not exempt:
+            self.waits += 1
+            self._ack = self.ACK_WAIT
+            if self.ctrl_stat & self.ORUNDETECT:
+                self.ctrl_stat |= self.STICKYORUN
+        elif self.ctrl_stat & (self.STICKYORUN | self.STICKYERR |
+                               self.WDATAERR) and not exempt:
+            self.faults += 1
+            self._ack = self.ACK_FAULT
+        else:
+            self._ack = self.ACK_OK
+            if read:
+                self._data = self._execute(True, 0)
+
+    def _execute(self, read: bool, data: int) -> int:
+        apndp = bool(self._request & 0x02)
+        address = (self._request >> 1) & 0xc
+        if apndp:
+            self.ap_accesses += 1
+            self._ready = self.clocks + self.latency
+            # AP reads are posted: the previous result is returned
+            result = self._buffer
+            if self.select >> 24 or not self.ctrl_stat & self.POWER_REQS:
+                self.ctrl_stat |= self.STICKYERR
+                return result
+            value, ok = self.ap.access((self.select & 0xf0) | address, read,
+                                       data)
+            if not ok:
+                self.ctrl_stat |= self.STICKYERR
+            if read:
+                self._buffer = value
+            return result
+        if address == 0x0:
+            if read:
+                return self.DPIDR
+            # ABORT
+            if data & (1 << 1):
+                self.ctrl_stat &= ~self.STICKYCMP
+            if data & (1 << 2):
+                self.ctrl_stat &= ~self.STICKYERR
+            if data & (1 << 3):
+                self.ctrl_stat &= ~self.WDATAERR
+            if data & (1 << 4):
+                self.ctrl_stat &= ~self.STICKYORUN
+        elif address == 0x4:
+            if read:
+                # power up requests are acknowledged once power_delay
+                # CTRL/STAT reads have been answered
+                reqs = self.ctrl_stat & self.POWER_REQS
+                if reqs and self.power_delay:
+                    self.power_delay -= 1
+                    return self.ctrl_stat
+                return self.ctrl_stat | (reqs << 1)
+            self.ctrl_stat = ((self.ctrl_stat & ~(self.POWER_REQS |
+                                                  self.ORUNDETECT)) |
+                              (data & (self.POWER_REQS | self.ORUNDETECT)))
+        elif address == 0x8:
+            if not read:
+                self.select = data
+        elif address == 0xc:
+            if read:
+                return self._buffer
+        return 0
+
+    @classmethod
+    def _parity(cls, value: int) -> int:
+        return bin(value).count('1') & 1
@@ -308,6 +308,7 @@ class MockBackend(IBackend):
 
     def flush_devices(self):
         self._devices.clear()
+        self._ftdis.clear()
 
     @property
     def devices(self) -> List[MockDevice]:
@@ -28,6 +28,7 @@
 # EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+from os import urandom
 from pyftdi.bits import BitSequence, BitZSequence, BitSequenceError
 
 
@@ -222,9 +223,19 @@ class BitSequenceTestCase(unittest.TestCase):
         self.assertEqual(repr(self.bs7+self.bzs4),
                          '11Z1Z010ZZ010011111010101001')
 
+    def test_large(self):
+        for size in (32, 1 << 10, 1 << 20):
+            data = urandom(size//8)
+            bs = BitSequence(bytes_=data)
+            self.assertEqual(len(bs[3:size-5]), size-8)
+            self.assertEqual(bs.tobytes(msby=True), data)
+            self.assertEqual(int(bs), int.from_bytes(data, 'little'))
+
 
 def suite():
-    return unittest.makeSuite(BitSequenceTestCase, 'test_')
+    suite_ = unittest.TestSuite()
+    suite_.addTest(unittest.makeSuite(BitSequenceTestCase, 'test_'))
+    return suite_
 
 
 if __name__ == '__main__':
@@ -9,21 +9,48 @@
 #pylint: disable-msg=no-self-use
 
 import logging
+from array import array
 from collections import defaultdict
 from contextlib import redirect_stdout
 from doctest import testmod
-from io import StringIO
+from io import BytesIO, StringIO
+from math import ceil
 from os import environ
+from mmap import mmap
+from os.path import join as joinpath
+from select import select
+from socket import AF_UNIX, create_connection, socket
+from socketserver import TCPServer, UnixStreamServer
 from string import ascii_letters
+from tempfile import TemporaryDirectory, TemporaryFile
+from threading import Thread
 from sys import modules, stdout, version_info
+from time import perf_counter as now, sleep
 from unittest import TestCase, TestSuite, makeSuite, main as ut_main
 from urllib.parse import urlsplit
 from pyftdi import FtdiLogger
+from pyftdi.adiv5 import Adiv5Error, Adiv5FaultError, JtagDp, MemAp
 from pyftdi.ftdi import Ftdi, FtdiMpsseError
-from pyftdi.gpio import GpioController
+from pyftdi.gpio import (GpioCapture, GpioController, GpioException,
+                         GpioMpsseController, GpioMpsseSequence, GpioPwm,
+                         GpioRingBuffer, GpioWatcher)
+from pyftdi.i2c import (I2cController, I2cIOError, I2cNackError,
+                        I2cScheduler)
+from pyftdi.i2ceeprom import I2cEeprom, I2cEepromError
+from pyftdi.bits import BitSequence
+from pyftdi.bsdl import Bsdl, BsdlError, BsdlSampler
+from pyftdi.jtag import (JtagChain, JtagController, JtagEngine, JtagError,
+                         JtagQueue)
+from pyftdi.remotebitbang import RemoteBitbangDecoder, RemoteBitbangServer
 from pyftdi.serialext import serial_for_url
+from pyftdi.svf import SvfError, SvfPlayer
+from pyftdi.swd import SwdController, SwdError, SwdFaultError, SwdQueue
 from pyftdi.usbtools import UsbTools
+from backend.i2cmock import MockI2cEeprom, MockI2cMemory
+from backend.jtagmock import MockJtagChain, MockJtagDap, MockJtagTap
 from backend.loader import MockLoader
+from backend.mpssemock import MockMpssePeripheral
+from backend.swdmock import MockSwdDp
 
 # need support for f-string syntax
 if version_info[:2] < (3, 6):
@@ -431,6 +458,605 @@ class MockSimpleGpioTestCase(TestCase):
         gpio.close()
 
 
+class MockGpioWaveformTestCase(TestCase):
+    """Test GPIO waveform streaming in bitbang mode
+    """
+
+    RATE = 100000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.gpio = GpioController()
+        self.gpio.configure('ftdi://:232h/1', direction=0xFF)
+        bus, address, _ = self.gpio.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.vftdi.bitbang_output.clear()
+        self.vftdi.bitbang_underruns = 0
+
+    def tearDown(self):
+        self.gpio.close()
+
+    def _drain(self, player):
+        # wait for the virtual device to play the buffered samples out
+        sleep(2*self.vftdi.BITBANG_FIFO_SIZE/player.rate)
+        return self.vftdi.bitbang_output
+
+    def test_play(self):
+        samples = bytes(range(256))*16
+        player = self.gpio.play(samples, self.RATE)
+        self.assertFalse(player.is_playing)
+        self.assertEqual(player.rate, self.RATE)
+        self.assertEqual(player.sample_count, len(samples))
+        self.assertEqual(self._drain(player), samples)
+        self.assertEqual(player.underruns, 0)
+        self.assertEqual(self.vftdi.bitbang_underruns, 0)
+        FtdiLogger.log.debug('Waveform: %.1f Ksamples/s',
+                             player.throughput/1000)
+        self.assertAlmostEqual(player.throughput, player.rate,
+                               delta=0.1*player.rate)
+        self.assertEqual(self.vftdi.gpio & 0xFF, 0xFF)
+
+    def test_samples(self):
+        player = self.gpio.play(array('B', [0x12, 0x34]), self.RATE)
+        self.assertEqual(player.sample_count, 2)
+        player = self.gpio.play([0x56, 0x78, 0x9a], self.RATE)
+        self.assertEqual(player.sample_count, 3)
+        self.assertEqual(self._drain(player), b'\x12\x34\x56\x78\x9a')
+        self.assertRaises(GpioException, self.gpio.play,
+                          array('H', [0x1234]), self.RATE)
+        self.assertRaises(GpioException, self.gpio.play, [0x100],
+                          self.RATE)
+        self.assertRaises(GpioException, self.gpio.play, b'', self.RATE)
+
+    def test_loop(self):
+        first = bytes((0x55,))*512
+        second = bytes((0xaa,))*512
+        player = self.gpio.play(first, self.RATE, loop=True)
+        self.assertTrue(player.is_playing)
+        sleep(0.05)
+        player.queue(second)
+        sleep(0.05)
+        player.stop()
+        self.assertFalse(player.is_playing)
+        output = self._drain(player)
+        self.assertEqual(len(output), player.sample_count)
+        # waveforms are only switched at the end of a loop
+        switch = output.index(0xaa)
+        self.assertEqual(switch % len(first), 0)
+        self.assertEqual(output[:switch], first*(switch//len(first)))
+        self.assertEqual(output[switch:],
+                         second*((len(output)-switch)//len(second)))
+        self.assertEqual(player.underruns, 0)
+
+    def test_underrun(self):
+        player = self.gpio.play(bytes(range(256)), self.RATE, loop=True)
+        sleep(0.02)
+        # stall the player for a while
+        with player._lock:
+            sleep(0.05)
+        sleep(0.02)
+        player.stop()
+        self._drain(player)
+        self.assertGreaterEqual(self.vftdi.bitbang_underruns, 1)
+        self.assertGreaterEqual(player.underruns, 1)
+        self.assertLess(player.throughput, 0.9*player.rate)
+
+
+class MockGpioPwmTestCase(TestCase):
+    """Test GPIO PWM generation in bitbang mode
+    """
+
+    RATE = 100000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.gpio = GpioController()
+        self.gpio.configure('ftdi://:232h/1', direction=0x0F)
+        self.gpio.write(0x08)
+        bus, address, _ = self.gpio.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.vftdi.bitbang_output.clear()
+        self.vftdi.bitbang_underruns = 0
+
+    def tearDown(self):
+        self.gpio.close()
+
+    def _drain(self, pwm):
+        sleep(2*self.vftdi.BITBANG_FIFO_SIZE/pwm.rate)
+        return self.vftdi.bitbang_output
+
+    def test_pattern(self):
+        pwm = GpioPwm(self.gpio, self.RATE)
+        pwm.set_channel(0x01, 1000, 0.25)
+        pwm.set_channel(0x06, 500, phase=0.5)
+        pwm.start()
+        self.assertTrue(pwm.is_running)
+        sleep(0.05)
+        pwm.stop()
+        output = self._drain(pwm)
+        self.assertEqual(pwm.period, 200)
+        self.assertEqual(pwm.channels, {0x01: (1000.0, 0.25),
+                                        0x06: (500.0, 0.5)})
+        self.assertGreater(len(output), 4*pwm.period)
+        expected = bytes(0x08 | (0x01 if pos % 100 < 25 else 0) |
+                         (0x06 if pos >= 100 else 0) for pos in range(200))
+        self.assertEqual(output, (expected*(len(output)//200+1))
+                         [:len(output)])
+        self.assertEqual(pwm.underruns, 0)
+        self.assertEqual(self.vftdi.bitbang_underruns, 0)
+
+    def test_swap(self):
+        pwm = GpioPwm(self.gpio, self.RATE)
+        pwm.set_channel(0x01, 1000)
+        pwm.start()
+        sleep(0.03)
+        pwm.set_channel(0x01, 1000, 0.1)
+        pwm.apply()
+        sleep(0.03)
+        pwm.clear_channel(0x01)
+        pwm.set_channel(0x02, 2000)
+        pwm.apply()
+        sleep(0.03)
+        pwm.stop()
+        output = self._drain(pwm)
+        first = (b'\x09'*50 + b'\x08'*50)
+        second = (b'\x09'*10 + b'\x08'*90)
+        third = (b'\x0a'*25 + b'\x08'*25)
+        # patterns are swapped on period boundaries
+        swap = output.index(second)
+        self.assertEqual(swap % 100, 0)
+        self.assertEqual(output[:swap], first*(swap//100))
+        end = output.index(third)
+        self.assertEqual(end % 100, 0)
+        self.assertEqual(output[swap:end], second*((end-swap)//100))
+        self.assertEqual(output[end:],
+                         (third*((len(output)-end)//50+1))[:len(output)-end])
+        self.assertEqual(pwm.underruns, 0)
+
+    def test_errors(self):
+        pwm = GpioPwm(self.gpio, self.RATE)
+        self.assertRaises(GpioException, pwm.set_channel, 0x10, 1000)
+        pwm.set_channel(0x03, 1000)
+        self.assertRaises(GpioException, pwm.set_channel, 0x01, 1000)
+        self.assertRaises(ValueError, pwm.set_channel, 0x04, self.RATE)
+        self.assertRaises(ValueError, pwm.set_channel, 0x04, 1000, 1.5)
+        # periods of 100 and 997 samples do not fit the maximum period
+        pwm.set_channel(0x04, self.RATE/997)
+        self.assertRaises(GpioException, pwm.start)
+
+
+class MockGpioCaptureTestCase(TestCase):
+    """Test GPIO captures in bitbang mode
+    """
+
+    RATE = 100000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.gpio = GpioController()
+        self.gpio.configure('ftdi://:232h/1', direction=0x0F)
+        bus, address, _ = self.gpio.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self._stop = False
+        self._toggler = None
+
+    def tearDown(self):
+        self._stop = True
+        if self._toggler:
+            self._toggler.join()
+        self.gpio.close()
+
+    def _toggle(self):
+        def toggle():
+            level = 0
+            while not self._stop:
+                self.vftdi.gpio = level
+                level ^= 0xa5
+                sleep(0.005)
+        self._toggler = Thread(target=toggle, daemon=True)
+        self._toggler.start()
+
+    def test_capture(self):
+        self._toggle()
+        capture = self.gpio.capture(self.RATE, duration=0.1)
+        self.assertEqual(capture.rate, self.RATE)
+        self.assertEqual(capture.sample_count, 10000)
+        self.assertEqual(capture.overruns, 0)
+        samples = capture.samples
+        self.assertEqual(len(samples), 10000)
+        self.assertEqual(set(samples), {0x00, 0xa5})
+        FtdiLogger.log.debug('Capture: %.1f Ksamples/s',
+                             capture.throughput/1000)
+        self.assertGreater(capture.throughput, 0.5*capture.rate)
+        # the port is restored once the capture completes
+        self.assertEqual(self.vftdi.direction, 0x0F)
+        self.assertRaises(ValueError, self.gpio.capture, self.RATE)
+        self.assertRaises(ValueError, self.gpio.capture, self.RATE, 1.0,
+                          100)
+
+    def test_sinks(self):
+        self._toggle()
+        ring = GpioRingBuffer(1000)
+        capture = self.gpio.capture(self.RATE, sample_count=5000, sink=ring)
+        self.assertIsNone(capture.samples)
+        self.assertEqual(len(ring), 1000)
+        self.assertEqual(set(bytes(ring.samples)) - {0x00, 0xa5}, set())
+        with TemporaryFile() as tfp:
+            tfp.truncate(5000)
+            with mmap(tfp.fileno(), 5000) as mfp:
+                self.gpio.capture(self.RATE, sample_count=5000, sink=mfp)
+                self.assertEqual(set(mfp[:]), {0x00, 0xa5})
+        ring = GpioRingBuffer(4)
+        ring.write(b'\x01\x02\x03')
+        ring.write(b'\x04\x05')
+        self.assertEqual(bytes(ring.samples), b'\x02\x03\x04\x05')
+        ring.write(b'\x06\x07\x08\x09\x0a')
+        self.assertEqual(bytes(ring.samples), b'\x07\x08\x09\x0a')
+
+    def test_overrun(self):
+        class SlowSink:
+            def write(self, data):
+                sleep(0.05)
+                return len(data)
+        depth = GpioCapture.QUEUE_DEPTH
+        GpioCapture.QUEUE_DEPTH = 1
+        try:
+            capture = self.gpio.capture(self.RATE, sample_count=20000,
+                                        sink=SlowSink())
+        finally:
+            GpioCapture.QUEUE_DEPTH = depth
+        self.assertEqual(capture.sample_count, 20000)
+        self.assertGreater(capture.overruns, 0)
+
+    def test_failing_sink(self):
+        class FailingSink:
+            def write(self, data):
+                raise ValueError('sink is full')
+        start = now()
+        self.assertRaises(ValueError, self.gpio.capture, self.RATE,
+                          sample_count=400000, sink=FailingSink())
+        # the capture is aborted without waiting for the reader to complete
+        self.assertLess(now()-start, 1.0)
+        self.assertEqual(self.gpio.direction, 0x0F)
+        # the port is still usable
+        capture = self.gpio.capture(self.RATE, sample_count=1000)
+        self.assertEqual(capture.sample_count, 1000)
+
+    def test_vcd(self):
+        out = StringIO()
+        GpioCapture.write_vcd(out, b'\x00\x00\x01\x01\x03\x02', 1E6,
+                              ['clk', 'data'])
+        lines = out.getvalue().splitlines()
+        self.assertIn('$var wire 1 ! clk $end', lines)
+        self.assertIn('$var wire 1 " data $end', lines)
+        changes = lines[lines.index('$enddefinitions $end')+1:]
+        self.assertEqual(changes, ['#0', '0!', '0"', '#2000', '1!',
+                                   '#4000', '1"', '#5000', '0!'])
+        self.gpio.write(0x0a)
+        self.vftdi.gpio = 0x50
+        capture = self.gpio.capture(self.RATE, sample_count=100)
+        out = StringIO()
+        capture.export_vcd(out)
+        changes = out.getvalue().split('$enddefinitions $end')[1].split()
+        self.assertEqual(changes, ['#0', '0!', '1"', '0#', '1$', '1%', '0&',
+                                   '1\'', '0('])
+
+
+class MockGpioSyncTestCase(TestCase):
+    """Test GPIO exchanges in synchronous bitbang mode
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def test_exchange(self):
+        gpio = GpioController()
+        gpio.configure('ftdi://:232h/1', direction=0x0F, sync=True)
+        bus, address, _ = gpio.ftdi.usb_path
+        vftdi = self.loader.get_virtual_ftdi(bus, address)
+        vftdi.rx_peak = 0
+        vftdi.gpio = 0xa0
+        gpio.write(0x05)
+        self.assertEqual(vftdi.gpio, 0xa5)
+        self.assertEqual(gpio.read(), 0xa5)
+        stimulus = bytes(pos & 0x0F for pos in range(100000))
+        start = now()
+        response = gpio.exchange(stimulus)
+        delay = now()-start
+        FtdiLogger.log.debug('Sync bitbang: %.1f Ksamples/s',
+                             len(stimulus)/delay/1000)
+        self.assertEqual(len(response), len(stimulus))
+        self.assertEqual(response, bytes(0xa0 | value for value in stimulus))
+        # the RX FIFO never overflows
+        self.assertLessEqual(vftdi.rx_peak, gpio.ftdi.fifo_sizes[1])
+        self.assertEqual(gpio.exchange([0x03]), b'\xa3')
+        gpio.set_direction(0xFF, 0x03)
+        self.assertEqual(gpio.exchange([0x0F]), b'\xa3')
+        gpio.close()
+        gpio.configure('ftdi://:232h/1', direction=0x0F)
+        self.assertRaises(GpioException, gpio.exchange, b'\x00')
+        gpio.close()
+
+
+class MockGpioWatcherTestCase(TestCase):
+    """Test GPIO edge watcher
+    """
+
+    URLS = ('ftdi://::FT1ABC1/1', 'ftdi://::FT1ABC2/1')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h_x2.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.gpios = []
+        self.vftdis = []
+        for url in self.URLS:
+            gpio = GpioController()
+            gpio.configure(url, direction=0x0F)
+            bus, address, _ = gpio.ftdi.usb_path
+            vftdi = self.loader.get_virtual_ftdi(bus, address)
+            vftdi.gpio = 0x00
+            self.gpios.append(gpio)
+            self.vftdis.append(vftdi)
+
+    def tearDown(self):
+        for gpio in self.gpios:
+            gpio.close()
+
+    def test_edges(self):
+        gpio1, gpio2 = self.gpios
+        vftdi1, vftdi2 = self.vftdis
+        rising = []
+        with GpioWatcher() as watcher:
+            watcher.watch(gpio1, 0x30)
+            watcher.watch(gpio2, 0x40, rising.append, GpioWatcher.RISING)
+            vftdi1.gpio = 0x10
+            event = watcher.get_event(1.0)
+            self.assertEqual((event.controller, event.pins, event.value),
+                             (gpio1, 0x10, 0x10))
+            vftdi1.gpio = 0x20
+            event = watcher.get_event(1.0)
+            self.assertEqual((event.pins, event.value), (0x30, 0x20))
+            # unwatched pins are ignored
+            vftdi1.gpio = 0xA0
+            self.assertIsNone(watcher.get_event(0.2))
+            # only rising edges are reported
+            vftdi2.gpio = 0x40
+            sleep(0.2)
+            vftdi2.gpio = 0x00
+            sleep(0.2)
+            self.assertEqual(len(rising), 1)
+            self.assertEqual((rising[0].controller, rising[0].pins,
+                              rising[0].value), (gpio2, 0x40, 0x40))
+            self.assertIsNone(watcher.get_event(0))
+
+    def test_debounce(self):
+        gpio = self.gpios[0]
+        vftdi = self.vftdis[0]
+        watcher = GpioWatcher()
+        watcher.watch(gpio, 0x10, debounce=0.1)
+        vftdi.gpio = 0x10
+        self.assertTrue(watcher.poll())
+        # a glitch is not reported
+        vftdi.gpio = 0x00
+        watcher.poll()
+        sleep(0.15)
+        self.assertFalse(watcher.poll())
+        self.assertIsNone(watcher.get_event(0))
+        vftdi.gpio = 0x10
+        watcher.poll()
+        self.assertIsNone(watcher.get_event(0))
+        sleep(0.15)
+        watcher.poll()
+        event = watcher.get_event(0)
+        self.assertEqual((event.pins, event.value), (0x10, 0x10))
+        # all the subscriptions of a controller share a single read
+        watcher.watch(gpio, 0x20)
+        reads = []
+        read = gpio.read
+        gpio.read = lambda: reads.append(1) or read()
+        watcher.poll()
+        self.assertEqual(len(reads), 1)
+
+    def test_adaptive(self):
+        gpio = self.gpios[0]
+        vftdi = self.vftdis[0]
+        watcher = GpioWatcher(min_interval=1E-3, max_interval=50E-3)
+        watcher.watch(gpio, 0x10)
+        watcher.start()
+        try:
+            sleep(1.0)
+            # the watcher backs off when idle
+            self.assertEqual(watcher.interval, 50E-3)
+            self.assertLess(watcher.poll_count, 40)
+            for level in (0x10, 0x00, 0x10):
+                start = now()
+                vftdi.gpio = level
+                event = watcher.get_event(1.0)
+                latency = now()-start
+                self.assertEqual(event.value, level)
+                # edge latency is bounded by the idle poll interval
+                self.assertLess(latency, 50E-3+20E-3)
+                sleep(0.3)
+        finally:
+            watcher.stop()
+        self.assertFalse(watcher.is_running)
+
+
+class MockGpioMpsseTestCase(TestCase):
+    """Test MPSSE GPIO APIs
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.gpio = GpioMpsseController()
+        # AD0 is left as an input, as it outputs the clock during delays
+        self.gpio.configure('ftdi://:232h/1', direction=0x55fe,
+                            initial=0x0100)
+        bus, address, _ = self.gpio.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.loop = _MockGpioLoop(self.vftdi.mpsse)
+        self.vftdi.attach(self.loop)
+
+    def tearDown(self):
+        self.vftdi.detach(self.loop)
+        self.gpio.close()
+
+    def test_gpio(self):
+        gpio = self.gpio
+        self.assertEqual(gpio.width, 16)
+        self.assertEqual(gpio.pins, 0xffff)
+        self.assertEqual(self.vftdi.mpsse.direction, 0x55fe)
+        # AD8 is looped back to AD9, inverted
+        self.assertEqual(gpio.read() & 0x0300, 0x0100)
+        gpio.write(0x0000)
+        self.assertEqual(gpio.read() & 0x0300, 0x0200)
+        gpio.set_direction(0x00ff, 0x0000)
+        self.assertEqual(gpio.direction, 0x5500)
+        self.assertEqual(self.vftdi.mpsse.direction, 0x5500)
+        self.assertEqual(gpio.read() & 0x00ff, 0x00ff)
+        self.assertRaises(GpioException, gpio.write, 0x10000)
+
+    def test_sequence(self):
+        gpio = self.gpio
+        sequence = GpioMpsseSequence(gpio)
+        for _ in range(100):
+            sequence.write(0x0100)
+            sequence.delay(10E-6)
+            sequence.read()
+            sequence.write(0x0000)
+            sequence.delay(2E-6)
+            sequence.read()
+        self.assertEqual(sequence.read_count, 200)
+        writes = self.vftdi.bulk_writes
+        reads = self.vftdi.bulk_reads
+        self.vftdi.mpsse.reset_stats()
+        self.loop.changes.clear()
+        values = gpio.execute(sequence)
+        # the commands are only split into USB write chunks
+        size = sum(len(segment) for segment, _ in
+                   sequence.build_segments(gpio.ftdi.fifo_sizes[1]))
+        chunks = (size+gpio.ftdi.write_data_get_chunksize()-1) // \
+            gpio.ftdi.write_data_get_chunksize()
+        self.assertEqual(self.vftdi.bulk_writes-writes, chunks)
+        self.assertEqual(self.vftdi.bulk_reads-reads, 1)
+        self.assertEqual([value & 0x0300 for value in values],
+                         [0x0100, 0x0200]*100)
+        # AD8 pulse widths only depend on the MPSSE clock
+        edges = [time for time, pins in self.loop.changes if pins & 0x0100]
+        falls = [time for time, pins in self.loop.changes
+                 if not pins & 0x0100]
+        widths = [fall-rise for rise, fall in zip(edges, falls[1:])]
+        self.assertEqual(len(widths), 99)
+        for width in widths:
+            # 10 us delay, then a 16-bit read and a single byte write
+            self.assertAlmostEqual(width, 10E-6+3*0.5E-6, delta=0.2E-6)
+        # the duration does not account for the command decoding time
+        self.assertLessEqual(sequence.duration, self.vftdi.mpsse.bus_time)
+        self.assertGreater(sequence.duration,
+                           0.98*self.vftdi.mpsse.bus_time)
+        self.assertEqual(gpio.execute(sequence)[-2:], values[-2:])
+
+    def test_sequence_state(self):
+        gpio = self.gpio
+        # a read-only sequence does not alter the controller state
+        reader = GpioMpsseSequence(gpio)
+        reader.read()
+        gpio.set_direction(0xff00, 0xff00)
+        gpio.execute(reader)
+        self.assertEqual(gpio.direction, 0xfffe)
+        gpio.write(0x0300)
+        self.assertEqual(self.vftdi.mpsse.direction, 0xfffe)
+        # the pins a sequence does not set keep the state they have on
+        # execution, not the state they had when the sequence was built
+        toggler = GpioMpsseSequence(gpio)
+        toggler.set_direction(0x0002, 0x0000)
+        gpio.set_direction(0x0f00, 0x0000)
+        gpio.write(0x0000)
+        gpio.execute(toggler)
+        self.assertEqual(gpio.direction, 0xf0fc)
+        self.assertEqual(self.vftdi.mpsse.direction, 0xf0fc)
+        gpio.set_direction(0x00f0, 0x0000)
+        gpio.execute(toggler)
+        self.assertEqual(gpio.direction, 0xf00c)
+        self.assertEqual(self.vftdi.mpsse.direction, 0xf00c)
+
+
+class _MockGpioLoop(MockMpssePeripheral):
+    """Virtual peripheral that drives AD9 with the inverted AD8 level, and
+       records the AD8 level changes.
+    """
+
+    def __init__(self, mpsse):
+        self.mpsse = mpsse
+        self.changes = []
+        self._level = None
+
+    def update(self, pins: int) -> int:
+        level = pins & 0x0100
+        if level != self._level:
+            self._level = level
+            bus_time = self.mpsse.bus_time if self.mpsse else 0.0
+            self.changes.append((bus_time, level))
+        return self.RELEASED & ~0x0200 if level else self.RELEASED
+
+
 class MockSimpleUartTestCase(TestCase):
     """Test FTDI UART APIs
     """
@@ -461,6 +1087,1590 @@ class MockSimpleUartTestCase(TestCase):
         self.assertEqual(msg, buf)
         port.close()
 
+    def test_modem_status(self):
+        """Check the modem status cache."""
+        port = serial_for_url('ftdi:///1')
+        bus, address, _ = port.usb_path
+        vftdi = self.loader.get_virtual_ftdi(bus, address)
+        ftdi = port.ftdi
+        ftdi.modem_status_max_age = 0.1
+        vftdi.gpio = 0x08
+        polls = vftdi.modem_polls
+        # the status is polled once, then served from the cache
+        self.assertTrue(port.cts)
+        self.assertFalse(port.dsr)
+        self.assertEqual(vftdi.modem_polls, polls+1)
+        sleep(0.15)
+        self.assertTrue(port.cts)
+        self.assertEqual(vftdi.modem_polls, polls+2)
+        # the status bytes of the bulk IN stream refresh the cache
+        sleep(0.15)
+        vftdi.gpio = 0x20
+        vftdi.uart_write(b'x')
+        self.assertEqual(port.read(1), b'x')
+        vftdi.gpio = 0x40
+        self.assertFalse(port.cts)
+        self.assertTrue(port.dsr)
+        self.assertFalse(port.cd)
+        self.assertEqual(vftdi.modem_polls, polls+2)
+        self.assertTrue(ftdi.get_modem_status(0) & Ftdi.MODEM_RLSD)
+        self.assertTrue(port.cd)
+        self.assertEqual(vftdi.modem_polls, polls+3)
+        ftdi.modem_status_max_age = 0
+        self.assertTrue(port.cd)
+        self.assertEqual(vftdi.modem_polls, polls+4)
+        port.close()
+
+    def test_statistics(self):
+        """Check the USB traffic statistics."""
+        port = serial_for_url('ftdi:///1')
+        bus, address, _ = port.usb_path
+        vftdi = self.loader.get_virtual_ftdi(bus, address)
+        ftdi = port.ftdi
+        packet_size = ftdi.max_packet_size
+        ftdi.reset_statistics()
+        port.write(bytes(packet_size+1))
+        vftdi.uart_read(packet_size+1)
+        vftdi.uart_write(b'x'*10)
+        self.assertEqual(port.read(10), b'x'*10)
+        # an empty poll
+        self.assertEqual(ftdi.read_data(1), b'')
+        vftdi.line_status = Ftdi.MODEM_OE >> 8 | Ftdi.MODEM_PE >> 8
+        vftdi.uart_write(b'y')
+        self.assertEqual(port.read(1), b'y')
+        vftdi.line_status = 0
+        stats = ftdi.statistics()
+        self.assertEqual((stats.tx_bytes, stats.tx_packets),
+                         (packet_size+1, 2))
+        self.assertEqual((stats.rx_bytes, stats.rx_packets,
+                          stats.empty_packets), (11, 3, 1))
+        self.assertEqual(stats.line_status['overrun'], 1)
+        self.assertEqual(stats.line_status['parity'], 1)
+        self.assertEqual(stats.line_status['framing'], 0)
+        ftdi.reset_statistics()
+        stats = ftdi.statistics()
+        self.assertEqual(stats[:5], (0, 0, 0, 0, 0))
+        self.assertFalse(any(stats.line_status.values()))
+        port.close()
+
+
+class MockI2cTestCase(TestCase):
+    """Test I2C APIs against virtual I2C slaves
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.i2c = I2cController()
+        self.i2c.configure('ftdi://:232h/1')
+        bus, address, _ = self.i2c.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.memory = MockI2cMemory(0x50)
+        self.vftdi.attach(self.memory)
+
+    def tearDown(self):
+        self.vftdi.detach(self.memory)
+        self.i2c.terminate()
+
+    def test_exchange(self):
+        """Check I2C write and read sequences."""
+        port = self.i2c.get_port(0x50)
+        port.write_to(0x20, b'pyftdi')
+        self.assertEqual(self.memory.memory[0x20:0x26], b'pyftdi')
+        self.assertEqual(port.read_from(0x22, 4), b'ftdi')
+        self.assertFalse(self.i2c.poll(0x51))
+        self.assertTrue(self.i2c.poll(0x50))
+
+    def test_poll_batch(self):
+        """Check batched ACK polling of a busy device."""
+        port = self.i2c.get_port(0x50)
+        self.memory.busy_count = 23
+        port.write_to(0x10, b'\x01')
+        self.memory.selections = 0
+        self.assertEqual(port.poll_batch(64, write=True, batch=10), 23)
+        # the last batch is completed, even if the slave has acknowledged
+        self.assertEqual(self.memory.selections, 30)
+        self.memory.busy_count = 40
+        port.write_to(0x10, b'\x02')
+        self.assertIsNone(port.poll_batch(16))
+        self.assertEqual(port.poll_batch(32), 24)
+        self.assertEqual(port.read_from(0x10, 1), b'\x02')
+
+    def test_poll_cond_batch(self):
+        """Check batched polling of a data-ready condition."""
+        port = self.i2c.get_port(0x50)
+        # use the memory as a FIFO of status register values
+        status = bytes((0x00, 0x10, 0x02, 0x00, 0x83, 0x81, 0x03, 0x01))
+        port.write_to(0x00, status)
+        # reset the address pointer
+        port.write(b'\x00')
+        result = port.poll_cond_batch(1, 0x83, 0x83, 16, batch=3)
+        self.assertEqual(result, (b'\x83', 4))
+        port.write(b'\x00')
+        self.assertIsNone(port.poll_cond_batch(1, 0x80, 0x80, 4))
+        port.write(b'\x00')
+        port.configure_register(True, 2)
+        self.memory.selections = 0
+        result = port.poll_cond_batch(2, 0xFF00, 0x8300, 16)
+        self.assertEqual(result, (b'\x83\x81', 2))
+        # batch size is limited by the FTDI TX FIFO, which can hold up to 7
+        # of these poll cycles
+        self.assertEqual(self.memory.selections, 7)
+
+
+class MockI2cSchedulerTestCase(TestCase):
+    """Test I2C scheduler against virtual I2C slaves
+    """
+
+    class Memory(MockI2cMemory):
+        """Log slave selections on a shared bus log."""
+
+        def __init__(self, address: int, log: list, **kwargs):
+            super().__init__(address, **kwargs)
+            self._log = log
+            self.stops = 0
+
+        def select(self, read: bool) -> bool:
+            ack = super().select(read)
+            self._log.append((self.address, 'r' if read else 'w', ack))
+            return ack
+
+        def stop(self) -> None:
+            self.stops += 1
+            super().stop()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.i2c = I2cController()
+        self.i2c.configure('ftdi://:232h/1')
+        bus, address, _ = self.i2c.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.log = []
+        self.memories = [self.Memory(0x50, self.log),
+                         self.Memory(0x51, self.log)]
+        for memory in self.memories:
+            self.vftdi.attach(memory)
+
+    def tearDown(self):
+        for memory in self.memories:
+            self.vftdi.detach(memory)
+        self.i2c.terminate()
+
+    def _block(self, scheduler: I2cScheduler, address: int):
+        """Hold the controller, so that transactions can be queued up before
+           they get executed."""
+        # pylint: disable-msg=protected-access
+        self.i2c._lock.acquire()
+        # the first transaction is dequeued by the worker thread, which then
+        # waits for the controller
+        trans = scheduler.submit(address, b'\x00\x00')
+        while scheduler.statistics[address].depth:
+            pass
+        return trans
+
+    def test_round_robin(self):
+        """Check transactions are served in turn, and coalesced."""
+        scheduler = I2cScheduler(self.i2c)
+        try:
+            first = self._block(scheduler, 0x50)
+            trans = []
+            for _ in range(3):
+                trans.append(scheduler.submit(0x50, b'\x10', 2))
+            for _ in range(2):
+                trans.append(scheduler.submit(0x51, b'\x20', 1))
+            self.i2c._lock.release()  # pylint: disable-msg=protected-access
+            first.wait(1.0)
+            for tran in trans:
+                self.assertEqual(tran.wait(1.0), bytes(tran.readlen))
+            self.assertEqual([(addr, mode) for addr, mode, _ in self.log],
+                             [(0x50, 'w')] +
+                             [(0x50, 'w'), (0x50, 'r'),
+                              (0x51, 'w'), (0x51, 'r')] * 2 +
+                             [(0x50, 'w'), (0x50, 'r')])
+            stats = scheduler.statistics
+            self.assertEqual(stats[0x50].count, 4)
+            self.assertEqual(stats[0x50].max_depth, 3)
+            self.assertEqual(stats[0x50].batched, 3)
+            self.assertEqual(stats[0x51].count, 2)
+            self.assertEqual(stats[0x51].depth, 0)
+            self.assertGreater(stats[0x51].max_wait, 0.0)
+        finally:
+            scheduler.terminate()
+
+    def test_priority(self):
+        """Check a busy slave does not delay a higher priority slave."""
+        scheduler = I2cScheduler(self.i2c, I2cScheduler.PRIORITY)
+        scheduler.set_priority(0x51, 1)
+        # each attempt selects the slave twice, for writing then reading
+        self.memories[0].busy_count = 4
+        self.memories[0].memory[0x10] = 0x5a
+        self.memories[1].memory[0x00] = 0xa5
+        try:
+            first = self._block(scheduler, 0x50)
+            low = scheduler.submit(0x50, b'\x10', 1)
+            high = [scheduler.submit(0x51, b'\x00', 1) for _ in range(2)]
+            self.i2c._lock.release()  # pylint: disable-msg=protected-access
+            first.wait(1.0)
+            self.assertEqual(low.wait(1.0), b'\x5a')
+            for tran in high:
+                self.assertEqual(tran.wait(1.0), b'\xa5')
+            # the busy slave is retried after the high priority slave has
+            # been served
+            self.assertEqual(self.log,
+                             [(0x50, 'w', True),
+                              (0x51, 'w', True), (0x51, 'r', True),
+                              (0x51, 'w', True), (0x51, 'r', True),
+                              (0x50, 'w', False), (0x50, 'r', False),
+                              (0x50, 'w', False), (0x50, 'r', False),
+                              (0x50, 'w', True), (0x50, 'r', True)])
+            stats = scheduler.statistics
+            self.assertEqual(stats[0x50].retries, 2)
+            self.assertEqual(stats[0x51].retries, 0)
+            # retry budget exhausted
+            self.memories[0].busy_count = 6
+            scheduler.write(0x50, b'\x00\x01')
+            with self.assertRaises(I2cNackError):
+                scheduler.read(0x50, 1)
+        finally:
+            scheduler.terminate()
+
+    def test_retry_order(self):
+        """Check a NACKed transaction is retried before the next
+           transactions of the same slave."""
+        scheduler = I2cScheduler(self.i2c, coalesce=False)
+        # the blocking write starts a write cycle
+        self.memories[0].busy_count = 1
+        try:
+            first = self._block(scheduler, 0x50)
+            write = scheduler.submit(0x50, b'\x10\x5a')
+            read = scheduler.submit(0x50, b'\x10', 1)
+            other = scheduler.submit(0x51, b'\x00', 1)
+            self.i2c._lock.release()  # pylint: disable-msg=protected-access
+            first.wait(1.0)
+            write.wait(1.0)
+            self.assertEqual(read.wait(1.0), b'\x5a')
+            other.wait(1.0)
+            # the other slave is served before the NACKed write is retried
+            self.assertEqual(self.log[1:4], [(0x50, 'w', False),
+                                             (0x51, 'w', True),
+                                             (0x51, 'r', True)])
+            self.assertEqual(self.log[4], (0x50, 'w', True))
+        finally:
+            scheduler.terminate()
+
+    def test_batch_error(self):
+        """Check the bus is released when a batched request fails."""
+        scheduler = I2cScheduler(self.i2c)
+        memory = self.memories[0]
+        memory.memory[:] = bytes([0xff]*len(memory.memory))
+        ftdi = self.i2c.ftdi
+        read_data_bytes = ftdi.read_data_bytes
+        try:
+            ftdi.read_data_bytes = lambda size, attempt=1: b''
+            stops = memory.stops
+            with self.assertRaises(I2cIOError):
+                scheduler.read(0x50, 4)
+            self.assertEqual(memory.stops, stops+1)
+            ftdi.read_data_bytes = read_data_bytes
+            # discard the response which has not been read back
+            ftdi.read_data_bytes(16)
+            self.assertEqual(scheduler.read(0x50, 2), b'\xff\xff')
+        finally:
+            ftdi.read_data_bytes = read_data_bytes
+            scheduler.terminate()
+
+    def test_port(self):
+        """Check I2C ports may be used with a scheduler."""
+        scheduler = I2cScheduler(self.i2c, coalesce=False)
+        try:
+            port = scheduler.get_port(0x51)
+            port.write_to(0x40, b'abc')
+            self.assertEqual(port.read_from(0x40, 3), b'abc')
+            self.assertTrue(port.poll())
+            self.assertEqual(scheduler.statistics[0x51].count, 3)
+            self.assertEqual(scheduler.statistics[0x51].batched, 0)
+        finally:
+            scheduler.terminate()
+
+    def test_port_poll_batch(self):
+        """Check batched polls may be used through a scheduler port."""
+        scheduler = I2cScheduler(self.i2c)
+        try:
+            port = scheduler.get_port(0x50)
+            self.memories[0].busy_count = 12
+            port.write_to(0x10, b'\x83')
+            self.assertEqual(port.poll_batch(32, write=True, batch=5), 12)
+            port.write(b'\x10')
+            self.assertEqual(port.poll_cond_batch(1, 0x83, 0x83, 4),
+                             (b'\x83', 0))
+            self.assertEqual(scheduler.statistics[0x50].count, 4)
+        finally:
+            scheduler.terminate()
+
+    def test_nack_read(self):
+        """Check a coalesced read is aborted when its slave NACKs."""
+
+        class Clock(MockMpssePeripheral):
+            """Count the SCL clock pulses."""
+
+            def __init__(self):
+                self.pulses = 0
+                self._scl = True
+
+            def update(self, pins: int) -> int:
+                scl = bool(pins & MockI2cMemory.SCL_BIT)
+                if scl and not self._scl:
+                    self.pulses += 1
+                self._scl = scl
+                return self.RELEASED
+
+        clock = Clock()
+        self.vftdi.attach(clock)
+        scheduler = I2cScheduler(self.i2c, retry_count=1)
+        try:
+            self.memories[0].busy_count = 8
+            scheduler.write(0x50, b'\x00\x01')
+            pulses = []
+            for readlen in (1, 32):
+                clock.pulses = 0
+                with self.assertRaises(I2cNackError):
+                    scheduler.read(0x50, readlen)
+                pulses.append(clock.pulses)
+            # only the address phase is clocked, whatever the read length
+            self.assertEqual(pulses[0], pulses[1])
+            clock.pulses = 0
+            self.assertEqual(scheduler.read(0x51, 2), b'\x00\x00')
+            self.assertEqual(clock.pulses, pulses[0]+2*9)
+        finally:
+            scheduler.terminate()
+            self.vftdi.detach(clock)
+
+
+class MockI2cEepromTestCase(TestCase):
+    """Test I2C EEPROM driver against virtual EEPROMs
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.i2c = I2cController()
+        self.i2c.configure('ftdi://:232h/1', frequency=400E3)
+        bus, address, _ = self.i2c.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.device = None
+
+    def tearDown(self):
+        if self.device:
+            self.vftdi.detach(self.device)
+        self.i2c.terminate()
+
+    def _attach(self, model: str, busy_count: int = 5) -> I2cEeprom:
+        eeprom = I2cEeprom(self.i2c, model)
+        geometry = eeprom.geometry
+        self.device = MockI2cEeprom(I2cEeprom.DEFAULT_ADDRESS, geometry.size,
+                                    geometry.page_size, geometry.addr_width,
+                                    geometry.addr_bits, busy_count)
+        self.vftdi.attach(self.device)
+        return eeprom
+
+    def _check_write_read(self, model: str, offset: int, length: int):
+        eeprom = self._attach(model)
+        data = bytes((x*7+3) & 0xff for x in range(length))
+        eeprom.write(offset, data)
+        self.assertEqual(self.device.memory[offset:offset+length], data)
+        # first and last pages are only partially written
+        page_size = eeprom.page_size
+        pages = (((offset+length+page_size-1)//page_size) -
+                 (offset//page_size))
+        self.assertEqual(self.device.page_writes, pages)
+        self.assertEqual(eeprom.read(offset, length), data)
+        self.assertGreater(eeprom.read_throughput, 0.0)
+        self.assertGreater(eeprom.write_throughput, 0.0)
+
+    def test_8bit_address(self):
+        """Check 24C02 EEPROM, w/ 8-bit cell address."""
+        self._check_write_read('24C02', 0x13, 0x40)
+
+    def test_device_address(self):
+        """Check 24C08 EEPROM, w/ cell address bits in device address."""
+        self._check_write_read('24C08', 0x1F5, 0x120)
+
+    def test_16bit_address(self):
+        """Check 24C64 EEPROM, w/ 16-bit cell address."""
+        self._check_write_read('24C64', 0x0FF0, 0x50)
+
+    def test_update(self):
+        """Check unchanged pages are not written."""
+        eeprom = self._attach('24C32', 0)
+        data = bytearray(range(128))
+        eeprom.write(0x40, data)
+        self.device.page_writes = 0
+        data[0x05] = 0xff
+        data[0x45:0x48] = b'abc'
+        eeprom.reset_statistics()
+        self.assertEqual(eeprom.update(0x40, data), 2)
+        self.assertEqual(self.device.page_writes, 2)
+        self.assertEqual(self.device.memory[0x40:0xC0], data)
+        # only the modified bytes are accounted for
+        throughput = eeprom.write_throughput
+        self.assertGreater(throughput, 0.0)
+        # pylint: disable-msg=protected-access
+        self.assertEqual(eeprom._write_bytes, 4)
+        self.assertEqual(eeprom.update(0x40, data), 0)
+        self.assertEqual(eeprom.write_throughput, throughput)
+        with self.assertRaises(I2cEepromError):
+            eeprom.read(0xFF0, 0x20)
+
+
+class MockI2cBenchmarkTestCase(TestCase):
+    """Estimate I2C throughput for each I2C mode, using the virtual MPSSE
+       engine to account for the time spent on the I2C bus.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def test(self):
+        """Report bus-level throughput for standard, fast and fast-plus
+           modes."""
+        rates = []
+        for frequency in (100E3, 400E3, 1E6):
+            i2c = I2cController()
+            i2c.configure('ftdi://:232h/1', frequency=frequency)
+            bus, address, _ = i2c.ftdi.usb_path
+            vftdi = self.loader.get_virtual_ftdi(bus, address)
+            memory = MockI2cMemory(0x50)
+            vftdi.attach(memory)
+            try:
+                port = i2c.get_port(0x50)
+                data = bytes(range(128))
+                vftdi.mpsse.reset_stats()
+                port.write_to(0x00, data)
+                write_time = vftdi.mpsse.bus_time
+                vftdi.mpsse.reset_stats()
+                self.assertEqual(port.read_from(0x00, len(data)), data)
+                read_time = vftdi.mpsse.bus_time
+            finally:
+                vftdi.detach(memory)
+                i2c.terminate()
+            write_rate = (len(data)+1)/write_time
+            read_rate = len(data)/read_time
+            rates.append((write_rate, read_rate))
+            FtdiLogger.log.debug('I2C %6.1f KHz: write %6.2f KB/s, '
+                                 'read %6.2f KB/s, host %6.2f KB/s',
+                                 i2c.frequency/1E3, write_rate/1E3,
+                                 read_rate/1E3, i2c.throughput/1E3)
+        for mode in range(len(rates)-1):
+            self.assertLess(rates[mode][0], rates[mode+1][0])
+            self.assertLess(rates[mode][1], rates[mode+1][1])
+
+
+class MockJtagTestCase(TestCase):
+    """Test JTAG engine against a virtual TAP controller
+    """
+
+    IDCODE = 0x4ba00477
+    USER_INSTR = 0b1000
+    USER_LENGTH = 1003
+    LONG_INSTR = 0b1001
+    LONG_LENGTH = 12003
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.jtag = JtagEngine(frequency=6E6)
+        self.jtag.configure('ftdi://:232h/1')
+        bus, address, _ = self.jtag.controller.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.tap = MockJtagTap(4, self.IDCODE,
+                               registers={self.USER_INSTR: self.USER_LENGTH,
+                                          self.LONG_INSTR: self.LONG_LENGTH})
+        self.chain = MockJtagChain([self.tap])
+        self.vftdi.attach(self.chain)
+        self.jtag.reset()
+
+    def tearDown(self):
+        self.vftdi.detach(self.chain)
+        self.jtag.close()
+
+    def test_idcode(self):
+        idcode = self.jtag.read_dr(32)
+        self.jtag.go_idle()
+        self.assertEqual(int(idcode), self.IDCODE)
+
+    def test_shift_bytes(self):
+        ctrl = self.jtag.controller
+        self.jtag.write_ir(BitSequence(self.USER_INSTR, length=4))
+        self.assertEqual(self.tap.instruction, self.USER_INSTR)
+        self.jtag.change_state('shift_dr')
+        length = self.USER_LENGTH
+        data = bytes((x*13+5) & 0xff for x in range((length+7)//8))
+        mask = (1 << length)-1
+        self.assertEqual(ctrl.shift_bytes(data, length), bytes(len(data)))
+        # the register now contains the pattern, which is shifted out as the
+        # register is refilled
+        out = ctrl.shift_bytes(bytes(len(data)), length)
+        self.assertEqual(int.from_bytes(out, 'little'),
+                         int.from_bytes(data, 'little') & mask)
+        self.assertEqual(len(out), len(data))
+        # BitSequence-based API
+        seq = BitSequence(bytes_=data)[:length]
+        self.assertEqual(int(ctrl.shift_register(seq)), 0)
+        self.assertEqual(ctrl.shift_register(seq), seq)
+        self.assertEqual(ctrl.read_bytes(length), out)
+        self.assertEqual(len(ctrl.read(length)), length)
+
+    def test_long_shift(self):
+        """Shift a register larger than the FTDI FIFOs."""
+        ctrl = self.jtag.controller
+        self.jtag.write_ir(BitSequence(self.LONG_INSTR, length=4))
+        self.jtag.change_state('shift_dr')
+        length = self.LONG_LENGTH
+        data = bytes((x*7+1) & 0xff for x in range((length+7)//8))
+        value = int.from_bytes(data, 'little') & ((1 << length)-1)
+        ctrl.shift_bytes(data, length)
+        out = ctrl.shift_bytes(data, length)
+        self.assertEqual(int.from_bytes(out, 'little'), value)
+        self.assertEqual(int.from_bytes(ctrl.read_bytes(length), 'little'),
+                         value)
+        # write-only path, then read back the register through update/capture
+        seq = BitSequence(value ^ ((1 << length)-1), length=length)
+        self.jtag.go_idle()
+        self.jtag.write_dr(seq)
+        self.assertEqual(self.tap.values[self.LONG_INSTR], int(seq))
+        self.assertEqual(self.jtag.read_dr(length), seq)
+
+    def test_change_state(self):
+        """Move the TAP controller across all the state transitions."""
+        statenames = self.jtag.get_available_statenames()
+        self.assertEqual(len(statenames), 16)
+        self.jtag.go_idle()
+        for source in statenames:
+            for target in statenames:
+                if target in (source, 'test_logic_reset'):
+                    continue
+                self.jtag.change_state(source)
+                self.tap.reset_stats()
+                self.jtag.change_state(target)
+                self.assertEqual(self.tap.state, target)
+                path = self.jtag.state_machine.find_path(target, source)
+                self.assertEqual(self.tap.clocks, len(path)-1)
+        self.jtag.reset()
+        self.assertEqual(self.tap.state, 'test_logic_reset')
+
+    def test_ir_cache(self):
+        """Skip redundant instruction shifts."""
+        length = self.USER_LENGTH
+        instr = BitSequence(self.USER_INSTR, length=4)
+        # instructions are always shifted by default
+        self.jtag.go_idle()
+        self.jtag.write_ir(instr)
+        self.jtag.write_ir(instr)
+        self.assertEqual(self.tap.ir_scans, 2)
+        self.assertEqual(self.tap.state, 'update_ir')
+        self.tap.reset_stats()
+        self.jtag.ir_cache = True
+        self.jtag.go_idle()
+        for loop in range(3):
+            data = BitSequence(loop*0x5a5a5+1, length=length)
+            self.jtag.write_ir(instr)
+            self.jtag.go_idle()
+            self.jtag.write_dr(data)
+            self.assertEqual(self.tap.values[self.USER_INSTR], int(data))
+        self.assertEqual(self.tap.ir_scans, 1)
+        # stay in Run-Test/Idle, moving there along with the last data bit
+        for loop in range(3):
+            self.tap.reset_stats()
+            writes = self.vftdi.bulk_writes
+            self.jtag.write_ir(instr)
+            self.jtag.write_dr(data, end_state='run_test_idle')
+            self.assertEqual(self.vftdi.bulk_writes-writes, 1)
+            # Select-DR, Capture-DR, Shift-DR, data, Update-DR, Run-Test/Idle
+            self.assertEqual(self.tap.clocks, 3+length+2)
+        self.assertEqual(self.tap.ir_scans, 0)
+        self.jtag.write_ir(instr, force=True)
+        self.assertEqual(self.tap.ir_scans, 1)
+        # a TAP reset selects the IDCODE instruction
+        self.jtag.reset()
+        self.jtag.write_ir(instr)
+        self.assertEqual(self.tap.ir_scans, 2)
+        self.assertEqual(self.jtag.read_dr(length), data)
+        # so does any move through Test-Logic-Reset
+        self.jtag.change_state('test_logic_reset')
+        self.jtag.go_idle()
+        self.assertEqual(self.tap.instruction, self.tap.idcode_instr)
+        self.jtag.write_ir(instr)
+        self.assertEqual(self.tap.ir_scans, 3)
+        self.assertEqual(self.tap.instruction, self.USER_INSTR)
+        queue = JtagQueue(self.jtag)
+        queue.change_state('test_logic_reset')
+        queue.change_state('run_test_idle')
+        queue.flush()
+        self.jtag.write_ir(instr)
+        self.assertEqual(self.tap.ir_scans, 4)
+        self.assertEqual(self.tap.instruction, self.USER_INSTR)
+
+    def test_queue(self):
+        queue = JtagQueue(self.jtag)
+        length = self.USER_LENGTH
+        pattern = int.from_bytes(bytes((x*11+3) & 0xff
+                                       for x in range((length+7)//8)),
+                                 'little') & ((1 << length)-1)
+        queue.reset()
+        idcode = queue.read_dr(32)
+        queue.scan_ir(self.USER_INSTR, 4)
+        self.assertIsNone(queue.scan_dr(pattern, length, capture=False))
+        readback = queue.scan_dr(0, length, expect=pattern)
+        mismatch = queue.scan_dr(0, length, expect=pattern)
+        queue.scan_ir(BitSequence('1111'))
+        bypass = queue.scan_dr(0b1010, 4, end_state='pause_dr')
+        queue.run_test(100)
+        self.assertFalse(idcode.done)
+        writes = self.vftdi.bulk_writes
+        reads = self.vftdi.bulk_reads
+        scans = queue.flush()
+        # a single USB request for the whole queue
+        self.assertEqual(self.vftdi.bulk_writes-writes, 1)
+        self.assertEqual(self.vftdi.bulk_reads-reads, 1)
+        self.assertEqual(scans, [idcode, readback, mismatch, bypass])
+        self.assertEqual(int(idcode), self.IDCODE)
+        self.assertEqual(idcode.value, BitSequence(self.IDCODE, length=32))
+        self.assertEqual(int(readback), pattern)
+        self.assertTrue(readback.matched)
+        self.assertFalse(mismatch.matched)
+        self.assertEqual(int(mismatch), 0)
+        # BYPASS captures a zero bit, then delays TDI by one clock cycle
+        self.assertEqual(int(bypass), 0b0100)
+        self.assertEqual(self.tap.ir_scans, 2)
+        self.assertEqual(self.tap.dr_scans, 5)
+        self.assertEqual(self.tap.state, 'run_test_idle')
+        self.assertEqual(str(self.jtag.state_machine.state()),
+                         'run_test_idle')
+        self.assertEqual(queue.flush(), [])
+
+    def test_queue_segments(self):
+        """Queue more TDO data than the FTDI FIFOs may hold."""
+        queue = JtagQueue(self.jtag)
+        length = self.LONG_LENGTH
+        pattern = int.from_bytes(bytes((x*5+1) & 0xff
+                                       for x in range((length+7)//8)),
+                                 'little') & ((1 << length)-1)
+        queue.scan_ir(self.LONG_INSTR, 4)
+        first = queue.scan_dr(pattern, length)
+        idcodes = []
+        for _ in range(3):
+            second = queue.scan_dr(pattern ^ ((1 << length)-1), length)
+            queue.scan_ir(0b0001, 4)
+            idcodes.append(queue.read_dr(32))
+            queue.scan_ir(self.LONG_INSTR, 4)
+        queue.flush()
+        self.assertEqual(int(first), 0)
+        self.assertEqual(int(second), pattern ^ ((1 << length)-1))
+        self.assertEqual([int(idcode) for idcode in idcodes],
+                         [self.IDCODE]*3)
+
+    def test_svf(self):
+        length = self.USER_LENGTH
+        pattern = int.from_bytes(bytes((x*3+7) & 0xff
+                                       for x in range((length+7)//8)),
+                                 'little') & ((1 << length)-1)
+        hexdata = '%0*x' % ((length+3)//4, pattern)
+        # split the data vector over several lines
+        lines = '\n'.join(hexdata[pos:pos+64]
+                          for pos in range(0, len(hexdata), 64))
+        svf = StringIO(f"""! check the device identifier
+TRST OFF;
+ENDIR IDLE;
+ENDDR IDLE;
+STATE RESET;
+STATE IDLE;
+FREQUENCY 1E6 HZ;
+SIR 4 TDI (1);
+SDR 32 TDI (00000000) TDO (4ba00477) MASK (0fffffff);
+// load then read back the user register
+SIR 4 TDI (8); SDR {length} TDI (
+{lines});
+RUNTEST 100 TCK ENDSTATE IDLE;
+SDR {length} TDI (0) TDO ({hexdata});
+ENDDR DRPAUSE;
+SDR {length} TDO ({hexdata}) MASK (0);
+RUNTEST IDLE 2E-3 SEC;
+""")
+        frequency = self.jtag.controller.frequency
+        self.tap.reset_stats()
+        stats = SvfPlayer(self.jtag).play_svf(svf)
+        FtdiLogger.log.debug('SVF: %.3f MB/s', stats.throughput/1E6)
+        self.assertEqual(self.tap.values[self.USER_INSTR], 0)
+        self.assertEqual(self.tap.ir_scans, 2)
+        self.assertEqual(self.tap.dr_scans, 4)
+        self.assertEqual(self.tap.state, 'run_test_idle')
+        self.assertEqual(stats.commands, 15)
+        self.assertEqual(stats.scans, 6)
+        self.assertEqual(stats.bits, 8+32+3*length)
+        # RUNTEST clocks are issued at the SVF frequency
+        self.assertGreater(self.tap.clocks, 2000+100)
+        self.assertEqual(self.jtag.controller.frequency, frequency)
+
+    def test_svf_runtest(self):
+        # ENDSTATE is sticky, unless the run state is specified
+        pause = 'RUNTEST 10 TCK ENDSTATE DRPAUSE;'
+        for runtests, state in ((pause, 'pause_dr'),
+                                (f'{pause} RUNTEST 10 TCK;', 'pause_dr'),
+                                (f'{pause} RUNTEST IDLE 10 TCK;',
+                                 'run_test_idle'),
+                                ('RUNTEST DRPAUSE 10 TCK; RUNTEST 10 TCK;',
+                                 'pause_dr')):
+            svf = StringIO(f'STATE RESET;\n{runtests}\n')
+            SvfPlayer(self.jtag).play_svf(svf)
+            self.assertEqual(self.tap.state, state, runtests)
+
+    def test_svf_mismatch(self):
+        svf = StringIO("""STATE RESET;
+SIR 4 TDI (1);
+SDR 32 TDI (0) TDO (4ba00476);
+""")
+        with self.assertRaises(SvfError) as exc:
+            SvfPlayer(self.jtag).play_svf(svf)
+        self.assertIn('line 3', str(exc.exception))
+        svf = StringIO('SIR 4 TDI (1);\nPIO (HL);\n')
+        self.assertRaises(SvfError, SvfPlayer(self.jtag).play_svf, svf)
+
+    def test_xsvf(self):
+        length = self.USER_LENGTH
+        size = (length+7)//8
+        pattern = int.from_bytes(bytes((x*9+1) & 0xff for x in range(size)),
+                                 'little') & ((1 << length)-1)
+
+        def vector(value, bits=length):
+            return value.to_bytes((bits+7)//8, 'big')
+
+        xsvf = BytesIO(b''.join((
+            bytes((SvfPlayer.XSTATE, 0, SvfPlayer.XSTATE, 1,
+                   SvfPlayer.XENDIR, 0, SvfPlayer.XENDDR, 0,
+                   SvfPlayer.XREPEAT, 2, SvfPlayer.XSIR, 4, 0x01,
+                   SvfPlayer.XSDRSIZE)), vector(32, 32),
+            bytes((SvfPlayer.XTDOMASK,)), vector(0xffffffff, 32),
+            bytes((SvfPlayer.XSDRTDO,)), vector(0, 32),
+            vector(self.IDCODE, 32),
+            bytes((SvfPlayer.XREPEAT, 0, SvfPlayer.XRUNTEST)),
+            vector(100, 32),
+            bytes((SvfPlayer.XSIR, 4, 0x08, SvfPlayer.XSDRSIZE)),
+            vector(length, 32),
+            bytes((SvfPlayer.XTDOMASK,)), vector((1 << length)-1),
+            bytes((SvfPlayer.XSDRTDO,)), vector(pattern), vector(0),
+            bytes((SvfPlayer.XSDRTDO,)), vector(pattern), vector(pattern),
+            bytes((SvfPlayer.XSDR,)), vector(pattern),
+            bytes((SvfPlayer.XCOMMENT,)), b'done\0',
+            bytes((SvfPlayer.XCOMPLETE,)))))
+        self.tap.reset_stats()
+        stats = SvfPlayer(self.jtag).play_xsvf(xsvf)
+        FtdiLogger.log.debug('XSVF: %.3f MB/s', stats.throughput/1E6)
+        self.assertEqual(self.tap.values[self.USER_INSTR], pattern)
+        self.assertEqual(self.tap.dr_scans, 4)
+        self.assertEqual(self.tap.state, 'run_test_idle')
+        self.assertEqual(stats.scans, 6)
+        xsvf = BytesIO(b''.join((
+            bytes((SvfPlayer.XSDRSIZE,)), vector(length, 32),
+            bytes((SvfPlayer.XTDOMASK,)), vector((1 << length)-1),
+            bytes((SvfPlayer.XSDRTDO,)), vector(0), vector(0))))
+        self.assertRaises(SvfError, SvfPlayer(self.jtag).play_xsvf, xsvf)
+
+    def test_xsvf_retry(self):
+        length = self.USER_LENGTH
+        pattern = (1 << length)-3
+
+        def vector(value, bits=length):
+            return value.to_bytes((bits+7)//8, 'big')
+
+        # the register only holds the expected value on the fourth capture
+        captures = []
+
+        def capture():
+            captures.append(self.tap.idle_clocks)
+            return pattern if len(captures) > 3 else 0
+
+        self.tap.captures[self.USER_INSTR] = capture
+        xsvf = BytesIO(b''.join((
+            bytes((SvfPlayer.XSTATE, 0, SvfPlayer.XSTATE, 1,
+                   SvfPlayer.XENDIR, 0, SvfPlayer.XENDDR, 0,
+                   SvfPlayer.XREPEAT, 4, SvfPlayer.XRUNTEST)),
+            vector(100, 32),
+            bytes((SvfPlayer.XSIR, 4, self.USER_INSTR, SvfPlayer.XSDRSIZE)),
+            vector(length, 32),
+            bytes((SvfPlayer.XTDOMASK,)), vector((1 << length)-1),
+            bytes((SvfPlayer.XSDRTDO,)), vector(0), vector(pattern),
+            bytes((SvfPlayer.XCOMPLETE,)))))
+        self.tap.reset_stats()
+        stats = SvfPlayer(self.jtag).play_xsvf(xsvf)
+        self.assertEqual(len(captures), 4)
+        self.assertEqual(stats.scans, 5)
+        self.assertEqual(self.tap.state, 'run_test_idle')
+        # each retry goes through Run-Test/Idle, and waits 25% longer than
+        # the previous attempt
+        frequency = self.jtag.controller.frequency
+        waits = [ceil(runtest*1E-6*frequency)
+                 for runtest in (125, 156, 195)]
+        idles = [end-start for start, end in zip(captures, captures[1:])]
+        # the Run-Test/Idle clock cycle which leaves the state is accounted
+        self.assertEqual(idles, [wait+1 for wait in waits])
+        # no retry without XRUNTEST
+        captures.clear()
+        xsvf = BytesIO(xsvf.getvalue().replace(
+            bytes((SvfPlayer.XRUNTEST,)) + vector(100, 32),
+            bytes((SvfPlayer.XRUNTEST,)) + vector(0, 32)))
+        self.assertRaises(SvfError, SvfPlayer(self.jtag).play_xsvf, xsvf)
+        self.assertEqual(len(captures), 1)
+
+
+
+class MockJtagChainTestCase(TestCase):
+    """Test JTAG chain discovery against virtual TAP controllers
+    """
+
+    USER_INSTR = 0b0010
+    USER_LENGTH = 77
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.jtag = JtagEngine(frequency=6E6)
+        self.jtag.configure('ftdi://:232h/1')
+        bus, address, _ = self.jtag.controller.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        # the first TAP is the closest one to the host TDI output
+        self.taps = [MockJtagTap(4, 0x4ba00477,
+                                 registers={self.USER_INSTR: 8}),
+                     MockJtagTap(6, None,
+                                 registers={self.USER_INSTR:
+                                            self.USER_LENGTH}),
+                     MockJtagTap(5, 0x16d4a093, idcode_instr=0b01001,
+                                 registers={self.USER_INSTR: 16})]
+        self.chain = MockJtagChain(self.taps)
+        self.vftdi.attach(self.chain)
+        self.jtag.reset()
+
+    def tearDown(self):
+        self.vftdi.detach(self.chain)
+        self.jtag.close()
+
+    def test_detect(self):
+        chain = JtagChain(self.jtag)
+        writes = self.vftdi.bulk_writes
+        reads = self.vftdi.bulk_reads
+        devices = chain.detect()
+        # a single USB request
+        self.assertEqual(self.vftdi.bulk_writes-writes, 1)
+        self.assertEqual(self.vftdi.bulk_reads-reads, 1)
+        self.assertEqual(len(chain), 3)
+        self.assertEqual(len(devices), 3)
+        self.assertEqual(chain.idcodes, [0x4ba00477, None, 0x16d4a093])
+        self.assertEqual(chain.ir_lengths, [4, 6, 5])
+        self.assertEqual([dev.ir_length for dev in devices], [4, 6, 5])
+        # all the TAP controllers are left in BYPASS mode
+        for tap in self.taps:
+            self.assertEqual(tap.instruction, tap.bypass_instr)
+        self.assertRaises(JtagError, chain.detect, [4, 4, 7])
+        self.assertEqual(len(chain.detect([4, 6, 5])), 3)
+
+    def test_device(self):
+        chain = JtagChain(self.jtag)
+        device = chain.detect()[1]
+        self.assertRaises(JtagError, device.read_dr, self.USER_LENGTH)
+        device.write_ir(self.USER_INSTR)
+        self.assertEqual([tap.instruction for tap in self.taps],
+                         [0b1111, self.USER_INSTR, 0b11111])
+        pattern = BitSequence(0x1234_5678_9abc_def0_5a5, length=77)
+        device.write_dr(pattern)
+        self.assertEqual(self.taps[1].values[self.USER_INSTR], int(pattern))
+        self.assertEqual(device.read_dr(self.USER_LENGTH), pattern)
+        # the other devices have not been altered
+        self.assertEqual(self.taps[0].values[self.USER_INSTR], 0)
+        self.assertEqual(self.taps[2].values[self.USER_INSTR], 0)
+        last = chain[2]
+        last.write_ir(self.USER_INSTR)
+        last.write_dr(0xbeef, 16)
+        self.assertEqual(self.taps[2].values[self.USER_INSTR], 0xbeef)
+        self.assertEqual(int(last.read_dr(16)), 0xbeef)
+        self.assertRaises(JtagError, device.write_dr, pattern)
+        first = chain[0]
+        first.write_ir(self.USER_INSTR)
+        first.write_dr(0xa5, 8)
+        self.assertEqual(self.taps[0].values[self.USER_INSTR], 0xa5)
+        self.assertEqual(self.taps[2].ir_scans, 4)
+
+    def test_device_queue(self):
+        chain = JtagChain(self.jtag)
+        device = chain.detect()[1]
+        queue = JtagQueue(self.jtag)
+        device.queue_ir(queue, self.USER_INSTR)
+        # the instruction has not been shifted yet
+        self.assertRaises(JtagError, device.write_dr, 0x5, 77)
+        queue.flush()
+        self.assertEqual([tap.instruction for tap in self.taps],
+                         [0b1111, self.USER_INSTR, 0b11111])
+        device.write_dr(0x5, 77)
+        self.assertEqual(self.taps[1].values[self.USER_INSTR], 0x5)
+        self.assertEqual(int(device.read_dr(self.USER_LENGTH)), 0x5)
+        # a reset selects the IDCODE instructions again
+        queue.reset()
+        queue.flush()
+        self.assertRaises(JtagError, device.read_dr, self.USER_LENGTH)
+
+
+
+class MockBsdlTestCase(TestCase):
+    """Test boundary-scan sampling against a virtual TAP controller
+    """
+
+    IDCODE = 0x4ba00477
+    SAMPLE_INSTR = 0b0010
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.jtag = JtagEngine(frequency=30E6)
+        self.jtag.configure('ftdi://:232h/1')
+        bus, address, _ = self.jtag.controller.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.jtag.reset()
+        self.chain = None
+
+    def tearDown(self):
+        if self.chain:
+            self.vftdi.detach(self.chain)
+        self.jtag.close()
+
+    def _attach(self, taps):
+        self.chain = MockJtagChain(taps)
+        self.vftdi.attach(self.chain)
+
+    @classmethod
+    def _counter(cls, mask):
+        count = [-1]
+
+        def capture():
+            count[0] += 1
+            return count[0] & mask
+        return capture
+
+    def test_parse(self):
+        bsdl = Bsdl.from_file('pyftdi/tests/resources/mockdev.bsd')
+        self.assertEqual(bsdl.entity, 'MOCKDEV')
+        self.assertEqual(bsdl.ir_length, 4)
+        self.assertEqual(bsdl.boundary_length, 8)
+        self.assertEqual(bsdl.instructions['SAMPLE'], self.SAMPLE_INSTR)
+        self.assertEqual(bsdl.get_jtag_ir('preload'),
+                         BitSequence(self.SAMPLE_INSTR, length=4))
+        self.assertRaises(BsdlError, bsdl.get_jtag_ir, 'clamp')
+        self.assertTrue(bsdl.match_idcode(self.IDCODE))
+        self.assertTrue(bsdl.match_idcode(self.IDCODE | 0xf0000000))
+        self.assertFalse(bsdl.match_idcode(self.IDCODE ^ 0x100))
+        self.assertEqual(sorted(bsdl.pins), ['CLK', 'D(0)', 'D(1)', 'IO',
+                                             'LED'])
+        self.assertEqual(tuple(bsdl.pins['IO']), (5, 4, 3))
+        self.assertEqual(bsdl.cells[4].disable_result, 'Z')
+        self.assertRaises(BsdlError, Bsdl, 'entity FOO is end FOO;')
+
+    def test_sample(self):
+        bsdl = Bsdl.from_file('pyftdi/tests/resources/mockdev.bsd')
+        tap = MockJtagTap(4, self.IDCODE, registers={self.SAMPLE_INSTR: 8})
+        tap.captures[self.SAMPLE_INSTR] = self._counter(0xff)
+        other = MockJtagTap(6, None)
+        self._attach([other, tap])
+        device = JtagChain(self.jtag).detect()[1]
+        self.assertTrue(bsdl.match_idcode(device.idcode))
+        sampler = BsdlSampler(self.jtag, bsdl, device, batch_size=64)
+        samples = sampler.sample(100)
+        self.assertEqual(samples, list(range(100)))
+        self.assertEqual(tap.instruction, self.SAMPLE_INSTR)
+        levels = sampler.decode(samples, ['CLK', 'D(1)', 'LED'])
+        self.assertEqual(levels['CLK'],
+                         sum(1 << pos for pos in range(1, 100, 2)))
+        self.assertEqual(levels['D(1)'],
+                         sum(1 << pos for pos in range(100) if pos & 4))
+        self.assertEqual(levels['LED'],
+                         sum(1 << pos for pos in range(100) if pos & 64))
+        self.assertRaises(BsdlError, sampler.decode, samples, ['TDO'])
+        try:
+            arrays = sampler.decode_array(samples)
+        except ImportError:
+            return
+        self.assertEqual(list(arrays['IO']),
+                         [(pos >> 5) & 1 for pos in range(100)])
+
+    def test_benchmark(self):
+        """Report the sample rate of a 512-cell boundary register."""
+        length = 512
+        cells = ' & '.join(f'"{cell} (BC_1, P{cell}, input, X),"'
+                           for cell in range(length-1))
+        bsdl = Bsdl(f"""entity BENCH is
+  attribute INSTRUCTION_LENGTH of BENCH : entity is 4;
+  attribute INSTRUCTION_OPCODE of BENCH : entity is
+    "BYPASS (1111), SAMPLE (0010), IDCODE (0001)";
+  attribute BOUNDARY_LENGTH of BENCH : entity is {length};
+  attribute BOUNDARY_REGISTER of BENCH : entity is {cells} &
+    "{length-1} (BC_1, *, internal, X)";
+end BENCH;""")
+        tap = MockJtagTap(4, self.IDCODE,
+                          registers={self.SAMPLE_INSTR: length})
+        tap.captures[self.SAMPLE_INSTR] = self._counter((1 << length)-1)
+        self._attach([tap])
+        sampler = BsdlSampler(self.jtag, bsdl)
+        count = 500
+        self.vftdi.mpsse.reset_stats()
+        samples = sampler.sample(count)
+        bus_rate = count/self.vftdi.mpsse.bus_time
+        start = now()
+        levels = sampler.decode(samples)
+        decode_time = (now()-start)/count
+        self.assertEqual(len(levels), length-1)
+        self.assertEqual(levels['P0'],
+                         sum(1 << pos for pos in range(1, count, 2)))
+        FtdiLogger.log.debug('BSDL %d cells @ %.0f MHz: bus %.0f samples/s, '
+                             'host %.0f samples/s, decode %.1f us/sample',
+                             length, self.jtag.controller.frequency/1E6,
+                             bus_rate, sampler.sample_rate, decode_time*1E6)
+        self.assertGreater(bus_rate, 1000)
+
+
+class MockAdiv5TestCase(TestCase):
+    """Test ARM ADIv5 debug port accesses against a virtual JTAG-DP
+    """
+
+    BASE = 0x20000000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.jtag = JtagEngine(frequency=30E6)
+        self.jtag.configure('ftdi://:232h/1')
+        bus, address, _ = self.jtag.controller.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.jtag.reset()
+        self.chain = None
+
+    def tearDown(self):
+        if self.chain:
+            self.vftdi.detach(self.chain)
+        self.jtag.close()
+
+    def _attach(self, taps):
+        self.chain = MockJtagChain(taps)
+        self.vftdi.attach(self.chain)
+
+    def test_registers(self):
+        dap = MockJtagDap()
+        self._attach([MockJtagTap(5, 0x06431041), dap])
+        device = JtagChain(self.jtag).detect()[1]
+        dp = JtagDp(self.jtag, device)
+        self.assertEqual(dp.read_idcode(), dap.idcode)
+        dp.power_up()
+        self.assertEqual(dp.read_dp(JtagDp.CTRL_STAT) & 0xf0000000,
+                         0xf0000000)
+        mem = MemAp(dp)
+        self.assertEqual(mem.read_idr(), dap.AP_IDR)
+        self.assertEqual(dap.select, 0xf0)
+        mem.write32(self.BASE+0x10, 0x12345678)
+        self.assertEqual(dap.memory[0x10:0x14], bytes.fromhex('78563412'))
+        self.assertEqual(mem.read32(self.BASE+0x10), 0x12345678)
+        self.assertEqual(dap.select, 0)
+        # the bank selection is not written again: TAR, DRW, CTRL/STAT and
+        # RDBUFF scans
+        scans = dap.dr_scans
+        self.assertEqual(mem.read32(self.BASE+0x10), 0x12345678)
+        self.assertEqual(dap.dr_scans-scans, 4)
+        dp.write_ap(0, MemAp.TAR, self.BASE)
+        self.assertEqual(dp.read_ap(0, MemAp.TAR), self.BASE)
+
+    def test_memory(self):
+        dap = MockJtagDap()
+        self._attach([dap])
+        dp = JtagDp(self.jtag)
+        dp.power_up()
+        mem = MemAp(dp, batch_size=1024)
+        data = bytes((pos*7) & 0xff for pos in range(0x1800))
+        # cross several 1KB boundaries
+        address = self.BASE+0x3f0
+        self.vftdi.mpsse.reset_stats()
+        mem.write_memory(address, data)
+        write_time = self.vftdi.mpsse.bus_time
+        self.assertEqual(dap.memory[0x3f0:0x3f0+len(data)], data)
+        self.vftdi.mpsse.reset_stats()
+        self.assertEqual(mem.read_memory(address, len(data)), data)
+        read_time = self.vftdi.mpsse.bus_time
+        self.assertEqual(dp.wait_count, 0)
+        self.assertRaises(Adiv5Error, mem.read_memory, address+2, 4)
+        FtdiLogger.log.debug('ADIv5 %d bytes @ %.0f MHz: '
+                             'bus write %.0f KB/s, read %.0f KB/s, '
+                             'host write %.0f KB/s, read %.0f KB/s',
+                             len(data), self.jtag.controller.frequency/1E6,
+                             len(data)/write_time/1024,
+                             len(data)/read_time/1024,
+                             mem.write_throughput/1024,
+                             mem.read_throughput/1024)
+
+    def test_wait(self):
+        dap = MockJtagDap(latency=40)
+        self._attach([dap])
+        dp = JtagDp(self.jtag)
+        dp.power_up()
+        mem = MemAp(dp, batch_size=256)
+        data = bytes((pos*13) & 0xff for pos in range(0x800))
+        mem.write_memory(self.BASE+0x200, data)
+        self.assertEqual(dap.memory[0x200:0xa00], data)
+        self.assertEqual(mem.read_memory(self.BASE+0x200, len(data)), data)
+        self.assertGreater(dp.wait_count, 0)
+        self.assertEqual(dap.waits, dp.wait_count)
+        self.assertGreaterEqual(dp.idle_cycles, 1)
+        # idle cycles after each AP access avoid WAIT responses
+        dap.waits = 0
+        dp = JtagDp(self.jtag, idle_cycles=40)
+        mem = MemAp(dp)
+        self.assertEqual(mem.read_memory(self.BASE+0x200, len(data)), data)
+        self.assertEqual(dp.wait_count, 0)
+        self.assertEqual(dap.waits, 0)
+
+    def test_fault(self):
+        dap = MockJtagDap(size=0x400)
+        self._attach([dap])
+        dp = JtagDp(self.jtag)
+        dp.power_up()
+        mem = MemAp(dp)
+        self.assertRaises(Adiv5FaultError, mem.read_memory,
+                          self.BASE+0x3f0, 0x20)
+        self.assertFalse(dp.read_dp(JtagDp.CTRL_STAT) & JtagDp.STICKYERR)
+        self.assertRaises(Adiv5FaultError, mem.write32, self.BASE-4, 0)
+        mem.write32(self.BASE, 0xcafebabe)
+        self.assertEqual(mem.read32(self.BASE), 0xcafebabe)
+
+
+
+class MockSwdTestCase(TestCase):
+    """Test SWD accesses against a virtual SW-DP
+    """
+
+    BASE = 0x20000000
+    CSW = 0x00
+    TAR = 0x04
+    DRW = 0x0C
+    IDR = 0xFC
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.swd = SwdController(frequency=10E6)
+        self.swd.configure('ftdi://:232h/1')
+        bus, address, _ = self.swd.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.dp = None
+
+    def tearDown(self):
+        if self.dp:
+            self.vftdi.detach(self.dp)
+        self.swd.close()
+
+    def _attach(self, **kwargs):
+        self.dp = MockSwdDp(**kwargs)
+        self.vftdi.attach(self.dp)
+        return self.dp
+
+    def _setup_memap(self):
+        self.swd.connect()
+        self.swd.power_up()
+        self.swd.write_ap(0, self.CSW, 0x03000052)
+
+    def test_connect(self):
+        dp = self._attach()
+        # still in JTAG mode
+        self.assertRaises(SwdError, self.swd.read_dp, SwdController.DPIDR)
+        self.assertEqual(self.swd.connect(), dp.DPIDR)
+        self.assertEqual(dp.line_resets, 2)
+        self.assertEqual(dp.ctrl_stat, SwdController.ORUNDETECT)
+        self.swd.power_up()
+        self.assertEqual(self.swd.read_ap(0, self.IDR), dp.ap.IDR)
+        self.assertEqual(dp.select, 0xf0)
+        # after a line reset, DPIDR should be read first
+        self.swd.line_reset()
+        self.assertRaises(SwdError, self.swd.read_dp,
+                          SwdController.CTRL_STAT)
+        self.swd.line_reset()
+        self.assertEqual(self.swd.read_dp(SwdController.DPIDR), dp.DPIDR)
+        self.assertEqual(self.swd.read_dp(SwdController.CTRL_STAT) >> 28,
+                         0xf)
+
+    def test_power_up(self):
+        dp = self._attach()
+        self.swd.connect()
+        # slow power domains are waited for, whatever the retry count
+        dp.power_delay = 4*SwdController.DEFAULT_RETRIES
+        self.swd.power_up()
+        self.assertEqual(dp.power_delay, 0)
+        dp.power_delay = 1 << 20
+        start = now()
+        with self.assertRaises(SwdError):
+            self.swd.power_up(timeout=0.05)
+        self.assertLess(now()-start, 1.0)
+
+    def test_batch(self):
+        dp = self._attach()
+        self._setup_memap()
+        # TAR auto-increment wraps on 1KB boundaries
+        count = 200
+        queue = SwdQueue(self.swd)
+        queue.write_ap(0, self.TAR, self.BASE)
+        for pos in range(count):
+            queue.write_ap(0, self.DRW, pos*0x01010101)
+        queue.write_ap(0, self.TAR, self.BASE)
+        reads = [queue.read_ap(0, self.DRW) for _ in range(count)]
+        tar = queue.read_ap(0, self.TAR)
+        writes = self.vftdi.bulk_writes
+        queue.flush()
+        # the batch is executed with a handful of USB requests
+        self.assertLess(self.vftdi.bulk_writes-writes, count//5)
+        self.assertEqual([read.value for read in reads],
+                         [pos*0x01010101 & 0xffffffff
+                          for pos in range(count)])
+        self.assertEqual(tar.value, self.BASE+4*count)
+        self.assertEqual(dp.memory[4:8], bytes((1, 1, 1, 1)))
+        self.assertEqual(self.swd.wait_count, 0)
+
+    def test_wait(self):
+        dp = self._attach(latency=60)
+        self._setup_memap()
+        count = 64
+        queue = SwdQueue(self.swd)
+        queue.write_ap(0, self.TAR, self.BASE+0x100)
+        for pos in range(count):
+            queue.write_ap(0, self.DRW, 0x5a5a0000 | pos)
+        queue.write_ap(0, self.TAR, self.BASE+0x100)
+        reads = [queue.read_ap(0, self.DRW) for _ in range(count)]
+        queue.flush()
+        self.assertEqual([read.value for read in reads],
+                         [0x5a5a0000 | pos for pos in range(count)])
+        self.assertGreater(self.swd.wait_count, 0)
+        # requests following a WAIT response may also be answered with WAIT
+        self.assertGreaterEqual(dp.waits, self.swd.wait_count)
+        self.assertGreater(self.swd.idle_cycles, 0)
+        self.assertFalse(dp.ctrl_stat & SwdController.STICKYORUN)
+
+    def test_fault(self):
+        dp = self._attach(size=0x100)
+        self._setup_memap()
+        queue = SwdQueue(self.swd)
+        queue.write_ap(0, self.TAR, self.BASE+0xf8)
+        for _ in range(4):
+            queue.read_ap(0, self.DRW)
+        self.assertRaises(SwdFaultError, queue.flush)
+        self.assertFalse(dp.ctrl_stat & SwdController.STICKYERR)
+        self.swd.write_ap(0, self.TAR, self.BASE)
+        self.swd.write_ap(0, self.DRW, 0xdeadbeef)
+        self.swd.write_ap(0, self.TAR, self.BASE)
+        self.assertEqual(self.swd.read_ap(0, self.DRW), 0xdeadbeef)
+
+    def test_benchmark(self):
+        """Report the count of register accesses per second."""
+        self._attach()
+        self._setup_memap()
+        count = 2000
+        for read in (False, True):
+            queue = SwdQueue(self.swd)
+            queue.write_ap(0, self.TAR, self.BASE)
+            for pos in range(count):
+                if read:
+                    queue.read_ap(0, self.DRW)
+                else:
+                    queue.write_ap(0, self.DRW, pos)
+            self.vftdi.mpsse.reset_stats()
+            start = now()
+            queue.flush()
+            host_time = now()-start
+            bus_rate = count/self.vftdi.mpsse.bus_time
+            FtdiLogger.log.debug('SWD %s @ %.0f MHz: bus %.0f accesses/s, '
+                                 'host %.0f accesses/s',
+                                 'read' if read else 'write',
+                                 self.swd.frequency/1E6, bus_rate,
+                                 count/host_time)
+            self.assertGreater(bus_rate, 10000)
+
+
+class MockRemoteBitbangTestCase(TestCase):
+    """Test the remote bitbang server against a virtual TAP controller
+    """
+
+    IDCODE = 0x4ba00477
+    USER_INSTR = 0b1000
+    USER_LENGTH = 4096
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loader = MockLoader()
+        with open('pyftdi/tests/resources/ft232h.yaml', 'rb') as yfp:
+            cls.loader.load(yfp)
+        UsbTools.flush_cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loader.unload()
+
+    def setUp(self):
+        self.jtag = JtagEngine(frequency=6E6)
+        self.jtag.configure('ftdi://:232h/1')
+        bus, address, _ = self.jtag.controller.ftdi.usb_path
+        self.vftdi = self.loader.get_virtual_ftdi(bus, address)
+        self.tap = MockJtagTap(4, self.IDCODE,
+                               registers={self.USER_INSTR: self.USER_LENGTH})
+        self.chain = MockJtagChain([self.tap])
+        self.vftdi.attach(self.chain)
+
+    def tearDown(self):
+        self.vftdi.detach(self.chain)
+        self.jtag.close()
+
+    @classmethod
+    def _clock(cls, tms: int, tdi: int, read: bool = False) -> bytes:
+        # the sequence OpenOCD emits for each TCK cycle
+        low = 0x30 | (tms << 1) | tdi
+        return bytes((low, 0x52, low | 0x04) if read else (low, low | 0x04))
+
+    @classmethod
+    def _scan(cls, ir: bool, value: int, length: int) -> bytes:
+        """Build a scan from Run-Test/Idle, back to Run-Test/Idle"""
+        # select-DR-scan [select-IR-scan], capture, shift
+        cmds = bytearray(cls._clock(1, 0))
+        if ir:
+            cmds.extend(cls._clock(1, 0))
+        cmds.extend(cls._clock(0, 0))
+        cmds.extend(cls._clock(0, 0))
+        for pos in range(length):
+            cmds.extend(cls._clock(int(pos == length-1),
+                                   (value >> pos) & 1, True))
+        # update, run-test/idle
+        cmds.extend(cls._clock(1, 0))
+        cmds.extend(cls._clock(0, 0))
+        return bytes(cmds)
+
+    @classmethod
+    def _reset(cls) -> bytes:
+        cmds = bytearray(b'r')
+        for _ in range(5):
+            cmds.extend(cls._clock(1, 0))
+        cmds.extend(cls._clock(0, 0))
+        return bytes(cmds)
+
+    @classmethod
+    def _decode(cls, answers: bytes) -> int:
+        return sum(int(bit == 0x31) << pos
+                   for pos, bit in enumerate(answers))
+
+    def _request(self, sock: socket, cmds: bytes, length: int) -> bytes:
+        sock.sendall(cmds)
+        answers = bytearray()
+        while len(answers) < length:
+            select([sock], [], [], 5)
+            data = sock.recv(length-len(answers))
+            self.assertTrue(data)
+            answers.extend(data)
+        return bytes(answers)
+
+    def _serve(self, address):
+        server = RemoteBitbangServer(self.jtag.controller, address)
+        # the standard server classes are left untouched
+        self.assertFalse(TCPServer.allow_reuse_address)
+        self.assertFalse(UnixStreamServer.allow_reuse_address)
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server, thread
+
+    def _check_client(self, sock: socket):
+        idcode = self._request(sock, self._reset() +
+                               self._scan(False, 0, 32), 32)
+        self.assertEqual(self._decode(idcode), self.IDCODE)
+        self._request(sock, self._scan(True, self.USER_INSTR, 4), 4)
+        self.assertEqual(self.tap.instruction, self.USER_INSTR)
+        pattern = 0xc3a55a3c0ff0 | (1 << 47)
+        self._request(sock, self._scan(False, pattern, 48), 48)
+        value = self._decode(self._request(sock,
+                                           self._scan(False, 0, 48), 48))
+        # the register is longer than the scan
+        self.assertEqual(value, pattern >> (self.USER_LENGTH-48))
+        sock.sendall(b'Q')
+
+    def test_tcp(self):
+        server, thread = self._serve(('localhost', 0))
+        try:
+            with create_connection(server.server_address) as sock:
+                self._check_client(sock)
+        finally:
+            server.shutdown()
+            thread.join()
+            server.close()
+
+    def test_unix(self):
+        with TemporaryDirectory() as tmpdir:
+            path = joinpath(tmpdir, 'jtag.sock')
+            server, thread = self._serve(path)
+            try:
+                with socket(AF_UNIX) as sock:
+                    sock.connect(path)
+                    self._check_client(sock)
+            finally:
+                server.shutdown()
+                thread.join()
+                server.close()
+
+    def test_decoder(self):
+        decoder = RemoteBitbangDecoder(self.jtag.controller)
+        decoder.feed(self._reset())
+        # TDO requested while TCK is high, then while TCK is low with no
+        # more clock cycle
+        decoder.feed(b'01')
+        decoder.feed(self._clock(0, 0)[:1])
+        decoder.feed(self._clock(0, 0)[1:])
+        decoder.feed(b'4R0R')
+        self.assertTrue(decoder.pending)
+        self.assertEqual(decoder.flush(), b'11')
+        self.assertFalse(decoder.pending)
+        # shift data registers with scans longer than the buffered cycles
+        decoder = RemoteBitbangDecoder(self.jtag.controller, max_cycles=16)
+        decoder.feed(self._reset() + self._scan(False, 0, 32))
+        self.assertEqual(self._decode(decoder.flush()), self.IDCODE)
+        decoder.feed(b'Q')
+        self.assertTrue(decoder.quit)
+
+    def test_benchmark(self):
+        ctrl = self.jtag.controller
+        decoder = RemoteBitbangDecoder(ctrl)
+        naive = _NaiveBitbangDecoder(ctrl)
+        pattern = int.from_bytes(bytes(range(256)) * 2, 'little')
+        results = {}
+        for name, engine in (('naive', naive), ('batched', decoder)):
+            engine.feed(self._reset())
+            engine.feed(self._scan(True, self.USER_INSTR, 4))
+            engine.flush()
+            cmds = self._scan(False, pattern, self.USER_LENGTH)
+            start = now()
+            engine.feed(cmds)
+            answers = engine.flush()
+            host_time = now()-start
+            self.assertEqual(len(answers), self.USER_LENGTH)
+            rate = self.USER_LENGTH/host_time
+            results[name] = rate
+            FtdiLogger.log.debug('Remote bitbang %s: %.1f Kbits/s', name,
+                                 rate/1000)
+        self.assertGreater(results['batched'], 10*results['naive'])
+
+
+class _NaiveBitbangDecoder:
+    """Remote bitbang decoder that maps each command to a MPSSE pin update,
+       for comparison purpose.
+    """
+
+    def __init__(self, controller: JtagController):
+        self._ftdi = controller.ftdi
+        self._direction = controller.direction
+        self._answers = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        for code in data:
+            if 0x30 <= code <= 0x37:
+                value = code - 0x30
+                pins = (((value >> 2) & 1) * JtagController.TCK_BIT |
+                        ((value >> 1) & 1) * JtagController.TMS_BIT |
+                        (value & 1) * JtagController.TDI_BIT)
+                self._ftdi.write_data(bytes((Ftdi.SET_BITS_LOW, pins,
+                                             self._direction)))
+            elif code == 0x52:
+                self._ftdi.write_data(bytes((Ftdi.GET_BITS_LOW,
+                                             Ftdi.SEND_IMMEDIATE)))
+                pins = self._ftdi.read_data_bytes(1, 4)[0]
+                self._answers.append(
+                    0x30 + int(bool(pins & JtagController.TDO_BIT)))
+
+    def flush(self) -> bytes:
+        answers, self._answers = self._answers, bytearray()
+        return bytes(answers)
+
 
 def suite():
     suite_ = TestSuite()
@@ -474,7 +2684,23 @@ def suite():
     suite_.addTest(makeSuite(MockSimpleDirectTestCase, 'test'))
     suite_.addTest(makeSuite(MockSimpleMpsseTestCase, 'test'))
     suite_.addTest(makeSuite(MockSimpleGpioTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioWaveformTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioPwmTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioCaptureTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioSyncTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioWatcherTestCase, 'test'))
+    suite_.addTest(makeSuite(MockGpioMpsseTestCase, 'test'))
     suite_.addTest(makeSuite(MockSimpleUartTestCase, 'test'))
+    suite_.addTest(makeSuite(MockI2cTestCase, 'test'))
+    suite_.addTest(makeSuite(MockI2cSchedulerTestCase, 'test'))
+    suite_.addTest(makeSuite(MockI2cEepromTestCase, 'test'))
+    suite_.addTest(makeSuite(MockI2cBenchmarkTestCase, 'test'))
+    suite_.addTest(makeSuite(MockJtagTestCase, 'test'))
+    suite_.addTest(makeSuite(MockJtagChainTestCase, 'test'))
+    suite_.addTest(makeSuite(MockBsdlTestCase, 'test'))
+    suite_.addTest(makeSuite(MockAdiv5TestCase, 'test'))
+    suite_.addTest(makeSuite(MockSwdTestCase, 'test'))
+    suite_.addTest(makeSuite(MockRemoteBitbangTestCase, 'test'))
     return suite_
 
 
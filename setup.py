@@ -111,7 +111,8 @@ if __name__ == '__main__':
         packages=PACKAGES,
         scripts=['pyftdi/bin/i2cscan.py',
                  'pyftdi/bin/ftdi_urls.py',
-                 'pyftdi/bin/ftconf.py'],
+                 'pyftdi/bin/ftconf.py',
+                 'pyftdi/bin/jtagserver.py'],
         package_dir={'': '.'},
         package_data={'pyftdi': ['*.rst', 'doc/*.rst', 'doc/api/*.rst',
                                  'INSTALL'],